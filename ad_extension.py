@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Chrome 擴充功能執行模式
+
+一般模式下掃描、替換、按鈕與還原的 JavaScript 都由 Python 以 execute_script
+送出，每次導航後重新注入。此模式在啟動前把同一套邏輯（batched_replace 的
+替換腳本、網站的還原腳本）與替換圖片、按鈕樣式打包成未封裝的擴充功能，
+以 --load-extension 載入；content script 在符合的網站頁面自動執行，
+與 Python 之間只交換兩種訊號：
+
+- content script → Python：ready（廣告位置已穩定，附位置清單）、
+  capture（某一組已替換並捲動到位，請截圖）、done
+- Python → content script：對每個訊號回覆 ack（ready 時附上分組計畫，
+  capture 時告知繼續或停止）
+
+訊號都寫在 <html> 的 data- 屬性上（content script 的 isolated world 與頁面
+共用 DOM），Python 端每個訊號只需要一次 execute_async_script。
+"""
+
+import json
+import os
+
+from batched_replace import BATCHED_REPLACE_SCRIPT
+
+EXTENSION_VERSION = "1.0"
+
+DEFAULT_SLOT_SELECTOR = ', '.join([
+    'ins.adsbygoogle',
+    'div[id^="div-gpt-ad"]',
+    'div[id*="google_ads"]',
+    'iframe[id^="google_ads_iframe"]',
+    'iframe[id^="aswift_"]',
+    'iframe[src*="googlesyndication"]',
+    'iframe[src*="doubleclick"]',
+])
+
+SIGNAL_ATTR = 'data-ad-replacer-signal'
+ACK_ATTR = 'data-ad-replacer-ack'
+PRESENCE_ATTR = 'data-ad-replacer-extension'
+
+CONTENT_SCRIPT_JS = """
+(function() {
+    var config = window.AD_REPLACER_CONFIG;
+    if (!config || !config.enabled || window.top !== window) return;
+    var root = document.documentElement;
+    root.setAttribute('%(presence)s', config.version);
+
+    var seq = 0;
+    var signal = function(type, payload) {
+        seq++;
+        root.setAttribute('%(signal)s', JSON.stringify({seq: seq, type: type, payload: payload || {}}));
+        return seq;
+    };
+
+    var waitAck = function(expectedSeq) {
+        return new Promise(function(resolve) {
+            var check = function() {
+                var raw = root.getAttribute('%(ack)s');
+                if (!raw) return false;
+                var ack = JSON.parse(raw);
+                if (ack.seq !== expectedSeq) return false;
+                resolve(ack);
+                return true;
+            };
+            if (check()) return;
+            var observer = new MutationObserver(function() { if (check()) observer.disconnect(); });
+            observer.observe(root, {attributes: true, attributeFilter: ['%(ack)s']});
+        });
+    };
+
+    // DOM 停止變動 quietMs 或超過 settleTimeoutMs 即視為廣告位置已穩定
+    var waitSettled = function() {
+        return new Promise(function(resolve) {
+            var start = Date.now(), lastChange = Date.now();
+            var observer = new MutationObserver(function() { lastChange = Date.now(); });
+            observer.observe(root, {childList: true, subtree: true});
+            var poll = function() {
+                var now = Date.now();
+                if (now - lastChange >= config.quietMs || now - start >= config.settleTimeoutMs) {
+                    observer.disconnect();
+                    return resolve();
+                }
+                setTimeout(poll, 100);
+            };
+            poll();
+        });
+    };
+
+    var nextPaint = function() {
+        return new Promise(function(resolve) {
+            requestAnimationFrame(function() { requestAnimationFrame(function() { setTimeout(resolve, config.paintDelayMs); }); });
+        });
+    };
+
+    // 每個尺寸取文件順序中第一個可見且有替換圖片的位置
+    var scan = function() {
+        var picked = {}, slots = [];
+        document.querySelectorAll(config.slotSelector).forEach(function(element) {
+            var rect = element.getBoundingClientRect();
+            var key = Math.round(rect.width) + 'x' + Math.round(rect.height);
+            var image = config.images[key];
+            if (!image || picked[key]) return;
+            var style = window.getComputedStyle(element);
+            if (style.display === 'none' || style.visibility === 'hidden') return;
+            picked[key] = true;
+            slots.push({
+                element: element,
+                image: image,
+                sizeKey: key,
+                rect: {top: rect.top + window.pageYOffset, left: rect.left + window.pageXOffset,
+                       width: rect.width, height: rect.height}
+            });
+        });
+        return slots;
+    };
+
+    var describe = function(slot) {
+        return {sizeKey: slot.sizeKey, filename: slot.image.filename, isGif: slot.image.isGif, rect: slot.rect};
+    };
+
+    var replaceSlots = function(slots) {
+        return new Promise(function(resolve) {
+            batchedReplace(slots.map(function(slot) {
+                return {element: slot.element, imageData: slot.image.data, width: slot.image.width,
+                        height: slot.image.height, isGif: slot.image.isGif};
+            }), config.buttons, config.replaceOptions, resolve);
+        });
+    };
+
+    var run = async function() {
+        await waitSettled();
+        var slots = scan();
+        var viewport = {width: window.innerWidth, height: window.innerHeight,
+                        devicePixelRatio: window.devicePixelRatio || 1};
+        var ack = await waitAck(signal('ready', {slots: slots.map(describe), viewport: viewport}));
+        if (ack.action !== 'run') return;
+
+        for (var i = 0; i < ack.groups.length; i++) {
+            var group = ack.groups[i];
+            var groupSlots = group.indexes.map(function(index) { return slots[index]; });
+            var results = await replaceSlots(groupSlots);
+            var replaced = groupSlots.filter(function(slot, j) { return results[j] && results[j].ok; });
+            if (!replaced.length) { restoreReplacedAds(); continue; }
+
+            window.scrollTo(0, group.scrollY);
+            await nextPaint();
+            ack = await waitAck(signal('capture', {group: i, scrollY: group.scrollY, viewport: viewport,
+                                                    slots: replaced.map(describe)}));
+            restoreReplacedAds();
+            if (ack.action === 'stop') break;
+        }
+        window.scrollTo(0, 0);
+        signal('done');
+    };
+
+    var start = function() { run().catch(function(e) { signal('error', {message: String(e)}); }); };
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', start);
+    else start();
+})();
+""" % {'presence': PRESENCE_ATTR, 'signal': SIGNAL_ATTR, 'ack': ACK_ATTR}
+
+WAIT_SIGNAL_JS = """
+var lastSeq = arguments[0], timeoutMs = arguments[1];
+var done = arguments[arguments.length - 1];
+var root = document.documentElement;
+var read = function() {
+    var raw = root.getAttribute('%(signal)s');
+    if (!raw) return null;
+    var message = JSON.parse(raw);
+    return message.seq > lastSeq ? message : null;
+};
+var message = read();
+if (message) return done(message);
+var observer = new MutationObserver(function() {
+    var message = read();
+    if (message) { observer.disconnect(); clearTimeout(timer); done(message); }
+});
+observer.observe(root, {attributes: true, attributeFilter: ['%(signal)s']});
+var timer = setTimeout(function() { observer.disconnect(); done(null); }, timeoutMs);
+""" % {'signal': SIGNAL_ATTR}
+
+
+def build_extension(output_dir, images_by_size, button_style, is_none_mode, replace_options,
+                    restore_script, matches, slot_selector=DEFAULT_SLOT_SELECTOR,
+                    quiet_ms=1500, settle_timeout_ms=15000, paint_delay_ms=300):
+    """產生未封裝的擴充功能資料夾，回傳絕對路徑
+
+    images_by_size 為 {'970x90': {'data', 'width', 'height', 'is_gif', 'filename'}}，
+    restore_script 為網站原本 restore 時執行的 JavaScript。
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {
+        'manifest_version': 3,
+        'name': 'Ad Replacer',
+        'version': EXTENSION_VERSION,
+        'content_scripts': [{
+            'matches': matches,
+            'js': ['config.js', 'replace.js', 'content.js'],
+            'run_at': 'document_start',
+        }],
+    }
+    config = {
+        'enabled': True,
+        'version': EXTENSION_VERSION,
+        'slotSelector': slot_selector,
+        'quietMs': quiet_ms,
+        'settleTimeoutMs': settle_timeout_ms,
+        'paintDelayMs': paint_delay_ms,
+        'images': {key: {'data': image['data'], 'width': image['width'], 'height': image['height'],
+                         'isGif': bool(image['is_gif']), 'filename': image['filename']}
+                   for key, image in images_by_size.items()},
+        'buttons': {
+            'closeHtml': '' if is_none_mode else button_style['close_button']['html'],
+            'closeStyle': '' if is_none_mode else button_style['close_button']['style'],
+            'infoHtml': '' if is_none_mode else button_style['info_button']['html'],
+            'infoStyle': '' if is_none_mode else button_style['info_button']['style'],
+            'isNoneMode': is_none_mode,
+        },
+        'replaceOptions': replace_options,
+    }
+    files = {
+        'manifest.json': json.dumps(manifest, indent=2),
+        'config.js': f"window.AD_REPLACER_CONFIG = {json.dumps(config)};\n",
+        'replace.js': (f"function batchedReplace() {{\n{BATCHED_REPLACE_SCRIPT}\n}}\n\n"
+                       f"function restoreReplacedAds() {{\n{restore_script}\n}}\n"),
+        'content.js': CONTENT_SCRIPT_JS,
+    }
+    for name, content in files.items():
+        with open(os.path.join(output_dir, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+    return output_dir
+
+
+def add_extension_arguments(chrome_options, extension_dir):
+    """載入擴充功能（新版 Chrome 需另外允許 --load-extension）"""
+    chrome_options.add_argument(f'--load-extension={extension_dir}')
+    chrome_options.add_argument('--disable-features=DisableLoadExtensionCommandLineSwitch')
+
+
+class ExtensionController:
+    """Python 端：等待 content script 的訊號並回覆"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.last_seq = 0
+
+    def new_page(self):
+        """每次導航後 content script 重新計數"""
+        self.last_seq = 0
+
+    def present(self):
+        return bool(self.driver.execute_script(f"return document.documentElement.getAttribute('{PRESENCE_ATTR}');"))
+
+    def wait_signal(self, timeout=30):
+        """等待下一個訊號，逾時回傳 None"""
+        previous_timeout = self.driver.timeouts.script
+        self.driver.set_script_timeout(timeout + 5)
+        try:
+            message = self.driver.execute_async_script(WAIT_SIGNAL_JS, self.last_seq, int(timeout * 1000))
+        finally:
+            self.driver.set_script_timeout(previous_timeout)
+        if message:
+            self.last_seq = message['seq']
+        return message
+
+    def ack(self, message, action='next', **extra):
+        payload = dict(extra, seq=message['seq'], action=action)
+        self.driver.execute_script(
+            f"document.documentElement.setAttribute('{ACK_ATTR}', arguments[0]);", json.dumps(payload))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分階段批次廣告替換
+
+原本每個替換器的 replace_ad_content 會在同一段 JavaScript 中交錯讀取
+(getBoundingClientRect / getComputedStyle) 與寫入 (樣式、插入按鈕、隱藏 iframe)，
+每次寫入後的讀取都會強制同步重排，多個廣告位置時更是逐一累加。
+
+這裡改為兩個階段處理所有選定的廣告位置：
+  1. 量測階段：一次讀完所有位置需要的尺寸與計算樣式
+  2. 寫入階段：在同一個 requestAnimationFrame 內套用所有變更
+每頁強制重排次數因此固定為 O(1)，與廣告位置數量無關。
+"""
+
+BATCHED_REPLACE_SCRIPT = """
+var slots = arguments[0];
+var buttons = arguments[1];
+var options = arguments[2];
+var done = arguments[arguments.length - 1];
+
+var CONTROL_SELECTORS = ['#abgcp', '.abgcp', '#abgc', '.abgc', '#abgb', '.abgb', '#abgs', '.abgs',
+                         '#cbb', '.cbb', 'label.cbb', '[data-vars-label*="feedback"]'];
+
+function isControlButton(img, rect) {
+    if (rect.width < options.controlMinSize || rect.height < options.controlMinSize) return true;
+    if (img.className.includes('abg') || img.id.includes('abg')) return true;
+    var src = img.src || '';
+    if (src.includes('googleads') || src.includes('googlesyndication') ||
+        src.includes('adchoices') || src.includes('zh_tw.png')) return true;
+    for (var i = 0; i < CONTROL_SELECTORS.length; i++) {
+        if (img.closest(CONTROL_SELECTORS[i])) return true;
+    }
+    var alt = img.alt || '';
+    return alt.includes('關閉') || alt.includes('close');
+}
+
+// ===== 階段一：量測（只讀取，不寫入） =====
+var plans = slots.map(function(slot) {
+    var container = slot.element;
+    if (!container || !container.getBoundingClientRect) {
+        return { ok: false, reason: 'missing' };
+    }
+    var containerRect = container.getBoundingClientRect();
+    var plan = {
+        ok: true,
+        container: container,
+        slot: slot,
+        width: containerRect.width,
+        height: containerRect.height,
+        containerStatic: window.getComputedStyle(container).position === 'static',
+        imgs: [],
+        iframes: [],
+        background: null
+    };
+    if (Math.abs(containerRect.width - slot.width) > options.sizeTolerance ||
+        Math.abs(containerRect.height - slot.height) > options.sizeTolerance) {
+        plan.ok = false;
+        plan.reason = 'size';
+        return plan;
+    }
+
+    var imgs = container.querySelectorAll('img');
+    for (var i = 0; i < imgs.length; i++) {
+        var img = imgs[i];
+        var imgRect = img.getBoundingClientRect();
+        if (isControlButton(img, imgRect) || !img.src || img.src.startsWith('data:')) continue;
+        var parent = img.parentElement || container;
+        plan.imgs.push({
+            img: img,
+            parent: parent,
+            parentStatic: window.getComputedStyle(parent).position === 'static'
+        });
+    }
+
+    var iframes = container.querySelectorAll('iframe');
+    for (var i = 0; i < iframes.length; i++) {
+        var iframeRect = iframes[i].getBoundingClientRect();
+        plan.iframes.push({
+            iframe: iframes[i],
+            top: iframeRect.top - containerRect.top,
+            left: iframeRect.left - containerRect.left,
+            right: containerRect.right - iframeRect.right,
+            width: iframeRect.width,
+            height: iframeRect.height
+        });
+    }
+
+    if (plan.imgs.length === 0 && plan.iframes.length === 0) {
+        var style = window.getComputedStyle(container);
+        if (style.backgroundImage && style.backgroundImage !== 'none') {
+            plan.background = {
+                image: style.backgroundImage,
+                size: style.backgroundSize,
+                repeat: style.backgroundRepeat,
+                position: style.backgroundPosition
+            };
+        }
+    }
+    return plan;
+});
+
+// ===== 階段二：寫入（同一個 animation frame 內完成所有變更） =====
+function makeButton(id, className, html, cssText) {
+    var button = document.createElement('div');
+    button.id = id;
+    if (className) button.className = className;
+    button.innerHTML = html;
+    button.style.cssText = cssText;
+    return button;
+}
+
+function removeOldButtons(parent, ids) {
+    ids.forEach(function(id) {
+        var old = parent.querySelector('#' + id);
+        if (old) old.remove();
+    });
+}
+
+function applyPlan(plan) {
+    var container = plan.container;
+    var slot = plan.slot;
+    var mimeType = (options.gifMime && slot.isGif) ? 'image/gif' : 'image/png';
+    var newImageSrc = 'data:' + mimeType + ';base64,' + slot.imageData;
+    var showButtons = !buttons.isNoneMode && (buttons.closeHtml || buttons.infoHtml);
+    var suffix = options.uniqueButtonIds ? '_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9) : '';
+    var closeId = 'close_button' + suffix;
+    var infoId = 'abgb' + suffix;
+    var oldIds = suffix ? ['close_button', 'abgb', closeId, infoId] : ['close_button', 'abgb'];
+    var replacedCount = 0;
+
+    if (plan.containerStatic) container.style.position = 'relative';
+    removeOldButtons(container, oldIds);
+
+    // 方法1: 只替換img標籤的src，不移除元素
+    plan.imgs.forEach(function(entry) {
+        var img = entry.img;
+        if (!img.getAttribute('data-original-src')) {
+            img.setAttribute('data-original-src', img.src);
+        }
+        if (options.saveOriginalStyle && !img.getAttribute('data-original-style')) {
+            img.setAttribute('data-original-style', img.style.cssText || '');
+        }
+        img.src = newImageSrc;
+        img.style.objectFit = 'contain';
+        img.style.width = '100%';
+        img.style.height = 'auto';
+        img.style.maxWidth = 'none';
+        img.style.maxHeight = 'none';
+        img.style.minWidth = 'auto';
+        img.style.minHeight = 'auto';
+        img.style.display = 'block';
+        img.style.margin = '0';
+        img.style.padding = '0';
+        img.style.border = 'none';
+        img.style.outline = 'none';
+        replacedCount++;
+
+        if (entry.parentStatic) entry.parent.style.position = 'relative';
+        removeOldButtons(entry.parent, oldIds);
+        if (showButtons) {
+            if (buttons.infoHtml) entry.parent.appendChild(makeButton(infoId, 'abgb', buttons.infoHtml, buttons.infoStyle));
+            if (buttons.closeHtml) entry.parent.appendChild(makeButton(closeId, null, buttons.closeHtml, buttons.closeStyle));
+        }
+    });
+
+    // 方法2: 處理iframe（位置已在量測階段換算成相對容器的座標）
+    plan.iframes.forEach(function(entry) {
+        entry.iframe.style.visibility = 'hidden';
+
+        var newImg = document.createElement('img');
+        newImg.src = newImageSrc;
+        newImg.style.position = 'absolute';
+        newImg.style.top = entry.top + 'px';
+        newImg.style.left = entry.left + 'px';
+        newImg.style.width = Math.round(entry.width) + 'px';
+        newImg.style.height = Math.round(entry.height) + 'px';
+        newImg.style.objectFit = 'contain';
+        newImg.style.zIndex = '1';
+        container.appendChild(newImg);
+
+        removeOldButtons(container, oldIds);
+        if (showButtons) {
+            var buttonTop = entry.top + options.iframeButtonOffset;
+            var buttonRight = entry.right + options.iframeButtonOffset;
+            var infoRight = entry.right + 17;
+            var infoTop = entry.top + 1;
+
+            // 小尺寸廣告（高度 ≤ 60px）：按鈕收在廣告內部右上角
+            if (options.compactSmallAdButtons && entry.height <= 60) {
+                buttonTop = Math.max(0, entry.top);
+                buttonRight = Math.max(0, entry.right);
+                if (buttonRight < 15) buttonRight = 0;
+                infoTop = buttonTop;
+                infoRight = buttonRight + 16;
+                if (infoRight + 15 > entry.width) {
+                    infoRight = buttonRight - 16;
+                    if (infoRight < 0) infoRight = buttonRight + 1;
+                }
+            }
+
+            if (buttons.infoHtml) {
+                container.appendChild(makeButton(infoId, 'abgb', buttons.infoHtml,
+                    'position:absolute;top:' + infoTop + 'px;right:' + infoRight + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);line-height:0;'));
+            }
+            if (buttons.closeHtml) {
+                container.appendChild(makeButton(closeId, null, buttons.closeHtml,
+                    'position:absolute;top:' + buttonTop + 'px;right:' + buttonRight + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);'));
+            }
+        }
+        replacedCount++;
+    });
+
+    // 方法3: 處理背景圖片
+    if (replacedCount === 0 && plan.background) {
+        if (options.saveOriginalBackground) {
+            if (!container.getAttribute('data-original-background')) {
+                container.setAttribute('data-original-background', plan.background.image);
+            }
+            if (!container.getAttribute('data-original-bg-style')) {
+                container.setAttribute('data-original-bg-style', JSON.stringify({
+                    size: plan.background.size,
+                    repeat: plan.background.repeat,
+                    position: plan.background.position
+                }));
+            }
+        }
+        container.style.backgroundImage = 'url(' + newImageSrc + ')';
+        container.style.backgroundSize = 'contain';
+        container.style.backgroundRepeat = 'no-repeat';
+        container.style.backgroundPosition = 'center';
+        replacedCount = 1;
+
+        removeOldButtons(container, oldIds);
+        if (showButtons) {
+            if (buttons.infoHtml) container.appendChild(makeButton(infoId, 'abgb', buttons.infoHtml, buttons.infoStyle));
+            if (buttons.closeHtml) container.appendChild(makeButton(closeId, null, buttons.closeHtml, buttons.closeStyle));
+        }
+    }
+    return replacedCount;
+}
+
+var finished = false;
+function mutate() {
+    if (finished) return;
+    finished = true;
+
+    // 添加 Google 廣告標準樣式
+    if (options.adStylesCss && !document.getElementById('google_ad_styles')) {
+        var style = document.createElement('style');
+        style.id = 'google_ad_styles';
+        style.textContent = options.adStylesCss;
+        document.head.appendChild(style);
+    }
+
+    var results = plans.map(function(plan) {
+        var result = { ok: false, width: plan.width || 0, height: plan.height || 0, reason: plan.reason || null };
+        if (!plan.ok) return result;
+        try {
+            result.ok = applyPlan(plan) > 0;
+            if (!result.ok) result.reason = 'nothing-to-replace';
+        } catch (e) {
+            result.reason = String(e);
+        }
+        return result;
+    });
+    done(results);
+}
+
+// 背景分頁不會觸發 requestAnimationFrame，以計時器作為保險
+requestAnimationFrame(mutate);
+setTimeout(mutate, 100);
+"""
+
+# 各網站共用的預設選項，網站差異透過 options 覆寫
+DEFAULT_BATCH_OPTIONS = {
+    'sizeTolerance': 0,              # 容器尺寸與目標尺寸允許的誤差 (px)
+    'controlMinSize': 50,            # 小於此尺寸的 img 視為廣告控制按鈕
+    'saveOriginalStyle': True,       # 替換前保存 img 原始樣式 (data-original-style)
+    'saveOriginalBackground': True,  # 替換前保存原始背景 (data-original-background)
+    'uniqueButtonIds': False,        # 按鈕 ID 加上唯一後綴，避免多個位置衝突
+    'iframeButtonOffset': 0,         # iframe 上叉叉按鈕的額外偏移 (px)
+    'compactSmallAdButtons': False,  # 小尺寸廣告按鈕收在廣告內部
+    'gifMime': False,                # GIF 圖片使用 image/gif MIME
+    'adStylesCss': '',               # 注入的 #google_ad_styles 樣式
+}
+
+
+def replace_slots_batched(driver, slots, button_style, is_none_mode, options=None):
+    """一次替換多個廣告位置
+
+    slots 為 [{'element', 'image_data', 'width', 'height', 'is_gif'}]，
+    回傳與 slots 順序相同的 [{'ok', 'width', 'height', 'reason'}]。
+    """
+    merged = dict(DEFAULT_BATCH_OPTIONS)
+    merged.update(options or {})
+
+    buttons = {
+        'closeHtml': '' if is_none_mode else button_style["close_button"]["html"],
+        'closeStyle': '' if is_none_mode else button_style["close_button"]["style"],
+        'infoHtml': '' if is_none_mode else button_style["info_button"]["html"],
+        'infoStyle': '' if is_none_mode else button_style["info_button"]["style"],
+        'isNoneMode': is_none_mode,
+    }
+    js_slots = [{
+        'element': slot['element'],
+        'imageData': slot['image_data'],
+        'width': slot['width'],
+        'height': slot['height'],
+        'isGif': bool(slot.get('is_gif', False)),
+    } for slot in slots]
+
+    results = driver.execute_async_script(BATCHED_REPLACE_SCRIPT, js_slots, buttons, merged)
+    return results or [{'ok': False, 'width': 0, 'height': 0, 'reason': 'no-result'} for _ in slots]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+瀏覽器後端
+
+replacer 只透過 open_browser() 取得 driver，不需要知道瀏覽器在哪裡：
+- "local"：每次執行啟動本機 webdriver.Chrome
+- "daemon"：連上本機常駐的 Chrome（見 browser_daemon.py）
+- "remote"：向 Selenium Grid / 遠端端點的 session 池租用（見 session_pool.py）
+- "cdp"：不經 chromedriver，以非同步 CDP 引擎操作常駐 Chrome 的新分頁（見 cdp_engine.py）
+
+常駐或遠端瀏覽器無法使用時，改為啟動本機瀏覽器。
+"""
+
+import atexit
+
+from selenium import webdriver
+
+from browser_daemon import BrowserDaemon, DEFAULT_DAEMON_PORT, DEFAULT_PROFILE_DIR
+from session_pool import (SessionPool, DEFAULT_POOL_SIZE, DEFAULT_MAX_PAGES, DEFAULT_MAX_MEMORY_MB,
+                          DEFAULT_SESSION_REGISTRY)
+from cdp_engine import CdpEngine, WEBSOCKETS_AVAILABLE
+
+try:
+    from gif_config import (BROWSER_DAEMON_PORT, BROWSER_PROFILE_DIR, REMOTE_WEBDRIVER_URL,
+                            SESSION_POOL_SIZE, SESSION_MAX_PAGES, SESSION_MAX_MEMORY_MB, SESSION_REGISTRY)
+except ImportError:
+    BROWSER_DAEMON_PORT = DEFAULT_DAEMON_PORT
+    BROWSER_PROFILE_DIR = DEFAULT_PROFILE_DIR
+    REMOTE_WEBDRIVER_URL = "http://localhost:4444/wd/hub"
+    SESSION_POOL_SIZE = DEFAULT_POOL_SIZE
+    SESSION_MAX_PAGES = DEFAULT_MAX_PAGES
+    SESSION_MAX_MEMORY_MB = DEFAULT_MAX_MEMORY_MB
+    SESSION_REGISTRY = DEFAULT_SESSION_REGISTRY
+
+_session_pool = None
+_cdp_engines = {}
+
+
+def get_session_pool():
+    """同一行程共用的遠端 session 池，結束時把閒置 session 留給下一次執行"""
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionPool(REMOTE_WEBDRIVER_URL, SESSION_POOL_SIZE, SESSION_MAX_PAGES, SESSION_MAX_MEMORY_MB,
+                                    SESSION_REGISTRY)
+        atexit.register(_session_pool.close)
+    return _session_pool
+
+
+def get_cdp_engine(address):
+    """同一行程對同一個瀏覽器共用一條 CDP 連線"""
+    if address not in _cdp_engines:
+        _cdp_engines[address] = CdpEngine(address)
+        atexit.register(_cdp_engines[address].close)
+    return _cdp_engines[address]
+
+
+class BrowserSession:
+    """replacer 持有的瀏覽器，不論來源都以 close() 結束"""
+
+    def __init__(self, driver, backend, release=None, reused=False, debugger_address=None):
+        self.driver = driver
+        self.backend = backend
+        self.reused = reused        # 是否沿用先前執行已暖機的瀏覽器
+        self.debugger_address = debugger_address  # 常駐瀏覽器的位址（監控時用來找出行程）
+        self._release = release
+
+    @property
+    def attached(self):
+        """非本次啟動的瀏覽器：視窗位置與全螢幕不由 replacer 調整"""
+        return self.backend != "local"
+
+    def close(self):
+        if self._release:
+            self._release(self.driver)
+        else:
+            self.driver.quit()
+
+
+def open_browser(chrome_options, screen_id=1, backend="local"):
+    """依 backend 取得瀏覽器，回傳 BrowserSession"""
+    if backend != "local" and any(argument.startswith('--load-extension=') for argument in chrome_options.arguments):
+        # 擴充功能每次執行重新打包（內含本次選用的圖片），常駐或遠端瀏覽器會沿用舊的版本或無法載入
+        print(f"🧩 載入擴充功能時不使用 {backend} 瀏覽器，改為啟動本機瀏覽器")
+        backend = "local"
+    if backend == "daemon":
+        daemon = BrowserDaemon(screen_id, BROWSER_DAEMON_PORT, BROWSER_PROFILE_DIR)
+        driver = daemon.connect(chrome_options)
+        if driver is not None:
+            return BrowserSession(driver, backend, daemon.release, daemon.reused, daemon.address)
+    elif backend == "remote":
+        pool = get_session_pool()
+        try:
+            driver = pool.lease(chrome_options)
+            return BrowserSession(driver, backend, lambda d: pool.release(d, chrome_options),
+                                  driver.pages_loaded > 0)
+        except Exception as e:
+            print(f"遠端瀏覽器無法使用，改為啟動本機瀏覽器: {e}")
+    elif backend == "cdp":
+        daemon = BrowserDaemon(screen_id, BROWSER_DAEMON_PORT, BROWSER_PROFILE_DIR)
+        try:
+            if not WEBSOCKETS_AVAILABLE:
+                raise RuntimeError("未安裝 websockets 套件")
+            daemon.ensure(chrome_options.arguments)
+            driver = get_cdp_engine(daemon.address).new_tab(chrome_options.page_load_strategy)
+            print(f"⚡ 使用非同步 CDP 引擎 ({daemon.address})")
+            return BrowserSession(driver, backend, reused=daemon.reused, debugger_address=daemon.address)
+        except Exception as e:
+            print(f"CDP 引擎無法使用，改為啟動本機瀏覽器: {e}")
+    elif backend != "local":
+        print(f"未知的瀏覽器後端 {backend}，改為啟動本機瀏覽器")
+    return BrowserSession(webdriver.Chrome(options=chrome_options), "local")
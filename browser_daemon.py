@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+常駐瀏覽器
+
+每次執行都重新啟動 Chrome，且沒有 --user-data-dir，磁碟快取每次都是空的。
+此模組讓 Chrome 以固定的 remote debugging port 與持久化 profile 常駐，
+替換器執行時只需以 debuggerAddress 連上：啟動時間幾乎為零，重複造訪同一
+網站時靜態資源直接由快取取得。
+
+每個螢幕使用各自的 port 與 profile（同一個 profile 不能被兩個 Chrome 使用）。
+每次執行在常駐瀏覽器中開一個新分頁，結束時只關閉該分頁，瀏覽器保持執行。
+
+常駐瀏覽器啟動時的參數（user-agent、--headless、--disable-web-security 等）
+記錄在 profile 中；之後的執行只有在參數完全相同時才沿用，否則改為啟動本機瀏覽器，
+避免一個網站沿用另一個網站的啟動設定。
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+import urllib.request
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+DEFAULT_DAEMON_PORT = 9222
+DEFAULT_PROFILE_DIR = "chrome_profile"
+
+# 僅在啟動瀏覽器時有意義、不需傳給 Chrome 的參數
+_LAUNCH_ONLY_PREFIXES = ('--remote-debugging-port', '--user-data-dir')
+_LAUNCH_ARGS_FILE = "launch_args.json"
+
+
+def launch_arguments(arguments):
+    """傳給常駐 Chrome 的啟動參數（排序後用來比對是否相同）"""
+    return sorted(arg for arg in arguments if not arg.startswith(_LAUNCH_ONLY_PREFIXES))
+
+
+def find_chrome_binary():
+    """找出本機的 Chrome / Chromium 執行檔，找不到回傳 None"""
+    system = platform.system()
+    candidates = []
+    if system == "Darwin":
+        candidates = ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+                      "/Applications/Chromium.app/Contents/MacOS/Chromium"]
+    elif system == "Windows":
+        for base in (os.environ.get('PROGRAMFILES', ''), os.environ.get('PROGRAMFILES(X86)', ''),
+                     os.environ.get('LOCALAPPDATA', '')):
+            if base:
+                candidates.append(os.path.join(base, 'Google', 'Chrome', 'Application', 'chrome.exe'))
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    for name in ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome'):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+class BrowserDaemon:
+    """啟動或連上指定螢幕的常駐 Chrome"""
+
+    def __init__(self, screen_id=1, base_port=DEFAULT_DAEMON_PORT, profile_dir=DEFAULT_PROFILE_DIR,
+                 chrome_binary=None):
+        self.screen_id = screen_id
+        self.port = base_port + screen_id - 1
+        self.profile_dir = os.path.abspath(os.path.join(profile_dir, f"screen_{screen_id}"))
+        self.chrome_binary = chrome_binary or find_chrome_binary()
+        self.reused = False     # 本次執行是否連上既有的常駐瀏覽器
+        self.run_handle = None  # 本次執行使用的分頁
+
+    @property
+    def address(self):
+        return f"127.0.0.1:{self.port}"
+
+    def _json(self, path, timeout=1):
+        with urllib.request.urlopen(f"http://{self.address}{path}", timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def alive(self):
+        try:
+            return 'webSocketDebuggerUrl' in self._json('/json/version')
+        except Exception:
+            return False
+
+    def start(self, arguments, timeout=15):
+        """以 arguments 啟動常駐 Chrome，與本程式的生命週期脫鉤"""
+        if not self.chrome_binary:
+            raise RuntimeError("找不到 Chrome 執行檔")
+        os.makedirs(self.profile_dir, exist_ok=True)
+        command = [self.chrome_binary,
+                   f'--remote-debugging-port={self.port}',
+                   f'--user-data-dir={self.profile_dir}',
+                   '--no-first-run', '--no-default-browser-check']
+        command += launch_arguments(arguments)
+        command.append('about:blank')
+
+        popen_kwargs = {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+        if platform.system() == "Windows":
+            popen_kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_kwargs['start_new_session'] = True
+        subprocess.Popen(command, **popen_kwargs)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.alive():
+                with open(os.path.join(self.profile_dir, _LAUNCH_ARGS_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(launch_arguments(arguments), f, ensure_ascii=False)
+                print(f"🚀 已啟動常駐瀏覽器 (螢幕 {self.screen_id}, {self.address}, profile: {self.profile_dir})")
+                return
+            time.sleep(0.2)
+        raise RuntimeError(f"常駐瀏覽器 {timeout} 秒內未就緒")
+
+    def _running_arguments(self):
+        """執行中的常駐瀏覽器啟動時的參數，沒有紀錄時回傳 None"""
+        try:
+            with open(os.path.join(self.profile_dir, _LAUNCH_ARGS_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def ensure(self, arguments):
+        """未執行時以 arguments 啟動；已執行但啟動參數不同（或不明）時拋出 RuntimeError"""
+        self.reused = self.alive()
+        if not self.reused:
+            self.start(arguments)
+        elif self._running_arguments() != launch_arguments(arguments):
+            raise RuntimeError(f"{self.address} 的常駐瀏覽器以不同的啟動參數執行，不沿用")
+
+    def _close_stale_tabs(self):
+        """關閉先前執行異常結束時留下的分頁，只保留一個"""
+        try:
+            pages = [t for t in self._json('/json/list') if t.get('type') == 'page']
+            for target in pages[1:]:
+                urllib.request.urlopen(f"http://{self.address}/json/close/{target['id']}", timeout=1).close()
+        except Exception:
+            pass
+
+    def connect(self, chrome_options):
+        """連上（必要時先啟動）常駐瀏覽器並開啟本次執行的分頁，失敗回傳 None
+
+        chrome_options 的啟動參數只在啟動常駐瀏覽器時使用；頁面載入策略與
+        goog:loggingPrefs 等 chromedriver 端設定會沿用到連線。
+        """
+        try:
+            self.ensure(chrome_options.arguments)
+            if self.reused:
+                self._close_stale_tabs()
+
+            attach_options = Options()
+            attach_options.add_experimental_option('debuggerAddress', self.address)
+            attach_options.page_load_strategy = chrome_options.page_load_strategy
+            logging_prefs = chrome_options.to_capabilities().get('goog:loggingPrefs')
+            if logging_prefs:
+                attach_options.set_capability('goog:loggingPrefs', logging_prefs)
+
+            driver = webdriver.Chrome(options=attach_options)
+            driver.switch_to.new_window('tab')
+            self.run_handle = driver.current_window_handle
+            state = "沿用" if self.reused else "連上新啟動的"
+            print(f"✅ 已{state}常駐瀏覽器 {self.address}")
+            return driver
+        except Exception as e:
+            print(f"常駐瀏覽器無法使用，改為啟動新的瀏覽器: {e}")
+            return None
+
+    def release(self, driver):
+        """關閉本次執行的分頁並結束 chromedriver，常駐瀏覽器保持執行"""
+        try:
+            if self.run_handle in driver.window_handles and len(driver.window_handles) > 1:
+                driver.switch_to.window(self.run_handle)
+                driver.close()
+        except Exception:
+            pass
+        # 以 debuggerAddress 連上的 session，quit() 只結束 chromedriver，不會關閉瀏覽器
+        driver.quit()
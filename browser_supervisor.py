@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+瀏覽器監控
+
+Chrome 卡住或當掉時，main() 原本只會捕捉例外後等待，失效的 session 之後
+每個網址都會再失敗一次；長時間執行時 Chrome 的記憶體也會持續成長。
+BrowserSupervisor 包住 replacer 的 process_website()：
+- 每個網址前以簡單指令檢查瀏覽器，回應逾時或 session 已失效就強制結束並重啟
+- 單一網址處理超過 page_timeout 視為卡住，強制結束瀏覽器讓卡住的指令返回
+- 處理 max_pages 頁或瀏覽器（含 renderer）記憶體超過上限時主動回收；
+  常駐瀏覽器依頁數回收時只換掉本次的分頁，瀏覽器本身只在卡住或當掉時才結束
+
+重啟只重新呼叫 replacer 的 setup_driver()，replacer 物件與其統計
+（total_screenshots 等）保持不變，main() 接著處理下一個網址。
+卡住的處理流程在瀏覽器結束後仍未返回時拋出 BrowserUnrecoverable，
+main() 應停止執行，以免卡住的執行緒與新的瀏覽器同時操作 replacer。
+"""
+
+import threading
+import time
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+DEFAULT_MAX_PAGES = 40
+DEFAULT_MAX_MEMORY_MB = 2500
+DEFAULT_COMMAND_TIMEOUT = 10
+DEFAULT_PAGE_TIMEOUT = 300
+
+# 出現這些訊息代表瀏覽器或 session 已不可用，需要重啟
+_BROWSER_FAILURE_MARKERS = (
+    'invalid session id', 'chrome not reachable', 'disconnected', 'target crashed',
+    'tab crashed', 'session deleted', 'no such window', 'connection refused', 'max retries exceeded',
+)
+
+
+class BrowserUnrecoverable(RuntimeError):
+    """卡住的處理流程無法中止，不能安全地重啟瀏覽器繼續執行"""
+
+
+def is_browser_failure(error):
+    """例外是否來自瀏覽器本身失效（而非網頁內容）"""
+    message = str(error).lower()
+    return any(marker in message for marker in _BROWSER_FAILURE_MARKERS)
+
+
+def _call_with_timeout(func, timeout):
+    """在背景執行緒呼叫 func，回傳 (完成與否, 回傳值或例外)"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['value'] = func()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        return False, None
+    return True, outcome.get('error', outcome.get('value'))
+
+
+class BrowserSupervisor:
+    """監控 replacer 的瀏覽器，卡住、當掉或用量過高時重啟"""
+
+    def __init__(self, bot, headless=False, max_pages=DEFAULT_MAX_PAGES, max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                 command_timeout=DEFAULT_COMMAND_TIMEOUT, page_timeout=DEFAULT_PAGE_TIMEOUT):
+        self.bot = bot
+        self.headless = headless
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.command_timeout = command_timeout
+        self.page_timeout = page_timeout
+        self.pages = 0              # 目前這個瀏覽器處理過的頁數
+        self.stats = {'restarts': 0, 'recycles': 0, 'hangs': 0, 'latency_ms': 0}
+
+    # 健康檢查
+
+    def probe(self):
+        """送出一個簡單指令，回傳延遲 (ms)；逾時或失效回傳 None"""
+        start = time.time()
+        finished, result = _call_with_timeout(lambda: self.bot.driver.execute_script("return 1;"),
+                                              self.command_timeout)
+        if not finished or result != 1:
+            return None
+        latency_ms = (time.time() - start) * 1000
+        self.stats['latency_ms'] = latency_ms
+        return latency_ms
+
+    def _browser_processes(self):
+        """本機瀏覽器的行程（含 renderer），無法取得時回傳空清單"""
+        if not PSUTIL_AVAILABLE:
+            return []
+        browser = self.bot.browser
+        try:
+            if browser.debugger_address:
+                # 常駐瀏覽器：以 remote debugging port 找出主行程
+                port_arg = f"--remote-debugging-port={browser.debugger_address.rsplit(':', 1)[1]}"
+                roots = [p for p in psutil.process_iter(['cmdline']) if port_arg in (p.info['cmdline'] or [])]
+            elif browser.backend == "local":
+                roots = [psutil.Process(self.bot.driver.service.process.pid)]
+            else:
+                return []
+            processes = []
+            for root in roots:
+                processes.append(root)
+                processes.extend(root.children(recursive=True))
+            return processes
+        except Exception:
+            return []
+
+    def memory_mb(self):
+        """瀏覽器行程的 RSS 總和；無法取得行程時改用頁面 JS heap"""
+        processes = self._browser_processes()
+        if processes:
+            total = 0
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except Exception:
+                    pass
+            return total / 1024 / 1024
+        finished, used = _call_with_timeout(lambda: self.bot.driver.execute_script(
+            "return performance.memory ? performance.memory.usedJSHeapSize : 0;"), self.command_timeout)
+        if not finished or isinstance(used, Exception):
+            return 0
+        return (used or 0) / 1024 / 1024
+
+    # 重啟
+
+    def _kill(self, hard=True):
+        """結束目前的瀏覽器：先正常關閉，卡住時直接結束行程
+
+        hard=False 用於定期回收：常駐瀏覽器正常關閉本次的分頁後就保留瀏覽器。
+        """
+        processes = self._browser_processes()
+        finished, _ = _call_with_timeout(self.bot.browser.close, self.command_timeout)
+        if finished and (self.bot.browser.backend == "local" or not hard):
+            return
+        # 常駐瀏覽器 close() 只關分頁；卡住或當掉時連同瀏覽器一起結束
+        for process in processes:
+            try:
+                process.kill()
+            except Exception:
+                pass
+        if not finished and self.bot.browser.backend == "local":
+            try:
+                self.bot.driver.service.process.kill()
+            except Exception:
+                pass
+
+    def restart(self, reason, hard=True):
+        print(f"🔁 {'重啟瀏覽器' if hard or not self.bot.browser.attached else '更換分頁'}: {reason}")
+        self._kill(hard)
+        self.bot.setup_driver(self.headless)
+        self.pages = 0
+        self.stats['restarts'] += 1
+
+    def ensure_ready(self):
+        """處理網址前確認瀏覽器可用，必要時回收或重啟"""
+        if self.max_pages and self.pages >= self.max_pages:
+            self.stats['recycles'] += 1
+            self.restart(f"已處理 {self.pages} 頁", hard=False)
+            return
+        latency_ms = self.probe()
+        if latency_ms is None:
+            self.restart(f"瀏覽器無回應（{self.command_timeout} 秒內未完成指令）")
+            return
+        memory_mb = self.memory_mb()
+        if self.max_memory_mb and memory_mb >= self.max_memory_mb:
+            self.stats['recycles'] += 1
+            self.restart(f"記憶體 {memory_mb:.0f} MB 超過上限 {self.max_memory_mb} MB")
+
+    # 處理網址
+
+    def process(self, url):
+        """以監控方式執行 bot.process_website(url)
+
+        瀏覽器失效時重啟後再拋出原本的例外，由 main() 記錄失敗並處理下一個網址；
+        卡住且無法中止時拋出 BrowserUnrecoverable。
+        """
+        self.ensure_ready()
+
+        outcome = {}
+
+        def target():
+            try:
+                outcome['value'] = self.bot.process_website(url)
+            except Exception as e:
+                outcome['error'] = e
+
+        worker = threading.Thread(target=target, daemon=True)
+        worker.start()
+        worker.join(self.page_timeout)
+        self.pages += 1
+
+        if worker.is_alive():
+            # 卡住的指令要等瀏覽器結束才會返回；等它結束後才建立新的瀏覽器，避免沿用到新 driver
+            self.stats['hangs'] += 1
+            print(f"🔁 重啟瀏覽器: 處理網址超過 {self.page_timeout} 秒")
+            self._kill()
+            worker.join(self.command_timeout * 3)
+            if worker.is_alive():
+                # 卡住的執行緒仍持有 replacer，之後可能寫入新的 driver 與統計，不能繼續使用
+                raise BrowserUnrecoverable(f"處理網址超過 {self.page_timeout} 秒，結束瀏覽器後流程仍未返回")
+            self.bot.setup_driver(self.headless)
+            self.pages = 0
+            self.stats['restarts'] += 1
+            raise TimeoutError(f"處理網址超過 {self.page_timeout} 秒，已重啟瀏覽器")
+
+        error = outcome.get('error')
+        if error is not None:
+            if is_browser_failure(error) or self.probe() is None:
+                self.restart(f"瀏覽器失效: {str(error).splitlines()[0] if str(error) else type(error).__name__}")
+            raise error
+        return outcome.get('value')
+
+    def print_summary(self):
+        if not any(self.stats[key] for key in ('restarts', 'recycles', 'hangs')):
+            return
+        print(f"🩺 瀏覽器監控: 重啟 {self.stats['restarts']} 次 "
+              f"(回收 {self.stats['recycles']} 次, 卡住 {self.stats['hangs']} 次)")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+視窗分組截圖規劃
+
+把同一個視窗高度內可同時看見的廣告位置分成一組（例如右欄的 300x250 與 300x600），
+整組一起替換、捲動一次、只截一張圖；需要「一張圖一個廣告」時再從整組畫面裁切。
+"""
+
+import os
+
+
+def measure_slots(driver, elements):
+    """一次取得所有元素在整頁中的絕對位置與目前的視窗資訊"""
+    return driver.execute_script("""
+        var elements = arguments[0];
+        var rects = elements.map(function(element) {
+            if (!element || !element.getBoundingClientRect) return null;
+            var rect = element.getBoundingClientRect();
+            return {
+                top: rect.top + window.pageYOffset,
+                left: rect.left + window.pageXOffset,
+                width: rect.width,
+                height: rect.height
+            };
+        });
+        return {
+            rects: rects,
+            viewport: {
+                width: window.innerWidth,
+                height: window.innerHeight,
+                scrollY: window.pageYOffset,
+                devicePixelRatio: window.devicePixelRatio || 1
+            }
+        };
+    """, elements)
+
+
+def plan_viewport_groups(slots, viewport_height, margin=40):
+    """依頁面垂直位置將廣告位置分組
+
+    slots 需包含 'rect' (絕對座標)；同一組的最上緣到最下緣加上上下邊距
+    不超過視窗高度。回傳 [{'slots': [...], 'top', 'bottom', 'scroll_y'}]。
+    """
+    usable_height = max(1, viewport_height - margin * 2)
+    ordered = sorted((s for s in slots if s.get('rect')), key=lambda s: s['rect']['top'])
+
+    groups = []
+    for slot in ordered:
+        rect = slot['rect']
+        bottom = rect['top'] + rect['height']
+        if groups:
+            group = groups[-1]
+            span_bottom = max(group['bottom'], bottom)
+            if span_bottom - group['top'] <= usable_height:
+                group['slots'].append(slot)
+                group['bottom'] = span_bottom
+                continue
+        groups.append({'slots': [slot], 'top': rect['top'], 'bottom': bottom})
+
+    # 讓整組位於視窗中央
+    for group in groups:
+        center = (group['top'] + group['bottom']) / 2
+        group['scroll_y'] = max(0, center - viewport_height / 2)
+    return groups
+
+
+def crop_slot_from_frame(frame_path, slot_rect, scroll_y, viewport, crop_margin=200, suffix=None):
+    """從整組截圖裁切出單一廣告周圍的區域，回傳新檔案路徑
+
+    截圖為整個螢幕，視窗內容貼齊畫面底部；以畫面寬度與 innerWidth 的比例換算座標。
+    """
+    from PIL import Image
+
+    with Image.open(frame_path) as frame:
+        scale = frame.width / float(viewport['width'] or frame.width)
+        viewport_top = max(0, frame.height - int(viewport['height'] * scale))
+
+        top = (slot_rect['top'] - scroll_y - crop_margin) * scale + viewport_top
+        bottom = (slot_rect['top'] + slot_rect['height'] - scroll_y + crop_margin) * scale + viewport_top
+        box = (0, max(viewport_top, int(top)), frame.width, min(frame.height, int(bottom)))
+
+        base, ext = os.path.splitext(frame_path)
+        crop_path = f"{base}_{suffix or int(slot_rect['top'])}{ext}"
+        frame.crop(box).save(crop_path)
+    return crop_path
+
+
+def discard_frame(frame_path):
+    """裁切完成後刪除整組截圖，截圖資料夾中只留下有記錄的裁切圖"""
+    try:
+        os.remove(frame_path)
+    except OSError as e:
+        print(f"⚠️ 無法刪除整組截圖 {frame_path}: {e}")
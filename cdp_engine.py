@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+非同步 CDP 引擎
+
+Selenium 每個步驟都是一次對 chromedriver 的阻塞 HTTP 往返，一個執行緒同時
+只能操作一個頁面。此引擎以 asyncio 直接透過 websocket 與瀏覽器的 DevTools
+通訊：
+- 一條連線以 flatten session 同時操作多個分頁，指令不必等前一個回應即可送出
+- 可訂閱事件：頁面載入、GPT 廣告位置完成繪製 (slotRenderEnded)、網路請求
+
+CdpTabDriver 在背景事件迴圈上提供與 Selenium driver 相同的常用介面
+（execute_script、execute_async_script、execute_cdp_cmd、get、title、
+save_screenshot、get_log('performance') …），掃描 / 替換 / 截圖共用模組
+不需修改即可使用。網站流程目前仍以一個 CdpTabDriver 逐頁處理；
+run_pages() 是給自行撰寫 async handler 的批次工具，以多個分頁並行處理一批網址。
+頁面中的元素以 data-ad-slot-handle 表示 (CdpElement)，不持有遠端物件。
+
+需要 websockets 套件，並連上以 remote debugging port 啟動的 Chrome
+（見 browser_daemon.py）。
+"""
+
+import asyncio
+import base64
+import collections
+import itertools
+import json
+import threading
+import time
+import urllib.request
+
+from selenium.common.exceptions import (ElementNotInteractableException, JavascriptException, NoSuchElementException,
+                                        TimeoutException, WebDriverException)
+from selenium.webdriver.common.by import By
+
+from slot_handles import SLOT_HANDLE_ATTR, TAG_SLOT_JS
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    websockets = None
+    WEBSOCKETS_AVAILABLE = False
+
+# 頁面載入策略對應的等待事件
+LOAD_EVENTS = {
+    'normal': 'Page.loadEventFired',
+    'eager': 'Page.domContentEventFired',
+    'none': None,
+}
+
+# 以 chromedriver performance log 的格式保留的網路事件（Network.enable 後才會收到）
+PERFORMANCE_LOG_EVENTS = (
+    'Network.requestWillBeSent',
+    'Network.responseReceived',
+    'Network.loadingFinished',
+    'Network.loadingFailed',
+)
+PERFORMANCE_LOG_LIMIT = 20000
+
+# 執行 Selenium 形式的腳本：arguments 與回傳值中的元素以 handle 轉換
+SCRIPT_WRAPPER_JS = """
+(function(argsJson, isAsync, timeoutMs) {
+    %(tag_slot)s
+    var decode = function(value) {
+        if (Array.isArray(value)) return value.map(decode);
+        if (value && typeof value === 'object') {
+            if (value.__slotHandle) return document.querySelector('[%(attr)s="' + value.__slotHandle + '"]');
+            var out = {};
+            for (var key in value) out[key] = decode(value[key]);
+            return out;
+        }
+        return value;
+    };
+    var encode = function(value, depth) {
+        depth = depth || 0;
+        if (value === undefined || value === null || depth > 20) return null;
+        if (value instanceof Element) return {__slotHandle: tagSlot(value)};
+        if (value instanceof NodeList || value instanceof HTMLCollection) value = Array.from(value);
+        if (Array.isArray(value)) return value.map(function(item) { return encode(item, depth + 1); });
+        if (typeof value === 'object') {
+            if (value === window || value === document) return null;
+            var out = {};
+            for (var key in value) {
+                try { if (typeof value[key] !== 'function') out[key] = encode(value[key], depth + 1); } catch (e) {}
+            }
+            return out;
+        }
+        return value;
+    };
+    var args = decode(JSON.parse(argsJson));
+    var body = function() { %(body)s
+    };
+    if (!isAsync) return encode(body.apply(null, args));
+    return new Promise(function(resolve, reject) {
+        var timer = setTimeout(function() { reject(new Error('script timeout')); }, timeoutMs);
+        args.push(function(result) { clearTimeout(timer); resolve(encode(result)); });
+        try { body.apply(null, args); } catch (e) { clearTimeout(timer); reject(e); }
+    });
+})(%(args)s, %(is_async)s, %(timeout)s)
+"""
+
+# 文件開始時掛上 GPT slotRenderEnded，透過 binding 回報給引擎
+SLOT_RENDER_HOOK_JS = """
+(function() {
+    window.googletag = window.googletag || {cmd: []};
+    googletag.cmd = googletag.cmd || [];
+    googletag.cmd.push(function() {
+        googletag.pubads().addEventListener('slotRenderEnded', function(event) {
+            var size = event.size || [0, 0];
+            window.__adSlotRendered(JSON.stringify({
+                elementId: event.slot.getSlotElementId(),
+                adUnitPath: event.slot.getAdUnitPath(),
+                isEmpty: event.isEmpty,
+                width: size[0],
+                height: size[1]
+            }));
+        });
+    });
+})();
+"""
+
+FIND_ELEMENTS_JS = """
+var by = arguments[0], value = arguments[1], root = arguments[2] || document;
+if (by === 'xpath') {
+    var found = document.evaluate(value, root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    var nodes = [];
+    for (var i = 0; i < found.snapshotLength; i++) nodes.push(found.snapshotItem(i));
+    return nodes;
+}
+return Array.from(root.querySelectorAll(value));
+"""
+
+
+class CdpError(WebDriverException):
+    pass
+
+
+class AsyncCdpConnection:
+    """一條 DevTools websocket：指令以 id 對應回應，事件分派給訂閱者"""
+
+    def __init__(self, ws_url):
+        self.ws_url = ws_url
+        self.ws = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = {}     # (method, sessionId) -> [callback]
+        self._reader = None
+
+    async def open(self):
+        self.ws = await websockets.connect(self.ws_url, max_size=None)
+        self._reader = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.pop(message['id'], None)
+                    if future is None or future.done():
+                        continue
+                    if 'error' in message:
+                        future.set_exception(CdpError(message['error'].get('message', str(message['error']))))
+                    else:
+                        future.set_result(message.get('result', {}))
+                else:
+                    self._dispatch(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CdpError("DevTools 連線已關閉"))
+            self._pending.clear()
+
+    def _dispatch(self, message):
+        key = (message.get('method'), message.get('sessionId'))
+        for callback in list(self._listeners.get(key, [])):
+            try:
+                callback(message.get('params', {}))
+            except Exception as e:
+                print(f"CDP 事件處理失敗 ({key[0]}): {e}")
+
+    async def send(self, method, params=None, session_id=None):
+        """送出指令並等待回應；多個 send 以 gather 並行時指令會連續送出（pipelining）"""
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        await self.ws.send(json.dumps(message))
+        return await future
+
+    def on(self, method, callback, session_id=None):
+        """訂閱事件，回傳取消訂閱的函式"""
+        listeners = self._listeners.setdefault((method, session_id), [])
+        listeners.append(callback)
+        return lambda: listeners.remove(callback) if callback in listeners else None
+
+    async def wait_for(self, method, session_id=None, predicate=None, timeout=30):
+        future = asyncio.get_running_loop().create_future()
+
+        def callback(params):
+            if not future.done() and (predicate is None or predicate(params)):
+                future.set_result(params)
+
+        unsubscribe = self.on(method, callback, session_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            unsubscribe()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class AsyncCdpTab:
+    """以 flatten session 操作的分頁"""
+
+    def __init__(self, connection, target_id, session_id):
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+
+    @classmethod
+    async def create(cls, connection):
+        target = await connection.send('Target.createTarget', {'url': 'about:blank'})
+        attached = await connection.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+        tab = cls(connection, target['targetId'], attached['sessionId'])
+        await asyncio.gather(tab.send('Page.enable'), tab.send('Runtime.enable'))
+        return tab
+
+    async def send(self, method, params=None):
+        return await self.connection.send(method, params, self.session_id)
+
+    async def send_many(self, commands):
+        """一次送出多個 (method, params)，依序回傳結果"""
+        return await asyncio.gather(*(self.send(method, params) for method, params in commands))
+
+    def on(self, method, callback):
+        return self.connection.on(method, callback, self.session_id)
+
+    async def wait_for(self, method, predicate=None, timeout=30):
+        return await self.connection.wait_for(method, self.session_id, predicate, timeout)
+
+    async def navigate(self, url, strategy='normal', timeout=30):
+        """導航並依頁面載入策略等待 load / DOMContentLoaded 事件"""
+        event = LOAD_EVENTS.get(strategy, LOAD_EVENTS['normal'])
+        # 先訂閱再導航，避免錯過事件
+        waiter = asyncio.ensure_future(self.wait_for(event, timeout=timeout)) if event else None
+        try:
+            result = await self.send('Page.navigate', {'url': url})
+            if result.get('errorText'):
+                raise CdpError(f"導航失敗: {result['errorText']}")
+            if waiter is not None:
+                await waiter
+        except asyncio.TimeoutError:
+            raise TimeoutException(f"頁面 {timeout} 秒內未載入: {url}")
+        finally:
+            if waiter is not None and not waiter.done():
+                waiter.cancel()
+
+    async def evaluate(self, expression, await_promise=False):
+        result = await self.send('Runtime.evaluate', {
+            'expression': expression, 'returnByValue': True, 'awaitPromise': await_promise
+        })
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            description = (details.get('exception') or {}).get('description') or details.get('text')
+            raise JavascriptException(description)
+        return result['result'].get('value')
+
+    async def run_script(self, script, args=(), is_async=False, timeout=30):
+        """執行 Selenium 形式的腳本（使用 arguments、async 版以最後一個參數回呼）"""
+        expression = SCRIPT_WRAPPER_JS % {
+            'tag_slot': TAG_SLOT_JS,
+            'attr': SLOT_HANDLE_ATTR,
+            'body': script,
+            'args': json.dumps(json.dumps(list(args), default=_encode_arg)),
+            'is_async': 'true' if is_async else 'false',
+            'timeout': int(timeout * 1000),
+        }
+        return await self.evaluate(expression, await_promise=is_async)
+
+    async def screenshot(self):
+        result = await self.send('Page.captureScreenshot', {'format': 'png'})
+        return base64.b64decode(result['data'])
+
+    async def click(self, x, y):
+        """在視窗座標 (x, y) 送出滑鼠左鍵點擊（使用者操作事件，與 WebDriver 的 click 相同）"""
+        await self.send('Input.dispatchMouseEvent', {'type': 'mouseMoved', 'x': x, 'y': y})
+        for event_type in ('mousePressed', 'mouseReleased'):
+            await self.send('Input.dispatchMouseEvent', {
+                'type': event_type, 'x': x, 'y': y, 'button': 'left', 'clickCount': 1})
+
+    async def watch_slot_renders(self, callback):
+        """訂閱 GPT slotRenderEnded，callback 收到 {elementId, adUnitPath, isEmpty, width, height}"""
+        def on_binding(params):
+            if params.get('name') == '__adSlotRendered':
+                callback(json.loads(params['payload']))
+
+        self.on('Runtime.bindingCalled', on_binding)
+        await self.send_many([
+            ('Runtime.addBinding', {'name': '__adSlotRendered'}),
+            ('Page.addScriptToEvaluateOnNewDocument', {'source': SLOT_RENDER_HOOK_JS}),
+        ])
+
+    async def watch_network(self, callback):
+        """訂閱網路事件，callback 收到 (method, params)"""
+        for method in ('Network.requestWillBeSent', 'Network.loadingFinished', 'Network.loadingFailed'):
+            self.on(method, lambda params, method=method: callback(method, params))
+        await self.send('Network.enable')
+
+    async def close(self):
+        try:
+            await self.connection.send('Target.closeTarget', {'targetId': self.target_id})
+        except CdpError:
+            pass
+
+
+class CdpElement:
+    """以 handle 表示的頁面元素，提供常用的 WebElement 屬性"""
+
+    def __init__(self, driver, handle):
+        self._driver = driver
+        self.handle = handle
+
+    @property
+    def id(self):
+        return self.handle
+
+    def __eq__(self, other):
+        return isinstance(other, CdpElement) and other.handle == self.handle
+
+    def __hash__(self):
+        return hash(self.handle)
+
+    def get_attribute(self, name):
+        return self._driver.execute_script("return arguments[0] && arguments[0].getAttribute(arguments[1]);", self, name)
+
+    def is_displayed(self):
+        return bool(self._driver.execute_script("""
+            var e = arguments[0];
+            if (!e) return false;
+            var style = window.getComputedStyle(e), rect = e.getBoundingClientRect();
+            return rect.width > 0 && rect.height > 0 && style.display !== 'none' && style.visibility !== 'hidden';
+        """, self))
+
+    def is_enabled(self):
+        return bool(self._driver.execute_script("return !!arguments[0] && !arguments[0].disabled;", self))
+
+    def click(self):
+        """捲動到元素後點擊其中心"""
+        center = self._driver.execute_script("""
+            var e = arguments[0];
+            if (!e) return null;
+            e.scrollIntoView({block: 'center', inline: 'center'});
+            var r = e.getBoundingClientRect();
+            return r.width > 0 && r.height > 0 ? {x: r.left + r.width / 2, y: r.top + r.height / 2} : null;
+        """, self)
+        if center is None:
+            raise ElementNotInteractableException("元素不存在或沒有可點擊的區域")
+        self._driver.click_at(center['x'], center['y'])
+
+    @property
+    def rect(self):
+        return self._driver.execute_script("""
+            var r = arguments[0].getBoundingClientRect();
+            return {x: r.left + window.pageXOffset, y: r.top + window.pageYOffset, width: r.width, height: r.height};
+        """, self)
+
+    @property
+    def size(self):
+        rect = self.rect
+        return {'width': rect['width'], 'height': rect['height']}
+
+    @property
+    def location(self):
+        rect = self.rect
+        return {'x': rect['x'], 'y': rect['y']}
+
+    @property
+    def tag_name(self):
+        return self._driver.execute_script("return arguments[0].tagName.toLowerCase();", self)
+
+    @property
+    def text(self):
+        return self._driver.execute_script("return arguments[0].innerText;", self)
+
+    def find_elements(self, by=By.CSS_SELECTOR, value=None):
+        return self._driver.find_elements(by, value, root=self)
+
+    def find_element(self, by=By.CSS_SELECTOR, value=None):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"找不到元素: {by}={value}")
+        return elements[0]
+
+
+def _encode_arg(value):
+    if isinstance(value, CdpElement):
+        return {'__slotHandle': value.handle}
+    raise TypeError(f"無法傳入腳本的參數: {type(value).__name__}")
+
+
+class _Timeouts:
+    def __init__(self):
+        self.script = 30
+        self.page_load = 30
+        self.implicit_wait = 0
+
+
+class CdpEngine:
+    """在背景執行緒的事件迴圈上維持一條 DevTools 連線"""
+
+    def __init__(self, address):
+        self.address = address
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        with urllib.request.urlopen(f"http://{address}/json/version", timeout=5) as response:
+            ws_url = json.loads(response.read().decode('utf-8'))['webSocketDebuggerUrl']
+        self.connection = AsyncCdpConnection(ws_url)
+        self.run(self.connection.open())
+
+    def run(self, coroutine, timeout=None):
+        """由一般執行緒執行協程並等待結果"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def new_tab(self, page_load_strategy='normal'):
+        tab = self.run(AsyncCdpTab.create(self.connection))
+        return CdpTabDriver(self, tab, page_load_strategy)
+
+    def run_pages(self, urls, handler, concurrency=4, strategy='normal', timeout=30):
+        """以 concurrency 個分頁並行處理 urls，handler 為 async (tab, url) -> 結果"""
+        return self.run(run_pages(self.connection, urls, handler, concurrency, strategy, timeout))
+
+    def close(self):
+        try:
+            self.run(self.connection.close(), timeout=5)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+async def run_pages(connection, urls, handler, concurrency=4, strategy='normal', timeout=30):
+    """多個分頁並行：每個分頁從佇列取網址、載入後交給 handler，回傳 {url: 結果或例外}"""
+    pending = asyncio.Queue()
+    for url in urls:
+        pending.put_nowait(url)
+    results = {}
+
+    async def worker():
+        tab = await AsyncCdpTab.create(connection)
+        try:
+            while not pending.empty():
+                url = pending.get_nowait()
+                try:
+                    await tab.navigate(url, strategy, timeout)
+                    results[url] = await handler(tab, url)
+                except Exception as e:
+                    results[url] = e
+        finally:
+            await tab.close()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(urls)) or 1)))
+    return results
+
+
+class CdpTabDriver:
+    """以 Selenium driver 的介面操作一個 CDP 分頁（同步呼叫，由背景事件迴圈執行）"""
+
+    def __init__(self, engine, tab, page_load_strategy='normal'):
+        self.engine = engine
+        self.tab = tab
+        self.page_load_strategy = page_load_strategy
+        self.timeouts = _Timeouts()
+        self.session_id = tab.session_id
+        self._performance_log = collections.deque(maxlen=PERFORMANCE_LOG_LIMIT)
+        for method in PERFORMANCE_LOG_EVENTS:
+            tab.on(method, lambda params, method=method: self._log_event(method, params))
+
+    def _log_event(self, method, params):
+        self._performance_log.append({
+            'level': 'INFO',
+            'timestamp': int(time.time() * 1000),
+            'message': json.dumps({'message': {'method': method, 'params': params}, 'webview': self.tab.target_id}),
+        })
+
+    def _run(self, coroutine, timeout=None):
+        return self.engine.run(coroutine, timeout)
+
+    def _wrap(self, value):
+        if isinstance(value, dict):
+            if set(value) == {'__slotHandle'}:
+                return CdpElement(self, value['__slotHandle'])
+            return {key: self._wrap(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._wrap(item) for item in value]
+        return value
+
+    # --- 腳本與 CDP ---
+
+    def execute_script(self, script, *args):
+        return self._wrap(self._run(self.tab.run_script(script, args, False, self.timeouts.script)))
+
+    def execute_async_script(self, script, *args):
+        try:
+            return self._wrap(self._run(self.tab.run_script(script, args, True, self.timeouts.script)))
+        except JavascriptException as e:
+            if 'script timeout' in str(e):
+                raise TimeoutException(f"非同步腳本 {self.timeouts.script} 秒內未完成")
+            raise
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self._run(self.tab.send(cmd, cmd_args))
+
+    def set_script_timeout(self, seconds):
+        self.timeouts.script = seconds
+
+    def set_page_load_timeout(self, seconds):
+        self.timeouts.page_load = seconds
+
+    def implicitly_wait(self, seconds):
+        self.timeouts.implicit_wait = seconds
+
+    # --- 導航與頁面資訊 ---
+
+    def get(self, url):
+        self._run(self.tab.navigate(url, self.page_load_strategy, self.timeouts.page_load))
+
+    @property
+    def title(self):
+        return self._run(self.tab.evaluate('document.title'))
+
+    @property
+    def current_url(self):
+        return self._run(self.tab.evaluate('location.href'))
+
+    @property
+    def current_window_handle(self):
+        return self.tab.target_id
+
+    @property
+    def window_handles(self):
+        return [self.tab.target_id]
+
+    @property
+    def capabilities(self):
+        return {'browserName': 'chrome', 'goog:chromeOptions': {'debuggerAddress': self.engine.address}}
+
+    def find_elements(self, by=By.CSS_SELECTOR, value=None, root=None):
+        selectors = {
+            By.CSS_SELECTOR: lambda v: v,
+            By.ID: lambda v: f'[id="{v}"]',
+            By.CLASS_NAME: lambda v: f'.{v}',
+            By.TAG_NAME: lambda v: v,
+        }
+        if by == By.XPATH:
+            return self.execute_script(FIND_ELEMENTS_JS, 'xpath', value, root)
+        if by not in selectors:
+            raise CdpError(f"CDP 引擎不支援的定位方式: {by}")
+        return self.execute_script(FIND_ELEMENTS_JS, 'css', selectors[by](value), root)
+
+    def find_element(self, by=By.CSS_SELECTOR, value=None):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"找不到元素: {by}={value}")
+        return elements[0]
+
+    # --- 截圖與視窗 ---
+
+    def click_at(self, x, y):
+        self._run(self.tab.click(x, y))
+
+    def get_screenshot_as_png(self):
+        return self._run(self.tab.screenshot())
+
+    def save_screenshot(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.get_screenshot_as_png())
+        return True
+
+    get_screenshot_as_file = save_screenshot
+
+    def _set_window_bounds(self, bounds):
+        window = self._run(self.engine.connection.send('Browser.getWindowForTarget', {'targetId': self.tab.target_id}))
+        if bounds.get('windowState') is None:
+            # 改變位置或大小前需先離開全螢幕 / 最大化
+            self._run(self.engine.connection.send('Browser.setWindowBounds', {
+                'windowId': window['windowId'], 'bounds': {'windowState': 'normal'}}))
+        self._run(self.engine.connection.send('Browser.setWindowBounds', {
+            'windowId': window['windowId'], 'bounds': bounds}))
+
+    def fullscreen_window(self):
+        self._set_window_bounds({'windowState': 'fullscreen'})
+
+    def maximize_window(self):
+        self._set_window_bounds({'windowState': 'maximized'})
+
+    def set_window_position(self, x, y):
+        self._set_window_bounds({'left': x, 'top': y})
+
+    def set_window_size(self, width, height):
+        self._set_window_bounds({'width': width, 'height': height})
+
+    def get_log(self, log_type):
+        """取出並清空自上次呼叫以來的網路事件（格式同 chromedriver 的 performance log）"""
+        if log_type != 'performance':
+            raise CdpError(f"CDP 引擎只提供 performance 日誌: {log_type}")
+        entries = []
+        while self._performance_log:
+            entries.append(self._performance_log.popleft())
+        return entries
+
+    # --- 結束 ---
+
+    def close(self):
+        self._run(self.tab.close())
+
+    def quit(self):
+        self.close()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+跨來源廣告 iframe 引擎
+
+Google safeframe 等廣告 iframe 是跨來源（通常在另一個 renderer process），
+頁面 JS 看不到內容，只能隱藏或覆蓋。此引擎直接連上瀏覽器的 DevTools
+websocket，以 Target.setAutoAttach (flatten) 取得每個廣告 iframe 的 session，
+在 iframe 內量測實際素材尺寸並替換內容。所有 iframe 的指令一次送出、
+統一收回應，不需要逐一 switch_to.frame。
+
+需要 websocket-client 套件；未安裝或無法連線時 available() 為 False，
+呼叫端應改用原本的頁面層替換。
+"""
+
+import json
+import time
+import urllib.request
+
+try:
+    import websocket
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    websocket = None
+    WEBSOCKET_AVAILABLE = False
+
+# 視為廣告 iframe 的網址關鍵字
+AD_FRAME_URL_KEYWORDS = ('googlesyndication', 'doubleclick', 'safeframe', 'googleads')
+
+# 在 iframe 內量測：素材為可見元素中面積最大者，沒有時以 iframe 視窗大小為準
+MEASURE_CREATIVE_JS = """
+(function() {
+    var best = null, bestArea = 0;
+    var nodes = document.querySelectorAll('img, canvas, video, iframe, a, div');
+    for (var i = 0; i < nodes.length; i++) {
+        var rect = nodes[i].getBoundingClientRect();
+        var area = rect.width * rect.height;
+        if (area > bestArea && rect.width <= window.innerWidth + 1 && rect.height <= window.innerHeight + 1) {
+            best = rect;
+            bestArea = area;
+        }
+    }
+    return {
+        width: Math.round(best ? best.width : window.innerWidth),
+        height: Math.round(best ? best.height : window.innerHeight),
+        viewportWidth: window.innerWidth,
+        viewportHeight: window.innerHeight
+    };
+})()
+"""
+
+REPLACE_CREATIVE_JS = """
+(function(args) {
+    if (!document.body) return false;
+    if (window.__adFrameOriginal === undefined) {
+        window.__adFrameOriginal = {html: document.body.innerHTML, style: document.body.style.cssText};
+    }
+    document.body.innerHTML = '';
+    document.body.style.cssText = 'margin:0;padding:0;overflow:hidden;position:relative;';
+
+    var img = document.createElement('img');
+    img.src = 'data:' + args.mime + ';base64,' + args.imageData;
+    img.style.cssText = 'display:block;width:' + args.width + 'px;height:' + args.height + 'px;border:none;';
+    document.body.appendChild(img);
+
+    if (!args.isNoneMode) {
+        [[args.infoHtml, args.infoStyle], [args.closeHtml, args.closeStyle]].forEach(function(button) {
+            if (!button[0]) return;
+            var div = document.createElement('div');
+            div.innerHTML = button[0];
+            div.style.cssText = button[1];
+            document.body.appendChild(div);
+        });
+    }
+    return true;
+})(%s)
+"""
+
+RESTORE_CREATIVE_JS = """
+(function() {
+    if (window.__adFrameOriginal === undefined) return false;
+    document.body.innerHTML = window.__adFrameOriginal.html;
+    document.body.style.cssText = window.__adFrameOriginal.style;
+    delete window.__adFrameOriginal;
+    return true;
+})()
+"""
+
+
+class CrossOriginFrameEngine:
+    """以 flatten session 直接操作跨來源廣告 iframe"""
+
+    def __init__(self, driver, url_keywords=AD_FRAME_URL_KEYWORDS):
+        self.driver = driver
+        self.url_keywords = url_keywords
+        self.ws = None
+        self.page_session = None
+        self.page_target = None
+        self.frames = {}            # sessionId -> {'target_id', 'url', 'parent_session'}
+        self.replaced_sessions = []
+        self._next_id = 0
+
+    def available(self):
+        """websocket-client 已安裝且可取得瀏覽器 DevTools 位址"""
+        return WEBSOCKET_AVAILABLE and bool(self._debugger_address())
+
+    def _debugger_address(self):
+        return (self.driver.capabilities.get('goog:chromeOptions') or {}).get('debuggerAddress')
+
+    def connect(self):
+        if self.ws is not None:
+            return
+        with urllib.request.urlopen(f"http://{self._debugger_address()}/json/version", timeout=5) as response:
+            info = json.loads(response.read().decode('utf-8'))
+        self.ws = websocket.create_connection(info['webSocketDebuggerUrl'], suppress_origin=True)
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+        self.ws = None
+        self.page_session = None
+        self.page_target = None
+        self.frames = {}
+        self.replaced_sessions = []
+
+    # --- CDP 指令收送 ---
+
+    def _send(self, method, params=None, session_id=None):
+        self._next_id += 1
+        message = {'id': self._next_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        self.ws.send(json.dumps(message))
+        return self._next_id
+
+    def _handle_event(self, message):
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Target.attachedToTarget':
+            target = params['targetInfo']
+            session_id = params['sessionId']
+            if target.get('type') == 'iframe':
+                self.frames[session_id] = {
+                    'target_id': target['targetId'],
+                    'url': target.get('url', ''),
+                    'parent_session': message.get('sessionId'),
+                }
+                # 巢狀的 safeframe 也要自動連上
+                self._send('Target.setAutoAttach', {
+                    'autoAttach': True, 'waitForDebuggerOnStart': False, 'flatten': True
+                }, session_id)
+        elif method == 'Target.detachedFromTarget':
+            self.frames.pop(params.get('sessionId'), None)
+
+    def _read(self, pending_ids, timeout):
+        """讀取訊息直到 pending_ids 全部回應或逾時，途中處理事件"""
+        results = {}
+        pending = set(pending_ids)
+        deadline = time.time() + timeout
+        while time.time() < deadline and (pending or not pending_ids):
+            self.ws.settimeout(max(0.05, deadline - time.time()))
+            try:
+                message = json.loads(self.ws.recv())
+            except websocket.WebSocketTimeoutException:
+                break
+            if 'id' in message:
+                if message['id'] in pending:
+                    results[message['id']] = message
+                    pending.discard(message['id'])
+            else:
+                self._handle_event(message)
+        return results
+
+    def call_many(self, commands, timeout=10):
+        """一次送出多個 (method, params, session_id) 指令，依序回傳 result（失敗為 None）"""
+        ids = [self._send(method, params, session_id) for method, params, session_id in commands]
+        responses = self._read(ids, timeout)
+        return [responses.get(i, {}).get('result') for i in ids]
+
+    def call(self, method, params=None, session_id=None, timeout=10):
+        return self.call_many([(method, params, session_id)], timeout)[0]
+
+    # --- 廣告 iframe 操作 ---
+
+    def _attach_current_page(self):
+        target_id = self.driver.current_window_handle  # chromedriver 的視窗 handle 即 targetId
+        if self.page_target == target_id and self.page_session:
+            return
+        result = self.call('Target.attachToTarget', {'targetId': target_id, 'flatten': True})
+        self.page_session = result['sessionId']
+        self.page_target = target_id
+        self.frames = {}
+        self.call('Target.setAutoAttach', {
+            'autoAttach': True, 'waitForDebuggerOnStart': False, 'flatten': True
+        }, self.page_session)
+
+    def _top_level_session(self, session_id):
+        """巢狀 iframe 往上找到直接嵌在頁面中的那一層"""
+        while session_id in self.frames and self.frames[session_id]['parent_session'] != self.page_session:
+            session_id = self.frames[session_id]['parent_session']
+        return session_id
+
+    def discover(self, settle_time=0.5):
+        """連上目前頁面的所有廣告 iframe 並量測素材尺寸
+
+        回傳 [{'session_id', 'url', 'width', 'height', 'owner_backend_node_id'}]，
+        owner 為頁面中對應的 <iframe> 元素（巢狀時為最外層）。
+        """
+        self.connect()
+        self._attach_current_page()
+        # 等待既有 iframe 的 attachedToTarget 事件
+        self._read([], settle_time)
+
+        sessions = [sid for sid, frame in self.frames.items()
+                    if any(keyword in frame['url'] for keyword in self.url_keywords)]
+        if not sessions:
+            return []
+
+        measurements = self.call_many([
+            ('Runtime.evaluate', {'expression': MEASURE_CREATIVE_JS, 'returnByValue': True}, sid)
+            for sid in sessions
+        ])
+        top_sessions = [self._top_level_session(sid) for sid in sessions]
+        self.call('DOM.getDocument', {'depth': 0}, self.page_session)
+        owners = self.call_many([
+            ('DOM.getFrameOwner', {'frameId': self.frames[top]['target_id']}, self.page_session)
+            for top in top_sessions
+        ])
+
+        frames = []
+        for sid, measurement, owner in zip(sessions, measurements, owners):
+            value = ((measurement or {}).get('result') or {}).get('value')
+            if not value or not owner:
+                continue
+            frames.append({
+                'session_id': sid,
+                'url': self.frames[sid]['url'],
+                'width': value['width'],
+                'height': value['height'],
+                'owner_backend_node_id': owner.get('backendNodeId'),
+            })
+        return frames
+
+    def replace_frames(self, slots, button_style, is_none_mode):
+        """在多個 iframe 內同時替換素材，slots 需含 frame、image_data、width、height、is_gif"""
+        commands = []
+        for slot in slots:
+            args = {
+                'imageData': slot['image_data'],
+                'mime': 'image/gif' if slot.get('is_gif') else 'image/png',
+                'width': slot['width'],
+                'height': slot['height'],
+                'isNoneMode': is_none_mode,
+                'closeHtml': '' if is_none_mode else button_style['close_button']['html'],
+                'closeStyle': '' if is_none_mode else button_style['close_button']['style'],
+                'infoHtml': '' if is_none_mode else button_style['info_button']['html'],
+                'infoStyle': '' if is_none_mode else button_style['info_button']['style'],
+            }
+            commands.append(('Runtime.evaluate', {
+                'expression': REPLACE_CREATIVE_JS % json.dumps(args),
+                'returnByValue': True
+            }, slot['frame']['session_id']))
+
+        outcomes = []
+        for slot, result in zip(slots, self.call_many(commands)):
+            ok = bool(((result or {}).get('result') or {}).get('value'))
+            if ok:
+                self.replaced_sessions.append(slot['frame']['session_id'])
+            outcomes.append(ok)
+        return outcomes
+
+    def restore_frames(self):
+        """還原所有替換過的 iframe"""
+        if not self.replaced_sessions or self.ws is None:
+            return
+        self.call_many([
+            ('Runtime.evaluate', {'expression': RESTORE_CREATIVE_JS, 'returnByValue': True}, sid)
+            for sid in self.replaced_sessions
+        ])
+        self.replaced_sessions = []
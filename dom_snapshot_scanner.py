@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+DOMSnapshot 廣告位置掃描器
+
+以一次 CDP DOMSnapshot.captureSnapshot 取得整份文件（含同源 iframe）的
+版面方塊、屬性與計算樣式，之後在 Python 端比對尺寸，不需要在頁面主執行緒
+執行 querySelectorAll('*') 並逐一呼叫 getBoundingClientRect。
+"""
+
+from size_matcher import match_sizes
+
+# 取得計算樣式的欄位順序（layout.styles 依此順序給出字串索引）
+SNAPSHOT_STYLES = ['display', 'visibility', 'opacity', 'background-image', 'position']
+
+# 與頁面腳本掃描一致的廣告關鍵字
+AD_KEYWORDS = ['ad', 'advertisement', 'banner', 'google', 'ads', 'ad-', '-ad']
+
+
+class PageSnapshot:
+    """單次 DOMSnapshot 的解析結果，boxes 為每個有版面方塊的元素"""
+
+    def __init__(self, raw):
+        self.strings = raw.get('strings', [])
+        self.documents = raw.get('documents', [])
+        self.boxes = []
+        self.frame_owners = {}      # 子文件 index -> 主文件中包含它的 iframe 方塊
+        self.scroll_x = 0
+        self.scroll_y = 0
+        if self.documents:
+            self.scroll_x = self.documents[0].get('scrollOffsetX', 0) or 0
+            self.scroll_y = self.documents[0].get('scrollOffsetY', 0) or 0
+        self._parse()
+
+    def _string(self, index):
+        if index is None or index < 0 or index >= len(self.strings):
+            return ''
+        return self.strings[index]
+
+    def _parse(self):
+        # 每份文件相對於主文件的位移（iframe 內文件的座標以 iframe 方塊為原點）
+        offsets = {0: (0.0, 0.0)}
+        layout_by_doc = []
+        owner_nodes = {}            # 子文件 index -> (所在文件, iframe 節點)
+
+        for doc_index, document in enumerate(self.documents):
+            nodes = document.get('nodes', {})
+            layout = document.get('layout', {})
+            node_bounds = {}
+            for layout_index, node_index in enumerate(layout.get('nodeIndex', [])):
+                node_bounds[node_index] = layout_index
+            layout_by_doc.append(node_bounds)
+
+            content_docs = nodes.get('contentDocumentIndex', {})
+            base_x, base_y = offsets.get(doc_index, (0.0, 0.0))
+            for node_index, child_doc in zip(content_docs.get('index', []), content_docs.get('value', [])):
+                layout_index = node_bounds.get(node_index)
+                if layout_index is None:
+                    continue
+                x, y = layout['bounds'][layout_index][:2]
+                offsets[child_doc] = (base_x + x, base_y + y)
+                owner_nodes[child_doc] = (doc_index, node_index)
+
+        for doc_index, document in enumerate(self.documents):
+            nodes = document.get('nodes', {})
+            layout = document.get('layout', {})
+            parent_index = nodes.get('parentIndex', [])
+            node_names = nodes.get('nodeName', [])
+            attributes = nodes.get('attributes', [])
+            backend_ids = nodes.get('backendNodeId', [])
+            base_x, base_y = offsets.get(doc_index, (0.0, 0.0))
+
+            # 祖先 opacity:0 / visibility:hidden 時整個子樹視為不可見（與 TreeWalker FILTER_REJECT 一致）
+            hidden_nodes = set()
+            styles_by_node = {}
+            for layout_index, node_index in enumerate(layout.get('nodeIndex', [])):
+                style_values = [self._string(i) for i in layout['styles'][layout_index]]
+                styles_by_node[node_index] = dict(zip(SNAPSHOT_STYLES, style_values))
+
+            for node_index in range(len(parent_index)):
+                parent = parent_index[node_index]
+                style = styles_by_node.get(node_index)
+                if parent >= 0 and parent in hidden_nodes:
+                    hidden_nodes.add(node_index)
+                elif style and (style.get('visibility') == 'hidden' or style.get('opacity') == '0'):
+                    hidden_nodes.add(node_index)
+
+            for layout_index, node_index in enumerate(layout.get('nodeIndex', [])):
+                if node_index in hidden_nodes or node_index >= len(node_names):
+                    continue
+                tag = self._string(node_names[node_index]).lower()
+                if not tag or tag.startswith('#') or tag.startswith('::'):
+                    continue
+                x, y, width, height = layout['bounds'][layout_index][:4]
+                if width <= 0 or height <= 0:
+                    continue
+
+                attrs = {}
+                raw_attrs = attributes[node_index] if node_index < len(attributes) else []
+                for i in range(0, len(raw_attrs) - 1, 2):
+                    attrs[self._string(raw_attrs[i])] = self._string(raw_attrs[i + 1])
+
+                style = styles_by_node.get(node_index, {})
+                self.boxes.append({
+                    'doc': doc_index,
+                    'node_index': node_index,
+                    'backend_node_id': backend_ids[node_index] if node_index < len(backend_ids) else None,
+                    'tag': tag,
+                    'id': attrs.get('id', ''),
+                    'class': attrs.get('class', ''),
+                    'src': attrs.get('src', ''),
+                    'attributes': attrs,
+                    'x': base_x + x,
+                    'y': base_y + y,
+                    'width': round(width),
+                    'height': round(height),
+                    'background_image': style.get('background-image', 'none'),
+                    'position': style.get('position', ''),
+                })
+
+        # 子文件（同源 iframe）一路往上找到主文件中的 iframe 方塊
+        boxes_by_node = {(box['doc'], box['node_index']): box for box in self.boxes}
+        for child_doc in owner_nodes:
+            doc_index, node_index = owner_nodes[child_doc]
+            while doc_index != 0 and doc_index in owner_nodes:
+                doc_index, node_index = owner_nodes[doc_index]
+            owner = boxes_by_node.get((doc_index, node_index)) if doc_index == 0 else None
+            if owner:
+                self.frame_owners[child_doc] = owner
+
+    def is_likely_ad(self, box):
+        """與頁面腳本掃描相同的判斷：廣告關鍵字、img/iframe/div 或有背景圖片"""
+        haystack = ' '.join([box['class'], box['id'], box['src']]).lower()
+        has_ad_keyword = any(keyword in haystack for keyword in AD_KEYWORDS)
+        is_image_element = box['tag'] in ('img', 'iframe', 'div')
+        has_background_image = bool(box['background_image']) and box['background_image'] != 'none'
+        return has_ad_keyword or is_image_element or has_background_image
+
+    def _candidate_box(self, box):
+        """主文件方塊原樣使用；同源 iframe 內的方塊以主文件中的 iframe 元素代表（保留內容的尺寸與位置）"""
+        if box['doc'] == 0:
+            return box
+        owner = self.frame_owners.get(box['doc'])
+        if owner is None:
+            return None
+        return dict(box, doc=0, node_index=owner['node_index'], backend_node_id=owner['backend_node_id'],
+                    frame_content=True)
+
+    def match_ad_boxes(self, target_sizes, tolerance=0, tolerances=None):
+        """所有文件中可能是廣告的方塊與所有目標尺寸一次比對，回傳排序後的比對表
+
+        同源 iframe 內的素材以其在主文件中的 iframe 元素代表，WebElement 才能在主文件中取回。
+        同一目標尺寸中位置重複或代表同一個元素的方塊只保留排名最前者。
+        """
+        candidates = []
+        for box in self.boxes:
+            if not self.is_likely_ad(box):
+                continue
+            candidate = self._candidate_box(box)
+            if candidate is not None:
+                candidates.append(candidate)
+        table = []
+        seen_positions = set()
+        seen_nodes = set()
+        for row in match_sizes(candidates, target_sizes, tolerance, tolerances):
+            box = row['candidate']
+            position_key = (row['size_key'], round(box['x']), round(box['y']))
+            node_key = (row['size_key'], box['backend_node_id'])
+            if position_key in seen_positions or node_key in seen_nodes:
+                continue
+            seen_positions.add(position_key)
+            seen_nodes.add(node_key)
+            table.append(row)
+        return table
+
+    def find_ad_boxes(self, target_width, target_height, tolerance=0):
+        """尋找符合尺寸的廣告方塊，依差距與頁面位置排序"""
+        table = self.match_ad_boxes([(target_width, target_height)], tolerance)
+        return [row['candidate'] for row in table]
+
+    def size_distribution(self, min_size=50):
+        """統計所有元素的尺寸分佈（取代 querySelectorAll('*') 的頁面腳本）"""
+        size_map = {}
+        for box in self.boxes:
+            if box['width'] <= min_size or box['height'] <= min_size:
+                continue
+            size_key = f"{box['width']}x{box['height']}"
+            entry = size_map.setdefault(size_key, {'count': 0, 'elements': []})
+            entry['count'] += 1
+            if len(entry['elements']) < 3:
+                entry['elements'].append({'tag': box['tag'], 'class': box['class'], 'id': box['id']})
+        return size_map
+
+
+def capture_snapshot(driver):
+    """以一次 CDP 呼叫取得整份文件的版面快照"""
+    raw = driver.execute_cdp_cmd('DOMSnapshot.captureSnapshot', {
+        'computedStyles': SNAPSHOT_STYLES,
+        'includeDOMRects': False,
+        'includePaintOrder': False,
+    })
+    return PageSnapshot(raw)
+
+
+def resolve_elements(driver, boxes, marker='data-snapshot-slot'):
+    """把快照方塊轉成 WebElement：以 backendNodeId 標記節點後一次查詢取回，取回後移除標記"""
+    boxes = [box for box in boxes if box.get('backend_node_id') is not None]
+    if not boxes:
+        return {}
+
+    driver.execute_cdp_cmd('DOM.getDocument', {'depth': 0})
+    pushed = driver.execute_cdp_cmd('DOM.pushNodesByBackendIdsToFrontend', {
+        'backendNodeIds': [box['backend_node_id'] for box in boxes]
+    })
+    for box, node_id in zip(boxes, pushed.get('nodeIds', [])):
+        if node_id:
+            driver.execute_cdp_cmd('DOM.setAttributeValue', {
+                'nodeId': node_id, 'name': marker, 'value': str(box['backend_node_id'])
+            })
+
+    elements = driver.execute_script("""
+        var marker = arguments[0];
+        var found = {};
+        document.querySelectorAll('[' + marker + ']').forEach(function(el) {
+            found[el.getAttribute(marker)] = el;
+            el.removeAttribute(marker);
+        });
+        return found;
+    """, marker)
+    return {int(key): element for key, element in (elements or {}).items()}
+
+
+def scan_for_ads(driver, target_width, target_height, tolerance=0):
+    """以 DOMSnapshot 掃描符合尺寸的廣告，回傳與 scan_entire_page_for_ads 相同格式的列表"""
+    snapshot = capture_snapshot(driver)
+    print(f"DOMSnapshot 取得 {len(snapshot.boxes)} 個版面方塊，開始比對尺寸...")
+
+    boxes = snapshot.find_ad_boxes(target_width, target_height, tolerance)
+    elements = resolve_elements(driver, boxes)
+
+    matching_elements = []
+    for box in boxes:
+        element = elements.get(box['backend_node_id'])
+        if element is None:
+            continue
+        top = box['y'] - snapshot.scroll_y
+        left = box['x'] - snapshot.scroll_x
+        matching_elements.append({
+            'element': element,
+            'width': box['width'],
+            'height': box['height'],
+            'position': f"top:{top:.0f}, left:{left:.0f}"
+        })
+        print(f"找到符合尺寸的廣告元素: {box['width']}x{box['height']} at {top:.0f},{left:.0f}")
+
+    print(f"掃描完成，找到 {len(matching_elements)} 個符合尺寸的廣告元素")
+    return matching_elements
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+提早開始掃描的導航模式
+
+搭配 'eager' / 'none' 頁面載入策略，driver.get() 不必等到 load 事件。
+文件開始時注入的腳本會持續檢查設定的廣告位置，當位置已出現且有尺寸、
+並在一小段時間內不再增加時發出「廣告位置就緒」訊號，掃描就從這時開始；
+若截圖不需要其餘資源（追蹤器、影片等），以 window.stop() 停止載入。
+"""
+
+import json
+import time
+
+DEFAULT_READY_SELECTOR = ', '.join([
+    'ins.adsbygoogle',
+    'div[id^="div-gpt-ad"]',
+    'div[id*="google_ads"]',
+    'iframe[src*="googlesyndication"]',
+    'iframe[src*="doubleclick"]',
+    'iframe[id^="google_ads_iframe"]',
+    'iframe[id^="aswift_"]',
+])
+
+SLOTS_READY_SCRIPT = """
+(function(options) {
+    if (window.__adSlotsReady) return;
+    var state = window.__adSlotsReady = {
+        docId: Date.now().toString(36) + '-' + Math.random().toString(36).substr(2, 9),
+        ready: false,
+        reason: '',
+        slots: 0
+    };
+    var lastCount = -1;
+    var stableSince = Date.now();
+    var markReady = function(reason) {
+        if (state.ready) return;
+        state.ready = true;
+        state.reason = reason;
+        clearInterval(timer);
+    };
+    var check = function() {
+        var count = 0;
+        var elements = document.querySelectorAll(options.selector);
+        for (var i = 0; i < elements.length; i++) {
+            var rect = elements[i].getBoundingClientRect();
+            if (rect.width > 0 && rect.height > 0) count++;
+        }
+        if (count !== lastCount) {
+            lastCount = count;
+            stableSince = Date.now();
+        }
+        state.slots = count;
+        if (count >= options.minSlots && Date.now() - stableSince >= options.quietMs) markReady('slots');
+    };
+    var timer = setInterval(check, 100);
+    window.addEventListener('load', function() { check(); markReady('load'); });
+})(%s);
+"""
+
+WAIT_READY_SCRIPT = """
+var previousDocId = arguments[0];
+var timeoutMs = arguments[1];
+var done = arguments[arguments.length - 1];
+var start = Date.now();
+var poll = function() {
+    var state = window.__adSlotsReady;
+    var isNewDocument = state && state.docId !== previousDocId;
+    if (isNewDocument && state.ready) {
+        return done({ready: true, reason: state.reason, slots: state.slots, docId: state.docId, readyState: document.readyState});
+    }
+    if (Date.now() - start > timeoutMs) {
+        return done({ready: false, reason: 'timeout', slots: state ? state.slots : 0,
+                     docId: state ? state.docId : null, readyState: document.readyState});
+    }
+    setTimeout(poll, 100);
+};
+poll();
+"""
+
+
+def build_slots_ready_script(selector=DEFAULT_READY_SELECTOR, min_slots=1, quiet_ms=800):
+    return SLOTS_READY_SCRIPT % json.dumps({'selector': selector, 'minSlots': min_slots, 'quietMs': quiet_ms})
+
+
+def install_slots_ready_signal(driver, selector=DEFAULT_READY_SELECTOR, min_slots=1, quiet_ms=800):
+    """將就緒訊號註冊到之後每一次導航的文件開始階段，成功回傳 True"""
+    try:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+            'source': build_slots_ready_script(selector, min_slots, quiet_ms)
+        })
+        return True
+    except Exception as e:
+        print(f"安裝廣告位置就緒訊號失敗，改為載入後啟動: {e}")
+        return False
+
+
+def navigate_early(driver, url, timeout=15, stop_loading=True, signal_installed=True,
+                   selector=DEFAULT_READY_SELECTOR, min_slots=1, quiet_ms=800):
+    """導航並等到廣告位置就緒（而非 load 事件），需要時停止其餘載入，回傳狀態 dict
+
+    driver 需以 'eager' 或 'none' 頁面載入策略建立。signal_installed 為
+    install_slots_ready_signal 的結果；為 False 時在 driver.get() 返回後才啟動訊號，
+    此時需使用 'eager'（'none' 可能仍停留在上一頁）。
+    """
+    start = time.time()
+    try:
+        previous_doc_id = driver.execute_script("return window.__adSlotsReady ? window.__adSlotsReady.docId : null;")
+    except Exception:
+        previous_doc_id = None
+
+    driver.get(url)
+    if not signal_installed:
+        driver.execute_script(build_slots_ready_script(selector, min_slots, quiet_ms))
+
+    previous_timeout = driver.timeouts.script
+    driver.set_script_timeout(timeout + 5)
+    try:
+        try:
+            state = driver.execute_async_script(WAIT_READY_SCRIPT, previous_doc_id, int(timeout * 1000))
+        except Exception:
+            # 'none' 策略下腳本可能在上一頁執行、隨即被卸載，於新文件重試一次
+            remaining = max(1, timeout - (time.time() - start))
+            state = driver.execute_async_script(WAIT_READY_SCRIPT, previous_doc_id, int(remaining * 1000))
+    finally:
+        driver.set_script_timeout(previous_timeout)
+
+    state['stopped'] = False
+    if stop_loading and state['readyState'] != 'complete':
+        state['stopped'] = driver.execute_script(
+            "if (document.readyState !== 'complete') { window.stop(); return true; } return false;")
+
+    state['elapsed'] = time.time() - start
+    status = "✅ 廣告位置就緒" if state['ready'] else "⏱️ 等待廣告位置逾時"
+    stopped = "，已停止其餘載入" if state['stopped'] else ""
+    print(f"{status} ({state['reason']}, {state['slots']} 個位置, {state['elapsed']:.1f} 秒{stopped})")
+    return state
@@ -8,10 +8,20 @@ import base64
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from dom_snapshot_scanner import capture_snapshot, scan_for_ads
+from batched_replace import replace_slots_batched
+from lazy_sweep import sweep_lazy_ads
+from resource_blocking import ResourceBlocker, enable_network_log
+from browser_backend import open_browser
+from browser_supervisor import BrowserSupervisor, BrowserUnrecoverable
+from stage_watchdog import StageTimeout, StageWatchdog
+from run_ledger import RunLedger
+from results_store import ResultsStore
+from seen_urls import SeenUrlIndex
+from slot_yield import SlotYieldMemory
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -47,6 +57,145 @@ except ImportError:
     # GIF 使用策略預設設定
     GIF_PRIORITY = True
     # RANDOM_SELECTION = False  # 已移除隨機選擇功能
+    # 廣告位置掃描預設設定
+    USE_DOM_SNAPSHOT_SCAN = True
+    # 懶載入觸發預設設定
+    LAZY_LOAD_SWEEP = True
+    LAZY_SWEEP_BAND_TIMEOUT = 1.5
+    LAZY_SWEEP_MAX_SECONDS = 15
+    # 資源封鎖預設設定
+    RESOURCE_BLOCKING = True
+    RESOURCE_BLOCKING_DRY_RUN = False
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
+    # 瀏覽器監控預設設定
+    BROWSER_SUPERVISOR = True
+    BROWSER_MAX_PAGES = 40
+    BROWSER_MAX_MEMORY_MB = 2500
+    BROWSER_COMMAND_TIMEOUT = 10
+    BROWSER_PAGE_TIMEOUT = 300
+    # 階段時限預設設定
+    STAGE_WATCHDOG = True
+    STAGE_BUDGETS = None
+    STAGE_ABORT_GRACE = 5
+    # 檢查點預設設定
+    CHECKPOINT_LEDGER = True
+    CHECKPOINT_DIR = "checkpoints"
+    CHECKPOINT_FSYNC_EVERY = 5
+    # 結果資料庫預設設定
+    RESULTS_DB = "results.db"
+    # 已截圖網址索引預設設定
+    SEEN_URL_FILTER = True
+    SEEN_URL_DB = "seen_urls.db"
+    SEEN_URL_EXPIRY_DAYS = 30
+    SEEN_URL_SITE_EXPIRY_DAYS = {}
+    # 版位產出記憶預設設定
+    SLOT_YIELD_MEMORY = True
+    SLOT_YIELD_DB = "slot_yield.db"
+    SLOT_YIELD_WINDOW_DAYS = 60
+    SLOT_YIELD_SKIP_AFTER = 3
+
+# 按鈕位置依 BUTTON_TOP_OFFSET 調整，{actual_top} 於替換時代入
+GOOGLE_AD_STYLES_CSS_TEMPLATE = """
+div {
+    margin: 0;
+    padding: 0;
+}
+.abgb {
+    position: absolute;
+    right: 17px;
+    top: {actual_top}px;
+}
+.abgb {
+    display: inline-block;
+    height: 15px;
+}
+.abgc {
+    cursor: pointer;
+}
+.abgc {
+    display: block;
+    height: 15px;
+    position: absolute;
+    right: 1px;
+    top: {actual_top}px;
+    text-rendering: geometricPrecision;
+    z-index: 2147483646;
+}
+.abgc .il-wrap {
+    background-color: #ffffff;
+    height: 15px;
+    white-space: nowrap;
+}
+.abgc .il-icon {
+    height: 15px;
+    width: 15px;
+}
+.abgc .il-icon svg {
+    fill: #00aecd;
+}
+.abgs svg, .abgb svg {
+    display: inline-block;
+    height: 15px;
+    width: 15px;
+    vertical-align: top;
+}
+#close_button { 
+    text-decoration: none; 
+    margin: 0; 
+    padding: 0; 
+    border: none;
+    cursor: pointer;
+    position: absolute; 
+    z-index: 100; 
+    top: {actual_top}px;
+    bottom: auto;
+    vertical-align: top;
+    margin-top: 0px;
+    right: 1px;
+    left: auto;
+    text-align: right;
+    margin-right: 0px;
+    display: block; 
+    width: 15px; 
+    height: 15px;
+}
+#close_button #close_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+#abgb #info_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+[id^="close_button_"] { 
+    text-decoration: none; 
+    margin: 0; 
+    padding: 0; 
+    border: none;
+    cursor: pointer;
+    position: absolute !important; 
+    z-index: 100 !important; 
+    top: {actual_top}px !important;
+    right: 1px !important;
+    display: block !important; 
+    width: 15px !important; 
+    height: 15px !important;
+    background-color: rgba(255,255,255,1) !important;
+}
+[id^="abgb_"] { 
+    position: absolute !important;
+    right: 17px !important;
+    top: {actual_top}px !important;
+    width: 15px !important; 
+    height: 15px !important;
+    z-index: 100 !important;
+    display: block !important;
+    background-color: rgba(255,255,255,1) !important;
+}
+"""
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -265,7 +414,17 @@ class EttodayAdReplacer:
         self.total_replacements = 0     # 總替換次數
         self.gif_replacements = 0       # GIF 替換次數
         self.static_replacements = 0    # 靜態圖片替換次數
-        self.replacement_details = []   # 詳細替換記錄
+        self.results = ResultsStore(RESULTS_DB, 'ettoday', SCREENSHOT_COUNT)  # 詳細替換記錄（SQLite）
+        self.ledger = None              # 檢查點帳本（由 main 設定）
+        # 跨執行的已截圖網址，探索文章時略過
+        self.seen_urls = None
+        if SEEN_URL_FILTER:
+            self.seen_urls = SeenUrlIndex(SEEN_URL_DB, 'ettoday', SEEN_URL_SITE_EXPIRY_DAYS.get('ettoday', SEEN_URL_EXPIRY_DAYS))
+        # 各網址與網址樣式的版位產出，探索文章時依預期產出排序
+        self.slot_yield = None
+        if SLOT_YIELD_MEMORY:
+            self.slot_yield = SlotYieldMemory(SLOT_YIELD_DB, 'ettoday', SLOT_YIELD_WINDOW_DAYS, SLOT_YIELD_SKIP_AFTER)
+        self.page_slot_sizes = None     # 本頁找到的版位尺寸，尚未完成掃描時為 None
         
         self.setup_driver(headless)
         self.load_replace_images()
@@ -314,17 +473,39 @@ class EttodayAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
+        if RESOURCE_BLOCKING:
+            enable_network_log(chrome_options)
+        
         print("正在啟動 Chrome 瀏覽器...")
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
         print("Chrome 瀏覽器啟動成功！")
         
+        # 封鎖影片、字型與追蹤器等不影響廣告截圖的資源（重啟瀏覽器時沿用先前的統計）
+        previous_blocker = getattr(self, 'resource_blocker', None)
+        self.resource_blocker = None
+        if RESOURCE_BLOCKING:
+            self.resource_blocker = ResourceBlocker(self.driver, 'ettoday', RESOURCE_BLOCKING_DRY_RUN)
+            if previous_blocker:
+                self.resource_blocker.totals = previous_blocker.totals
+                self.resource_blocker.known_sizes = previous_blocker.known_sizes
+            self.resource_blocker.apply()
+        
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
         
         # 設置超時時間
         self.driver.set_page_load_timeout(30)  # 增加到30秒
         self.driver.implicitly_wait(10)  # 隱式等待10秒
+        
+        # 各階段時限：卡住時中止頁面工作，重啟瀏覽器時沿用先前的統計
+        previous_watchdog = getattr(self, 'watchdog', None)
+        self.watchdog = StageWatchdog(self.driver, STAGE_BUDGETS, STAGE_ABORT_GRACE, enabled=STAGE_WATCHDOG)
+        self.watchdog.carry_over(previous_watchdog)
+        self.watchdog.listener = self.results.record_stage
         print("瀏覽器設置完成！")
     
     def move_to_screen(self):
@@ -527,6 +708,12 @@ class EttodayAdReplacer:
                         print(f"搜尋連結失敗 ({selector}): {e}")
                         continue
                 
+                # 略過先前已截圖的文章，並依預期產出排序
+                if news_urls and self.seen_urls:
+                    news_urls = self.seen_urls.filter_new(news_urls)
+                if news_urls and self.slot_yield:
+                    news_urls = self.slot_yield.prioritize(news_urls)
+                
                 if news_urls:
                     # 選擇前 N 個新聞連結（已移除隨機選擇）
                     selected_urls = news_urls[:min(NEWS_COUNT, len(news_urls))]
@@ -555,38 +742,47 @@ class EttodayAdReplacer:
     def analyze_page_sizes(self):
         """分析頁面上所有元素的尺寸分佈"""
         try:
-            size_distribution = self.driver.execute_script("""
-                var sizeMap = {};
-                var elements = document.querySelectorAll('*');
+            size_distribution = None
+            if USE_DOM_SNAPSHOT_SCAN:
+                try:
+                    size_distribution = capture_snapshot(self.driver).size_distribution(min_size=50)
+                except Exception as e:
+                    print(f"DOMSnapshot 分析失敗，改用頁面腳本分析: {e}")
+            
+            if size_distribution is None:
+                with self.watchdog.stage('scan'):
+                    size_distribution = self.driver.execute_script("""
+                        var sizeMap = {};
+                        var elements = document.querySelectorAll('*');
                 
-                for (var i = 0; i < elements.length; i++) {
-                    var element = elements[i];
-                    var rect = element.getBoundingClientRect();
-                    var width = Math.round(rect.width);
-                    var height = Math.round(rect.height);
+                        for (var i = 0; i < elements.length; i++) {
+                            var element = elements[i];
+                            var rect = element.getBoundingClientRect();
+                            var width = Math.round(rect.width);
+                            var height = Math.round(rect.height);
                     
-                    // 只記錄可見且有一定尺寸的元素
-                    if (width > 50 && height > 50 && rect.width > 0 && rect.height > 0) {
-                        var sizeKey = width + 'x' + height;
-                        if (!sizeMap[sizeKey]) {
-                            sizeMap[sizeKey] = {
-                                count: 0,
-                                elements: []
-                            };
-                        }
-                        sizeMap[sizeKey].count++;
-                        if (sizeMap[sizeKey].elements.length < 3) {
-                            sizeMap[sizeKey].elements.push({
-                                tag: element.tagName.toLowerCase(),
-                                class: element.className || '',
-                                id: element.id || ''
-                            });
+                            // 只記錄可見且有一定尺寸的元素
+                            if (width > 50 && height > 50 && rect.width > 0 && rect.height > 0) {
+                                var sizeKey = width + 'x' + height;
+                                if (!sizeMap[sizeKey]) {
+                                    sizeMap[sizeKey] = {
+                                        count: 0,
+                                        elements: []
+                                    };
+                                }
+                                sizeMap[sizeKey].count++;
+                                if (sizeMap[sizeKey].elements.length < 3) {
+                                    sizeMap[sizeKey].elements.push({
+                                        tag: element.tagName.toLowerCase(),
+                                        class: element.className || '',
+                                        id: element.id || ''
+                                    });
+                                }
+                            }
                         }
-                    }
-                }
                 
-                return sizeMap;
-            """)
+                        return sizeMap;
+                    """)
             
             # 顯示常見尺寸
             common_sizes = sorted(size_distribution.items(), key=lambda x: x[1]['count'], reverse=True)[:10]
@@ -597,6 +793,8 @@ class EttodayAdReplacer:
                     example = info['elements'][0]
                     print(f"    例如: <{example['tag']} class='{example['class'][:30]}' id='{example['id'][:20]}'>")
             
+        except StageTimeout:
+            raise
         except Exception as e:
             print(f"分析頁面尺寸失敗: {e}")
     
@@ -604,6 +802,13 @@ class EttodayAdReplacer:
         """掃描整個網頁尋找符合尺寸的廣告元素"""
         print(f"開始掃描整個網頁尋找 {target_width}x{target_height} 的廣告...")
         
+        # 優先使用 DOMSnapshot：一次 CDP 呼叫取得所有版面方塊，在 Python 端比對
+        if USE_DOM_SNAPSHOT_SCAN:
+            try:
+                return scan_for_ads(self.driver, target_width, target_height, tolerance=2)
+            except Exception as e:
+                print(f"DOMSnapshot 掃描失敗，改用頁面腳本掃描: {e}")
+        
         # 獲取所有可見的元素
         all_elements = self.driver.execute_script("""
             function getAllVisibleElements() {
@@ -881,414 +1086,80 @@ class EttodayAdReplacer:
         return button_styles.get(button_style, button_styles["dots"])
 
     def replace_ad_content(self, element, image_data, target_width, target_height, ad_info=None):
+        """替換單一廣告位置"""
+        is_gif = ad_info and ad_info.get('is_gif', False) if ad_info else False
+        return self.replace_ad_contents([{
+            'element': element,
+            'image_data': image_data,
+            'width': target_width,
+            'height': target_height,
+            'is_gif': is_gif
+        }])[0]
+    
+    def replace_ad_contents(self, slots):
+        """分階段批次替換多個廣告位置：先量測所有位置，再於同一個 animation frame 內寫入"""
+        if not slots:
+            return []
         try:
-            # 獲取原始尺寸
-            original_info = self.driver.execute_script("""
-                var element = arguments[0];
-                if (!element || !element.getBoundingClientRect) return null;
-                var rect = element.getBoundingClientRect();
-                return {width: rect.width, height: rect.height};
-            """, element)
-            
-            if not original_info:
-                return False
-            
-            # 檢查是否符合目標尺寸（允許±2像素誤差）
-            if (abs(original_info['width'] - target_width) > 2 or 
-                abs(original_info['height'] - target_height) > 2):
-                print(f"尺寸不匹配: 期望 {target_width}x{target_height}, 實際 {original_info['width']}x{original_info['height']}")
-                return False
-            
             # 獲取按鈕樣式
             button_style = self.get_button_style()
-            close_button_html = button_style["close_button"]["html"]
-            close_button_style = button_style["close_button"]["style"]
-            info_button_html = button_style["info_button"]["html"]
-            info_button_style = button_style["info_button"]["style"]
             
             # 檢查是否為 "none" 模式
             current_button_style = getattr(self, 'button_style', 'dots')
             is_none_mode = current_button_style == "none"
             
-            # 檢查是否為 GIF 檔案
-            is_gif = ad_info and ad_info.get('is_gif', False) if ad_info else False
-            
-            # 獲取按鈕偏移量設定（用於 JavaScript 中的 actual_top）
+            # 獲取按鈕偏移量設定（用於樣式中的 actual_top）
             try:
                 actual_top = 0 + BUTTON_TOP_OFFSET
             except NameError:
                 actual_top = 1  # 預設偏移量
             
-            # 只替換圖片，保留廣告按鈕，支援動態尺寸調整
-            success = self.driver.execute_script("""
-                // 添加 Google 廣告標準樣式
-                if (!document.getElementById('google_ad_styles')) {
-                    var style = document.createElement('style');
-                    style.id = 'google_ad_styles';
-                    style.textContent = `
-                        div {
-                            margin: 0;
-                            padding: 0;
-                        }
-                        .abgb {
-                            position: absolute;
-                            right: 17px;
-                            top: """ + str(actual_top) + """px;
-                        }
-                        .abgb {
-                            display: inline-block;
-                            height: 15px;
-                        }
-                        .abgc {
-                            cursor: pointer;
-                        }
-                        .abgc {
-                            display: block;
-                            height: 15px;
-                            position: absolute;
-                            right: 1px;
-                            top: """ + str(actual_top) + """px;
-                            text-rendering: geometricPrecision;
-                            z-index: 2147483646;
-                        }
-                        .abgc .il-wrap {
-                            background-color: #ffffff;
-                            height: 15px;
-                            white-space: nowrap;
-                        }
-                        .abgc .il-icon {
-                            height: 15px;
-                            width: 15px;
-                        }
-                        .abgc .il-icon svg {
-                            fill: #00aecd;
-                        }
-                        .abgs svg, .abgb svg {
-                            display: inline-block;
-                            height: 15px;
-                            width: 15px;
-                            vertical-align: top;
-                        }
-                        #close_button { 
-                            text-decoration: none; 
-                            margin: 0; 
-                            padding: 0; 
-                            border: none;
-                            cursor: pointer;
-                            position: absolute; 
-                            z-index: 100; 
-                            top: """ + str(actual_top) + """px;
-                            bottom: auto;
-                            vertical-align: top;
-                            margin-top: 0px;
-                            right: 1px;
-                            left: auto;
-                            text-align: right;
-                            margin-right: 0px;
-                            display: block; 
-                            width: 15px; 
-                            height: 15px;
-                        }
-                        #close_button #close_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                        #abgb #info_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                        [id^="close_button_"] { 
-                            text-decoration: none; 
-                            margin: 0; 
-                            padding: 0; 
-                            border: none;
-                            cursor: pointer;
-                            position: absolute !important; 
-                            z-index: 100 !important; 
-                            top: """ + str(actual_top) + """px !important;
-                            right: 1px !important;
-                            display: block !important; 
-                            width: 15px !important; 
-                            height: 15px !important;
-                            background-color: rgba(255,255,255,1) !important;
-                        }
-                        [id^="abgb_"] { 
-                            position: absolute !important;
-                            right: 17px !important;
-                            top: """ + str(actual_top) + """px !important;
-                            width: 15px !important; 
-                            height: 15px !important;
-                            z-index: 100 !important;
-                            display: block !important;
-                            background-color: rgba(255,255,255,1) !important;
-                        }
-                    `;
-                    document.head.appendChild(style);
-                }
-                
-                var container = arguments[0];
-                var imageBase64 = arguments[1];
-                var targetWidth = arguments[2];
-                var targetHeight = arguments[3];
-                var closeButtonHtml = arguments[4];
-                var closeButtonStyle = arguments[5];
-                var infoButtonHtml = arguments[6];
-                var infoButtonStyle = arguments[7];
-                var isNoneMode = arguments[8];
-
-                
-                if (!container) return false;
-                
-                // 確保 container 是 relative
-                if (window.getComputedStyle(container).position === 'static') {
-                  container.style.position = 'relative';
-                }
-                // 生成唯一ID避免衝突
-                var uniqueId = Date.now() + '_' + Math.random().toString(36).substr(2, 9);
-                var closeButtonId = 'close_button_' + uniqueId;
-                var infoButtonId = 'abgb_' + uniqueId;
-                
-                // 先移除舊的（避免重複）
-                ['close_button', 'abgb', closeButtonId, infoButtonId].forEach(function(id){
-                  var old = container.querySelector('#'+id);
-                  if(old) old.remove();
-                });
-                
-                var replacedCount = 0;
-                var isGif = arguments[9] || false;
-                var mimeType = isGif ? 'image/gif' : 'image/png';
-                var newImageSrc = 'data:' + mimeType + ';base64,' + imageBase64;
-                
-                // 方法1: 只替換img標籤的src，不移除元素
-                var imgs = container.querySelectorAll('img');
-                for (var i = 0; i < imgs.length; i++) {
-                    var img = imgs[i];
-                    // 排除Google廣告控制按鈕
-                    var imgRect = img.getBoundingClientRect();
-                    var isControlButton = imgRect.width < 50 || imgRect.height < 50 || 
-                                         img.className.includes('abg') || 
-                                         img.id.includes('abg') ||
-                                         img.src.includes('googleads') ||
-                                         img.src.includes('googlesyndication') ||
-                                         img.src.includes('adchoices') ||
-                                         img.src.includes('zh_tw.png') ||
-                                         img.closest('#abgcp') ||
-                                         img.closest('.abgcp') ||
-                                         img.closest('#abgc') ||
-                                         img.closest('.abgc') ||
-                                         img.closest('#abgb') ||
-                                         img.closest('.abgb') ||
-                                         img.closest('#abgs') ||
-                                         img.closest('.abgs') ||
-                                         img.closest('#cbb') ||
-                                         img.closest('.cbb') ||
-                                         img.closest('label.cbb') ||
-                                         img.closest('[data-vars-label*="feedback"]') ||
-                                         img.alt.includes('關閉') ||
-                                         img.alt.includes('close');
-                    
-                    if (!isControlButton && img.src && !img.src.startsWith('data:')) {
-                        // 保存原始src以便復原
-                        if (!img.getAttribute('data-original-src')) {
-                            img.setAttribute('data-original-src', img.src);
-                        }
-                        // 保存原始樣式以便復原
-                        if (!img.getAttribute('data-original-style')) {
-                            img.setAttribute('data-original-style', img.style.cssText || '');
-                        }
-                        // 替換圖片，保持原始尺寸和佈局
-                        img.src = newImageSrc;
-                        img.style.objectFit = 'contain';
-                        img.style.width = '100%';
-                        img.style.height = 'auto';
-                        img.style.maxWidth = 'none';
-                        img.style.maxHeight = 'none';
-                        img.style.minWidth = 'auto';
-                        img.style.minHeight = 'auto';
-                        img.style.display = 'block';
-                        img.style.margin = '0';
-                        img.style.padding = '0';
-                        img.style.border = 'none';
-                        img.style.outline = 'none';
-                        replacedCount++;
-                        
-                        // 確保img的父層是relative
-                        var imgParent = img.parentElement || container;
-                        if (window.getComputedStyle(imgParent).position === 'static') {
-                            imgParent.style.position = 'relative';
-                        }
-                        
-                        // 先移除舊的按鈕
-                        [closeButtonId, infoButtonId, 'close_button', 'abgb'].forEach(function(id){
-                            var old = imgParent.querySelector('#'+id);
-                            if(old) old.remove();
-                        });
-                        
-                        // 只有在非 none 模式下才創建按鈕
-                        if (!isNoneMode && (closeButtonHtml || infoButtonHtml)) {
-                            // 叉叉 - 貼著替換圖片的右上角
-                            if (closeButtonHtml) {
-                                var closeButton = document.createElement('div');
-                                closeButton.id = closeButtonId;
-                                closeButton.innerHTML = closeButtonHtml;
-                                closeButton.style.cssText = closeButtonStyle;
-                                imgParent.appendChild(closeButton);
-                            }
-                            
-                            // 驚嘆號 - 貼著替換圖片的右上角，與叉叉對齊
-                            if (infoButtonHtml) {
-                                var abgb = document.createElement('div');
-                                abgb.id = infoButtonId;
-                                abgb.className = 'abgb';
-                                abgb.innerHTML = infoButtonHtml;
-                                abgb.style.cssText = infoButtonStyle;
-                                imgParent.appendChild(abgb);
-                            }
-                        }
-                    }
-                }
-                
-                // 方法2: 處理iframe
-                var iframes = container.querySelectorAll('iframe');
-                for (var i = 0; i < iframes.length; i++) {
-                    var iframe = iframes[i];
-                    var iframeRect = iframe.getBoundingClientRect();
-                    
-                    // 隱藏iframe
-                    iframe.style.visibility = 'hidden';
-                    
-                    // 確保容器是relative
-                    if (window.getComputedStyle(container).position === 'static') {
-                        container.style.position = 'relative';
-                    }
-                    
-                    // 在iframe位置創建新的圖片元素
-                    var newImg = document.createElement('img');
-                    newImg.src = newImageSrc;
-                    newImg.style.position = 'absolute';
-                    newImg.style.top = (iframeRect.top - container.getBoundingClientRect().top) + 'px';
-                    newImg.style.left = (iframeRect.left - container.getBoundingClientRect().left) + 'px';
-                    newImg.style.width = Math.round(iframeRect.width) + 'px';
-                    newImg.style.height = Math.round(iframeRect.height) + 'px';
-                    newImg.style.objectFit = 'contain';
-                    newImg.style.zIndex = '1';
-                    
-                    container.appendChild(newImg);
-                    
-                    // 先移除舊的按鈕
-                    [closeButtonId, infoButtonId, 'close_button', 'abgb'].forEach(function(id){
-                        var old = container.querySelector('#'+id);
-                        if(old) old.remove();
-                    });
-                    
-                    // 只有在非 none 模式下才創建按鈕
-                    if (!isNoneMode && (closeButtonHtml || infoButtonHtml)) {
-                        // 叉叉 - 貼著替換圖片的右上角
-                        if (closeButtonHtml) {
-                            var closeButton = document.createElement('div');
-                            closeButton.id = closeButtonId;
-                            closeButton.innerHTML = closeButtonHtml;
-                            closeButton.style.cssText = 'position:absolute;top:' + (iframeRect.top - container.getBoundingClientRect().top + 1) + 'px;right:' + (container.getBoundingClientRect().right - iframeRect.right + 1) + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);';
-                            container.appendChild(closeButton);
-                        }
-                        
-                        // 驚嘆號 - 貼著替換圖片的右上角，與叉叉水平對齊
-                        if (infoButtonHtml) {
-                            var abgb = document.createElement('div');
-                            abgb.id = infoButtonId;
-                            abgb.className = 'abgb';
-                            abgb.innerHTML = infoButtonHtml;
-                            abgb.style.cssText = 'position:absolute;top:' + (iframeRect.top - container.getBoundingClientRect().top + 1) + 'px;right:' + (container.getBoundingClientRect().right - iframeRect.right + 17) + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);line-height:0;';
-                            container.appendChild(abgb);
-                        }
-                    }
-                    replacedCount++;
-                }
-                
-                // 方法3: 處理背景圖片
-                if (replacedCount === 0) {
-                    var style = window.getComputedStyle(container);
-                    if (style.backgroundImage && style.backgroundImage !== 'none') {
-                        // 保存原始背景圖片
-                        if (!container.getAttribute('data-original-background')) {
-                            container.setAttribute('data-original-background', style.backgroundImage);
-                        }
-                        // 保存原始背景樣式
-                        if (!container.getAttribute('data-original-bg-style')) {
-                            var bgStyle = {
-                                size: style.backgroundSize,
-                                repeat: style.backgroundRepeat,
-                                position: style.backgroundPosition
-                            };
-                            container.setAttribute('data-original-bg-style', JSON.stringify(bgStyle));
-                        }
-                        container.style.backgroundImage = 'url(' + newImageSrc + ')';
-                        container.style.backgroundSize = 'contain';
-                        container.style.backgroundRepeat = 'no-repeat';
-                        container.style.backgroundPosition = 'center';
-                        replacedCount = 1;
-                        
-                        // 確保容器是relative
-                        if (window.getComputedStyle(container).position === 'static') {
-                            container.style.position = 'relative';
-                        }
-                        
-                        // 先移除舊的按鈕
-                        [closeButtonId, infoButtonId, 'close_button', 'abgb'].forEach(function(id){
-                            var old = container.querySelector('#'+id);
-                            if(old) old.remove();
-                        });
-                        
-                        // 只有在非 none 模式下才創建按鈕
-                        if (!isNoneMode && (closeButtonHtml || infoButtonHtml)) {
-                            // 叉叉 - 貼著替換圖片的右上角
-                            if (closeButtonHtml) {
-                                var closeButton = document.createElement('div');
-                                closeButton.id = closeButtonId;
-                                closeButton.innerHTML = closeButtonHtml;
-                                closeButton.style.cssText = closeButtonStyle;
-                                container.appendChild(closeButton);
-                            }
-                            
-                            // 驚嘆號 - 貼著替換圖片的右上角，與叉叉對齊
-                            if (infoButtonHtml) {
-                                var abgb = document.createElement('div');
-                                abgb.id = infoButtonId;
-                                abgb.className = 'abgb';
-                                abgb.innerHTML = infoButtonHtml;
-                                abgb.style.cssText = infoButtonStyle;
-                                container.appendChild(abgb);
-                            }
-                        }
-                    }
-                }
-                return replacedCount > 0;
-            """, element, image_data, target_width, target_height, close_button_html, close_button_style, info_button_html, info_button_style, is_none_mode, is_gif)
+            options = {
+                'sizeTolerance': 2,          # 允許±2像素誤差
+                'uniqueButtonIds': True,     # 生成唯一ID避免衝突
+                'iframeButtonOffset': 1,
+                'gifMime': True,
+                'adStylesCss': GOOGLE_AD_STYLES_CSS_TEMPLATE.replace('{actual_top}', str(actual_top))
+            }
+            results = replace_slots_batched(self.driver, slots, button_style, is_none_mode, options)
             
-            if success:
-                print(f"替換廣告 {original_info['width']}x{original_info['height']}")
-                return True
-            else:
-                print(f"廣告替換失敗 {original_info['width']}x{original_info['height']}")
-                return False
+            outcomes = []
+            for slot, result in zip(slots, results):
+                if result['ok']:
+                    print(f"替換廣告 {result['width']}x{result['height']}")
+                elif result.get('reason') == 'size':
+                    print(f"尺寸不匹配: 期望 {slot['width']}x{slot['height']}, 實際 {result['width']}x{result['height']}")
+                else:
+                    print(f"廣告替換失敗 {result['width']}x{result['height']}")
+                outcomes.append(bool(result['ok']))
+            return outcomes
                 
         except Exception as e:
             print(f"替換廣告失敗: {e}")
-            return False
+            return [False] * len(slots)
     
     def process_website(self, url):
         """處理單個網站，遍歷所有替換圖片"""
+        self.page_slot_sizes = None
         try:
             print(f"\n開始處理網站: {url}")
             
             # 載入網頁
             self.driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
-            self.driver.get(url)
+            if self.resource_blocker:
+                self.resource_blocker.discard_events()
+            with self.watchdog.stage('navigate', url):
+                self.driver.get(url)
             print("頁面載入完成，等待廣告載入...")
             time.sleep(WAIT_TIME + 2)  # 增加等待時間讓廣告有時間載入
             
+            # 掃描前一次觸發所有懶載入廣告（每段等到廣告繪製完成即前進）
+            if LAZY_LOAD_SWEEP:
+                try:
+                    sweep_lazy_ads(self.driver, band_timeout=LAZY_SWEEP_BAND_TIMEOUT, max_seconds=LAZY_SWEEP_MAX_SECONDS)
+                except Exception as e:
+                    print(f"懶載入掃描失敗: {e}")
+            
             # 獲取頁面標題
             try:
                 page_title = self.driver.title
@@ -1297,12 +1168,16 @@ class EttodayAdReplacer:
                 print(f"獲取頁面標題失敗: {e}")
                 page_title = None
             
-            # 滾動頁面以觸發懶載入的廣告
-            print("滾動頁面以載入更多廣告...")
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
-            time.sleep(2)
-            self.driver.execute_script("window.scrollTo(0, 0);")
-            time.sleep(1)
+            # 未啟用懶載入掃描時，才以固定等待的滾動觸發懶載入的廣告
+            if not LAZY_LOAD_SWEEP:
+                print("滾動頁面以載入更多廣告...")
+                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
+                time.sleep(2)
+                self.driver.execute_script("window.scrollTo(0, 0);")
+                time.sleep(1)
+            
+            if self.resource_blocker:
+                self.resource_blocker.page_report(url)
             
             # 遍歷所有替換圖片
             total_replacements = 0
@@ -1314,6 +1189,7 @@ class EttodayAdReplacer:
             
             # 按尺寸處理，而不是按單個圖片處理
             processed_sizes = set()
+            found_sizes = []
             
             for image_info in self.replace_images:
                 size_key = f"{image_info['width']}x{image_info['height']}"
@@ -1334,11 +1210,13 @@ class EttodayAdReplacer:
                 print(f"   可用圖片: {len(static_images)}張靜態 + {len(gif_images)}張GIF")
                 
                 # 掃描網頁尋找符合尺寸的廣告
-                matching_elements = self.scan_entire_page_for_ads(image_info['width'], image_info['height'])
+                with self.watchdog.stage('scan'):
+                    matching_elements = self.scan_entire_page_for_ads(image_info['width'], image_info['height'])
                 
                 if not matching_elements:
                     print(f"未找到符合 {size_key} 尺寸的廣告位置")
                     continue
+                found_sizes.append(size_key)
                 
                 # 嘗試替換找到的廣告
                 replaced = False
@@ -1364,7 +1242,9 @@ class EttodayAdReplacer:
                         # 將圖片類型資訊加入 ad_info
                         ad_info_with_type = {**ad_info, 'type': selected_image['type'], 'is_gif': selected_image['is_gif']}
                         
-                        if self.replace_ad_content(ad_info['element'], image_data, selected_image['width'], selected_image['height'], ad_info_with_type):
+                        with self.watchdog.stage('replace'):
+                            replaced_ok = self.replace_ad_content(ad_info['element'], image_data, selected_image['width'], selected_image['height'], ad_info_with_type)
+                        if replaced_ok:
                             type_icon = "🎬" if selected_image['is_gif'] else "🖼️"
                             print(f"✅ 成功替換廣告: {type_icon} {ad_info['width']}x{ad_info['height']} at {ad_info['position']}")
                             print(f"   📄 使用檔案: {selected_image['filename']}")
@@ -1411,137 +1291,141 @@ class EttodayAdReplacer:
                             # 每次替換後立即截圖
                             print("準備截圖...")
                             time.sleep(2)  # 等待頁面穩定
-                            screenshot_path = self.take_screenshot(page_title)
+                            with self.watchdog.stage('capture'):
+                                screenshot_path = self.take_screenshot(page_title)
                             if screenshot_path:
                                 screenshot_paths.append(screenshot_path)
                                 self.total_screenshots += 1  # 更新截圖統計
                                 print(f"✅ 截圖保存: {screenshot_path}")
-                                
-                                # 記錄詳細資訊（包含截圖路徑）
-                                self.replacement_details.append({
-                                    'type': 'GIF' if selected_image['is_gif'] else '靜態圖片',
-                                    'filename': selected_image['filename'],
-                                    'size': f"{ad_info['width']}x{ad_info['height']}",
-                                    'position': ad_info['position'],
-                                    'screenshot_path': screenshot_path
-                                })
+                                if self.ledger:
+                                    self.ledger.screenshot(screenshot_path)
                             else:
                                 print("❌ 截圖失敗")
-                                # 即使截圖失敗也記錄替換資訊
-                                self.replacement_details.append({
-                                    'type': 'GIF' if selected_image['is_gif'] else '靜態圖片',
-                                    'filename': selected_image['filename'],
-                                    'size': f"{ad_info['width']}x{ad_info['height']}",
-                                    'position': ad_info['position'],
-                                    'screenshot_path': None
-                                })
+                            
+                            # 記錄詳細資訊（包含截圖路徑，截圖失敗也記錄替換資訊）
+                            detail = {
+                                'type': 'GIF' if selected_image['is_gif'] else '靜態圖片',
+                                'filename': selected_image['filename'],
+                                'size': f"{ad_info['width']}x{ad_info['height']}",
+                                'position': ad_info['position'],
+                                'screenshot_path': screenshot_path
+                            }
+                            self.results.record_replacement(detail['size'], ad_info['position'], selected_image['filename'],
+                                                            selected_image['is_gif'], screenshot_path)
+                            if self.ledger:
+                                self.ledger.replacement(detail, selected_image['is_gif'])
                             
                             # 截圖後復原該位置的廣告
                             try:
-                                self.driver.execute_script("""
-                                    var element = arguments[0];
-                                    
-                                    // 只在當前廣告容器內移除我們添加的按鈕（包括動態ID）
-                                    var containerButtons = element.querySelectorAll('#close_button, #abgb, [id^="close_button_"], [id^="abgb_"]');
-                                    for (var i = 0; i < containerButtons.length; i++) {
-                                        containerButtons[i].remove();
-                                    }
+                                with self.watchdog.stage('restore'):
+                                    self.driver.execute_script("""
+                                        var element = arguments[0];
                                     
-                                    // 檢查父容器中的按鈕（如果廣告在父層）
-                                    var parent = element.parentElement;
-                                    if (parent) {
-                                        var parentButtons = parent.querySelectorAll('#close_button, #abgb, [id^="close_button_"], [id^="abgb_"]');
-                                        for (var i = 0; i < parentButtons.length; i++) {
-                                            parentButtons[i].remove();
+                                        // 只在當前廣告容器內移除我們添加的按鈕（包括動態ID）
+                                        var containerButtons = element.querySelectorAll('#close_button, #abgb, [id^="close_button_"], [id^="abgb_"]');
+                                        for (var i = 0; i < containerButtons.length; i++) {
+                                            containerButtons[i].remove();
                                         }
-                                    }
                                     
-                                    // 只移除當前容器內我們添加的圖片（通過data URI識別）
-                                    var containerImages = element.querySelectorAll('img[src^="data:image/"]');
-                                    for (var i = 0; i < containerImages.length; i++) {
-                                        // 只移除我們添加的圖片（base64 格式）
-                                        if (containerImages[i].src.includes('base64')) {
-                                            containerImages[i].remove();
+                                        // 檢查父容器中的按鈕（如果廣告在父層）
+                                        var parent = element.parentElement;
+                                        if (parent) {
+                                            var parentButtons = parent.querySelectorAll('#close_button, #abgb, [id^="close_button_"], [id^="abgb_"]');
+                                            for (var i = 0; i < parentButtons.length; i++) {
+                                                parentButtons[i].remove();
+                                            }
                                         }
-                                    }
                                     
-                                    // 檢查父容器中我們添加的圖片
-                                    if (parent) {
-                                        var parentImages = parent.querySelectorAll('img[src^="data:image/"]');
-                                        for (var i = 0; i < parentImages.length; i++) {
-                                            if (parentImages[i].src.includes('base64')) {
-                                                parentImages[i].remove();
+                                        // 只移除當前容器內我們添加的圖片（通過data URI識別）
+                                        var containerImages = element.querySelectorAll('img[src^="data:image/"]');
+                                        for (var i = 0; i < containerImages.length; i++) {
+                                            // 只移除我們添加的圖片（base64 格式）
+                                            if (containerImages[i].src.includes('base64')) {
+                                                containerImages[i].remove();
                                             }
                                         }
-                                    }
                                     
-                                    // 復原原始廣告內容
-                                    function restoreElement(el) {
-                                        if (el.tagName === 'IMG') {
-                                            // 恢復原始src
-                                            var originalSrc = el.getAttribute('data-original-src');
-                                            if (originalSrc) {
-                                                el.src = originalSrc;
-                                                el.removeAttribute('data-original-src');
-                                            }
-                                            // 恢復原始樣式
-                                            var originalStyle = el.getAttribute('data-original-style');
-                                            if (originalStyle !== null) {
-                                                el.style.cssText = originalStyle;
-                                                el.removeAttribute('data-original-style');
+                                        // 檢查父容器中我們添加的圖片
+                                        if (parent) {
+                                            var parentImages = parent.querySelectorAll('img[src^="data:image/"]');
+                                            for (var i = 0; i < parentImages.length; i++) {
+                                                if (parentImages[i].src.includes('base64')) {
+                                                    parentImages[i].remove();
+                                                }
                                             }
-                                        } else if (el.tagName === 'IFRAME') {
-                                            // 恢復iframe可見性
-                                            el.style.visibility = 'visible';
                                         }
+                                    
+                                        // 復原原始廣告內容
+                                        function restoreElement(el) {
+                                            if (el.tagName === 'IMG') {
+                                                // 恢復原始src
+                                                var originalSrc = el.getAttribute('data-original-src');
+                                                if (originalSrc) {
+                                                    el.src = originalSrc;
+                                                    el.removeAttribute('data-original-src');
+                                                }
+                                                // 恢復原始樣式
+                                                var originalStyle = el.getAttribute('data-original-style');
+                                                if (originalStyle !== null) {
+                                                    el.style.cssText = originalStyle;
+                                                    el.removeAttribute('data-original-style');
+                                                }
+                                            } else if (el.tagName === 'IFRAME') {
+                                                // 恢復iframe可見性
+                                                el.style.visibility = 'visible';
+                                            }
                                         
-                                        // 恢復背景圖片
-                                        var originalBg = el.getAttribute('data-original-background');
-                                        if (originalBg) {
-                                            el.style.backgroundImage = originalBg;
-                                            el.removeAttribute('data-original-background');
+                                            // 恢復背景圖片
+                                            var originalBg = el.getAttribute('data-original-background');
+                                            if (originalBg) {
+                                                el.style.backgroundImage = originalBg;
+                                                el.removeAttribute('data-original-background');
                                             
-                                            // 恢復背景樣式
-                                            var originalBgStyle = el.getAttribute('data-original-bg-style');
-                                            if (originalBgStyle) {
-                                                try {
-                                                    var bgStyle = JSON.parse(originalBgStyle);
-                                                    el.style.backgroundSize = bgStyle.size;
-                                                    el.style.backgroundRepeat = bgStyle.repeat;
-                                                    el.style.backgroundPosition = bgStyle.position;
-                                                } catch(e) {}
-                                                el.removeAttribute('data-original-bg-style');
+                                                // 恢復背景樣式
+                                                var originalBgStyle = el.getAttribute('data-original-bg-style');
+                                                if (originalBgStyle) {
+                                                    try {
+                                                        var bgStyle = JSON.parse(originalBgStyle);
+                                                        el.style.backgroundSize = bgStyle.size;
+                                                        el.style.backgroundRepeat = bgStyle.repeat;
+                                                        el.style.backgroundPosition = bgStyle.position;
+                                                    } catch(e) {}
+                                                    el.removeAttribute('data-original-bg-style');
+                                                }
                                             }
                                         }
-                                    }
                                     
-                                    // 復原主要元素
-                                    restoreElement(element);
+                                        // 復原主要元素
+                                        restoreElement(element);
                                     
-                                    // 復原容器內的所有圖片
-                                    var imgs = element.querySelectorAll('img[data-original-src]');
-                                    for (var i = 0; i < imgs.length; i++) {
-                                        restoreElement(imgs[i]);
-                                    }
+                                        // 復原容器內的所有圖片
+                                        var imgs = element.querySelectorAll('img[data-original-src]');
+                                        for (var i = 0; i < imgs.length; i++) {
+                                            restoreElement(imgs[i]);
+                                        }
                                     
-                                    // 復原容器內的所有iframe
-                                    var iframes = element.querySelectorAll('iframe[style*="visibility: hidden"]');
-                                    for (var i = 0; i < iframes.length; i++) {
-                                        restoreElement(iframes[i]);
-                                    }
+                                        // 復原容器內的所有iframe
+                                        var iframes = element.querySelectorAll('iframe[style*="visibility: hidden"]');
+                                        for (var i = 0; i < iframes.length; i++) {
+                                            restoreElement(iframes[i]);
+                                        }
                                     
-                                    // 移除我們添加的按鈕
-                                    var buttonsToRemove = element.querySelectorAll('[id^="close_button"], [id^="abgb"], #close_button, #abgb');
-                                    for (var i = 0; i < buttonsToRemove.length; i++) {
-                                        buttonsToRemove[i].remove();
-                                    }
-                                """, ad_info['element'])
+                                        // 移除我們添加的按鈕
+                                        var buttonsToRemove = element.querySelectorAll('[id^="close_button"], [id^="abgb"], #close_button, #abgb');
+                                        for (var i = 0; i < buttonsToRemove.length; i++) {
+                                            buttonsToRemove[i].remove();
+                                        }
+                                    """, ad_info['element'])
                                 print(f"✅ 廣告位置已復原: {ad_info['width']}x{ad_info['height']} at {ad_info['position']}")
+                            except StageTimeout:
+                                raise
                             except Exception as e:
                                 print(f"復原廣告失敗: {e}")
                             
                             # 繼續尋找下一個廣告位置，不要break
                             continue
+                    except StageTimeout:
+                        raise
                     except Exception as e:
                         print(f"❌ 載入圖片失敗: {e}")
                         continue
@@ -1552,6 +1436,9 @@ class EttodayAdReplacer:
                 if not replaced:
                     print(f"❌ 所有找到的 {size_key} 廣告位置都無法替換")
             
+            # 所有尺寸都掃描完成後才記錄，逾時或失敗的頁面不列入版位產出
+            self.page_slot_sizes = found_sizes
+            
             # 總結處理結果
             if total_replacements > 0:
                 print(f"\n{'='*50}")
@@ -1565,6 +1452,9 @@ class EttodayAdReplacer:
                 print("本網頁沒有找到任何可替換的廣告")
                 return []
                 
+        except StageTimeout as e:
+            print(f"⏱️ 跳過此網站: {e}")
+            return []
         except Exception as e:
             print(f"處理網站失敗: {e}")
             return []
@@ -1734,24 +1624,8 @@ class EttodayAdReplacer:
         print("📊 ETtoday 廣告替換統計報告")
         print("="*60)
         
-        print(f"📸 總截圖數量: {self.total_screenshots} 張")
-        print(f"🔄 總替換次數: {self.total_replacements} 次")
-        
-        if self.total_replacements > 0:
-            print(f"   🎬 GIF 替換: {self.gif_replacements} 次 ({self.gif_replacements/self.total_replacements*100:.1f}%)")
-            print(f"   🖼️ 靜態圖片替換: {self.static_replacements} 次 ({self.static_replacements/self.total_replacements*100:.1f}%)")
-        
-        if self.replacement_details:
-            print(f"\n📋 詳細替換記錄:")
-            for i, detail in enumerate(self.replacement_details, 1):
-                type_icon = "🎬" if detail['type'] == 'GIF' else "🖼️"
-                if detail.get('screenshot_path'):
-                    # 使用完整路徑，在支援的環境中可以點擊開啟
-                    import os
-                    full_path = os.path.abspath(detail['screenshot_path'])
-                    print(f"   {i:2d}. {type_icon} {detail['filename']} ({detail['size']}) → 📸 {full_path}")
-                else:
-                    print(f"   {i:2d}. {type_icon} {detail['filename']} ({detail['size']}) → ❌ 截圖失敗")
+        # 統計由結果資料庫彙總
+        self.results.print_report()
         
 
         
@@ -1771,7 +1645,14 @@ class EttodayAdReplacer:
     def close(self):
         """關閉瀏覽器並顯示統計"""
         self.show_statistics()
-        self.driver.quit()
+        if getattr(self, 'resource_blocker', None):
+            self.resource_blocker.print_summary()
+        self.results.close()
+        if self.seen_urls:
+            self.seen_urls.close()
+        if self.slot_yield:
+            self.slot_yield.close()
+        self.browser.close()
 
 def test_screen_setup():
     """測試螢幕設定功能"""
@@ -1816,7 +1697,7 @@ def test_screen_setup():
     finally:
         test_bot.close()
 
-def main():
+def main(resume=False):
     # 偵測並選擇螢幕
     screen_id, selected_screen = ScreenManager.select_screen()
     
@@ -1826,13 +1707,35 @@ def main():
     
     print(f"\n正在啟動 Chrome 瀏覽器到螢幕 {screen_id}...")
     bot = EttodayAdReplacer(headless=False, screen_id=screen_id)
+    # 瀏覽器卡住、當掉或用量過高時重啟，bot 的統計保持不變
+    supervisor = None
+    if BROWSER_SUPERVISOR:
+        supervisor = BrowserSupervisor(bot, headless=False, max_pages=BROWSER_MAX_PAGES,
+                                       max_memory_mb=BROWSER_MAX_MEMORY_MB,
+                                       command_timeout=BROWSER_COMMAND_TIMEOUT, page_timeout=BROWSER_PAGE_TIMEOUT)
+    
+    # 檢查點帳本：續跑時還原統計並只處理尚未完成的網址
+    ledger = None
+    resumed = False
+    if CHECKPOINT_LEDGER:
+        ledger = RunLedger(os.path.join(CHECKPOINT_DIR, f"ettoday_screen{bot.screen_id}_ledger.jsonl"), "ettoday", CHECKPOINT_FSYNC_EVERY)
+        resumed = ledger.open(resume, SCREENSHOT_COUNT, bot.results.run_id)
+        bot.ledger = ledger
+        if resumed:
+            ledger.restore(bot)
     
     try:
         # 尋找新聞連結 - 使用 ETtoday 旅遊雲網址
         ettoday_url = "https://travel.ettoday.net"
         print(f"正在連接 {ettoday_url}...")
         
-        news_urls = bot.get_random_news_urls(ettoday_url, NEWS_COUNT)
+        # 續跑時沿用上次的網址清單；沒有剩餘網址時重新尋找，並排除已完成的網址
+        news_urls = ledger.pending_urls() if resumed else []
+        if not news_urls:
+            news_urls = bot.get_random_news_urls(ettoday_url, NEWS_COUNT)
+            if ledger and news_urls:
+                news_urls = [u for u in news_urls if u not in ledger.finished_urls]
+                ledger.set_urls(ledger.finished_urls + news_urls)
         
         if not news_urls:
             print("❌ 無法獲取新聞連結，可能的原因：")
@@ -1848,7 +1751,7 @@ def main():
         print(f"獲取到 {len(news_urls)} 個新聞連結")
         print(f"目標截圖數量: {SCREENSHOT_COUNT}")
         
-        total_screenshots = 0
+        total_screenshots = bot.total_screenshots  # 續跑時從已完成的截圖數接續
         
         # 處理每個網站
         for i, url in enumerate(news_urls, 1):
@@ -1856,23 +1759,49 @@ def main():
             print(f"處理第 {i}/{len(news_urls)} 個網站")
             print(f"{'='*50}")
             
+            if ledger:
+                ledger.begin_url(url)
+            bot.results.begin_page(url)
             try:
                 # 處理網站並嘗試替換廣告
-                screenshot_paths = bot.process_website(url)
+                if supervisor:
+                    screenshot_paths = supervisor.process(url)
+                else:
+                    screenshot_paths = bot.process_website(url)
+                status = 'ok' if screenshot_paths else 'empty'
+                if bot.slot_yield and bot.page_slot_sizes is not None:
+                    bot.slot_yield.record(url, bot.page_slot_sizes, len(screenshot_paths or []))
+                bot.results.finish_page(url, status, len(screenshot_paths or []))
+                if ledger:
+                    ledger.finish_url(url, len(screenshot_paths or []), status)
                 
                 if screenshot_paths:
                     print(f"✅ 成功處理網站！共產生 {len(screenshot_paths)} 張截圖")
                     total_screenshots += len(screenshot_paths)
+                    if bot.seen_urls:
+                        bot.seen_urls.mark(url)
                     
                     # 檢查是否達到目標截圖數量
                     if total_screenshots >= SCREENSHOT_COUNT:
                         print(f"✅ 已達到目標截圖數量: {SCREENSHOT_COUNT}")
+                        bot.results.finish_run()
+                        if ledger:
+                            ledger.finish_run()
                         break
                 else:
                     print("❌ 網站處理完成，但沒有找到可替換的廣告")
                 
+            except BrowserUnrecoverable as e:
+                print(f"🛑 {e}，停止執行")
+                bot.results.finish_page(url, 'failed')
+                if ledger:
+                    ledger.finish_url(url, 0, 'failed')
+                break
             except Exception as e:
                 print(f"❌ 處理網站失敗: {e}")
+                bot.results.finish_page(url, 'failed')
+                if ledger:
+                    ledger.finish_url(url, 0, 'failed')
                 continue
             
             # 在處理下一個網站前稍作休息
@@ -1883,6 +1812,11 @@ def main():
         print(f"\n{'='*50}")
         print(f"🎉 所有網站處理完成！")
         print(f"{'='*50}")
+        if supervisor:
+            supervisor.print_summary()
+        bot.watchdog.print_summary()
+        if bot.slot_yield:
+            bot.slot_yield.print_summary()
         
 
         
@@ -1893,6 +1827,8 @@ def main():
         print(f"\n❌ 程式執行錯誤: {e}")
         print("正在關閉瀏覽器...")
     finally:
+        if ledger:
+            ledger.close()
         bot.close()
         print("瀏覽器已關閉")
 
@@ -1903,4 +1839,5 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         test_screen_setup()
     else:
-        main()
\ No newline at end of file
+        # --resume：從檢查點帳本續跑上一次中斷的執行
+        main(resume='--resume' in sys.argv[1:])
\ No newline at end of file
@@ -66,6 +66,81 @@ TARGET_AD_SIZES = [
     {"width": 970, "height": 90}     # google_970x90.jpg
 ]
 
+# 視窗分組截圖設定
+VIEWPORT_BATCH_CAPTURE = True    # 同一視窗內可見的廣告一起替換，只截一張圖
+CROP_PER_AD = False              # True: 從整組截圖裁切成一張圖一個廣告
+CROP_MARGIN = 200                # 裁切時廣告上下保留的邊距（px）
+
+# 廣告位置掃描設定
+USE_DOM_SNAPSHOT_SCAN = True     # 以 CDP DOMSnapshot 一次取得版面後在 Python 端比對尺寸，失敗時改用頁面腳本
+FRAME_ENGINE = "dom"             # "dom": 頁面層隱藏/覆蓋 iframe, "cdp": 以 CDP 直接進入跨來源廣告 iframe 替換（需 websocket-client）
+
+# 頁面載入策略
+PAGE_LOAD_STRATEGY = "normal"    # "normal": 等待 load 事件, "eager"/"none": 廣告位置就緒即開始掃描
+EARLY_COMMIT_TIMEOUT = 15        # 等待廣告位置就緒的上限（秒）
+STOP_LOADING_WHEN_READY = True   # 廣告位置就緒後以 window.stop() 停止其餘載入
+
+# 懶載入廣告觸發設定
+LAZY_LOAD_SWEEP = True           # 掃描前以視窗高度為一段捲動整頁，觸發懶載入廣告
+LAZY_SWEEP_BAND_TIMEOUT = 1.5    # 每一段最多等待廣告繪製的秒數
+LAZY_SWEEP_MAX_SECONDS = 15      # 整頁觸發的總時間上限（秒）
+
+# 資源封鎖設定
+RESOURCE_BLOCKING = True         # 依網站封鎖影片、字型、分析信標與社群外掛（廣告網域不受影響）
+RESOURCE_BLOCKING_DRY_RUN = False  # True: 不封鎖，只統計會被擋下的請求與位元組
+
+# 瀏覽器後端設定
+BROWSER_BACKEND = "local"        # "local": 每次啟動 Chrome, "daemon": 常駐的本機 Chrome, "remote": Selenium Grid session 池, "cdp": 非同步 CDP 引擎
+BROWSER_DAEMON_PORT = 9222       # remote debugging port，螢幕 N 使用 port + N - 1
+BROWSER_PROFILE_DIR = "chrome_profile"  # 持久化 profile 與磁碟快取，每個螢幕一個子資料夾
+REMOTE_WEBDRIVER_URL = "http://localhost:4444/wd/hub"  # Grid / 遠端 WebDriver 端點
+SESSION_POOL_SIZE = 2            # 每個行程最多保留的遠端 session 數
+SESSION_MAX_PAGES = 50           # session 載入超過此頁數後回收
+SESSION_MAX_MEMORY_MB = 1500     # JS heap 超過此值 (MB) 後回收
+SESSION_REGISTRY = "remote_sessions.json"  # 閒置 session 留給下一次執行 (None 表示結束時關閉)
+
+# 瀏覽器監控設定 (UDN / ETtoday 的 main 迴圈)
+BROWSER_SUPERVISOR = True        # True: 卡住或當掉時自動重啟瀏覽器並接續下一個網址
+BROWSER_MAX_PAGES = 40           # 同一個瀏覽器處理此頁數後重啟 (0 表示不限制)
+BROWSER_MAX_MEMORY_MB = 2500     # 瀏覽器 (含 renderer) 記憶體超過此值 (MB) 後重啟
+BROWSER_COMMAND_TIMEOUT = 10     # 健康檢查指令超過此秒數視為卡住
+BROWSER_PAGE_TIMEOUT = 300       # 單一網址處理超過此秒數視為卡住
+
+# 階段時限設定 (UDN / ETtoday)
+STAGE_WATCHDOG = True            # True: 各階段超過時限時中止頁面工作並跳過該頁
+STAGE_BUDGETS = {                # 各階段時限（秒）
+    'navigate': 35,
+    'scan': 15,
+    'replace': 10,
+    'restore': 5,
+    'capture': 15,
+}
+STAGE_ABORT_GRACE = 5            # 中止後仍未返回，再等待此秒數後關閉分頁
+
+# 檢查點設定 (UDN / ETtoday，加上 --resume 參數續跑中斷的執行)
+CHECKPOINT_LEDGER = True         # True: 每個網址、替換與截圖寫入檢查點帳本
+CHECKPOINT_DIR = "checkpoints"   # 帳本資料夾，每個網站、每個螢幕一個檔案
+CHECKPOINT_FSYNC_EVERY = 5       # 每幾筆紀錄 fsync 一次（網址完成時一定 fsync）
+
+# 結果資料庫 (UDN / ETtoday，SQLite WAL，多個螢幕的行程可共用)
+RESULTS_DB = "results.db"        # 每次執行、網址、替換、截圖與各階段耗時
+
+# 已截圖網址索引 (UDN / ETtoday / Linshibi，探索文章時略過先前已截圖的網址)
+SEEN_URL_FILTER = True           # True: 跨執行記住已截圖的網址
+SEEN_URL_DB = "seen_urls.db"     # 每個網站各自的範圍
+SEEN_URL_EXPIRY_DAYS = 30        # 超過此天數的紀錄失效，文章可再次截圖 (0 表示永不失效)
+SEEN_URL_SITE_EXPIRY_DAYS = {}   # 個別網站的失效天數，例如 {"udn": 7}
+
+# 版位產出記憶 (UDN / ETtoday / Linshibi，依過去的版位與截圖數排序待處理文章)
+SLOT_YIELD_MEMORY = True         # True: 記錄各網址與網址樣式的版位尺寸與截圖數
+SLOT_YIELD_DB = "slot_yield.db"
+SLOT_YIELD_WINDOW_DAYS = 60      # 只採用此天數內的紀錄 (0 表示全部)
+SLOT_YIELD_SKIP_AFTER = 3        # 同一網址樣式造訪此次數以上都沒有截圖就略過 (0 表示不略過)
+
+# 擴充功能執行模式 (目前支援 UDN)
+EXTENSION_MODE = False           # True: 掃描/替換/還原打包為 content script，以 --load-extension 載入（一律使用本機瀏覽器）
+EXTENSION_SIGNAL_TIMEOUT = 30    # 等待擴充功能訊號的上限（秒）
+
 # 按鈕設定
 CLOSE_BUTTON_SIZE = {"width": 15, "height": 15}  # 關閉按鈕大小
 INFO_BUTTON_SIZE = {"width": 15, "height": 15}   # 資訊按鈕大小 (與關閉按鈕一致)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+從廣告標籤本身取得廣告位置
+
+頁面有 Google Publisher Tag 時，googletag.pubads().getSlots() 直接列出每個
+廣告位置的容器 id 與宣告尺寸；AdSense 則是 ins.adsbygoogle。以這兩個來源
+取得廣告位置，不需要走訪所有 <script> 比對 textContent 中的 'googletag'。
+"""
+
+from slot_handles import TAG_SLOT_JS
+
+DECLARED_SLOTS_SCRIPT = TAG_SLOT_JS + """
+var extraSelector = arguments[0];
+var slots = [];
+var seen = new Set();
+
+var push = function(element, source, extra) {
+    if (!element || seen.has(element)) return;
+    seen.add(element);
+    var rect = element.getBoundingClientRect();
+    var style = window.getComputedStyle(element);
+    var entry = {
+        element: element,
+        handle: tagSlot(element),
+        source: source,
+        width: Math.round(rect.width),
+        height: Math.round(rect.height),
+        top: rect.top,
+        left: rect.left,
+        pageTop: rect.top + window.pageYOffset,
+        pageLeft: rect.left + window.pageXOffset,
+        display: style.display,
+        visibility: style.visibility,
+        visible: rect.width > 0 && rect.height > 0 && style.display !== 'none' && style.visibility !== 'hidden',
+        isGoogleAd: true,
+        adUnitPath: '',
+        declaredSizes: []
+    };
+    for (var key in extra || {}) entry[key] = extra[key];
+    slots.push(entry);
+};
+
+// 1. Google Publisher Tag：容器與其中的廣告 iframe 都列為候選（容器常比素材寬）
+var gpt = window.googletag;
+if (gpt && gpt.apiReady && typeof gpt.pubads === 'function') {
+    try {
+        gpt.pubads().getSlots().forEach(function(slot) {
+            var container = document.getElementById(slot.getSlotElementId());
+            if (!container) return;
+            var declaredSizes = [];
+            (slot.getSizes() || []).forEach(function(size) {
+                if (size && typeof size.getWidth === 'function') {
+                    declaredSizes.push([size.getWidth(), size.getHeight()]);
+                }
+            });
+            var extra = {adUnitPath: slot.getAdUnitPath(), declaredSizes: declaredSizes};
+            push(container, 'gpt', extra);
+            push(container.querySelector('iframe[id^="google_ads_iframe"]'), 'gpt', extra);
+        });
+    } catch (e) {}
+}
+
+// 2. AdSense：ins.adsbygoogle 與其中的 aswift iframe
+document.querySelectorAll('ins.adsbygoogle').forEach(function(ins) {
+    var extra = {adUnitPath: (ins.getAttribute('data-ad-client') || '') + '/' + (ins.getAttribute('data-ad-slot') || '')};
+    push(ins, 'adsense', extra);
+    push(ins.querySelector('iframe'), 'adsense', extra);
+});
+
+// 3. 網站自有的廣告容器
+if (extraSelector) {
+    document.querySelectorAll(extraSelector).forEach(function(element) {
+        push(element, 'selector');
+    });
+}
+
+return slots;
+"""
+
+
+def find_declared_ad_slots(driver, extra_selectors=None):
+    """回傳 (是否有廣告標籤, 候選列表)
+
+    候選列表格式與掃描結果相容：element、handle、width、height、top、left、
+    display、visibility、visible、isGoogleAd，另有 source / adUnitPath / declaredSizes
+    與文件座標 pageTop / pageLeft。
+    頁面沒有任何 GPT / AdSense 廣告位置時回傳 (False, [])，呼叫端應改用完整掃描。
+    """
+    slots = driver.execute_script(DECLARED_SLOTS_SCRIPT, ', '.join(extra_selectors or [])) or []
+    if not any(slot['source'] != 'selector' for slot in slots):
+        return False, []
+    return True, slots
+
+
+def declared_slots_of_size(slots, target_width, target_height, tolerance=0):
+    """可見且符合尺寸的廣告標籤位置，同一位置（容器與其中的 iframe）只保留一個"""
+    matches = []
+    seen_positions = set()
+    for slot in slots:
+        if not slot['visible']:
+            continue
+        if abs(slot['width'] - target_width) > tolerance or abs(slot['height'] - target_height) > tolerance:
+            continue
+        position = f"top:{slot['top']:.0f}, left:{slot['left']:.0f}"
+        if position in seen_positions:
+            continue
+        seen_positions.add(position)
+        matches.append(dict(slot, position=position))
+    return matches
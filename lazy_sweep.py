@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+懶載入廣告的單次觸發掃描
+
+掃描前以視窗高度為一段向下捲動整頁，每一段以 IntersectionObserver 找出進入
+畫面的廣告位置，等到這些位置完成繪製（GPT slotRenderEnded、AdSense
+data-ad-status、iframe 已有尺寸）就立刻前往下一段，不用固定秒數等待；
+最後回到頁首。整個過程有總時間上限，所有懶載入廣告在掃描前一次被觸發。
+"""
+
+LAZY_SWEEP_SCRIPT = """
+var options = arguments[0];
+var done = arguments[arguments.length - 1];
+var startTime = Date.now();
+var adSelector = options.adSelector;
+
+// GPT 廣告位置完成繪製事件
+var renderedIds = window.__adRenderedSlotIds = window.__adRenderedSlotIds || {};
+var gpt = window.googletag;
+if (gpt && gpt.cmd && !window.__adRenderListener) {
+    window.__adRenderListener = true;
+    gpt.cmd.push(function() {
+        gpt.pubads().addEventListener('slotRenderEnded', function(event) {
+            renderedIds[event.slot.getSlotElementId()] = true;
+        });
+    });
+}
+
+var isRendered = function(element) {
+    if (element.id && renderedIds[element.id]) return true;
+    var gptParent = element.closest('[id^="div-gpt-ad"]');
+    if (gptParent && renderedIds[gptParent.id]) return true;
+    if (element.matches('ins.adsbygoogle')) {
+        return element.hasAttribute('data-ad-status') || element.getAttribute('data-adsbygoogle-status') === 'done';
+    }
+    var frame = element.tagName === 'IFRAME' ? element : element.querySelector('iframe');
+    if (frame) {
+        var rect = frame.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0;
+    }
+    var img = element.tagName === 'IMG' ? element : element.querySelector('img');
+    return !!(img && img.complete && img.naturalWidth > 0);
+};
+
+// 進入畫面（含預載邊距）的廣告位置
+var visible = new Set();
+var seen = new Set();
+var observer = new IntersectionObserver(function(entries) {
+    entries.forEach(function(entry) {
+        if (entry.isIntersecting) {
+            visible.add(entry.target);
+            seen.add(entry.target);
+        } else {
+            visible.delete(entry.target);
+        }
+    });
+}, {rootMargin: options.rootMargin});
+document.querySelectorAll(adSelector).forEach(function(element) { observer.observe(element); });
+
+// 捲動途中新插入的廣告位置也納入觀察
+var mutationObserver = new MutationObserver(function(mutations) {
+    mutations.forEach(function(m) {
+        m.addedNodes.forEach(function(node) {
+            if (node.nodeType !== 1) return;
+            if (node.matches(adSelector)) observer.observe(node);
+            node.querySelectorAll(adSelector).forEach(function(element) { observer.observe(element); });
+        });
+    });
+});
+mutationObserver.observe(document.documentElement, {childList: true, subtree: true});
+
+var steps = 0;
+var rendered = 0;
+var pageHeight = function() {
+    return Math.max(document.body.scrollHeight, document.documentElement.scrollHeight);
+};
+
+var finish = function(timedOut) {
+    observer.disconnect();
+    mutationObserver.disconnect();
+    window.scrollTo(0, 0);
+    seen.forEach(function(element) { if (isRendered(element)) rendered++; });
+    done({
+        steps: steps,
+        slotsSeen: seen.size,
+        rendered: rendered,
+        timedOut: timedOut,
+        elapsed: Date.now() - startTime
+    });
+};
+
+var step = function(position) {
+    if (Date.now() - startTime > options.maxMs) return finish(true);
+    steps++;
+    window.scrollTo(0, position);
+    var bandStart = Date.now();
+
+    var check = function() {
+        var dwell = Date.now() - bandStart;
+        var pending = 0;
+        visible.forEach(function(element) { if (!isRendered(element)) pending++; });
+        var bandDone = dwell >= options.minDwellMs && pending === 0;
+        if (!bandDone && dwell < options.bandTimeoutMs && Date.now() - startTime <= options.maxMs) {
+            return setTimeout(check, 100);
+        }
+        if (position + window.innerHeight >= pageHeight() - 1) return finish(false);
+        step(position + window.innerHeight);
+    };
+    requestAnimationFrame(function() { setTimeout(check, 50); });
+};
+
+step(0);
+"""
+
+DEFAULT_AD_SELECTOR = ', '.join([
+    'ins.adsbygoogle',
+    'div[id^="div-gpt-ad"]',
+    'div[id*="google_ads"]',
+    'iframe[src*="googlesyndication"]',
+    'iframe[src*="doubleclick"]',
+    'iframe[id^="google_ads_iframe"]',
+    'iframe[id^="aswift_"]',
+])
+
+
+def sweep_lazy_ads(driver, ad_selector=DEFAULT_AD_SELECTOR, band_timeout=1.5, min_dwell=0.2, max_seconds=15):
+    """以視窗高度為一段捲動整頁觸發懶載入廣告，完成後回到頁首，回傳統計資訊"""
+    previous_timeout = driver.timeouts.script
+    driver.set_script_timeout(max_seconds + 5)
+    try:
+        result = driver.execute_async_script(LAZY_SWEEP_SCRIPT, {
+            'adSelector': ad_selector,
+            'rootMargin': '200px 0px',
+            'bandTimeoutMs': int(band_timeout * 1000),
+            'minDwellMs': int(min_dwell * 1000),
+            'maxMs': int(max_seconds * 1000),
+        })
+    finally:
+        driver.set_script_timeout(previous_timeout)
+    status = "⏱️ 已達時間上限" if result['timedOut'] else "✅ 完成"
+    print(f"{status} 懶載入掃描: {result['steps']} 段, 廣告位置 {result['slotsSeen']} 個 "
+          f"(已繪製 {result['rendered']}), {result['elapsed'] / 1000:.1f} 秒")
+    return result
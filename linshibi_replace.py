@@ -29,10 +29,13 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from slot_index import SlotIndex
+from browser_backend import open_browser
+from seen_urls import SeenUrlIndex
+from slot_yield import SlotYieldMemory
 
 # 載入 GIF 設定檔（主要設定檔）
 try:
@@ -50,6 +53,9 @@ except ImportError:
 if 'LINSHIBI_BASE_URL' not in globals():
     LINSHIBI_BASE_URL = "https://linshibi.com"
 
+# 找不到文章時的備用網址從這篇文章往前取
+LINSHIBI_FALLBACK_POST_ID = 47121
+
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
     
@@ -231,9 +237,20 @@ class LinshibiAdReplacer:
     
     def __init__(self, headless=False, screen_id=1):
         self.screen_id = screen_id
+        # 跨執行的已截圖網址，探索文章時略過
+        self.seen_urls = None
+        if SEEN_URL_FILTER:
+            self.seen_urls = SeenUrlIndex(SEEN_URL_DB, 'linshibi', SEEN_URL_SITE_EXPIRY_DAYS.get('linshibi', SEEN_URL_EXPIRY_DAYS))
+        # 各網址與網址樣式的版位產出，探索文章時依預期產出排序
+        self.slot_yield = None
+        if SLOT_YIELD_MEMORY:
+            self.slot_yield = SlotYieldMemory(SLOT_YIELD_DB, 'linshibi', SLOT_YIELD_WINDOW_DAYS, SLOT_YIELD_SKIP_AFTER)
+        self.page_slot_sizes = None     # 本頁找到的版位尺寸，尚未完成掃描時為 None
         self.setup_driver(headless)
         self.load_replace_images()
-        self.prewarm_svg_rendering()
+        # 沿用的常駐瀏覽器在先前執行時已預熱過，不需再載入預熱頁面
+        if not self.browser.reused:
+            self.prewarm_svg_rendering()
         
     def setup_driver(self, headless):
         chrome_options = Options()
@@ -252,10 +269,17 @@ class LinshibiAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
+        
+        # 文件開始時即追蹤動態插入的廣告位置
+        self.slot_index = SlotIndex(self.driver)
+        self.slot_index.install()
         
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -1107,6 +1131,7 @@ class LinshibiAdReplacer:
     
     def process_website(self, url):
         """處理單個網站，遍歷所有替換圖片"""
+        self.page_slot_sizes = None
         try:
             print(f"\n開始處理網站: {url}")
             
@@ -1123,6 +1148,7 @@ class LinshibiAdReplacer:
             total_replacements = 0
             screenshot_paths = []  # 儲存所有截圖路徑
             processed_positions = set()  # 記錄已處理的位置，避免重複
+            found_sizes = []
             
             for image_info in self.replace_images:
                 print(f"\n檢查圖片: {image_info['filename']} ({image_info['width']}x{image_info['height']})")
@@ -1140,6 +1166,7 @@ class LinshibiAdReplacer:
                 if not matching_elements:
                     print(f"未找到符合 {image_info['width']}x{image_info['height']} 尺寸的廣告位置")
                     continue
+                found_sizes.append(f"{image_info['width']}x{image_info['height']}")
                 
                 # 只處理第一個找到的廣告位置（每個版位只截一次）
                 for ad_info in matching_elements:
@@ -1351,6 +1378,9 @@ class LinshibiAdReplacer:
                         print(f"替換廣告失敗: {e}")
                         continue
             
+            # 所有圖片都掃描完成後才記錄，載入失敗的頁面不列入版位產出
+            self.page_slot_sizes = found_sizes
+            
             # 總結處理結果
             if total_replacements > 0:
                 print(f"\n{'='*50}")
@@ -1537,6 +1567,19 @@ class LinshibiAdReplacer:
         """等待動態廣告載入完成"""
         print("⏳ 等待動態廣告載入...")
         
+        # 以即時索引的版本差異判斷：有廣告位置且一段時間內不再變動即視為載入完成
+        try:
+            settled = self.slot_index.wait_until_settled(timeout=timeout)
+            ad_count = sum(1 for slot in self.slot_index.slots.values() if slot['width'] > 0 and slot['height'] > 0)
+            if settled:
+                print("✅ 動態廣告載入完成")
+            else:
+                print(f"⚠️ {timeout} 秒內廣告位置仍在變動")
+            print(f"🎯 檢測到 {ad_count} 個廣告元素 (索引版本 {self.slot_index.version})")
+            return ad_count > 0
+        except Exception as e:
+            print(f"⚠️ 廣告位置索引無法使用，改用掃描: {e}")
+        
         # 等待 AdSense 廣告載入
         try:
             self.driver.execute_script("""
@@ -1580,31 +1623,36 @@ class LinshibiAdReplacer:
         # 針對不同類型的動態廣告使用不同策略
         replaced_count = 0
         
+        # 從即時索引取得各類型的廣告位置，只解析需要的元素
+        self.slot_index.sync()
+        slots = list(self.slot_index.slots.values())
+        aswift_handles = [s['handle'] for s in slots
+                          if s['tagName'] == 'iframe' and s['id'].startswith('aswift_')
+                          and abs(s['width'] - target_width) <= 2 and abs(s['height'] - target_height) <= 2]
+        ns_handles = [s['handle'] for s in slots if s['tagName'] == 'div' and s['className'].startswith('ns-')]
+        criteo_handles = [s['handle'] for s in slots
+                          if s['tagName'] == 'div' and (s['id'] == 'bnr' or 'isSetup' in s['className'].split())]
+        elements = self.slot_index.resolve(aswift_handles + ns_handles + criteo_handles)
+        
         # 1. 處理 AdSense iframe 廣告
-        adsense_iframes = self.driver.find_elements(By.CSS_SELECTOR, 'iframe[id^="aswift_"]')
-        for iframe in adsense_iframes:
+        for handle in aswift_handles:
+            iframe = elements.get(handle)
+            if iframe is None:
+                continue
             try:
-                # 檢查 iframe 尺寸
-                size = self.driver.execute_script("""
-                    var iframe = arguments[0];
-                    var rect = iframe.getBoundingClientRect();
-                    return {width: Math.round(rect.width), height: Math.round(rect.height)};
-                """, iframe)
-                
-                if (abs(size['width'] - target_width) <= 2 and 
-                    abs(size['height'] - target_height) <= 2):
-                    
-                    # 替換 iframe 的父容器
-                    parent = iframe.find_element(By.XPATH, '..')
-                    if self.replace_iframe_ad(parent, target_width, target_height):
-                        replaced_count += 1
-                        print(f"✅ 成功替換 AdSense iframe 廣告")
+                # 替換 iframe 的父容器
+                parent = iframe.find_element(By.XPATH, '..')
+                if self.replace_iframe_ad(parent, target_width, target_height):
+                    replaced_count += 1
+                    print(f"✅ 成功替換 AdSense iframe 廣告")
             except Exception as e:
                 print(f"⚠️ 處理 AdSense iframe 失敗: {e}")
         
         # 2. 處理 Google 展示廣告 (ns- 類型)
-        ns_ads = self.driver.find_elements(By.CSS_SELECTOR, 'div[class^="ns-"]')
-        for ad in ns_ads:
+        for handle in ns_handles:
+            ad = elements.get(handle)
+            if ad is None:
+                continue
             try:
                 if self.replace_ns_ad(ad, target_width, target_height):
                     replaced_count += 1
@@ -1613,8 +1661,10 @@ class LinshibiAdReplacer:
                 print(f"⚠️ 處理 Google 展示廣告失敗: {e}")
         
         # 3. 處理 Criteo 廣告
-        criteo_ads = self.driver.find_elements(By.CSS_SELECTOR, 'div#bnr, div.isSetup')
-        for ad in criteo_ads:
+        for handle in criteo_handles:
+            ad = elements.get(handle)
+            if ad is None:
+                continue
             try:
                 if self.replace_criteo_ad(ad, target_width, target_height):
                     replaced_count += 1
@@ -2166,37 +2216,50 @@ class LinshibiAdReplacer:
                     not is_pagination and
                     self._is_valid_article_url(url)):
                     
+                    # 先前已截圖的文章不再排入
+                    if self.seen_urls and self.seen_urls.seen(url):
+                        processed_urls.add(url)
+                        print(f"🗂️ 跳過已截圖的文章: {url}")
+                        continue
+                    
                     blog_urls.append(url)
                     processed_urls.add(url)
                     print(f"第 {len(blog_urls)} 個文章: {title[:50]}...")
                     print(f"  URL: {url} (來源: {source})")
                     
-                    # 達到所需數量就停止
-                    if len(blog_urls) >= count:
+                    # 達到所需數量就停止（有版位產出記憶時先收集全部，排序後再取）
+                    if len(blog_urls) >= count and not self.slot_yield:
                         break
                 elif is_pagination:
                     print(f"⏭️ 跳過分頁連結: {title[:30]}... → {url}")
             
+            if self.slot_yield and blog_urls:
+                blog_urls = self.slot_yield.prioritize(blog_urls)[:count]
+            
             print(f"總共獲取到 {len(blog_urls)} 個按順序排列的文章連結")
             
             # 如果沒找到任何文章，返回備用 URL
             if not blog_urls:
                 print("未找到任何文章連結，使用備用 URL")
-                blog_urls = [
-                    "https://linshibi.com/?p=47121",
-                    "https://linshibi.com/?p=47120", 
-                    "https://linshibi.com/?p=47119"
-                ]
+                blog_urls = self._fallback_article_urls()
             
             return blog_urls
             
         except Exception as e:
             print(f"獲取文章連結失敗: {e}")
-            return [
-                "https://linshibi.com/?p=47121",
-                "https://linshibi.com/?p=47120",
-                "https://linshibi.com/?p=47119"
-            ]
+            return self._fallback_article_urls()
+    
+    def _fallback_article_urls(self, count=3, max_lookback=200):
+        """備用網址：從 LINSHIBI_FALLBACK_POST_ID 往前取尚未截圖過的文章"""
+        urls = []
+        for post_id in range(LINSHIBI_FALLBACK_POST_ID, LINSHIBI_FALLBACK_POST_ID - max_lookback, -1):
+            url = f"https://linshibi.com/?p={post_id}"
+            if self.seen_urls and self.seen_urls.seen(url):
+                continue
+            urls.append(url)
+            if len(urls) >= count:
+                break
+        return urls
     
     def _is_valid_article_url(self, url):
         """檢查是否為有效的文章 URL - 參考 linshibi_replace.py 的邏輯"""
@@ -2285,9 +2348,13 @@ class LinshibiAdReplacer:
                     }
                     
                     results.append(result)
+                    if self.slot_yield and self.page_slot_sizes is not None:
+                        self.slot_yield.record(url, self.page_slot_sizes, len(screenshot_paths))
                     
                     if result['success']:
                         successful_count += 1
+                        if self.seen_urls:
+                            self.seen_urls.mark(url)
                     
                     # 避免請求過於頻繁
                     if i < len(urls):
@@ -2314,6 +2381,8 @@ class LinshibiAdReplacer:
             print(f"\n📸 截圖統計:")
             print(f"成功截圖: {total_screenshots}")
             print(f"截圖保存位置: {SCREENSHOT_FOLDER}/")
+            if self.slot_yield:
+                self.slot_yield.print_summary()
             
             return results
             
@@ -2326,7 +2395,11 @@ class LinshibiAdReplacer:
         finally:
             # 清理資源
             try:
-                self.driver.quit()
+                if self.seen_urls:
+                    self.seen_urls.close()
+                if self.slot_yield:
+                    self.slot_yield.close()
+                self.browser.close()
                 print("✅ 瀏覽器已關閉")
             except:
                 pass
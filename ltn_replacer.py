@@ -9,10 +9,12 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from dom_snapshot_scanner import scan_for_ads
+from gpt_slots import declared_slots_of_size, find_declared_ad_slots
+from browser_backend import open_browser
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -52,6 +54,10 @@ except ImportError:
     PROCESS_DYNAMIC_ADS = False  # 是否處理動態廣告（False=跳過動態廣告）
     MAX_STABILITY_RETRIES = 3  # 每個位置最大重試次數
     STABILITY_WAIT_TIME = 2  # 等待廣告穩定的時間（秒）
+    # 廣告位置掃描預設設定
+    USE_DOM_SNAPSHOT_SCAN = True
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -294,10 +300,13 @@ class GoogleAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
         
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -476,6 +485,24 @@ class GoogleAdReplacer:
         """掃描整個網頁尋找符合尺寸的廣告元素"""
         print(f"開始掃描整個網頁尋找 {target_width}x{target_height} 的廣告...")
         
+        # 快速路徑：直接向 googletag / AdSense 取得廣告位置，有符合尺寸的就不必掃描整頁
+        try:
+            has_tags, declared_slots = find_declared_ad_slots(self.driver)
+            if has_tags:
+                matching = declared_slots_of_size(declared_slots, target_width, target_height)
+                print(f"⚡ 由廣告標籤取得 {len(declared_slots)} 個廣告位置，其中 {len(matching)} 個符合尺寸")
+                if matching:
+                    return matching
+        except Exception as e:
+            print(f"⚠️ 讀取 googletag/AdSense 廣告位置失敗，改用完整掃描: {e}")
+        
+        # 優先使用 DOMSnapshot：一次 CDP 呼叫取得所有版面方塊，在 Python 端比對
+        if USE_DOM_SNAPSHOT_SCAN:
+            try:
+                return scan_for_ads(self.driver, target_width, target_height, tolerance=0)
+            except Exception as e:
+                print(f"DOMSnapshot 掃描失敗，改用頁面腳本掃描: {e}")
+        
         # 獲取所有可見的元素
         all_elements = self.driver.execute_script("""
             function getAllVisibleElements() {
@@ -652,127 +679,79 @@ class GoogleAdReplacer:
         return button_styles.get(button_style, button_styles["dots"])
 
     def save_complete_ad_state(self, element):
-        """在任何操作前保存完整的廣告狀態"""
+        """在任何操作前保存完整的廣告狀態 - 狀態保留在頁面內，只回傳槽位 ID"""
         try:
-            saved_state = self.driver.execute_script("""
+            slot_id = self.driver.execute_script("""
                 var element = arguments[0];
                 if (!element) return null;
                 
-                return {
-                    outerHTML: element.outerHTML,
-                    innerHTML: element.innerHTML,
-                    cssSelector: arguments[1],
-                    xpath: arguments[2],
-                    attributes: Array.from(element.attributes).reduce((attrs, attr) => {
-                        attrs[attr.name] = attr.value;
-                        return attrs;
-                    }, {}),
-                    computedStyle: window.getComputedStyle(element).cssText,
-                    parentHTML: element.parentElement ? element.parentElement.outerHTML : null
-                };
-            """, element, self.generate_css_selector(element), self.generate_xpath(element))
-            
-            return saved_state
-        except Exception as e:
-            print(f"保存廣告狀態失敗: {e}")
-            return None
-
-    def generate_css_selector(self, element):
-        """生成元素的 CSS 選擇器"""
-        try:
-            return self.driver.execute_script("""
-                function getSelector(element) {
-                    if (element.id) {
-                        return '#' + element.id;
-                    }
-                    
-                    var path = [];
-                    while (element && element.nodeType === Node.ELEMENT_NODE) {
-                        var selector = element.nodeName.toLowerCase();
-                        if (element.className) {
-                            selector += '.' + element.className.replace(/\\s+/g, '.');
-                        }
-                        path.unshift(selector);
-                        element = element.parentElement;
-                    }
-                    return path.join(' > ');
+                // 頁面內的狀態倉庫：槽位 ID -> { 元素參考, 原始內容, 原始屬性 }
+                window.__adStateStore = window.__adStateStore || { seq: 0, slots: new Map() };
+                var store = window.__adStateStore;
+                
+                // 同一元素重複保存時沿用既有 ID，避免覆蓋最早的原始狀態
+                var slotId = element.getAttribute('data-ad-slot-id');
+                if (slotId && store.slots.has(slotId)) {
+                    return slotId;
                 }
-                return getSelector(arguments[0]);
-            """, element)
-        except Exception as e:
-            print(f"生成 CSS 選擇器失敗: {e}")
-            return None
-
-    def generate_xpath(self, element):
-        """生成元素的 XPath"""
-        try:
-            return self.driver.execute_script("""
-                function getXPath(element) {
-                    if (element.id) {
-                        return '//*[@id="' + element.id + '"]';
-                    }
-                    
-                    var path = [];
-                    while (element && element.nodeType === Node.ELEMENT_NODE) {
-                        var index = 0;
-                        var siblings = element.parentNode.childNodes;
-                        for (var i = 0; i < siblings.length; i++) {
-                            var sibling = siblings[i];
-                            if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName === element.nodeName) {
-                                index++;
-                            }
-                            if (sibling === element) {
-                                break;
-                            }
-                        }
-                        var tagName = element.nodeName.toLowerCase();
-                        path.unshift(tagName + '[' + index + ']');
-                        element = element.parentElement;
-                    }
-                    return '/' + path.join('/');
+                
+                slotId = 'ad-slot-' + (++store.seq);
+                var attributes = {};
+                for (var i = 0; i < element.attributes.length; i++) {
+                    attributes[element.attributes[i].name] = element.attributes[i].value;
                 }
-                return getXPath(arguments[0]);
+                store.slots.set(slotId, {
+                    element: element,
+                    innerHTML: element.innerHTML,
+                    attributes: attributes
+                });
+                element.setAttribute('data-ad-slot-id', slotId);
+                return slotId;
             """, element)
+            
+            return slot_id
         except Exception as e:
-            print(f"生成 XPath 失敗: {e}")
+            print(f"保存廣告狀態失敗: {e}")
             return None
 
     def restore_from_saved_state(self, saved_state):
-        """使用保存的狀態還原廣告"""
+        """使用保存的狀態還原廣告（saved_state 為 save_complete_ad_state 回傳的槽位 ID）"""
         try:
             if not saved_state:
                 return False
-                
-            # 嘗試使用 CSS 選擇器找到元素
-            element = None
-            if saved_state.get('cssSelector'):
-                try:
-                    element = self.driver.find_element(By.CSS_SELECTOR, saved_state['cssSelector'])
-                except:
-                    pass
             
-            # 如果 CSS 選擇器失敗，嘗試 XPath
-            if not element and saved_state.get('xpath'):
-                try:
-                    element = self.driver.find_element(By.XPATH, saved_state['xpath'])
-                except:
-                    pass
-            
-            if element:
-                # 還原元素內容
-                self.driver.execute_script("""
-                    var element = arguments[0];
-                    var savedState = arguments[1];
-                    
-                    // 還原 innerHTML
-                    element.innerHTML = savedState.innerHTML;
-                    
-                    // 還原屬性
-                    for (var attr in savedState.attributes) {
-                        element.setAttribute(attr, savedState.attributes[attr]);
+            restored = self.driver.execute_script("""
+                var slotId = arguments[0];
+                var store = window.__adStateStore;
+                if (!store || !store.slots.has(slotId)) return false;
+                
+                var state = store.slots.get(slotId);
+                var element = state.element;
+                
+                // 元素被網站重新渲染而脫離文件時，改用槽位標記找回
+                if (!element.isConnected) {
+                    element = document.querySelector('[data-ad-slot-id="' + slotId + '"]');
+                }
+                if (!element) return false;
+                
+                // 還原 innerHTML
+                element.innerHTML = state.innerHTML;
+                
+                // 移除替換過程中新增的屬性，再還原原始屬性
+                Array.from(element.attributes).forEach(function(attr) {
+                    if (!(attr.name in state.attributes)) {
+                        element.removeAttribute(attr.name);
                     }
-                """, element, saved_state)
+                });
+                for (var name in state.attributes) {
+                    element.setAttribute(name, state.attributes[name]);
+                }
                 
+                store.slots.delete(slotId);
+                return true;
+            """, saved_state)
+            
+            if restored:
                 print("✅ 從保存狀態成功還原廣告")
                 return True
             else:
@@ -783,30 +762,93 @@ class GoogleAdReplacer:
             print(f"從保存狀態還原失敗: {e}")
             return False
 
+    def discard_saved_state(self, saved_state):
+        """釋放頁面內保存的廣告狀態"""
+        try:
+            if not saved_state:
+                return
+            self.driver.execute_script("""
+                var slotId = arguments[0];
+                var store = window.__adStateStore;
+                if (!store || !store.slots.has(slotId)) return;
+                var element = store.slots.get(slotId).element;
+                if (element && element.removeAttribute) {
+                    element.removeAttribute('data-ad-slot-id');
+                }
+                store.slots.delete(slotId);
+            """, saved_state)
+        except Exception as e:
+            print(f"釋放廣告狀態失敗: {e}")
+
     def disable_sticky_behavior(self):
-        """暫時禁用網站的 sticky 廣告行為"""
+        """暫時禁用網站的 sticky 廣告行為 - 使用覆寫樣式表，切換成本為 O(1)"""
         disable_script = """
-            // 保存原始樣式
-            window.originalStyles = window.originalStyles || new Map();
-            
-            // 禁用所有 sticky 和 fixed 定位
-            var elements = document.querySelectorAll('*');
-            elements.forEach(function(el) {
-                var style = window.getComputedStyle(el);
-                if (style.position === 'sticky' || style.position === 'fixed') {
-                    if (!window.originalStyles.has(el)) {
-                        window.originalStyles.set(el, {
-                            position: style.position,
-                            top: style.top,
-                            bottom: style.bottom,
-                            left: style.left,
-                            right: style.right,
-                            zIndex: style.zIndex
-                        });
+            // 每個文件只建立一次 sticky/fixed 索引，之後只切換覆寫樣式表
+            if (!window.__adStickyIndex) {
+                var selectors = ['[style*="position: sticky"]', '[style*="position:sticky"]',
+                                 '[style*="position: fixed"]', '[style*="position:fixed"]'];
+                var unreadableSheet = false;
+                
+                // 1. 從可讀取的樣式表收集宣告 sticky/fixed 的選擇器，只用來縮小要檢查的元素
+                var collectRules = function(rules) {
+                    for (var i = 0; i < rules.length; i++) {
+                        var rule = rules[i];
+                        if (rule.cssRules && !rule.selectorText) {
+                            collectRules(rule.cssRules);  // @media / @supports
+                        } else if (rule.selectorText && rule.style) {
+                            var position = rule.style.position;
+                            // 巢狀規則的 & 無法在 querySelectorAll 中使用
+                            if ((position === 'sticky' || position === 'fixed' || position === '-webkit-sticky') &&
+                                rule.selectorText.indexOf('&') === -1) {
+                                selectors.push(rule.selectorText);
+                            }
+                        }
+                    }
+                };
+                for (var s = 0; s < document.styleSheets.length; s++) {
+                    try {
+                        collectRules(document.styleSheets[s].cssRules);
+                    } catch (e) {
+                        unreadableSheet = true;  // 跨網域樣式表無法讀取 cssRules
+                    }
+                }
+                
+                // 2. 只標記計算樣式確實為 sticky/fixed 的元素（不符合的 @media、被覆寫的規則不受影響）；
+                //    有無法讀取的樣式表時改為檢查所有元素
+                var tagIfSticky = function(node) {
+                    var position = window.getComputedStyle(node).position;
+                    if (position === 'sticky' || position === 'fixed' || position === '-webkit-sticky') {
+                        node.setAttribute('data-ad-sticky', 'true');
+                    }
+                };
+                if (unreadableSheet) {
+                    var walker = document.createTreeWalker(document.body, NodeFilter.SHOW_ELEMENT);
+                    var node;
+                    while (node = walker.nextNode()) {
+                        tagIfSticky(node);
+                    }
+                } else {
+                    for (var k = 0; k < selectors.length; k++) {
+                        try {
+                            document.querySelectorAll(selectors[k]).forEach(tagIfSticky);
+                        } catch (e) {}  // 瀏覽器不支援的選擇器
                     }
-                    el.style.position = 'static';
                 }
-            });
+                
+                var overrideStyle = document.createElement('style');
+                overrideStyle.id = 'ad_sticky_override';
+                overrideStyle.textContent = '[data-ad-sticky] { position: static !important; }';
+                (document.head || document.documentElement).appendChild(overrideStyle);
+                overrideStyle.sheet.disabled = true;
+                
+                window.__adStickyIndex = {
+                    style: overrideStyle,
+                    elementCount: document.querySelectorAll('[data-ad-sticky]').length
+                };
+            }
+            
+            // 禁用所有 sticky 和 fixed 定位
+            window.__adStickyIndex.style.sheet.disabled = false;
             
             // 暫停可能導致 DOM 變化的事件（簡化版本，避免使用 getEventListeners）
             window.pausedEvents = [];
@@ -833,17 +875,9 @@ class GoogleAdReplacer:
     def enable_sticky_behavior(self):
         """重新啟用 sticky 行為"""
         enable_script = """
-            // 還原原始樣式
-            if (window.originalStyles) {
-                window.originalStyles.forEach(function(originalStyle, element) {
-                    element.style.position = originalStyle.position;
-                    element.style.top = originalStyle.top;
-                    element.style.bottom = originalStyle.bottom;
-                    element.style.left = originalStyle.left;
-                    element.style.right = originalStyle.right;
-                    element.style.zIndex = originalStyle.zIndex;
-                });
-                window.originalStyles.clear();
+            // 停用覆寫樣式表即可還原原始定位
+            if (window.__adStickyIndex) {
+                window.__adStickyIndex.style.sheet.disabled = true;
             }
             
             // 重新啟用事件監聽器
@@ -901,6 +935,8 @@ class GoogleAdReplacer:
                 if not restore_success:
                     print("⚠️ 常規還原失敗，嘗試從保存狀態還原...")
                     self.restore_from_saved_state(saved_state)
+                else:
+                    self.discard_saved_state(saved_state)
                 
                 return screenshot_path
             else:
@@ -2256,7 +2292,7 @@ class GoogleAdReplacer:
                 return None
     
     def close(self):
-        self.driver.quit()
+        self.browser.close()
 
 def main():
     # 偵測並選擇螢幕
@@ -29,10 +29,10 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from browser_backend import open_browser
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -98,6 +98,8 @@ except ImportError:
     FULLSCREEN_MODE = True
     SCREENSHOT_FOLDER = "screenshots"
     BUTTON_STYLE = "none"
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -300,10 +302,13 @@ class NickleeAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
         
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -1591,7 +1596,7 @@ class NickleeAdReplacer:
         finally:
             # 清理資源
             try:
-                self.driver.quit()
+                self.browser.close()
                 print("✅ 瀏覽器已關閉")
             except:
                 pass
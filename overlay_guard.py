@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+插頁/遮罩廣告預先攔截
+
+在文件開始載入時 (Page.addScriptToEvaluateOnNewDocument) 注入樣式表與
+MutationObserver，讓插頁廣告、同意視窗與全螢幕廣告在第一次繪製前就被隱藏，
+不需要在頁面載入後再執行 remove_fullscreen_ads 掃描。
+
+腳本在剖析器建立 <html> 之前就會執行，此時 document.documentElement 仍是 null：
+MutationObserver 改為監看 document，樣式表等根元素出現後才插入。
+攔截是否在目前頁面生效以 overlay_guard_active() 確認，未生效時仍需載入後掃描。
+"""
+
+import json
+
+# 預設規則
+# - hide: 直接以樣式表隱藏的精確選擇器（一定是遮罩/插頁）
+# - candidates: 名稱可疑但不一定是遮罩的選擇器，插入時才檢查是否為 fixed 且覆蓋大半畫面
+DEFAULT_OVERLAY_RULES = {
+    "hide": [
+        '.modal-overlay',
+        '.popup-overlay',
+        '.ad-overlay',
+        '.interstitial',
+        'ins.adsbygoogle[data-vignette-loaded]',
+        'ins.adsbygoogle[style*="position: fixed"]',
+        'div[id^="google_vignette"]',
+        '.fc-consent-root',
+        '#onetrust-consent-sdk',
+    ],
+    "candidates": [
+        '.overlay',
+        'div[style*="position: fixed"][style*="z-index"]',
+        '[class*="fullscreen"]',
+        '[class*="popup"]',
+        '[id*="popup"]',
+        '[class*="modal"]',
+    ],
+}
+
+OVERLAY_GUARD_SCRIPT = """
+(function(rules) {
+    if (window.__adOverlayGuard) return;
+    window.__adOverlayGuard = { hidden: 0 };
+
+    // 1. 樣式表：精確選擇器與已判定為遮罩的元素在第一次繪製前就不顯示
+    //    文件開始時還沒有根元素，等 documentElement 出現後才插入
+    var css = rules.hide.concat(['[data-ad-overlay-hidden]']).join(',\\n') +
+              ' { display: none !important; }';
+    var styleInserted = false;
+    var ensureStyle = function() {
+        if (styleInserted || !document.documentElement) return;
+        var style = document.createElement('style');
+        style.id = 'ad_overlay_guard';
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+        styleInserted = true;
+    };
+    ensureStyle();
+
+    // 2. 可疑元素（插入時或 class/style 變動後開始符合選擇器）每個只檢查一次：
+    //    fixed 定位且覆蓋大半畫面才隱藏（absolute 定位可能是正常內容，不處理）
+    var candidateSelector = rules.candidates.join(',');
+    var checked = new WeakSet();
+    var hiddenOverlays = [];
+    var checkCandidate = function(el) {
+        if (checked.has(el)) return false;
+        checked.add(el);
+        var style = window.getComputedStyle(el);
+        if (style.position !== 'fixed') return false;
+        var rect = el.getBoundingClientRect();
+        var coversViewport = (rect.width >= window.innerWidth * 0.8 && rect.height >= window.innerHeight * 0.8) ||
+            (rect.top <= 0 && rect.left <= 0 &&
+             (rect.width >= window.innerWidth * 0.5 || rect.height >= window.innerHeight * 0.5));
+        if (!coversViewport) return false;
+        el.setAttribute('data-ad-overlay-hidden', 'true');
+        hiddenOverlays.push(el);
+        window.__adOverlayGuard.hidden++;
+        return true;
+    };
+
+    // 遮罩常把 body 設成 overflow:hidden 鎖住滾動：只在確實隱藏了遮罩、且遮罩仍在頁面上時解除，
+    // 選單、燈箱等網站自己的滾動鎖定不受影響
+    var overlayStillPresent = function() {
+        for (var i = 0; i < hiddenOverlays.length; i++) {
+            if (hiddenOverlays[i].isConnected) return true;
+        }
+        return false;
+    };
+    var unlockScroll = function() {
+        if (document.body && document.body.style.overflow === 'hidden') {
+            document.body.style.overflow = 'auto';
+        }
+    };
+
+    var pending = [];
+    var scheduled = false;
+    var flush = function() {
+        scheduled = false;
+        var batch = pending;
+        pending = [];
+        var hidAny = false;
+        for (var i = 0; i < batch.length; i++) {
+            if (batch[i].isConnected && checkCandidate(batch[i])) hidAny = true;
+        }
+        if (hidAny) unlockScroll();
+    };
+
+    var observer = new MutationObserver(function(mutations) {
+        ensureStyle();
+        for (var i = 0; i < mutations.length; i++) {
+            var m = mutations[i];
+            if (m.type === 'attributes') {
+                if (m.target === document.body) continue;
+                if (!checked.has(m.target) && m.target.matches && m.target.matches(candidateSelector)) {
+                    pending.push(m.target);
+                }
+                continue;
+            }
+            for (var j = 0; j < m.addedNodes.length; j++) {
+                var node = m.addedNodes[j];
+                if (node.nodeType !== 1) continue;
+                if (!checked.has(node) && node.matches(candidateSelector)) pending.push(node);
+                var inner = node.querySelectorAll(candidateSelector);
+                for (var k = 0; k < inner.length; k++) {
+                    if (!checked.has(inner[k])) pending.push(inner[k]);
+                }
+            }
+        }
+        // 同一批變動只檢查一次，並在繪製前完成
+        if (pending.length && !scheduled) {
+            scheduled = true;
+            requestAnimationFrame(flush);
+        }
+        // 遮罩在被隱藏後才鎖住滾動的情況
+        if (hiddenOverlays.length && document.body && document.body.style.overflow === 'hidden' &&
+            overlayStillPresent()) {
+            unlockScroll();
+        }
+    });
+    // document 在文件開始時就存在，根元素建立後的變動也都會收到
+    observer.observe(document, {
+        childList: true,
+        subtree: true,
+        attributes: true,
+        attributeFilter: ['style', 'class']
+    });
+    window.__adOverlayGuard.observer = observer;
+    window.__adOverlayGuard.active = true;
+})(%s);
+"""
+
+
+def build_overlay_guard_script(rules=None):
+    """根據網站規則產生要在文件開始時執行的腳本"""
+    rules = rules or DEFAULT_OVERLAY_RULES
+    merged = {
+        "hide": list(rules.get("hide", [])),
+        "candidates": list(rules.get("candidates", [])),
+    }
+    return OVERLAY_GUARD_SCRIPT % json.dumps(merged, ensure_ascii=False)
+
+
+def install_overlay_guard(driver, rules=None):
+    """將攔截腳本註冊到之後每一次導航的文件開始階段，成功回傳 True"""
+    try:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+            'source': build_overlay_guard_script(rules)
+        })
+        print("🛡️ 已安裝插頁/遮罩廣告預先攔截")
+        return True
+    except Exception as e:
+        print(f"安裝遮罩攔截失敗，改用載入後掃描: {e}")
+        return False
+
+
+def overlay_guard_active(driver):
+    """攔截腳本是否已在目前頁面成功執行"""
+    try:
+        return bool(driver.execute_script(
+            "return !!(window.__adOverlayGuard && window.__adOverlayGuard.active);"))
+    except Exception:
+        return False
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+各網站的資源封鎖設定
+
+文章頁會下載自動播放影片、網頁字型、分析信標與社群外掛，這些不會出現在
+廣告截圖中，卻拖慢就緒時間並消耗頻寬與 CPU。以 CDP Network.setBlockedURLs
+依網站設定封鎖，廣告投放網域列在允許清單中，任何會擋到它們的規則都不會套用。
+
+每頁的請求數與傳輸量由 Chrome performance log 統計：
+- 試算模式 (dry_run)：不封鎖，統計「會被擋下」的請求實際下載了多少，用來調整規則；
+  這些網址的大小依網站記錄到 resource_sizes.json
+- 封鎖模式：實際被擋下的請求數；被擋下的請求不會下載，省下的位元組只能依試算模式
+  記錄的大小估計，沒有紀錄時只回報請求數
+"""
+
+import json
+import os
+import re
+
+DEFAULT_RESOURCE_SIZES_PATH = "resource_sizes.json"
+
+# 所有網站共用：分析信標、社群外掛、第三方影片播放器
+COMMON_BLOCK_PATTERNS = [
+    '*://*.google-analytics.com/*',
+    '*://*.googletagmanager.com/gtag/js*',
+    '*://*.scorecardresearch.com/*',
+    '*://*.chartbeat.com/*',
+    '*://*.chartbeat.net/*',
+    '*://*.hotjar.com/*',
+    '*://*.clarity.ms/*',
+    '*://*.nr-data.net/*',
+    '*://connect.facebook.net/*',
+    '*://*.facebook.com/plugins/*',
+    '*://platform.twitter.com/*',
+    '*://social-plugins.line.me/*',
+    '*://*.disqus.com/*',
+    '*://www.youtube.com/embed/*',
+    '*://*.ytimg.com/*',
+    '*://*.jwpcdn.com/*',
+]
+
+# 網頁字型（不影響廣告位置尺寸，只影響文字字型）
+FONT_BLOCK_PATTERNS = [
+    '*://fonts.googleapis.com/*',
+    '*://fonts.gstatic.com/*',
+    '*://use.typekit.net/*',
+]
+
+# 各網站自有的影片與信標
+SITE_BLOCK_PROFILES = {
+    'tvbs': COMMON_BLOCK_PATTERNS + FONT_BLOCK_PATTERNS + [
+        '*://*.tvbs.com.tw/*.mp4*',
+        '*://*.tvbs.com.tw/*.m3u8*',
+    ],
+    'ettoday': COMMON_BLOCK_PATTERNS + FONT_BLOCK_PATTERNS + [
+        '*://*.ettoday.net/*.mp4*',
+        '*://*.ettoday.net/*.m3u8*',
+    ],
+    # Yahoo 的影片與廣告素材同在 s.yimg.com，只擋信標；字型保留以免版面文字改變
+    'yahoo': COMMON_BLOCK_PATTERNS + [
+        '*://udc.yahoo.com/*',
+        '*://*.analytics.yahoo.com/*',
+    ],
+}
+
+# 廣告投放網域：不可被任何規則擋下
+AD_ALLOWLIST_DOMAINS = [
+    'pagead2.googlesyndication.com',
+    'tpc.googlesyndication.com',
+    'safeframe.googlesyndication.com',
+    'securepubads.g.doubleclick.net',
+    'googleads.g.doubleclick.net',
+    'ad.doubleclick.net',
+    'www.googletagservices.com',
+    'www.googleadservices.com',
+    'adservice.google.com',
+    'imasdk.googleapis.com',
+    'static.criteo.net',
+    'cat.sg1.as.criteo.com',
+    'beap.gemini.yahoo.com',
+    's.yimg.com',
+]
+
+# 以這些路徑檢查規則是否會擋到允許清單中的網域
+_ALLOWLIST_PROBE_PATHS = ['/', '/tag/js/gpt.js', '/simgad/1.png', '/video.mp4', '/font.woff2', '/gtag/js?id=x']
+
+
+def _pattern_to_regex(pattern):
+    """CDP 封鎖規則只支援 * 萬用字元"""
+    return re.compile('^' + '.*'.join(re.escape(part) for part in pattern.split('*')) + '$')
+
+
+def filter_allowlisted(patterns, allowlist=AD_ALLOWLIST_DOMAINS):
+    """移除會擋到廣告網域的規則，回傳 (可套用的規則, 被移除的規則)"""
+    probes = [f"https://{domain}{path}" for domain in allowlist for path in _ALLOWLIST_PROBE_PATHS]
+    kept, dropped = [], []
+    for pattern in patterns:
+        regex = _pattern_to_regex(pattern)
+        if any(regex.match(url) for url in probes):
+            dropped.append(pattern)
+        else:
+            kept.append(pattern)
+    return kept, dropped
+
+
+def enable_network_log(chrome_options):
+    """建立 driver 前呼叫：開啟 performance log 以統計每頁請求"""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+class ResourceBlocker:
+    """套用網站封鎖規則並統計每頁省下的請求數與位元組"""
+
+    def __init__(self, driver, site, dry_run=False, extra_patterns=None, sizes_path=DEFAULT_RESOURCE_SIZES_PATH):
+        self.driver = driver
+        self.site = site
+        self.dry_run = dry_run
+        self.sizes_path = sizes_path
+        patterns = SITE_BLOCK_PROFILES.get(site, COMMON_BLOCK_PATTERNS) + list(extra_patterns or [])
+        self.patterns, dropped = filter_allowlisted(patterns)
+        for pattern in dropped:
+            print(f"⚠️ 封鎖規則會擋到廣告網域，已略過: {pattern}")
+        self._regexes = [_pattern_to_regex(p) for p in self.patterns]
+        self.known_sizes = self._load_sizes()   # 去掉 query 的網址 -> 試算模式觀察到的傳輸大小
+        self.totals = {'pages': 0, 'requests': 0, 'bytes': 0, 'saved_requests': 0, 'saved_bytes': 0,
+                       'estimated_requests': 0}
+
+    def _read_sizes_file(self):
+        try:
+            with open(self.sizes_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_sizes(self):
+        if not self.sizes_path:
+            return {}
+        return dict(self._read_sizes_file().get(self.site, {}))
+
+    def save_sizes(self):
+        """試算模式：記錄符合封鎖規則的網址大小，供封鎖模式估計省下的位元組"""
+        if not self.sizes_path or not self.dry_run or not self.known_sizes:
+            return
+        try:
+            all_sizes = self._read_sizes_file()
+            all_sizes[self.site] = self.known_sizes
+            temp_path = self.sizes_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(all_sizes, f, ensure_ascii=False)
+            os.replace(temp_path, self.sizes_path)
+        except OSError as e:
+            print(f"⚠️ 無法寫入資源大小紀錄 {self.sizes_path}: {e}")
+
+    def apply(self):
+        """啟用封鎖（試算模式只開啟 Network 事件），成功回傳 True"""
+        try:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            if not self.dry_run:
+                self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.patterns})
+            mode = "試算" if self.dry_run else "封鎖"
+            print(f"🚫 已套用 {self.site} 資源{mode}規則: {len(self.patterns)} 條")
+            return True
+        except Exception as e:
+            print(f"套用資源封鎖規則失敗: {e}")
+            return False
+
+    def matches(self, url):
+        return any(regex.match(url) for regex in self._regexes)
+
+    def _read_network_events(self):
+        try:
+            entries = self.driver.get_log('performance')
+        except Exception:
+            return []
+        events = []
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if message.get('method', '').startswith('Network.'):
+                events.append(message)
+        return events
+
+    def discard_events(self):
+        """換頁前清除尚未統計的事件"""
+        self._read_network_events()
+
+    def page_report(self, url=None):
+        """統計自上次呼叫以來的請求，回傳並累計本頁的節省量"""
+        urls, sizes, blocked = {}, {}, set()
+        for event in self._read_network_events():
+            params = event.get('params', {})
+            request_id = params.get('requestId')
+            method = event['method']
+            if method == 'Network.requestWillBeSent':
+                urls[request_id] = params['request']['url']
+            elif method == 'Network.loadingFinished':
+                sizes[request_id] = params.get('encodedDataLength', 0)
+            elif method == 'Network.loadingFailed' and params.get('blockedReason') == 'inspector':
+                blocked.add(request_id)
+
+        page = {'requests': 0, 'bytes': 0, 'saved_requests': 0, 'saved_bytes': 0, 'estimated_requests': 0}
+        for request_id, request_url in urls.items():
+            key = request_url.split('?')[0]
+            if request_id in blocked:
+                page['saved_requests'] += 1
+                if key in self.known_sizes:
+                    page['saved_bytes'] += self.known_sizes[key]
+                    page['estimated_requests'] += 1
+                continue
+            size = sizes.get(request_id, 0)
+            page['requests'] += 1
+            page['bytes'] += size
+            if self.dry_run and self.matches(request_url):
+                page['saved_requests'] += 1
+                page['saved_bytes'] += size
+                if size:
+                    self.known_sizes[key] = size
+
+        self.totals['pages'] += 1
+        for key in ('requests', 'bytes', 'saved_requests', 'saved_bytes', 'estimated_requests'):
+            self.totals[key] += page[key]
+        self.save_sizes()
+
+        print(f"📉 {url or '本頁'}: {page['requests']} 個請求 {page['bytes'] / 1024:.0f} KB，"
+              f"{self._saved_text(page, 'KB', 1024)}")
+        return page
+
+    def _saved_text(self, counts, unit, divisor):
+        if self.dry_run:
+            return f"可省下 {counts['saved_requests']} 個請求 {counts['saved_bytes'] / divisor:.1f} {unit}"
+        text = f"已省下 {counts['saved_requests']} 個請求"
+        if counts['estimated_requests']:
+            # 只有試算模式記錄過大小的請求能估計位元組
+            text += (f" (其中 {counts['estimated_requests']} 個依試算紀錄估計約 "
+                     f"{counts['saved_bytes'] / divisor:.1f} {unit})")
+        return text
+
+    def print_summary(self):
+        totals = self.totals
+        if not totals['pages']:
+            return
+        print(f"\n📉 資源封鎖統計 ({self.site}, {totals['pages']} 頁): "
+              f"下載 {totals['requests']} 個請求 {totals['bytes'] / 1024 / 1024:.1f} MB，"
+              f"{self._saved_text(totals, 'MB', 1024 * 1024)}")
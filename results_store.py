@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+替換結果資料庫
+
+replacement_details 原本是記憶體中的 list，執行越久越大，結束後也無法查詢。
+ResultsStore 把每次執行、網址、替換（廣告位置尺寸 / 位置、素材、GIF 與否、
+截圖路徑）與各階段耗時寫入 SQLite：
+- WAL 模式：多個 replacer 行程（不同螢幕）可同時寫入同一個資料庫，讀取不會擋住寫入
+- 寫入由背景執行緒負責：呼叫端只把紀錄放進佇列，不等磁碟；
+  背景執行緒把累積的紀錄合併在同一個交易中寫入
+- 結束時的統計直接以 SQL 彙總查詢
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_RESULTS_DB = "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    site        TEXT NOT NULL,
+    quota       INTEGER,
+    started_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    run_id      TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    status      TEXT,
+    screenshots INTEGER DEFAULT 0,
+    started_at  REAL,
+    finished_at REAL,
+    PRIMARY KEY (run_id, url)
+);
+CREATE TABLE IF NOT EXISTS replacements (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id          TEXT NOT NULL,
+    url             TEXT,
+    slot_size       TEXT,
+    slot_position   TEXT,
+    creative        TEXT,
+    is_gif          INTEGER NOT NULL DEFAULT 0,
+    screenshot_path TEXT,
+    created_at      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    run_id     TEXT NOT NULL,
+    url        TEXT,
+    stage      TEXT NOT NULL,
+    seconds    REAL NOT NULL,
+    overrun    INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_replacements_run ON replacements (run_id, url);
+CREATE INDEX IF NOT EXISTS idx_stage_timings_run ON stage_timings (run_id, stage);
+"""
+
+_STOP = object()
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=30000")
+    return connection
+
+
+class ResultsStore:
+    """以背景執行緒寫入 SQLite 的替換結果"""
+
+    def __init__(self, path=DEFAULT_RESULTS_DB, site="", quota=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.site = site
+        self.run_id = f"{site}-{time.strftime('%Y%m%d_%H%M%S')}-{os.getpid()}"
+        self.current_url = None
+
+        setup = _connect(path)
+        setup.executescript(SCHEMA)
+        setup.close()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._put("INSERT INTO runs (run_id, site, quota, started_at) VALUES (?, ?, ?, ?)",
+                  (self.run_id, site, quota, time.time()))
+
+    # 背景寫入
+
+    def _put(self, sql, params):
+        self._queue.put((sql, params))
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            # 把佇列中已累積的紀錄合併成同一個交易
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            statements = [item for item in batch if item is not _STOP]
+            try:
+                with connection:
+                    for sql, params in statements:
+                        connection.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"⚠️ 寫入結果資料庫失敗: {e}")
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                break
+        connection.close()
+
+    def flush(self):
+        """等待佇列中的紀錄全部寫入"""
+        self._queue.join()
+
+    # 紀錄
+
+    def resume_run(self, run_id):
+        """續跑上一次的執行：改用原本的 run_id，捨棄本次新建的執行"""
+        if run_id and run_id != self.run_id:
+            self._put("DELETE FROM runs WHERE run_id = ?", (self.run_id,))
+            self.run_id = run_id
+            self._put("UPDATE runs SET finished_at = NULL WHERE run_id = ?", (run_id,))
+
+    def begin_page(self, url):
+        """開始處理網址；同一次執行中先前中斷留下的紀錄一併清除"""
+        self.current_url = url
+        for table in ('replacements', 'stage_timings', 'pages'):
+            self._put(f"DELETE FROM {table} WHERE run_id = ? AND url = ?", (self.run_id, url))
+        self._put("INSERT INTO pages (run_id, url, status, started_at) VALUES (?, ?, 'running', ?)",
+                  (self.run_id, url, time.time()))
+
+    def finish_page(self, url, status, screenshots=0):
+        self._put("UPDATE pages SET status = ?, screenshots = ?, finished_at = ? WHERE run_id = ? AND url = ?",
+                  (status, screenshots, time.time(), self.run_id, url))
+
+    def record_replacement(self, slot_size, slot_position, creative, is_gif, screenshot_path):
+        self._put("INSERT INTO replacements (run_id, url, slot_size, slot_position, creative, is_gif, "
+                  "screenshot_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  (self.run_id, self.current_url, slot_size,
+                   None if slot_position is None else str(slot_position),
+                   creative, int(bool(is_gif)), screenshot_path, time.time()))
+
+    def record_stage(self, stage, url, seconds, overrun=False):
+        self._put("INSERT INTO stage_timings (run_id, url, stage, seconds, overrun, created_at) "
+                  "VALUES (?, ?, ?, ?, ?, ?)",
+                  (self.run_id, url or self.current_url, stage, seconds, int(bool(overrun)), time.time()))
+
+    def finish_run(self):
+        self._put("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    # 查詢
+
+    def _query(self, sql, params=()):
+        self.flush()
+        connection = _connect(self.path)
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+    def summary(self):
+        """本次執行的統計：截圖數、替換數、GIF / 靜態、各素材與各階段耗時"""
+        totals = self._query("""
+            SELECT COUNT(*) AS replacements,
+                   COALESCE(SUM(is_gif), 0) AS gif,
+                   COUNT(*) - COALESCE(SUM(is_gif), 0) AS static,
+                   COUNT(DISTINCT screenshot_path) AS screenshots
+            FROM replacements WHERE run_id = ?
+        """, (self.run_id,))[0]
+        totals['creatives'] = self._query("""
+            SELECT creative, slot_size, COUNT(*) AS uses, MAX(is_gif) AS is_gif
+            FROM replacements WHERE run_id = ?
+            GROUP BY creative, slot_size ORDER BY uses DESC
+        """, (self.run_id,))
+        totals['stages'] = self._query("""
+            SELECT stage, COUNT(*) AS runs, AVG(seconds) AS avg_seconds, MAX(seconds) AS max_seconds,
+                   SUM(overrun) AS overruns
+            FROM stage_timings WHERE run_id = ?
+            GROUP BY stage ORDER BY stage
+        """, (self.run_id,))
+        totals['pages'] = self._query("""
+            SELECT status, COUNT(*) AS count FROM pages WHERE run_id = ? GROUP BY status
+        """, (self.run_id,))
+        return totals
+
+    def details(self):
+        """本次執行的替換紀錄（依時間排序）"""
+        return self._query("""
+            SELECT url, slot_size, slot_position, creative, is_gif, screenshot_path
+            FROM replacements WHERE run_id = ? ORDER BY id
+        """, (self.run_id,))
+
+    def print_report(self):
+        """結束時的統計報告（取代逐筆保存在記憶體的 replacement_details）"""
+        summary = self.summary()
+        print(f"📸 總截圖數量: {summary['screenshots']} 張")
+        print(f"🔄 總替換次數: {summary['replacements']} 次")
+        if summary['replacements']:
+            print(f"   🎬 GIF 替換: {summary['gif']} 次 ({summary['gif'] / summary['replacements'] * 100:.1f}%)")
+            print(f"   🖼️ 靜態圖片替換: {summary['static']} 次 ({summary['static'] / summary['replacements'] * 100:.1f}%)")
+
+        details = self.details()
+        if details:
+            print(f"\n📋 詳細替換記錄:")
+            for i, detail in enumerate(details, 1):
+                type_icon = "🎬" if detail['is_gif'] else "🖼️"
+                target = f"📸 {os.path.abspath(detail['screenshot_path'])}" if detail['screenshot_path'] else "❌ 截圖失敗"
+                print(f"   {i:2d}. {type_icon} {detail['creative']} ({detail['slot_size']}) → {target}")
+
+        if summary['creatives']:
+            print(f"\n🖼️ 素材使用次數:")
+            for row in summary['creatives']:
+                print(f"   {row['creative']} ({row['slot_size']}): {row['uses']} 次")
+
+        if summary['stages']:
+            print(f"\n⏱️ 各階段耗時:")
+            for row in summary['stages']:
+                overrun = f", 逾時 {row['overruns']} 次" if row['overruns'] else ""
+                print(f"   {row['stage']}: {row['runs']} 次, 平均 {row['avg_seconds']:.2f}s, "
+                      f"最長 {row['max_seconds']:.2f}s{overrun}")
+        print(f"🗄️ 結果資料庫: {os.path.abspath(self.path)} (run_id: {self.run_id})")
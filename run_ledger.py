@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+檢查點帳本 (可續跑的執行紀錄)
+
+處理過的網址、替換紀錄與截圖原本只存在 replacer 物件的記憶體中，
+執行中斷後全部遺失。RunLedger 以 JSON Lines 逐筆附加寫入：
+- run：開始一次執行（網站、目標截圖數、結果資料庫的 run_id）
+- urls：本次要處理的網址清單（續跑時沿用，不重新隨機挑選）
+- url_begin：開始處理網址（之前中斷留下的同網址紀錄作廢）
+- replacement / screenshot：每一次替換與截圖，發生時立即寫入
+- url_done：網址處理完成
+- run_done：達到目標截圖數
+
+寫入後只 flush 到作業系統，每 fsync_every 筆或每個網址完成時才 fsync，
+避免每筆都等磁碟。續跑 (--resume) 時只採用已完成網址的紀錄；中斷當下
+處理到一半的網址會重新處理。
+"""
+
+import json
+import os
+import time
+
+DEFAULT_FSYNC_EVERY = 5
+
+
+class RunLedger:
+    """附加寫入的執行紀錄，可從中還原 replacer 的統計並略過已完成的網址"""
+
+    def __init__(self, path, site, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.path = path
+        self.site = site
+        self.fsync_every = fsync_every
+        self._file = None
+        self._unsynced = 0
+        self._reset()
+
+    def _reset(self):
+        self.current_url = None
+        self.run_id = None              # 對應結果資料庫中的執行
+        self.urls = []                  # 本次執行的網址清單
+        self.finished_urls = []         # 已完成的網址（依完成順序）
+        self.replacements = []          # [{'url', 'detail', 'is_gif'}]（僅已完成網址）
+        self.screenshots = []           # [{'url', 'path'}]（僅已完成網址）
+
+    # 讀取
+
+    def _load(self):
+        """讀取既有帳本，回傳上一次執行是否已完成"""
+        pending = {}                    # 尚未完成網址的紀錄
+        completed = False
+        self._valid_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break               # 中斷時寫到一半的最後一行
+                self._valid_bytes += len(line)
+                kind = entry.get('type')
+                if kind == 'run':
+                    self.run_id = entry.get('run_id')
+                elif kind == 'urls':
+                    self.urls = entry['urls']
+                elif kind == 'url_begin':
+                    pending[entry['url']] = []
+                elif kind in ('replacement', 'screenshot'):
+                    pending.setdefault(entry['url'], []).append(entry)
+                elif kind == 'url_done':
+                    url = entry['url']
+                    for record in pending.pop(url, []):
+                        if record['type'] == 'replacement':
+                            self.replacements.append(record)
+                        else:
+                            self.screenshots.append(record)
+                    if url not in self.finished_urls:
+                        self.finished_urls.append(url)
+                elif kind == 'run_done':
+                    completed = True
+        return completed
+
+    def open(self, resume=False, quota=None, run_id=None):
+        """開啟帳本；resume 時載入上一次未完成的執行，回傳是否成功續跑"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        resumed = False
+        if resume and os.path.exists(self.path):
+            if self._load():
+                print(f"📒 上一次執行已完成，重新開始: {self.path}")
+                self._reset()
+            else:
+                resumed = True
+                # 去掉寫到一半的最後一行，之後的紀錄才接得上
+                os.truncate(self.path, self._valid_bytes)
+                print(f"📒 續跑 {self.path}: 已完成 {len(self.finished_urls)} 個網址、"
+                      f"{len(self.screenshots)} 張截圖")
+        elif resume:
+            print(f"📒 找不到檢查點 {self.path}，重新開始")
+
+        self._file = open(self.path, 'a' if resumed else 'w', encoding='utf-8')
+        if not resumed:
+            self.run_id = run_id
+            self._append({'type': 'run', 'site': self.site, 'quota': quota, 'run_id': run_id}, sync=True)
+        return resumed
+
+    # 寫入
+
+    def _append(self, entry, sync=False):
+        entry['time'] = time.time()
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._unsynced += 1
+        if sync or self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        if self._file and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def set_urls(self, urls):
+        """記錄網址清單（續跑時若需要補充網址，再記一次完整清單）"""
+        self.urls = list(urls)
+        self._append({'type': 'urls', 'urls': self.urls}, sync=True)
+
+    def pending_urls(self):
+        finished = set(self.finished_urls)
+        return [url for url in self.urls if url not in finished]
+
+    def begin_url(self, url):
+        self.current_url = url
+        self._append({'type': 'url_begin', 'url': url})
+
+    def replacement(self, detail, is_gif):
+        self._append({'type': 'replacement', 'url': self.current_url, 'detail': detail, 'is_gif': bool(is_gif)})
+
+    def screenshot(self, path):
+        self._append({'type': 'screenshot', 'url': self.current_url, 'path': path})
+
+    def finish_url(self, url, screenshots, status):
+        """網址處理完成（不論是否有截圖），此時 fsync"""
+        self._append({'type': 'url_done', 'url': url, 'screenshots': screenshots, 'status': status}, sync=True)
+        self.finished_urls.append(url)
+        self.current_url = None
+
+    def finish_run(self):
+        self._append({'type': 'run_done'}, sync=True)
+
+    def close(self):
+        if self._file:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    # 還原
+
+    def image_usage(self):
+        """各替換圖片的使用次數"""
+        usage = {}
+        for record in self.replacements:
+            filename = (record['detail'] or {}).get('filename')
+            if filename:
+                usage[filename] = usage.get(filename, 0) + 1
+        return usage
+
+    def restore(self, bot):
+        """把已完成網址的統計寫回 replacer（替換明細已在結果資料庫中）
+
+        圖片選擇 (select_image_by_strategy) 依 GIF_PRIORITY 固定選用各尺寸的第一張，
+        不依使用次數輪替，因此圖片使用次數只列出供參考，不需要還原。
+        """
+        bot.total_screenshots = len(self.screenshots)
+        bot.total_replacements = len(self.replacements)
+        bot.gif_replacements = sum(1 for record in self.replacements if record['is_gif'])
+        bot.static_replacements = bot.total_replacements - bot.gif_replacements
+        if getattr(bot, 'results', None) and self.run_id:
+            bot.results.resume_run(self.run_id)
+        usage = self.image_usage()
+        if usage:
+            print("📒 先前已完成網址使用的替換圖片（僅供參考）: " + ", ".join(f"{name} x{count}" for name, count in sorted(usage.items())))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+以文件為範圍的廣告掃描快取
+
+每份文件（每次導航）在頁面中產生一個 docId，並以 MutationObserver 計算
+「廣告區域」的變動次數。快取以 (docId, 變動次數) 為 key：
+- 換了新頁面 (docId 不同) → 完整掃描一次
+- 同一頁面但廣告區域有新增/移除 → 重新掃描
+- 其餘情況直接回傳上次結果，不會沿用上一頁已失效的 WebElement
+
+替換程式自己注入的節點（data-injected / data-ad-replacer）不計入變動。
+"""
+
+# 視為廣告區域的節點：新增或移除這些節點（或包含它們的子樹）才算變動
+# iframe 只計入廣告 iframe，追蹤、社群與影片 iframe 的插入/移除不觸發重新掃描
+DEFAULT_AD_REGION_SELECTOR = ', '.join([
+    'iframe[id^="google_ads_iframe"]',
+    'iframe[src*="googlesyndication"]',
+    'iframe[src*="doubleclick"]',
+    'iframe[id^="aswift_"]',
+    'ins.adsbygoogle',
+    'div[id*="google_ads"]',
+    'div[id*="sda-"]',
+    'div[data-google-query-id]',
+    'div[data-google-av-cxn]',
+    'div[data-crto-id]',
+])
+
+SCAN_STATE_SCRIPT = """
+var adRegionSelector = arguments[0];
+var state = window.__adScanState;
+if (!state) {
+    state = window.__adScanState = {
+        docId: Date.now().toString(36) + '-' + Math.random().toString(36).substr(2, 9),
+        mutations: 0
+    };
+    var isOwnNode = function(node) {
+        return node.hasAttribute('data-injected') || node.hasAttribute('data-ad-replacer');
+    };
+    var touchesAdRegion = function(nodes) {
+        for (var i = 0; i < nodes.length; i++) {
+            var node = nodes[i];
+            if (node.nodeType !== 1 || isOwnNode(node)) continue;
+            if (node.matches(adRegionSelector) || node.querySelector(adRegionSelector)) return true;
+        }
+        return false;
+    };
+    var observer = new MutationObserver(function(mutations) {
+        for (var i = 0; i < mutations.length; i++) {
+            if (touchesAdRegion(mutations[i].addedNodes) || touchesAdRegion(mutations[i].removedNodes)) {
+                state.mutations++;
+                return;
+            }
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+    state.observer = observer;
+}
+return {docId: state.docId, mutations: state.mutations};
+"""
+
+
+class PageScanCache:
+    """scan_fn 為不帶參數的完整掃描函數；get() 只在文件或廣告區域改變時才呼叫它"""
+
+    def __init__(self, driver, scan_fn, ad_region_selector=DEFAULT_AD_REGION_SELECTOR):
+        self.driver = driver
+        self.scan_fn = scan_fn
+        self.ad_region_selector = ad_region_selector
+        self.doc_id = None
+        self.mutations = None
+        self.result = None
+        self.full_scans = 0
+        self.rescans = 0
+
+    def read_state(self):
+        """取得目前文件的 docId 與廣告區域變動次數（第一次呼叫時安裝計數器）"""
+        return self.driver.execute_script(SCAN_STATE_SCRIPT, self.ad_region_selector)
+
+    def get(self):
+        state = self.read_state()
+        if state['docId'] != self.doc_id:
+            print("🆕 新頁面，進行完整廣告掃描")
+            self.full_scans += 1
+        elif state['mutations'] != self.mutations:
+            print(f"🔄 廣告區域有變動 ({self.mutations} → {state['mutations']})，重新掃描")
+            self.rescans += 1
+        else:
+            return self.result
+
+        self.result = self.scan_fn()
+        # 掃描期間發生的變動已包含在結果中，以掃描後的計數為準
+        self.doc_id = state['docId']
+        self.mutations = self.read_state()['mutations']
+        return self.result
+
+    def invalidate(self):
+        """強制下次 get() 重新掃描"""
+        self.doc_id = None
+        self.mutations = None
+        self.result = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+已截圖網址索引
+
+各網站的文章探索每次都會回傳差不多的熱門文章（UDN 取頁面順序的前
+NEWS_COUNT 個連結，Linshibi 找不到文章時固定使用 ?p=47121 等備用網址），
+於是每次執行都重複截圖同樣的頁面。SeenUrlIndex 跨執行記住已截圖的網址，
+探索時先過濾，讓每次載入的頁面都是新的版位庫存：
+- 記憶體中以 Bloom filter 快速判斷「一定沒看過」，大部分網址不需查詢資料庫
+- Bloom filter 判斷「可能看過」時，以 SQLite 中的完整網址確認，不會誤判
+- 每個網站各自的範圍 (site)，紀錄超過 expiry_days 天後失效，文章可再次截圖
+
+網址比對前會正規化：去掉 #fragment、utm_* 等追蹤參數與結尾斜線。
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_SEEN_URL_DB = "seen_urls.db"
+DEFAULT_EXPIRY_DAYS = 30
+
+# 不影響頁面內容的追蹤參數
+_TRACKING_PARAMS = ('fbclid', 'gclid')
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if not key.lower().startswith('utm_') and key.lower() not in _TRACKING_PARAMS]
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ''))
+
+
+class BloomFilter:
+    """以 bytearray 實作的 Bloom filter（雙重雜湊）"""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1024)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenUrlIndex:
+    """跨執行的已截圖網址，探索文章時略過"""
+
+    def __init__(self, path=DEFAULT_SEEN_URL_DB, site="", expiry_days=DEFAULT_EXPIRY_DAYS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.site = site
+        self.expiry_days = expiry_days
+        self.skipped = 0
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA busy_timeout=30000")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS seen_urls (
+                    site       TEXT NOT NULL,
+                    url        TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen  REAL NOT NULL,
+                    captures   INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (site, url)
+                )
+            """)
+            if expiry_days:
+                self.connection.execute("DELETE FROM seen_urls WHERE site = ? AND last_seen < ?",
+                                        (site, time.time() - expiry_days * 86400))
+
+        urls = [row[0] for row in self.connection.execute("SELECT url FROM seen_urls WHERE site = ?", (site,))]
+        self.bloom = BloomFilter(len(urls) * 2)
+        for url in urls:
+            self.bloom.add(url)
+        expiry = f"{expiry_days} 天內" if expiry_days else "永久"
+        print(f"🗂️ 已截圖網址索引 ({site}): {len(urls)} 筆 ({expiry})")
+
+    def seen(self, url):
+        key = normalize_url(url)
+        if key not in self.bloom:
+            return False
+        return self.connection.execute("SELECT 1 FROM seen_urls WHERE site = ? AND url = ?",
+                                       (self.site, key)).fetchone() is not None
+
+    def filter_new(self, urls):
+        """保留尚未截圖過的網址（維持原本順序）"""
+        fresh = [url for url in urls if not self.seen(url)]
+        skipped = len(urls) - len(fresh)
+        if skipped:
+            self.skipped += skipped
+            print(f"🗂️ 略過 {skipped} 個先前已截圖的網址")
+        return fresh
+
+    def mark(self, url):
+        """記錄已截圖的網址"""
+        key = normalize_url(url)
+        now = time.time()
+        with self.connection:
+            self.connection.execute("""
+                INSERT INTO seen_urls (site, url, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                ON CONFLICT (site, url) DO UPDATE SET last_seen = excluded.last_seen, captures = captures + 1
+            """, (self.site, key, now, now))
+        self.bloom.add(key)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+遠端 WebDriver / Selenium Grid 的 session 池
+
+以 webdriver.Remote 連到 Grid（或任何 W3C 遠端端點），保留數個已建立的
+session 供 replacer 租用，省去每次執行建立 session 的時間：
+- 租用前以一段簡單腳本檢查 session 是否仍可用，失效的直接丟棄
+- 歸還時若已載入超過 max_pages 頁，或 JS heap 超過 max_memory_mb，就結束該 session
+- 每次租用開一個新分頁、關閉舊分頁，前一次執行註冊的 CDP 腳本與封鎖規則不會留下
+
+同一個池可供同一行程中的多個 replacer 使用；以啟動參數區分 session，
+不同網站的設定不會混用。
+
+每次執行都是新的行程，因此行程結束時閒置中的 session 不會結束，而是記錄在
+registry（JSON 檔）後留在 Grid 上；下一次執行直接接上這些已暖機的 session。
+registry 以 lock 檔保護，多個行程（不同螢幕）不會取走同一個 session。
+沒有再被接上的 session 由 Grid 的閒置逾時 (--session-timeout) 回收。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_PAGES = 50
+DEFAULT_MAX_MEMORY_MB = 1500
+DEFAULT_SESSION_REGISTRY = "remote_sessions.json"
+
+# lock 檔超過此秒數視為前一個行程異常結束時留下的
+_LOCK_STALE_SECONDS = 10
+
+
+class RemoteChromeDriver(webdriver.Remote):
+    """遠端 Chrome：補上本機 driver 才有的 execute_cdp_cmd，並計算載入頁數
+
+    指定 session_id 時接上 Grid 上既有的 session，不建立新的。
+    """
+
+    def __init__(self, remote_url, options, session_id=None, pages_loaded=0):
+        self._attach_session_id = session_id
+        super().__init__(command_executor=ChromeRemoteConnection(remote_server_addr=remote_url), options=options)
+        self.pages_loaded = pages_loaded
+
+    def start_session(self, capabilities):
+        if self._attach_session_id:
+            self.session_id = self._attach_session_id
+            self.caps = {}
+            return
+        super().start_session(capabilities)
+
+    def get(self, url):
+        self.pages_loaded += 1
+        super().get(url)
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
+
+
+def _options_key(chrome_options):
+    return (tuple(sorted(chrome_options.arguments)), chrome_options.page_load_strategy)
+
+
+class SessionRegistry:
+    """跨行程保存閒置的遠端 session：{remote_url, key, session_id, pages_loaded}"""
+
+    def __init__(self, path=DEFAULT_SESSION_REGISTRY):
+        self.path = path
+
+    @contextmanager
+    def _locked(self, timeout=10):
+        lock_path = self.path + '.lock'
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > _LOCK_STALE_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"無法取得 {lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write(self, records):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def take(self, remote_url, key):
+        """取走一筆相同端點與啟動參數的 session 紀錄，沒有時回傳 None"""
+        with self._locked():
+            records = self._read()
+            for index, record in enumerate(records):
+                if record['remote_url'] == remote_url and record['key'] == [list(key[0]), key[1]]:
+                    del records[index]
+                    self._write(records)
+                    return record
+        return None
+
+    def park(self, remote_url, key, driver):
+        with self._locked():
+            records = self._read()
+            records.append({'remote_url': remote_url, 'key': [list(key[0]), key[1]],
+                            'session_id': driver.session_id, 'pages_loaded': driver.pages_loaded})
+            self._write(records)
+
+
+class SessionPool:
+    """租用 / 歸還遠端 session，失效或用量過高時重建"""
+
+    def __init__(self, remote_url, size=DEFAULT_POOL_SIZE, max_pages=DEFAULT_MAX_PAGES,
+                 max_memory_mb=DEFAULT_MAX_MEMORY_MB, registry_path=DEFAULT_SESSION_REGISTRY):
+        self.remote_url = remote_url
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.registry = SessionRegistry(registry_path) if registry_path else None
+        self._idle = {}            # 啟動參數 -> queue.LifoQueue（最近使用的 session 最熱）
+        self._created = 0
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+
+    def _idle_queue(self, key):
+        return self._idle.setdefault(key, queue.LifoQueue())
+
+    def _healthy(self, driver):
+        try:
+            return driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    def _memory_mb(self, driver):
+        try:
+            used = driver.execute_script(
+                "return performance.memory ? performance.memory.usedJSHeapSize : 0;")
+            return (used or 0) / 1024 / 1024
+        except Exception:
+            return 0
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._returned.notify()
+
+    def _fresh_tab(self, driver):
+        """開新分頁並關閉其餘分頁，只保留本次租用的分頁"""
+        old_handles = list(driver.window_handles)
+        driver.switch_to.new_window('tab')
+        current = driver.current_window_handle
+        for handle in old_handles:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(current)
+
+    def lease(self, chrome_options, timeout=60):
+        """取得可用的 session；池已滿時等待其他 replacer 歸還"""
+        key = _options_key(chrome_options)
+        while True:
+            idle = self._idle_queue(key)
+            try:
+                driver = idle.get_nowait()
+            except queue.Empty:
+                driver = None
+
+            if driver is not None:
+                if self._healthy(driver):
+                    self._fresh_tab(driver)
+                    print(f"♻️ 沿用遠端 session {driver.session_id[:8]} (已載入 {driver.pages_loaded} 頁)")
+                    return driver
+                print("⚠️ 遠端 session 已失效，捨棄後重建")
+                self._discard(driver)
+                continue
+
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if not can_create:
+                # 池已滿：先結束其他設定閒置中的 session 騰出位置，否則等待歸還
+                if self._evict_idle(exclude=key):
+                    continue
+                with self._lock:
+                    if self._created >= self.size and not self._returned.wait(timeout):
+                        raise TimeoutError(f"{timeout} 秒內沒有可用的遠端 session")
+                continue
+
+            driver = self._attach_parked(key, chrome_options)
+            if driver is not None:
+                return driver
+            try:
+                driver = RemoteChromeDriver(self.remote_url, chrome_options)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            print(f"🌐 已建立遠端 session {driver.session_id[:8]} ({self.remote_url})")
+            return driver
+
+    def _attach_parked(self, key, chrome_options):
+        """接上先前行程留下的 session；失效的紀錄直接捨棄"""
+        if not self.registry:
+            return None
+        while True:
+            try:
+                record = self.registry.take(self.remote_url, key)
+            except Exception as e:
+                print(f"⚠️ 讀取遠端 session 紀錄失敗: {e}")
+                return None
+            if record is None:
+                return None
+            try:
+                driver = RemoteChromeDriver(self.remote_url, chrome_options, record['session_id'],
+                                            record.get('pages_loaded', 0))
+            except Exception:
+                continue
+            if self._healthy(driver):
+                self._fresh_tab(driver)
+                print(f"♻️ 接上先前執行留下的遠端 session {driver.session_id[:8]} "
+                      f"(已載入 {driver.pages_loaded} 頁)")
+                return driver
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def _evict_idle(self, exclude):
+        for key, idle in list(self._idle.items()):
+            if key == exclude:
+                continue
+            try:
+                driver = idle.get_nowait()
+            except queue.Empty:
+                continue
+            self._discard(driver)
+            return True
+        return False
+
+    def release(self, driver, chrome_options):
+        """歸還 session，超過頁數或記憶體上限時結束它"""
+        memory_mb = self._memory_mb(driver)
+        if driver.pages_loaded >= self.max_pages or memory_mb >= self.max_memory_mb:
+            print(f"♻️ 回收遠端 session {driver.session_id[:8]} "
+                  f"({driver.pages_loaded} 頁, JS heap {memory_mb:.0f} MB)")
+            self._discard(driver)
+            return
+        self._idle_queue(_options_key(chrome_options)).put(driver)
+        with self._lock:
+            self._returned.notify()
+
+    def close(self):
+        """行程結束：閒置中的 session 記錄到 registry 留給下一次執行，沒有 registry 時結束它們"""
+        for key, idle in list(self._idle.items()):
+            while True:
+                try:
+                    driver = idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self.registry:
+                    try:
+                        self.registry.park(self.remote_url, key, driver)
+                        print(f"🅿️ 保留遠端 session {driver.session_id[:8]} 供下一次執行使用")
+                        continue
+                    except Exception as e:
+                        print(f"⚠️ 無法記錄遠端 session，直接結束: {e}")
+                self._discard(driver)
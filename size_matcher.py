@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+廣告尺寸向量化比對
+
+把候選元素的位置與尺寸整理成陣列 (x, y, w, h, visible)，一次與所有目標尺寸
+(load_replace_images 產生的 target_ad_sizes) 比對，每個尺寸可有各自的容差，
+輸出依差距排序的比對表。DOMSnapshot 一頁常有數千個方塊，避免逐一在 Python
+迴圈中比較與解析 'WxH' 字串。
+
+安裝 NumPy 時使用向量化運算；未安裝時以相同規則的純 Python 迴圈比對。
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+def _candidate_position(candidate):
+    """候選元素的 (x, y)：掃描結果用 top/left，快照方塊用 x/y"""
+    x = candidate.get('left', candidate.get('x', 0)) or 0
+    y = candidate.get('top', candidate.get('y', 0)) or 0
+    return float(x), float(y)
+
+
+class CandidateGeometry:
+    """候選元素的幾何陣列，candidates 為含 width/height 的 dict 列表"""
+
+    def __init__(self, candidates):
+        self.candidates = list(candidates)
+        positions = [_candidate_position(c) for c in self.candidates]
+        xs = [p[0] for p in positions]
+        ys = [p[1] for p in positions]
+        ws = [int(c.get('width', 0) or 0) for c in self.candidates]
+        hs = [int(c.get('height', 0) or 0) for c in self.candidates]
+        visible = [bool(c.get('visible', True)) and w > 0 and h > 0
+                   for c, w, h in zip(self.candidates, ws, hs)]
+
+        if NUMPY_AVAILABLE:
+            self.x = np.asarray(xs, dtype=np.float64)
+            self.y = np.asarray(ys, dtype=np.float64)
+            self.w = np.asarray(ws, dtype=np.int32)
+            self.h = np.asarray(hs, dtype=np.int32)
+            self.visible = np.asarray(visible, dtype=bool)
+        else:
+            self.x, self.y, self.w, self.h, self.visible = xs, ys, ws, hs, visible
+
+    def __len__(self):
+        return len(self.candidates)
+
+
+def build_target_sizes(target_sizes, tolerance=0, tolerances=None):
+    """整理目標尺寸，回傳 [(width, height, tolerance), ...]
+
+    target_sizes 可為 [{'width', 'height'}] 或 [(w, h)]；
+    tolerances 以 'WxH' 為 key 指定個別尺寸的容差，其餘使用 tolerance。
+    """
+    tolerances = tolerances or {}
+    targets = []
+    for size in target_sizes:
+        if isinstance(size, dict):
+            width, height = size['width'], size['height']
+        else:
+            width, height = size
+        size_key = f"{width}x{height}"
+        targets.append((int(width), int(height), int(tolerances.get(size_key, tolerance))))
+    return targets
+
+
+def _match_numpy(geometry, targets):
+    target_w = np.asarray([t[0] for t in targets], dtype=np.int32)
+    target_h = np.asarray([t[1] for t in targets], dtype=np.int32)
+    target_tol = np.asarray([t[2] for t in targets], dtype=np.int32)
+
+    # (候選數, 目標數) 的差距矩陣，一次完成所有比對
+    dw = np.abs(geometry.w[:, None] - target_w[None, :])
+    dh = np.abs(geometry.h[:, None] - target_h[None, :])
+    mask = (dw <= target_tol[None, :]) & (dh <= target_tol[None, :]) & geometry.visible[:, None]
+
+    candidate_idx, target_idx = np.nonzero(mask)
+    if candidate_idx.size == 0:
+        return []
+    match_dw = dw[candidate_idx, target_idx]
+    match_dh = dh[candidate_idx, target_idx]
+    distance = match_dw + match_dh
+
+    # 排序：差距小者優先，其次頁面由上而下、由左而右
+    order = np.lexsort((geometry.x[candidate_idx], geometry.y[candidate_idx], distance))
+    return [
+        (int(candidate_idx[i]), int(target_idx[i]), int(match_dw[i]), int(match_dh[i]))
+        for i in order
+    ]
+
+
+def _match_python(geometry, targets):
+    rows = []
+    for ci in range(len(geometry)):
+        if not geometry.visible[ci]:
+            continue
+        for ti, (width, height, tol) in enumerate(targets):
+            dw = abs(geometry.w[ci] - width)
+            dh = abs(geometry.h[ci] - height)
+            if dw <= tol and dh <= tol:
+                rows.append((ci, ti, dw, dh))
+    rows.sort(key=lambda r: (r[2] + r[3], geometry.y[r[0]], geometry.x[r[0]]))
+    return rows
+
+
+def match_sizes(candidates, target_sizes, tolerance=0, tolerances=None):
+    """將所有候選元素與所有目標尺寸一次比對，回傳排序後的比對表
+
+    每列為 dict：candidate（原始候選 dict）、index、size_key、target_width、
+    target_height、width、height、dw、dh、distance、exact、rank（全表排名）
+    與 size_rank（同一目標尺寸內的排名）。
+    """
+    geometry = candidates if isinstance(candidates, CandidateGeometry) else CandidateGeometry(candidates)
+    targets = build_target_sizes(target_sizes, tolerance, tolerances)
+    if not len(geometry) or not targets:
+        return []
+
+    raw_rows = _match_numpy(geometry, targets) if NUMPY_AVAILABLE else _match_python(geometry, targets)
+
+    table = []
+    size_ranks = {}
+    for rank, (ci, ti, dw, dh) in enumerate(raw_rows):
+        width, height, _ = targets[ti]
+        size_key = f"{width}x{height}"
+        size_ranks[size_key] = size_ranks.get(size_key, -1) + 1
+        candidate = geometry.candidates[ci]
+        table.append({
+            'candidate': candidate,
+            'index': ci,
+            'size_key': size_key,
+            'target_width': width,
+            'target_height': height,
+            'width': int(candidate.get('width', 0) or 0),
+            'height': int(candidate.get('height', 0) or 0),
+            'dw': dw,
+            'dh': dh,
+            'distance': dw + dh,
+            'exact': dw == 0 and dh == 0,
+            'rank': rank,
+            'size_rank': size_ranks[size_key],
+        })
+    return table
+
+
+def matches_by_size(table):
+    """把比對表依目標尺寸分組，組內維持排名順序"""
+    grouped = {}
+    for row in table:
+        grouped.setdefault(row['size_key'], []).append(row)
+    return grouped
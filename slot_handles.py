@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+穩定的廣告位置 handle
+
+掃描時為每個廣告位置加上 data-ad-slot-handle 屬性並回傳 handle 字串，
+之後的替換、滑動、還原都在頁面中以屬性選擇器找回元素，不持有 WebElement，
+也就不會因 StaleElementReference 而需要重新掃描。
+"""
+
+SLOT_HANDLE_ATTR = 'data-ad-slot-handle'
+
+# 掃描腳本使用：為元素加上 handle（已有則沿用），回傳 handle 字串
+TAG_SLOT_JS = """
+var tagSlot = function(element) {
+    var handle = element.getAttribute('%(attr)s');
+    if (!handle) {
+        window.__adSlotSeq = (window.__adSlotSeq || 0) + 1;
+        handle = 'slot-' + window.__adSlotSeq;
+        element.setAttribute('%(attr)s', handle);
+    }
+    return handle;
+};
+""" % {'attr': SLOT_HANDLE_ATTR}
+
+# 替換/還原腳本使用：參數可為 handle 字串或 WebElement
+RESOLVE_SLOT_JS = """
+var resolveSlot = function(ref) {
+    if (typeof ref !== 'string') return ref;
+    return document.querySelector('[%(attr)s="' + ref + '"]');
+};
+""" % {'attr': SLOT_HANDLE_ATTR}
+
+
+def scroll_slot_into_view(driver, handle, viewport_ratio=0.25):
+    """滑動讓廣告頂部位於視窗 viewport_ratio 的位置，回傳滑動後的 scrollY，找不到時回傳 None"""
+    return driver.execute_script(RESOLVE_SLOT_JS + """
+        var element = resolveSlot(arguments[0]);
+        if (!element) return null;
+        var top = element.getBoundingClientRect().top + window.pageYOffset;
+        var position = Math.max(0, top - window.innerHeight * arguments[1]);
+        window.scrollTo(0, position);
+        return position;
+    """, handle, viewport_ratio)
+
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+頁面內的即時廣告位置索引
+
+在文件開始載入時 (Page.addScriptToEvaluateOnNewDocument) 啟動 MutationObserver
+與 ResizeObserver，追蹤廣告容器與 iframe 的插入、尺寸變化與移除，並依尺寸分桶。
+每次變動都會遞增版本號，Python 端只讀取「版本 N 之後有變動的位置」，
+不需要反覆執行整頁掃描。
+
+每個位置以 data-ad-slot-handle 標記（與 slot_handles 相同），替換時可直接用 handle。
+
+腳本在剖析器建立 <html> 之前就會執行：MutationObserver 監看 document，
+根元素出現後才走訪；所有設定完成後才公開 window.__adSlotIndex。
+"""
+
+import json
+import time
+
+from slot_handles import SLOT_HANDLE_ATTR, RESOLVE_SLOT_JS
+
+# 預設追蹤的廣告容器與 iframe
+DEFAULT_SLOT_SELECTORS = [
+    'iframe[id^="aswift_"]',
+    'iframe[id^="google_ads_iframe"]',
+    'iframe[src*="googlesyndication"]',
+    'iframe[src*="doubleclick"]',
+    'ins.adsbygoogle',
+    'div[id^="div-gpt-ad"]',
+    'div[id*="google_ads_iframe_"]',
+    'div[data-google-query-id]',
+    'div[id*="sda-"][id*="-iframe"]',
+    'div[class^="ns-"]',
+    'div#bnr',
+    'div.isSetup',
+    'div[data-crto-id]',
+]
+
+SLOT_INDEX_SCRIPT = """
+(function(selector, attr) {
+    if (window.__adSlotIndex && typeof window.__adSlotIndex.since === 'function') return;
+    var index = {
+        docId: Date.now().toString(36) + '-' + Math.random().toString(36).substr(2, 9),
+        version: 0,
+        slots: {},
+        buckets: {}
+    };
+
+    var tag = function(element) {
+        var handle = element.getAttribute(attr);
+        if (!handle) {
+            window.__adSlotSeq = (window.__adSlotSeq || 0) + 1;
+            handle = 'slot-' + window.__adSlotSeq;
+            element.setAttribute(attr, handle);
+        }
+        return handle;
+    };
+
+    var unbucket = function(slot) {
+        var bucket = index.buckets[slot.sizeKey];
+        if (!bucket) return;
+        var position = bucket.indexOf(slot.handle);
+        if (position >= 0) bucket.splice(position, 1);
+        if (!bucket.length) delete index.buckets[slot.sizeKey];
+    };
+
+    var record = function(element) {
+        var handle = tag(element);
+        var rect = element.getBoundingClientRect();
+        var width = Math.round(rect.width);
+        var height = Math.round(rect.height);
+        var slot = index.slots[handle];
+        if (slot && !slot.removed && slot.width === width && slot.height === height) return;
+        if (slot) unbucket(slot);
+        index.version++;
+        slot = index.slots[handle] = {
+            handle: handle,
+            tagName: element.tagName.toLowerCase(),
+            id: element.id || '',
+            className: typeof element.className === 'string' ? element.className : '',
+            width: width,
+            height: height,
+            top: rect.top + window.pageYOffset,
+            left: rect.left + window.pageXOffset,
+            sizeKey: width + 'x' + height,
+            version: index.version,
+            removed: false
+        };
+        (index.buckets[slot.sizeKey] = index.buckets[slot.sizeKey] || []).push(handle);
+    };
+
+    var forget = function(element) {
+        var handle = element.getAttribute(attr);
+        var slot = handle && index.slots[handle];
+        if (!slot || slot.removed || element.isConnected) return;
+        unbucket(slot);
+        index.version++;
+        slot.removed = true;
+        slot.version = index.version;
+    };
+
+    var resizeObserver = window.ResizeObserver ? new ResizeObserver(function(entries) {
+        for (var i = 0; i < entries.length; i++) record(entries[i].target);
+    }) : null;
+
+    var track = function(element) {
+        record(element);
+        if (resizeObserver) resizeObserver.observe(element);
+    };
+
+    var visit = function(node, callback) {
+        if (node.nodeType !== 1) return;
+        if (node.matches(selector)) callback(node);
+        var inner = node.querySelectorAll(selector);
+        for (var i = 0; i < inner.length; i++) callback(inner[i]);
+    };
+
+    var observer = new MutationObserver(function(mutations) {
+        for (var i = 0; i < mutations.length; i++) {
+            var m = mutations[i];
+            for (var j = 0; j < m.addedNodes.length; j++) visit(m.addedNodes[j], track);
+            for (var k = 0; k < m.removedNodes.length; k++) {
+                visit(m.removedNodes[k], function(element) {
+                    forget(element);
+                    if (resizeObserver) resizeObserver.unobserve(element);
+                });
+            }
+        }
+    });
+    // 只回傳 version 之後有變動的位置（含已移除的位置）
+    index.since = function(version) {
+        var changed = [];
+        for (var handle in index.slots) {
+            if (index.slots[handle].version > version) changed.push(index.slots[handle]);
+        }
+        return {docId: index.docId, version: index.version, changed: changed};
+    };
+
+    // 文件開始時 documentElement 還是 null：監看 document，<html> 插入後的節點都會收到
+    observer.observe(document, {childList: true, subtree: true});
+    if (document.documentElement) visit(document.documentElement, track);
+    window.__adSlotIndex = index;
+})(%s, %s);
+"""
+
+
+class SlotIndex:
+    """Python 端的位置索引副本，以版本差異同步"""
+
+    def __init__(self, driver, selectors=None):
+        self.driver = driver
+        self.selectors = selectors or DEFAULT_SLOT_SELECTORS
+        self.installed = False
+        self.reset()
+
+    def reset(self):
+        self.doc_id = None
+        self.version = 0
+        self.slots = {}
+
+    def build_script(self):
+        return SLOT_INDEX_SCRIPT % (json.dumps(', '.join(self.selectors)), json.dumps(SLOT_HANDLE_ATTR))
+
+    def install(self):
+        """註冊到之後每一次導航的文件開始階段，成功回傳 True"""
+        try:
+            self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+                'source': self.build_script()
+            })
+            self.installed = True
+            print("📇 已安裝廣告位置即時索引")
+        except Exception as e:
+            print(f"安裝廣告位置索引失敗，改為載入後啟動: {e}")
+        return self.installed
+
+    def sync(self):
+        """讀取上次同步之後的變動，回傳有變動的位置列表"""
+        read_delta = """
+            if (!window.__adSlotIndex || typeof window.__adSlotIndex.since !== 'function') return null;
+            var version = window.__adSlotIndex.docId === arguments[1] ? arguments[0] : 0;
+            return window.__adSlotIndex.since(version);
+        """
+        delta = self.driver.execute_script(read_delta, self.version, self.doc_id)
+        if delta is None:
+            # 文件開始時沒有注入成功（或尚未安裝），在目前頁面直接啟動
+            self.driver.execute_script(self.build_script())
+            delta = self.driver.execute_script(read_delta, self.version, self.doc_id)
+
+        if delta['docId'] != self.doc_id:
+            self.reset()
+            self.doc_id = delta['docId']
+        for slot in delta['changed']:
+            if slot['removed']:
+                self.slots.pop(slot['handle'], None)
+            else:
+                self.slots[slot['handle']] = slot
+        self.version = delta['version']
+        return delta['changed']
+
+    def slots_by_size(self, target_width, target_height, tolerance=0):
+        """本地副本中符合尺寸的位置（呼叫前先 sync）"""
+        return [
+            slot for slot in self.slots.values()
+            if abs(slot['width'] - target_width) <= tolerance and abs(slot['height'] - target_height) <= tolerance
+        ]
+
+    def size_buckets(self):
+        """本地副本依尺寸分桶：{'WxH': [handle, ...]}"""
+        buckets = {}
+        for slot in self.slots.values():
+            buckets.setdefault(slot['sizeKey'], []).append(slot['handle'])
+        return buckets
+
+    def wait_until_settled(self, timeout=10, quiet_period=1.0, poll_interval=0.25):
+        """等到至少有一個有尺寸的位置且 quiet_period 秒內沒有變動，回傳是否在時限內穩定"""
+        deadline = time.time() + timeout
+        last_change = time.time()
+        self.sync()
+        while time.time() < deadline:
+            if self.sync():
+                last_change = time.time()
+            has_slots = any(slot['width'] > 0 and slot['height'] > 0 for slot in self.slots.values())
+            if has_slots and time.time() - last_change >= quiet_period:
+                return True
+            time.sleep(poll_interval)
+        return False
+
+    def resolve(self, handles):
+        """一次將多個 handle 解析為 WebElement，已不存在的 handle 不會出現在結果中"""
+        elements = self.driver.execute_script(RESOLVE_SLOT_JS + """
+            var found = {};
+            arguments[0].forEach(function(handle) {
+                var element = resolveSlot(handle);
+                if (element) found[handle] = element;
+            });
+            return found;
+        """, list(handles))
+        return elements or {}
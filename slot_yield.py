@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+版位產出記憶
+
+大部分時間花在最後發現沒有任何符合 replace_image/ 尺寸版位的文章上
+（main() 中「沒有找到可替換的廣告」的情況）。SlotYieldMemory 記錄每次造訪
+的網址、所屬的網址樣式（文章所在的分區）、找到的版位尺寸與產生的截圖數，
+探索文章時依預期產出排序待處理的網址：
+- 網址樣式：網域 + 上層路徑，文章 ID（最後一段路徑、5 位數以上的數字段、
+  query 參數值）以 * 代替，例如 travel.udn.com/travel/story/7324/*
+- 預期產出：該樣式平均每頁截圖數，造訪次數少時向全站平均收斂；沒看過的樣式以全站平均計
+- 同一樣式造訪 skip_after 次以上都沒有截圖就略過；造訪過且沒有截圖的網址也略過。
+  樣式涵蓋全部候選網址時（例如 travel.ettoday.net/article/*、linshibi.com/?p=*
+  就是整個網站）不以樣式略過；全部網址都會被略過時改為依預期產出排序全部網址
+- 只採用 window_days 天內的紀錄，版位配置改變後樣式可重新被嘗試
+"""
+
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from seen_urls import normalize_url
+
+DEFAULT_SLOT_YIELD_DB = "slot_yield.db"
+DEFAULT_WINDOW_DAYS = 60
+DEFAULT_SKIP_AFTER = 3
+
+# 樣式平均值向全站平均收斂的權重（相當於幾次虛擬造訪）
+_PRIOR_WEIGHT = 2
+
+_ID_SEGMENT = re.compile(r'\d{5,}')
+
+
+def url_pattern(url):
+    """網址所屬的樣式（分區），文章 ID 以 * 代替"""
+    parts = urlsplit(normalize_url(url))
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if segments:
+        segments = [_ID_SEGMENT.sub('*', segment) for segment in segments[:-1]] + ['*']
+    query = urlencode([(key, '*') for key, _ in parse_qsl(parts.query, keep_blank_values=True)], safe='*')
+    pattern = parts.netloc + '/' + '/'.join(segments)
+    return f"{pattern}?{query}" if query else pattern
+
+
+class SlotYieldMemory:
+    """跨執行記錄各網址與網址樣式的版位尺寸與截圖數，依預期產出排序網址"""
+
+    def __init__(self, path=DEFAULT_SLOT_YIELD_DB, site="", window_days=DEFAULT_WINDOW_DAYS,
+                 skip_after=DEFAULT_SKIP_AFTER):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.site = site
+        self.window_days = window_days
+        self.skip_after = skip_after
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA busy_timeout=30000")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS slot_visits (
+                    site        TEXT NOT NULL,
+                    url         TEXT NOT NULL,
+                    pattern     TEXT NOT NULL,
+                    slot_sizes  TEXT NOT NULL DEFAULT '',
+                    screenshots INTEGER NOT NULL DEFAULT 0,
+                    visited_at  REAL NOT NULL
+                )
+            """)
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_slot_visits_pattern "
+                                    "ON slot_visits (site, pattern)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_slot_visits_url ON slot_visits (site, url)")
+            if window_days:
+                self.connection.execute("DELETE FROM slot_visits WHERE site = ? AND visited_at < ?",
+                                        (site, time.time() - window_days * 86400))
+
+    # 紀錄
+
+    def record(self, url, slot_sizes, screenshots):
+        """記錄一次完成掃描的造訪（載入失敗或逾時的頁面不要記錄）"""
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO slot_visits (site, url, pattern, slot_sizes, screenshots, visited_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.site, normalize_url(url), url_pattern(url), ','.join(sorted(set(slot_sizes or []))),
+                 screenshots, time.time()))
+
+    # 查詢
+
+    def pattern_stats(self):
+        """各樣式的造訪次數、截圖數與找到過的版位尺寸"""
+        stats = {}
+        for pattern, visits, screenshots in self.connection.execute("""
+            SELECT pattern, COUNT(*), SUM(screenshots) FROM slot_visits WHERE site = ? GROUP BY pattern
+        """, (self.site,)):
+            stats[pattern] = {'visits': visits, 'screenshots': screenshots or 0, 'sizes': {}}
+        for pattern, slot_sizes in self.connection.execute(
+                "SELECT pattern, slot_sizes FROM slot_visits WHERE site = ? AND slot_sizes != ''", (self.site,)):
+            sizes = stats[pattern]['sizes']
+            for size in slot_sizes.split(','):
+                sizes[size] = sizes.get(size, 0) + 1
+        return stats
+
+    def _empty_urls(self):
+        """造訪過但從未產生截圖的網址"""
+        return {url for (url,) in self.connection.execute("""
+            SELECT url FROM slot_visits WHERE site = ? GROUP BY url HAVING SUM(screenshots) = 0
+        """, (self.site,))}
+
+    def prioritize(self, urls):
+        """依預期產出排序網址（同分維持原本順序），略過已知沒有版位的網址與樣式
+
+        略過後不會回傳空清單：全部都被略過時依預期產出回傳全部網址。
+        """
+        urls = list(urls)
+        stats = self.pattern_stats()
+        total_visits = sum(entry['visits'] for entry in stats.values())
+        if not total_visits:
+            return urls
+        site_mean = sum(entry['screenshots'] for entry in stats.values()) / total_visits
+        empty_urls = self._empty_urls()
+        patterns = [url_pattern(url) for url in urls]
+        # 只有一個樣式時它涵蓋整個候選清單，略過它等於略過整個網站
+        narrower_than_site = len(set(patterns)) > 1
+
+        scored = []
+        fallback = []
+        skipped_urls = 0
+        skipped_patterns = set()
+        for index, (url, pattern) in enumerate(zip(urls, patterns)):
+            entry = stats.get(pattern)
+            if entry is None:
+                score = site_mean
+            else:
+                score = (entry['screenshots'] + _PRIOR_WEIGHT * site_mean) / (entry['visits'] + _PRIOR_WEIGHT)
+            if normalize_url(url) in empty_urls:
+                skipped_urls += 1
+                fallback.append((1, -score, index, url))
+            elif (narrower_than_site and entry is not None and self.skip_after
+                  and entry['visits'] >= self.skip_after and entry['screenshots'] == 0):
+                skipped_patterns.add(pattern)
+                fallback.append((0, -score, index, url))
+            else:
+                scored.append((-score, index, url))
+                fallback.append((0, -score, index, url))
+
+        if urls and not scored:
+            print(f"📈 {len(urls)} 個候選網址都會被略過，改依預期產出排序全部網址")
+            return [url for *_, url in sorted(fallback)]
+        if skipped_urls or skipped_patterns:
+            print(f"📈 略過 {skipped_urls} 個造訪過但沒有版位的網址、{len(skipped_patterns)} 個沒有版位的網址樣式")
+            for pattern in sorted(skipped_patterns):
+                print(f"   - {pattern} ({stats[pattern]['visits']} 次造訪，0 張截圖)")
+        return [url for _, _, url in sorted(scored)]
+
+    def print_summary(self, limit=5):
+        stats = self.pattern_stats()
+        if not stats:
+            return
+        window = f"{self.window_days} 天內" if self.window_days else "全部"
+        print(f"📈 版位產出記憶 ({self.site}，{window}): {len(stats)} 個網址樣式")
+        ranked = sorted(stats.items(), key=lambda item: item[1]['screenshots'] / item[1]['visits'], reverse=True)
+        for pattern, entry in ranked[:limit]:
+            sizes = ", ".join(f"{size} x{count}" for size, count in
+                              sorted(entry['sizes'].items(), key=lambda item: -item[1])) or "無"
+            print(f"   {pattern}: {entry['visits']} 次造訪, 平均 {entry['screenshots'] / entry['visits']:.1f} 張截圖 "
+                  f"(版位: {sizes})")
+
+    def close(self):
+        self.connection.close()
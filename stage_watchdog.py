@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+階段時限 (watchdog)
+
+異常頁面可能讓一次 execute_script（例如 querySelectorAll('*') 全頁走訪）
+或 driver.get 卡到 Selenium 的預設逾時才返回。StageWatchdog 為每個階段
+（navigate / scan / replace / restore / capture）設定時限，以背景計時器監看：
+- 逾時：透過 DevTools 旁路連線中止頁面工作（腳本階段送 Runtime.terminateExecution，
+  導航階段送 Page.stopLoading），卡住的指令隨即返回
+- 中止後 grace 秒仍未返回：開一個空白分頁後關閉原分頁，driver 切到新分頁
+
+逾時的階段會記錄下來並拋出 StageTimeout；同一頁之後的階段直接失敗，
+直到下一次 navigate，讓一個壞頁面不會拖住整次執行。
+
+旁路連線需要 websocket-client 且瀏覽器在本機（local / daemon 後端）；
+無法使用時只記錄逾時，不主動中止。
+"""
+
+import json
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException
+
+from cdp_frames import WEBSOCKET_AVAILABLE, websocket
+
+DEFAULT_STAGE_BUDGETS = {
+    'navigate': 35,
+    'scan': 15,
+    'replace': 10,
+    'restore': 5,
+    'capture': 15,
+}
+DEFAULT_ABORT_GRACE = 5
+
+# 各階段逾時時送出的中止指令
+_ABORT_COMMANDS = {
+    'navigate': 'Page.stopLoading',
+}
+_DEFAULT_ABORT_COMMAND = 'Runtime.terminateExecution'
+
+
+class StageTimeout(TimeoutException):
+    """某個階段超過時限"""
+
+    def __init__(self, stage, budget, elapsed=None):
+        self.stage = stage
+        self.budget = budget
+        self.elapsed = elapsed
+        detail = f"{elapsed:.1f} 秒" if elapsed is not None else "本頁已有階段逾時"
+        super().__init__(f"階段 {stage} 超過時限 {budget} 秒 ({detail})")
+
+
+class StageWatchdog:
+    """以計時器監看每個階段，逾時時中止頁面工作或分頁"""
+
+    def __init__(self, driver, budgets=None, grace=DEFAULT_ABORT_GRACE, enabled=True):
+        self.driver = driver
+        self.budgets = dict(DEFAULT_STAGE_BUDGETS, **(budgets or {}))
+        self.grace = grace
+        self.enabled = enabled
+        self.tripped = None         # 本頁逾時的階段，下次 navigate 前其他階段直接失敗
+        self._target = None         # (debugger address, target id)，取不到時為 False
+        self.stats = {stage: {'runs': 0, 'overruns': 0, 'seconds': 0.0} for stage in self.budgets}
+        self.overruns = []          # [{'stage', 'url', 'elapsed', 'action'}]
+        self.listener = None        # listener(stage, url, seconds, overrun)，例如寫入結果資料庫
+        self._url = None
+
+    def carry_over(self, previous):
+        """重啟瀏覽器後沿用先前的統計"""
+        if previous:
+            self.stats = previous.stats
+            self.overruns = previous.overruns
+
+    # 旁路連線
+
+    def _current_target(self):
+        if self._target is None:
+            # 取不到（遠端瀏覽器、非 Chrome driver）時記為 False，不再每個階段重試
+            self._target = False
+            try:
+                address = (self.driver.capabilities.get('goog:chromeOptions') or {}).get('debuggerAddress')
+                if address:
+                    target_id = self.driver.execute_cdp_cmd('Target.getTargetInfo', {})['targetInfo']['targetId']
+                    self._target = (address, target_id)
+            except Exception:
+                pass
+        return self._target or None
+
+    def _send_side_channel(self, target, method):
+        address, target_id = target
+        ws = websocket.create_connection(f"ws://{address}/devtools/page/{target_id}",
+                                         timeout=2, suppress_origin=True)
+        try:
+            ws.send(json.dumps({'id': 1, 'method': method, 'params': {}}))
+        finally:
+            ws.close()
+
+    def _close_tab(self, target):
+        """先開一個空白分頁（避免關掉最後一個分頁連帶結束瀏覽器），再關閉卡住的分頁"""
+        address, target_id = target
+        request = urllib.request.Request(f"http://{address}/json/new?about:blank", method='PUT')
+        urllib.request.urlopen(request, timeout=2).close()
+        urllib.request.urlopen(f"http://{address}/json/close/{target_id}", timeout=2).close()
+
+    def _abort(self, stage, target, record, finished):
+        """計時器執行緒：先中止頁面工作，grace 秒後仍未返回就關閉分頁"""
+        if target is None:
+            record['action'] = 'none'
+            return
+        method = _ABORT_COMMANDS.get(stage, _DEFAULT_ABORT_COMMAND)
+        if WEBSOCKET_AVAILABLE:
+            try:
+                self._send_side_channel(target, method)
+                record['action'] = method
+            except Exception as e:
+                print(f"⚠️ 無法中止 {stage} 階段的頁面工作: {e}")
+            if finished.wait(self.grace):
+                return
+        try:
+            self._close_tab(target)
+            record['action'] = 'close_tab'
+        except Exception as e:
+            print(f"⚠️ 無法關閉卡住的分頁: {e}")
+
+    def _recover_tab(self):
+        """原分頁已關閉：driver 切到剩下的分頁"""
+        self._target = None
+        try:
+            self.driver.switch_to.window(self.driver.window_handles[-1])
+        except Exception as e:
+            print(f"⚠️ 切換到新分頁失敗: {e}")
+
+    # 階段
+
+    @contextmanager
+    def stage(self, name, url=None):
+        """with watchdog.stage('scan'): ... 超過時限時拋出 StageTimeout"""
+        if not self.enabled or name not in self.budgets:
+            yield
+            return
+
+        budget = self.budgets[name]
+        if name == 'navigate':
+            self.tripped = None
+            self._url = url
+        elif self.tripped:
+            raise StageTimeout(self.tripped, self.budgets[self.tripped])
+
+        target = self._current_target()
+        record = {}
+        finished = threading.Event()
+        expired = threading.Event()
+
+        def on_expire():
+            expired.set()
+            print(f"⏱️ 階段 {name} 超過時限 {budget} 秒，中止中...")
+            self._abort(name, target, record, finished)
+
+        timer = threading.Timer(budget, on_expire)
+        timer.daemon = True
+        start = time.time()
+        timer.start()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+        finally:
+            finished.set()
+            timer.cancel()
+            elapsed = time.time() - start
+            stats = self.stats[name]
+            stats['runs'] += 1
+            stats['seconds'] += elapsed
+            if self.listener:
+                self.listener(name, self._url, elapsed, expired.is_set())
+
+        if expired.is_set():
+            stats['overruns'] += 1
+            self.tripped = name
+            self.overruns.append({'stage': name, 'url': self._url, 'elapsed': elapsed,
+                                  'action': record.get('action', 'pending')})
+            if record.get('action') == 'close_tab':
+                self._recover_tab()
+            raise StageTimeout(name, budget, elapsed) from error
+        if error is not None:
+            raise error
+
+    def print_summary(self):
+        if not self.enabled or not self.overruns:
+            return
+        print(f"⏱️ 階段逾時 {len(self.overruns)} 次:")
+        for stage, stats in self.stats.items():
+            if stats['overruns']:
+                print(f"   {stage}: {stats['overruns']}/{stats['runs']} 次逾時 (時限 {self.budgets[stage]} 秒)")
+        for overrun in self.overruns[-5:]:
+            print(f"   - {overrun['stage']} {overrun['elapsed']:.1f}s [{overrun['action']}] {overrun['url']}")
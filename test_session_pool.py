@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+測試 session_pool.py：以本機的簡易 W3C WebDriver 端點代替 Selenium Grid
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from selenium.webdriver.chrome.options import Options
+    from session_pool import SessionPool
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+
+class FakeGrid:
+    """只實作 session_pool 用到的 WebDriver 指令"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.created = 0
+        grid = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, value, status=200):
+                body = json.dumps({'value': value}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                if method == 'POST' and self.path == '/session':
+                    return self._reply(grid.new_session())
+                match = re.match(r'^/session/([^/]+)(/.*)?$', self.path)
+                session = grid.sessions.get(match.group(1)) if match else None
+                if session is None:
+                    return self._reply({'error': 'invalid session id', 'message': 'no such session'}, 404)
+                self._reply(grid.command(match.group(1), session, method, match.group(2) or '', payload))
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def new_session(self):
+        self.created += 1
+        session_id = uuid.uuid4().hex
+        handle = uuid.uuid4().hex
+        self.sessions[session_id] = {'handles': [handle], 'current': handle}
+        return {'sessionId': session_id, 'capabilities': {'browserName': 'chrome'}}
+
+    def command(self, session_id, session, method, path, payload):
+        if path == '' and method == 'DELETE':
+            del self.sessions[session_id]
+            return None
+        if path == '/execute/sync':
+            return 1 if payload.get('script') == 'return 1;' else 0
+        if path == '/url':
+            return None
+        if path == '/window/handles':
+            return list(session['handles'])
+        if path == '/window/new':
+            handle = uuid.uuid4().hex
+            session['handles'].append(handle)
+            return {'handle': handle, 'type': 'tab'}
+        if path == '/window':
+            if method == 'GET':
+                return session['current']
+            if method == 'POST':
+                session['current'] = payload['handle']
+                return None
+            session['handles'].remove(session['current'])
+            return list(session['handles'])
+        raise AssertionError(f"未實作的指令 {method} {path}")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@unittest.skipUnless(SELENIUM_AVAILABLE, "需要 selenium")
+class SessionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = FakeGrid()
+        self.addCleanup(self.grid.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.registry_path = os.path.join(directory.name, 'remote_sessions.json')
+
+    def _options(self, *arguments):
+        options = Options()
+        for argument in arguments:
+            options.add_argument(argument)
+        return options
+
+    def _pool(self, **kwargs):
+        return SessionPool(self.grid.url, registry_path=self.registry_path, **kwargs)
+
+    def _load_pages(self, driver, count):
+        for _ in range(count):
+            driver.get('https://example.com/')
+
+    def test_release_and_lease_reuses_session(self):
+        pool = self._pool()
+        options = self._options('--headless')
+        driver = pool.lease(options)
+        self._load_pages(driver, 3)
+        session_id = driver.session_id
+        pool.release(driver, options)
+
+        again = pool.lease(options)
+        self.assertEqual(again.session_id, session_id)
+        self.assertEqual(again.pages_loaded, 3)
+        self.assertEqual(len(self.grid.sessions[session_id]['handles']), 1)
+        self.assertEqual(self.grid.created, 1)
+
+    def test_different_options_get_different_sessions(self):
+        pool = self._pool()
+        first = pool.lease(self._options('--headless'))
+        pool.release(first, self._options('--headless'))
+        second = pool.lease(self._options('--headless', '--window-size=800,600'))
+        self.assertNotEqual(first.session_id, second.session_id)
+
+    def test_recycles_after_max_pages(self):
+        pool = self._pool(max_pages=2)
+        options = self._options('--headless')
+        driver = pool.lease(options)
+        self._load_pages(driver, 2)
+        pool.release(driver, options)
+        self.assertNotIn(driver.session_id, self.grid.sessions)
+
+    def test_next_process_attaches_parked_session(self):
+        options = self._options('--headless')
+        pool = self._pool()
+        driver = pool.lease(options)
+        self._load_pages(driver, 4)
+        session_id = driver.session_id
+        pool.release(driver, options)
+        pool.close()
+        self.assertIn(session_id, self.grid.sessions)
+
+        # 下一次執行：新的池從 registry 接上同一個 session，不在 Grid 上建立新的
+        next_pool = self._pool()
+        attached = next_pool.lease(self._options('--headless'))
+        self.assertEqual(attached.session_id, session_id)
+        self.assertEqual(attached.pages_loaded, 4)
+        self.assertEqual(self.grid.created, 1)
+
+    def test_dead_parked_session_is_replaced(self):
+        options = self._options('--headless')
+        pool = self._pool()
+        driver = pool.lease(options)
+        pool.release(driver, options)
+        pool.close()
+        del self.grid.sessions[driver.session_id]
+
+        next_pool = self._pool()
+        replacement = next_pool.lease(options)
+        self.assertNotEqual(replacement.session_id, driver.session_id)
+        self.assertEqual(replacement.pages_loaded, 0)
+        self.assertEqual(self.grid.created, 2)
+
+    def test_close_without_registry_quits_sessions(self):
+        options = self._options('--headless')
+        pool = SessionPool(self.grid.url, registry_path=None)
+        driver = pool.lease(options)
+        pool.release(driver, options)
+        pool.close()
+        self.assertEqual(self.grid.sessions, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,11 +26,14 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
 from urllib.parse import urlparse
+from lazy_sweep import sweep_lazy_ads
+from resource_blocking import ResourceBlocker, enable_network_log
+from browser_backend import open_browser
+from results_store import ResultsStore
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -69,6 +72,17 @@ except ImportError:
     # GIF 使用策略預設設定
     GIF_PRIORITY = True
     # RANDOM_SELECTION = False  # 已移除隨機選擇功能
+    # 懶載入觸發預設設定
+    LAZY_LOAD_SWEEP = True
+    LAZY_SWEEP_BAND_TIMEOUT = 1.5
+    LAZY_SWEEP_MAX_SECONDS = 15
+    # 資源封鎖預設設定
+    RESOURCE_BLOCKING = True
+    RESOURCE_BLOCKING_DRY_RUN = False
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
+    # 結果資料庫預設設定
+    RESULTS_DB = "results.db"
 
 # 嘗試載入 MSS 截圖庫
 try:
@@ -309,7 +323,7 @@ class TvbsAdReplacer:
         self.total_replacements = 0     # 總替換次數
         self.gif_replacements = 0       # GIF 替換次數
         self.static_replacements = 0    # 靜態圖片替換次數
-        self.replacement_details = []   # 詳細替換記錄
+        self.results = ResultsStore(RESULTS_DB, 'tvbs', SCREENSHOT_COUNT)  # 詳細替換記錄（SQLite）
        
     def setup_driver(self, headless):
         chrome_options = Options()
@@ -328,10 +342,22 @@ class TvbsAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        if RESOURCE_BLOCKING:
+            enable_network_log(chrome_options)
+        
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
+        
+        # 封鎖影片、字型與追蹤器等不影響廣告截圖的資源
+        self.resource_blocker = None
+        if RESOURCE_BLOCKING:
+            self.resource_blocker = ResourceBlocker(self.driver, 'tvbs', RESOURCE_BLOCKING_DRY_RUN)
+            self.resource_blocker.apply()
         
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -510,13 +536,12 @@ class TvbsAdReplacer:
             self.static_replacements += 1
         
         # 記錄詳細替換資訊
-        if current_image_info:
-            self.replacement_details.append({
-                'filename': current_image_info['filename'],
-                'size': f"{current_image_info['width']}x{current_image_info['height']}",
-                'type': current_image_info['type'],
-                'screenshot': filepath
-            })
+        self.results.record_replacement(
+            f"{current_image_info['width']}x{current_image_info['height']}" if current_image_info else None,
+            (original_ad_info or {}).get('position'),
+            current_image_info['filename'] if current_image_info else None,
+            current_image_info and current_image_info.get('is_gif'),
+            filepath)
         
         print(f"📊 總截圖數: {self.total_screenshots}")
         if self.gif_replacements > 0:
@@ -813,7 +838,7 @@ class TvbsAdReplacer:
                         self._take_screenshot_with_urlbar(screenshot_path)
                         
                         # 更新統計
-                        self._update_screenshot_count(screenshot_path, selected_image, None)
+                        self._update_screenshot_count(screenshot_path, selected_image, ad_info)
                         
                     except Exception as e:
                         print(f"截圖失敗: {e}")
@@ -1552,6 +1577,8 @@ class TvbsAdReplacer:
             print(f"{'='*60}")
             
             # 載入網頁
+            if self.resource_blocker:
+                self.resource_blocker.discard_events()
             self.driver.get(url)
             time.sleep(WAIT_TIME)
             
@@ -1570,57 +1597,67 @@ class TvbsAdReplacer:
             except Exception:
                 pass
             
-            # 分段滾動觸發懶載入廣告 - 0%, 20%, 40%, 60%, 80%, 100%
-            print("開始分段滾動觸發懶載入廣告...")
-            scroll_positions = [0, 20, 40, 60, 80, 100]
-            
-            try:
-                for i, position in enumerate(scroll_positions, 1):
-                    print(f"第 {i}/6 階段：滾動到 {position}% 位置")
-                    
-                    # 計算滾動位置
-                    scroll_script = f"""
-                        var scrollHeight = Math.max(
-                            document.body.scrollHeight,
-                            document.documentElement.scrollHeight
-                        );
-                        var targetPosition = scrollHeight * {position / 100};
-                        window.scrollTo(0, targetPosition);
-                        return targetPosition;
-                    """
-                    
-                    target_pos = self.driver.execute_script(scroll_script)
-                    print(f"  滾動到位置: {target_pos}px ({position}%)")
+            # 掃描前一次觸發所有懶載入廣告（每段等到廣告繪製完成即前進）
+            if LAZY_LOAD_SWEEP:
+                try:
+                    sweep_lazy_ads(self.driver, band_timeout=LAZY_SWEEP_BAND_TIMEOUT, max_seconds=LAZY_SWEEP_MAX_SECONDS)
+                except Exception as e:
+                    print(f"懶載入掃描失敗: {e}")
+            else:
+                # 分段滾動觸發懶載入廣告 - 0%, 20%, 40%, 60%, 80%, 100%
+                print("開始分段滾動觸發懶載入廣告...")
+                scroll_positions = [0, 20, 40, 60, 80, 100]
+                
+                try:
+                    for i, position in enumerate(scroll_positions, 1):
+                        print(f"第 {i}/6 階段：滾動到 {position}% 位置")
+                        
+                        # 計算滾動位置
+                        scroll_script = f"""
+                            var scrollHeight = Math.max(
+                                document.body.scrollHeight,
+                                document.documentElement.scrollHeight
+                            );
+                            var targetPosition = scrollHeight * {position / 100};
+                            window.scrollTo(0, targetPosition);
+                            return targetPosition;
+                        """
+                        
+                        target_pos = self.driver.execute_script(scroll_script)
+                        print(f"  滾動到位置: {target_pos}px ({position}%)")
+                        
+                        # 每個位置停留時間，讓廣告有時間載入
+                        if position == 0:
+                            time.sleep(2)  # 頂部停留較短
+                        elif position == 100:
+                            time.sleep(4)  # 底部停留較長，觸發更多懶載入
+                        else:
+                            time.sleep(3)  # 中間位置適中停留
+                        
+                        # 檢查是否有新的廣告元素載入
+                        try:
+                            ad_count = self.driver.execute_script("""
+                                var ads = document.querySelectorAll('[id*="google"], [class*="ads"], iframe[src*="google"]');
+                                return ads.length;
+                            """)
+                            print(f"  當前廣告元素數量: {ad_count}")
+                        except:
+                            pass
                     
-                    # 每個位置停留時間，讓廣告有時間載入
-                    if position == 0:
-                        time.sleep(2)  # 頂部停留較短
-                    elif position == 100:
-                        time.sleep(4)  # 底部停留較長，觸發更多懶載入
-                    else:
-                        time.sleep(3)  # 中間位置適中停留
+                    # 最後回到頂部，準備開始掃描
+                    print("回到頂部，準備開始廣告掃描...")
+                    self.driver.execute_script("window.scrollTo(0, 0);")
+                    time.sleep(2)
                     
-                    # 檢查是否有新的廣告元素載入
-                    try:
-                        ad_count = self.driver.execute_script("""
-                            var ads = document.querySelectorAll('[id*="google"], [class*="ads"], iframe[src*="google"]');
-                            return ads.length;
-                        """)
-                        print(f"  當前廣告元素數量: {ad_count}")
-                    except:
-                        pass
+                    print("✅ 分段滾動觸發完成")
+                except Exception as e:
+                    print(f"分段滾動觸發失敗: {e}")
                 
-                # 最後回到頂部，準備開始掃描
-                print("回到頂部，準備開始廣告掃描...")
-                self.driver.execute_script("window.scrollTo(0, 0);")
+                # 最終等待，確保所有廣告都載入完成
                 time.sleep(2)
-                
-                print("✅ 分段滾動觸發完成")
-            except Exception as e:
-                print(f"分段滾動觸發失敗: {e}")
             
-            # 最終等待，確保所有廣告都載入完成
-            time.sleep(2)
+            if self.resource_blocker:
+                self.resource_blocker.page_report(url)
             
             screenshot_paths = []
             total_replacements = 0
@@ -1789,8 +1826,11 @@ class TvbsAdReplacer:
 
     def close(self):
         """關閉瀏覽器"""
+        if getattr(self, 'resource_blocker', None):
+            self.resource_blocker.print_summary()
+        self.results.close()
         try:
-            self.driver.quit()
+            self.browser.close()
             print("瀏覽器已關閉")
         except:
             pass
@@ -1831,7 +1871,9 @@ def main():
                 
             print(f"\n處理第 {i+1}/{len(news_urls)} 個網站")
             
+            bot.results.begin_page(url)
             screenshot_paths = bot.process_website(url)
+            bot.results.finish_page(url, 'ok' if screenshot_paths else 'empty', len(screenshot_paths or []))
             
             if screenshot_paths:
                 print(f"✅ 成功處理網站！共產生 {len(screenshot_paths)} 張截圖")
@@ -1839,6 +1881,7 @@ def main():
                 # 檢查是否達到目標截圖數量
                 if bot.total_screenshots >= SCREENSHOT_COUNT:
                     print(f"✅ 已達到目標截圖數量: {SCREENSHOT_COUNT}")
+                    bot.results.finish_run()
                     break
             else:
                 print("❌ 網站處理失敗")
@@ -1851,19 +1894,8 @@ def main():
         print(f"\n{'='*60}")
         print(f"📊 TVBS 廣告替換統計報告")
         print(f"{'='*60}")
-        print(f"📸 總截圖數量: {bot.total_screenshots} 張")
-        print(f"🔄 總替換次數: {bot.total_replacements} 次")
-        if bot.total_replacements > 0:
-            gif_percentage = (bot.gif_replacements / bot.total_replacements) * 100
-            static_percentage = (bot.static_replacements / bot.total_replacements) * 100
-            print(f"   🎬 GIF 替換: {bot.gif_replacements} 次 ({gif_percentage:.1f}%)")
-            print(f"   🖼️ 靜態圖片替換: {bot.static_replacements} 次 ({static_percentage:.1f}%)")
-        
-        if bot.replacement_details:
-            print(f"\n📋 詳細替換記錄:")
-            for i, detail in enumerate(bot.replacement_details, 1):
-                type_icon = "🎬" if "GIF" in detail['type'] else "🖼️"
-                print(f"    {i}. {type_icon} {detail['filename']} ({detail['size']}) → 📸 {detail['screenshot']}")
+        # 統計由結果資料庫彙總
+        bot.results.print_report()
         
         # 顯示 GIF 使用策略
         try:
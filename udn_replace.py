@@ -8,10 +8,25 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from batched_replace import replace_slots_batched
+from capture_planner import measure_slots, plan_viewport_groups, crop_slot_from_frame, discard_frame
+from size_matcher import match_sizes, matches_by_size
+from gpt_slots import find_declared_ad_slots
+from cdp_frames import CrossOriginFrameEngine
+from dom_snapshot_scanner import resolve_elements
+from lazy_sweep import sweep_lazy_ads
+from early_commit import install_slots_ready_signal, navigate_early
+from browser_backend import open_browser
+from browser_supervisor import BrowserSupervisor, BrowserUnrecoverable
+from stage_watchdog import StageTimeout, StageWatchdog
+from run_ledger import RunLedger
+from results_store import ResultsStore
+from seen_urls import SeenUrlIndex
+from slot_yield import SlotYieldMemory
+from ad_extension import DEFAULT_SLOT_SELECTOR, ExtensionController, add_extension_arguments, build_extension
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -49,6 +64,203 @@ except ImportError:
     BUTTON_STYLE = "dots"  # 預設按鈕樣式
     # GIF 使用策略預設設定
     GIF_PRIORITY = True
+    # 視窗分組截圖預設設定
+    VIEWPORT_BATCH_CAPTURE = True
+    CROP_PER_AD = False
+    CROP_MARGIN = 200
+    FRAME_ENGINE = "dom"
+    # 懶載入觸發預設設定
+    LAZY_LOAD_SWEEP = True
+    LAZY_SWEEP_BAND_TIMEOUT = 1.5
+    LAZY_SWEEP_MAX_SECONDS = 15
+    # 頁面載入策略預設設定
+    PAGE_LOAD_STRATEGY = "normal"
+    EARLY_COMMIT_TIMEOUT = 15
+    STOP_LOADING_WHEN_READY = True
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
+    # 擴充功能執行模式預設設定
+    EXTENSION_MODE = False
+    EXTENSION_SIGNAL_TIMEOUT = 30
+    # 瀏覽器監控預設設定
+    BROWSER_SUPERVISOR = True
+    BROWSER_MAX_PAGES = 40
+    BROWSER_MAX_MEMORY_MB = 2500
+    BROWSER_COMMAND_TIMEOUT = 10
+    BROWSER_PAGE_TIMEOUT = 300
+    # 階段時限預設設定
+    STAGE_WATCHDOG = True
+    STAGE_BUDGETS = None
+    STAGE_ABORT_GRACE = 5
+    # 檢查點預設設定
+    CHECKPOINT_LEDGER = True
+    CHECKPOINT_DIR = "checkpoints"
+    CHECKPOINT_FSYNC_EVERY = 5
+    # 結果資料庫預設設定
+    RESULTS_DB = "results.db"
+    # 已截圖網址索引預設設定
+    SEEN_URL_FILTER = True
+    SEEN_URL_DB = "seen_urls.db"
+    SEEN_URL_EXPIRY_DAYS = 30
+    SEEN_URL_SITE_EXPIRY_DAYS = {}
+    # 版位產出記憶預設設定
+    SLOT_YIELD_MEMORY = True
+    SLOT_YIELD_DB = "slot_yield.db"
+    SLOT_YIELD_WINDOW_DAYS = 60
+    SLOT_YIELD_SKIP_AFTER = 3
+
+# 擴充功能模式的廣告位置選擇器（content script 看不到頁面的 googletag，只能以 DOM 比對）
+DEFAULT_EXTENSION_SLOT_SELECTOR = DEFAULT_SLOT_SELECTOR + ', .udn-ads, [class*="udn-ads"]'
+
+# 截圖後還原所有替換：移除注入元素、恢復 data-original-* 備份（擴充功能模式共用）
+RESTORE_REPLACED_ADS_SCRIPT = """
+// Yahoo 風格的簡化還原邏輯：直接清理所有注入元素
+
+// 移除所有注入的按鈕
+var buttons = document.querySelectorAll('#close_button, #abgb, #info_button, [id^="close_button"], [id^="abgb"]');
+for (var i = 0; i < buttons.length; i++) {
+    buttons[i].remove();
+}
+
+// 移除所有替換的圖片（通過 data:image 識別）
+var replacedImages = document.querySelectorAll('img[src*="data:image"]');
+for (var i = 0; i < replacedImages.length; i++) {
+    // 恢復原始 src
+    var originalSrc = replacedImages[i].getAttribute('data-original-src');
+    if (originalSrc) {
+        replacedImages[i].src = originalSrc;
+        replacedImages[i].removeAttribute('data-original-src');
+    } else {
+        // 如果沒有原始 src，移除該圖片
+        replacedImages[i].remove();
+    }
+}
+
+// 恢復所有被修改樣式的圖片
+var styledImages = document.querySelectorAll('img[data-original-style]');
+for (var i = 0; i < styledImages.length; i++) {
+    var originalStyle = styledImages[i].getAttribute('data-original-style');
+    if (originalStyle !== null) {
+        styledImages[i].style.cssText = originalStyle;
+        styledImages[i].removeAttribute('data-original-style');
+    }
+}
+
+// 恢復所有隱藏的 iframe
+var hiddenIframes = document.querySelectorAll('iframe[style*="display: none"], iframe[style*="visibility: hidden"]');
+for (var i = 0; i < hiddenIframes.length; i++) {
+    hiddenIframes[i].style.display = 'block';
+    hiddenIframes[i].style.visibility = 'visible';
+}
+
+// 恢復背景圖片
+var bgElements = document.querySelectorAll('[data-original-background]');
+for (var i = 0; i < bgElements.length; i++) {
+    var originalBg = bgElements[i].getAttribute('data-original-background');
+    if (originalBg) {
+        bgElements[i].style.backgroundImage = originalBg;
+        bgElements[i].removeAttribute('data-original-background');
+
+        // 恢復背景樣式
+        var originalBgStyle = bgElements[i].getAttribute('data-original-bg-style');
+        if (originalBgStyle) {
+            try {
+                var bgStyle = JSON.parse(originalBgStyle);
+                bgElements[i].style.backgroundSize = bgStyle.size;
+                bgElements[i].style.backgroundRepeat = bgStyle.repeat;
+                bgElements[i].style.backgroundPosition = bgStyle.position;
+            } catch(e) {}
+            bgElements[i].removeAttribute('data-original-bg-style');
+        }
+    }
+}
+
+// 清理所有備份相關的 data 屬性
+var allElements = document.querySelectorAll('[data-original-backup], [data-backup-done]');
+for (var i = 0; i < allElements.length; i++) {
+    allElements[i].removeAttribute('data-original-backup');
+    allElements[i].removeAttribute('data-backup-done');
+}
+
+console.log('✅ Yahoo 風格清理完成：已移除所有注入元素');
+"""
+
+# Google 廣告標準樣式（替換時注入為 #google_ad_styles）
+GOOGLE_AD_STYLES_CSS = """
+div {
+    margin: 0;
+    padding: 0;
+}
+.abgb {
+    position: absolute;
+    right: 16px;
+    top: 0px;
+}
+.abgb {
+    display: inline-block;
+    height: 15px;
+}
+.abgc {
+    cursor: pointer;
+}
+.abgc {
+    display: block;
+    height: 15px;
+    position: absolute;
+    right: 1px;
+    top: 1px;
+    text-rendering: geometricPrecision;
+    z-index: 2147483646;
+}
+.abgc .il-wrap {
+    background-color: #ffffff;
+    height: 15px;
+    white-space: nowrap;
+}
+.abgc .il-icon {
+    height: 15px;
+    width: 15px;
+}
+.abgc .il-icon svg {
+    fill: #00aecd;
+}
+.abgs svg, .abgb svg {
+    display: inline-block;
+    height: 15px;
+    width: 15px;
+    vertical-align: top;
+}
+#close_button { 
+    text-decoration: none; 
+    margin: 0; 
+    padding: 0; 
+    border: none;
+    cursor: pointer;
+    position: absolute; 
+    z-index: 100; 
+    top: 0px;
+    bottom: auto;
+    vertical-align: top;
+    margin-top: 1px;
+    right: 0px;
+    left: auto;
+    text-align: right;
+    margin-right: 1px;
+    display: block; 
+    width: 15px; 
+    height: 15px;
+}
+#close_button #close_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+#abgb #info_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+"""
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -257,6 +469,50 @@ class ScreenManager:
                 return screen
         return None
 
+# Google Ads 判斷：容器名稱、Google 廣告 iframe、Google 腳本或 googletag 腳本
+IS_GOOGLE_AD_JS = """
+function isGoogleAd(element) {
+    var tagName = element.tagName.toLowerCase();
+    var className = typeof element.className === 'string' ? element.className : '';
+    var id = element.id || '';
+    var src = element.src || '';
+    
+    // 檢查是否為 Google Ads 容器
+    var isGoogleAdContainer = (
+        id.includes('google_ads') || 
+        id.includes('ads-') ||
+        className.includes('google') ||
+        className.includes('ads') ||
+        id.includes('ads')
+    );
+    
+    // 檢查是否包含 Google Ads iframe
+    var hasGoogleIframe = element.querySelector('iframe[src*="googleads"], iframe[src*="googlesyndication"], iframe[src*="doubleclick"]');
+    
+    // 檢查是否為 Google Ads iframe
+    var isGoogleIframe = tagName === 'iframe' && (
+        src.includes('googleads') || 
+        src.includes('googlesyndication') || 
+        src.includes('doubleclick')
+    );
+    
+    // 檢查是否有 Google Ads 腳本
+    var hasGoogleScript = element.querySelector('script[src*="google"]');
+    
+    // 檢查是否包含 googletag 腳本
+    var hasGoogletagScript = false;
+    var scripts = element.querySelectorAll('script');
+    for (var i = 0; i < scripts.length; i++) {
+        if (scripts[i].textContent && scripts[i].textContent.includes('googletag')) {
+            hasGoogletagScript = true;
+            break;
+        }
+    }
+    
+    return !!(isGoogleAdContainer || hasGoogleIframe || isGoogleIframe || hasGoogleScript || hasGoogletagScript);
+}
+"""
+
 class UdnAdReplacer:
     def __init__(self, headless=False, screen_id=1):
         print("正在初始化 UDN 廣告替換器 - GIF 升級版...")
@@ -267,10 +523,22 @@ class UdnAdReplacer:
         self.total_replacements = 0     # 總替換次數
         self.gif_replacements = 0       # GIF 替換次數
         self.static_replacements = 0    # 靜態圖片替換次數
-        self.replacement_details = []   # 詳細替換記錄
+        self.results = ResultsStore(RESULTS_DB, 'udn', SCREENSHOT_COUNT)  # 詳細替換記錄（SQLite）
+        self.ledger = None              # 檢查點帳本（由 main 設定）
+        # 跨執行的已截圖網址，探索文章時略過
+        self.seen_urls = None
+        if SEEN_URL_FILTER:
+            self.seen_urls = SeenUrlIndex(SEEN_URL_DB, 'udn', SEEN_URL_SITE_EXPIRY_DAYS.get('udn', SEEN_URL_EXPIRY_DAYS))
+        # 各網址與網址樣式的版位產出，探索文章時依預期產出排序
+        self.slot_yield = None
+        if SLOT_YIELD_MEMORY:
+            self.slot_yield = SlotYieldMemory(SLOT_YIELD_DB, 'udn', SLOT_YIELD_WINDOW_DAYS, SLOT_YIELD_SKIP_AFTER)
+        self.page_slot_sizes = None     # 本頁找到的版位尺寸，尚未完成掃描時為 None
         
-        self.setup_driver(headless)
+        # 擴充功能模式需在啟動瀏覽器前打包替換圖片，因此先載入圖片
         self.load_replace_images()
+        self.frame_engine = None
+        self.setup_driver(headless)
         print("UDN 廣告替換器 - GIF 升級版")
         
     def setup_driver(self, headless):
@@ -287,7 +555,8 @@ class UdnAdReplacer:
         # 網路穩定性設定
         chrome_options.add_argument('--disable-web-security')
         chrome_options.add_argument('--disable-features=VizDisplayCompositor')
-        chrome_options.add_argument('--disable-extensions')
+        if not EXTENSION_MODE:
+            chrome_options.add_argument('--disable-extensions')
         chrome_options.add_argument('--disable-plugins')
         chrome_options.add_argument('--disable-images=false')  # 確保圖片載入
         
@@ -324,8 +593,19 @@ class UdnAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
+        # 'eager'/'none'：driver.get() 不等 load 事件，改以廣告位置就緒訊號開始掃描
+        chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+        
+        # 擴充功能模式：掃描、替換、按鈕與還原由 content script 執行
+        if EXTENSION_MODE:
+            extension_dir = self.build_replacement_extension()
+            add_extension_arguments(chrome_options, extension_dir)
+            print(f"🧩 已打包替換擴充功能: {extension_dir}")
+        
         print("正在啟動 Chrome 瀏覽器...")
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
         print("Chrome 瀏覽器啟動成功！")
         
         # 設置超時時間
@@ -333,9 +613,34 @@ class UdnAdReplacer:
         self.driver.implicitly_wait(10)  # 隱式等待10秒
         print("瀏覽器設置完成！")
         
+        self.extension = ExtensionController(self.driver) if EXTENSION_MODE else None
+        
+        # 各階段時限：卡住時中止頁面工作，重啟瀏覽器時沿用先前的統計
+        previous_watchdog = getattr(self, 'watchdog', None)
+        self.watchdog = StageWatchdog(self.driver, STAGE_BUDGETS, STAGE_ABORT_GRACE, enabled=STAGE_WATCHDOG)
+        self.watchdog.carry_over(previous_watchdog)
+        self.watchdog.listener = self.results.record_stage
+        
+        self.early_commit = PAGE_LOAD_STRATEGY != "normal"
+        if self.early_commit:
+            self.ready_signal_installed = install_slots_ready_signal(self.driver)
+        
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
+        
+        # iframe 引擎綁定目前的瀏覽器，重啟瀏覽器時一併重建
+        if self.frame_engine:
+            self.frame_engine.close()
+            self.frame_engine = None
+        if FRAME_ENGINE == "cdp":
+            engine = CrossOriginFrameEngine(self.driver)
+            if engine.available():
+                self.frame_engine = engine
+                print("🧬 使用 CDP 跨來源 iframe 引擎")
+            else:
+                print("⚠️ CDP iframe 引擎無法使用（需要 websocket-client），改用頁面層替換")
     
     def move_to_screen(self):
         """將瀏覽器移動到指定螢幕並設為全螢幕"""
@@ -496,6 +801,18 @@ class UdnAdReplacer:
     def _update_screenshot_count(self, filepath, current_image_info, original_ad_info):
         """更新截圖統計並返回檔案路徑 - ETtoday 統計模式"""
         self.total_screenshots += 1
+        self._record_replacement(filepath, current_image_info, original_ad_info)
+        if self.ledger:
+            self.ledger.screenshot(filepath)
+        
+        print(f"📊 總截圖數: {self.total_screenshots}")
+        if self.gif_replacements > 0:
+            print(f"📊 GIF 廣告數: {self.gif_replacements}")
+        
+        return filepath
+
+    def _record_replacement(self, filepath, current_image_info, original_ad_info=None):
+        """記錄一次廣告替換（同一張截圖可包含多個替換）"""
         self.total_replacements += 1
         
         # 檢查是否為 GIF 廣告
@@ -506,19 +823,22 @@ class UdnAdReplacer:
             self.static_replacements += 1
         
         # 記錄詳細替換資訊
+        detail = None
         if current_image_info:
-            self.replacement_details.append({
+            detail = {
                 'filename': current_image_info['filename'],
                 'size': f"{current_image_info['width']}x{current_image_info['height']}",
                 'type': current_image_info['type'],
                 'screenshot': filepath
-            })
-        
-        print(f"📊 總截圖數: {self.total_screenshots}")
-        if self.gif_replacements > 0:
-            print(f"📊 GIF 廣告數: {self.gif_replacements}")
-        
-        return filepath
+            }
+        self.results.record_replacement(
+            detail['size'] if detail else (original_ad_info or {}).get('sizeKey'),
+            (original_ad_info or {}).get('position'),
+            detail['filename'] if detail else None,
+            current_image_info and current_image_info.get('is_gif'),
+            filepath)
+        if self.ledger:
+            self.ledger.replacement(detail, current_image_info and current_image_info.get('is_gif'))
 
     def load_image_base64(self, image_path):
         if not os.path.exists(image_path):
@@ -602,7 +922,11 @@ class UdnAdReplacer:
                         else:
                             print(f"❌ 排除連結: {href} (valid:{is_valid_travel}, not_travel:{is_not_travel}, article:{is_article_page})")
                         
-            # 使用 ETtoday 模式：順序選擇而非隨機選擇
+            # 先略過先前已截圖的文章並依預期產出排序，再依 ETtoday 模式順序選擇而非隨機選擇
+            if self.seen_urls:
+                news_urls = self.seen_urls.filter_new(news_urls)
+            if self.slot_yield:
+                news_urls = self.slot_yield.prioritize(news_urls)
             selected_urls = news_urls[:min(NEWS_COUNT, len(news_urls))]
             print(f"選擇前 {len(selected_urls)} 個旅遊文章連結:")
             for i, url in enumerate(selected_urls):
@@ -612,192 +936,146 @@ class UdnAdReplacer:
             print(f"獲取旅遊連結失敗: {e}")
             return []
     
-    def scan_entire_page_for_ads(self, target_width, target_height):
-        """掃描整個網頁尋找符合尺寸的廣告元素"""
-        print(f"開始掃描整個網頁尋找 {target_width}x{target_height} 的廣告...")
+    def collect_google_ad_candidates(self):
+        """一次取得所有 Google Ads 候選元素的位置、尺寸與可見性"""
+        # 快速路徑：直接向 googletag / AdSense 取得廣告位置
+        has_tags, declared_slots = False, []
+        try:
+            has_tags, declared_slots = find_declared_ad_slots(self.driver, ['.udn-ads', '[class*="udn-ads"]'])
+            if has_tags:
+                sources = {}
+                for slot in declared_slots:
+                    sources[slot['source']] = sources.get(slot['source'], 0) + 1
+                print(f"⚡ 由廣告標籤取得 {len(declared_slots)} 個廣告位置: {sources}")
+        except Exception as e:
+            print(f"⚠️ 讀取 googletag/AdSense 廣告位置失敗，改用完整掃描: {e}")
         
-        # 專門獲取 Google Ads 相關元素
-        all_elements = self.driver.execute_script("""
+        # 廣告標籤以外的位置仍以 DOM 規則掃描補上；有 GPT/AdSense 時只看廣告標籤未涵蓋的區域，
+        # 不再搜尋 google / googletag 腳本的父元素
+        leftovers = self._scan_heuristic_candidates([slot['element'] for slot in declared_slots], has_tags)
+        if has_tags:
+            print(f"   另以 DOM 掃描補上 {len(leftovers)} 個廣告標籤以外的候選元素")
+        return declared_slots + leftovers
+    
+    def _scan_heuristic_candidates(self, covered_elements, has_tags=False):
+        """以 DOM 規則收集候選元素，已由廣告標籤取得（或包含/位於其中）的元素略過
+
+        has_tags 時只收集廣告標籤未涵蓋區域中的容器與 iframe，不再走訪腳本。
+        """
+        return self.driver.execute_script("""
+            var covered = (arguments[0] || []).filter(function(element) { return element; });
+            var hasTags = arguments[1];
+            
+            // 已取得的位置本身與其所有祖先：位於其中或包含它們的元素都算已涵蓋（每次判斷只需走訪祖先鏈）
+            var coveredSet = new Set(covered);
+            var coveredAncestors = new Set();
+            covered.forEach(function(element) {
+                for (var node = element.parentElement; node && !coveredAncestors.has(node); node = node.parentElement) {
+                    coveredAncestors.add(node);
+                }
+            });
+            var isCovered = function(element) {
+                if (coveredAncestors.has(element)) return true;
+                for (var node = element; node; node = node.parentElement) {
+                    if (coveredSet.has(node)) return true;
+                }
+                return false;
+            };
+            
             function getGoogleAdsElements() {
-                var googleAdsElements = [];
+                var found = new Set();
+                var add = function(element) {
+                    if (element && !found.has(element) && !isCovered(element)) found.add(element);
+                };
                 
                 // 1. 直接選擇 Google Ads 容器
-                var googleAdContainers = document.querySelectorAll('div[id*="google_ads"], div[id*="ads-"], div[class*="google"], div[class*="ads"]');
-                for (var i = 0; i < googleAdContainers.length; i++) {
-                    googleAdsElements.push(googleAdContainers[i]);
-                }
+                document.querySelectorAll('div[id*="google_ads"], div[id*="ads-"], div[class*="google"], div[class*="ads"]').forEach(add);
                 
                 // 2. 選擇 Google Ads iframe
-                var googleIframes = document.querySelectorAll('iframe[src*="googleads"], iframe[src*="googlesyndication"], iframe[src*="doubleclick"]');
-                for (var i = 0; i < googleIframes.length; i++) {
-                    googleAdsElements.push(googleIframes[i]);
-                }
+                document.querySelectorAll('iframe[src*="googleads"], iframe[src*="googlesyndication"], iframe[src*="doubleclick"]').forEach(add);
                 
-                // 3. 選擇包含 Google Ads 腳本的元素
-                var scriptElements = document.querySelectorAll('script[src*="google"]');
-                for (var i = 0; i < scriptElements.length; i++) {
-                    var parent = scriptElements[i].parentElement;
-                    if (parent && !googleAdsElements.includes(parent)) {
-                        googleAdsElements.push(parent);
-                    }
-                }
-                
-                // 4. 選擇包含 googletag 腳本的元素
-                var allScripts = document.querySelectorAll('script');
-                for (var i = 0; i < allScripts.length; i++) {
-                    var script = allScripts[i];
-                    if (script.textContent && script.textContent.includes('googletag')) {
-                        var parent = script.parentElement;
-                        if (parent && !googleAdsElements.includes(parent)) {
-                            googleAdsElements.push(parent);
-                        }
-                    }
+                // 3、4. 包含 Google Ads / googletag 腳本的元素（已由廣告標籤取得位置時不需要）
+                if (!hasTags) {
+                    document.querySelectorAll('script[src*="google"]').forEach(function(script) {
+                        add(script.parentElement);
+                    });
+                    document.querySelectorAll('script').forEach(function(script) {
+                        if (script.textContent && script.textContent.includes('googletag')) add(script.parentElement);
+                    });
                 }
                 
                 // 5. 選擇 udn-ads 類別的元素（聯合報特定的廣告容器）
-                var udnAdsElements = document.querySelectorAll('.udn-ads, [class*="udn-ads"]');
-                for (var i = 0; i < udnAdsElements.length; i++) {
-                    if (!googleAdsElements.includes(udnAdsElements[i])) {
-                        googleAdsElements.push(udnAdsElements[i]);
-                    }
-                }
+                document.querySelectorAll('.udn-ads, [class*="udn-ads"]').forEach(add);
                 
-                return googleAdsElements;
+                return Array.from(found);
             }
-            return getGoogleAdsElements();
-        """)
-        
-        print(f"找到 {len(all_elements)} 個 Google Ads 元素，開始檢查尺寸...")
+            
+            // 先讀取所有幾何資訊，比對交給 Python 端一次完成
+            return getGoogleAdsElements().map(function(element) {
+                var rect = element.getBoundingClientRect();
+                var computedStyle = window.getComputedStyle(element);
+                return {
+                    element: element,
+                    width: Math.round(rect.width),
+                    height: Math.round(rect.height),
+                    top: rect.top,
+                    left: rect.left,
+                    display: computedStyle.display,
+                    visibility: computedStyle.visibility,
+                    visible: rect.width > 0 && rect.height > 0 &&
+                             computedStyle.display !== 'none' && computedStyle.visibility !== 'hidden'
+                };
+            });
+        """, covered_elements, skip_googletag_scripts)
+    
+    def _confirm_google_ads(self, candidates):
+        """只對尺寸相符的候選元素做 Google Ads 判斷（需走訪其中的 script），一次呼叫完成"""
+        unchecked = [c for c in candidates if 'isGoogleAd' not in c]
+        if unchecked:
+            results = self.driver.execute_script(IS_GOOGLE_AD_JS + """
+                return arguments[0].map(function(element) { return isGoogleAd(element); });
+            """, [c['element'] for c in unchecked])
+            for candidate, is_google_ad in zip(unchecked, results or []):
+                candidate['isGoogleAd'] = bool(is_google_ad)
+        return [c for c in candidates if c.get('isGoogleAd')]
+    
+    def _match_google_ads(self, target_sizes):
+        """所有候選元素與目標尺寸一次比對（嚴格完全相符），回傳依尺寸分組的廣告列表"""
+        candidates = self.collect_google_ad_candidates()
+        print(f"找到 {len(candidates)} 個 Google Ads 元素，開始比對尺寸...")
         
-        matching_elements = []
+        # 先比對尺寸，只有尺寸相符的元素才檢查是否為 Google Ads
+        table = match_sizes(candidates, target_sizes, tolerance=0)
+        confirmed = {id(c) for c in self._confirm_google_ads([row['candidate'] for row in table])}
+        table = [row for row in table if id(row['candidate']) in confirmed]
+        ads_by_size = {}
+        for size_key, rows in matches_by_size(table).items():
+            ads_by_size[size_key] = []
+            for row in rows:
+                ad = row['candidate']
+                ads_by_size[size_key].append({
+                    'element': ad['element'],
+                    'width': ad['width'],
+                    'height': ad['height'],
+                    'position': f"top:{ad['top']:.0f}, left:{ad['left']:.0f}",
+                    'display': ad['display'],
+                    'visibility': ad['visibility']
+                })
+                print(f"✅ 確認找到 {size_key} Google Ads: {ad['width']}x{ad['height']} at {ad['top']:.0f},{ad['left']:.0f}")
+        return ads_by_size
+    
+    def scan_all_target_sizes(self):
+        """一次掃描整頁，回傳所有目標尺寸的符合廣告 {size_key: [...]}"""
+        print(f"開始掃描整個網頁尋找 {len(self.target_ad_sizes)} 種尺寸的廣告...")
+        ads_by_size = self._match_google_ads(self.target_ad_sizes)
+        print(f"掃描完成，找到 {sum(len(ads) for ads in ads_by_size.values())} 個符合尺寸的廣告元素")
+        return ads_by_size
+    
+    def scan_entire_page_for_ads(self, target_width, target_height):
+        """掃描整個網頁尋找符合尺寸的廣告元素"""
+        print(f"開始掃描整個網頁尋找 {target_width}x{target_height} 的廣告...")
         
-        for i, element in enumerate(all_elements):
-            try:
-                # 檢查元素尺寸
-                size_info = self.driver.execute_script("""
-                    var element = arguments[0];
-                    var rect = element.getBoundingClientRect();
-                    return {
-                        width: Math.round(rect.width),
-                        height: Math.round(rect.height),
-                        top: rect.top,
-                        left: rect.left,
-                        visible: rect.width > 0 && rect.height > 0
-                    };
-                """, element)
-                
-                # 嚴格檢查尺寸是否完全匹配
-                if (size_info and 
-                    size_info['visible'] and
-                    size_info['width'] == target_width and 
-                    size_info['height'] == target_height and
-                    size_info['width'] > 0 and 
-                    size_info['height'] > 0):
-                    
-                    # 專門檢查 Google Ads
-                    is_google_ad = self.driver.execute_script("""
-                        var element = arguments[0];
-                        var tagName = element.tagName.toLowerCase();
-                        var className = element.className || '';
-                        var id = element.id || '';
-                        var src = element.src || '';
-                        
-                        // 檢查是否為 Google Ads 容器
-                        var isGoogleAdContainer = (
-                            id.includes('google_ads') || 
-                            id.includes('ads-') ||
-                            className.includes('google') ||
-                            className.includes('ads') ||
-                            id.includes('ads')
-                        );
-                        
-                        // 檢查是否包含 Google Ads iframe
-                        var hasGoogleIframe = element.querySelector('iframe[src*="googleads"], iframe[src*="googlesyndication"], iframe[src*="doubleclick"]');
-                        
-                        // 檢查是否為 Google Ads iframe
-                        var isGoogleIframe = tagName === 'iframe' && (
-                            src.includes('googleads') || 
-                            src.includes('googlesyndication') || 
-                            src.includes('doubleclick')
-                        );
-                        
-                        // 檢查是否有 Google Ads 腳本
-                        var hasGoogleScript = element.querySelector('script[src*="google"]');
-                        
-                        // 檢查是否包含 googletag 腳本
-                        var hasGoogletagScript = false;
-                        var scripts = element.querySelectorAll('script');
-                        for (var i = 0; i < scripts.length; i++) {
-                            if (scripts[i].textContent && scripts[i].textContent.includes('googletag')) {
-                                hasGoogletagScript = true;
-                                break;
-                            }
-                        }
-                        
-                        return isGoogleAdContainer || hasGoogleIframe || isGoogleIframe || hasGoogleScript || hasGoogletagScript;
-                    """, element)
-                    
-                    if is_google_ad:
-                        # 再次驗證尺寸
-                        final_check = self.driver.execute_script("""
-                            var element = arguments[0];
-                            var rect = element.getBoundingClientRect();
-                            var computedStyle = window.getComputedStyle(element);
-                            
-                            return {
-                                width: Math.round(rect.width),
-                                height: Math.round(rect.height),
-                                display: computedStyle.display,
-                                visibility: computedStyle.visibility,
-                                position: computedStyle.position,
-                                zIndex: computedStyle.zIndex
-                            };
-                        """, element)
-                        
-                        # 最終尺寸驗證 - 在 JavaScript 中進行
-                        final_verification = self.driver.execute_script("""
-                            var element = arguments[0];
-                            var targetWidth = arguments[1];
-                            var targetHeight = arguments[2];
-                            
-                            var rect = element.getBoundingClientRect();
-                            var computedStyle = window.getComputedStyle(element);
-                            
-                            var widthDiff = Math.abs(Math.round(rect.width) - targetWidth);
-                            var heightDiff = Math.abs(Math.round(rect.height) - targetHeight);
-                            var isExactMatch = widthDiff <= 1 && heightDiff <= 1;
-                            
-                            return {
-                                width: Math.round(rect.width),
-                                height: Math.round(rect.height),
-                                display: computedStyle.display,
-                                visibility: computedStyle.visibility,
-                                isExactMatch: isExactMatch,
-                                isValid: isExactMatch && computedStyle.display !== 'none' && computedStyle.visibility !== 'hidden'
-                            };
-                        """, element, target_width, target_height)
-                        
-                        if final_verification['isValid']:
-                            matching_elements.append({
-                                'element': element,
-                                'width': final_verification['width'],
-                                'height': final_verification['height'],
-                                'position': f"top:{size_info['top']:.0f}, left:{size_info['left']:.0f}",
-                                'display': final_verification['display'],
-                                'visibility': final_verification['visibility']
-                            })
-                            print(f"✅ 確認找到 {target_width}x{target_height} Google Ads: {final_verification['width']}x{final_verification['height']} at {size_info['top']:.0f},{size_info['left']:.0f}")
-                        else:
-                            print(f"❌ 尺寸不匹配: 期望 {target_width}x{target_height}, 實際 {final_verification['width']}x{final_verification['height']}")
-                    else:
-                        print(f"❌ 不是 Google Ads: {size_info['width']}x{size_info['height']}")
-                
-                # 每檢查100個元素顯示進度
-                if (i + 1) % 100 == 0:
-                    print(f"已檢查 {i + 1}/{len(all_elements)} 個元素...")
-                    
-            except Exception as e:
-                continue
+        matching_elements = self._match_google_ads([(target_width, target_height)]).get(f"{target_width}x{target_height}", [])
         
         print(f"掃描完成，找到 {len(matching_elements)} 個符合尺寸的廣告元素")
         return matching_elements
@@ -862,388 +1140,170 @@ class UdnAdReplacer:
         
         return button_styles.get(button_style, button_styles["dots"])
 
+    def get_replace_options(self):
+        """批次替換選項（擴充功能模式共用）"""
+        return {
+            'sizeTolerance': 0,             # 精確尺寸匹配
+            'compactSmallAdButtons': True,  # 小尺寸廣告按鈕收在廣告內部
+            'adStylesCss': GOOGLE_AD_STYLES_CSS
+        }
+
     def replace_ad_content(self, element, image_data, target_width, target_height):
+        """替換單一廣告位置"""
+        return self.replace_ad_contents([{
+            'element': element,
+            'image_data': image_data,
+            'width': target_width,
+            'height': target_height
+        }])[0]
+    
+    def replace_ad_contents(self, slots):
+        """分階段批次替換多個廣告位置：先量測所有位置，再於同一個 animation frame 內寫入"""
+        if not slots:
+            return []
         try:
-            # 獲取原始尺寸
-            original_info = self.driver.execute_script("""
-                var element = arguments[0];
-                if (!element || !element.getBoundingClientRect) return null;
-                var rect = element.getBoundingClientRect();
-                return {width: rect.width, height: rect.height};
-            """, element)
-            
-            if not original_info:
-                return False
-            
-            # 檢查是否符合目標尺寸
-            if (original_info['width'] != target_width or 
-                original_info['height'] != target_height):
-                return False
-            
             # 獲取按鈕樣式
             button_style = self.get_button_style()
-            close_button_html = button_style["close_button"]["html"]
-            close_button_style = button_style["close_button"]["style"]
-            info_button_html = button_style["info_button"]["html"]
-            info_button_style = button_style["info_button"]["style"]
             
             # 檢查是否為 "none" 模式
             current_button_style = getattr(self, 'button_style', 'dots')
             is_none_mode = current_button_style == "none"
             
-            # 只替換圖片，保留廣告按鈕
-            success = self.driver.execute_script("""
-                // 添加 Google 廣告標準樣式
-                if (!document.getElementById('google_ad_styles')) {
-                    var style = document.createElement('style');
-                    style.id = 'google_ad_styles';
-                    style.textContent = `
-                        div {
-                            margin: 0;
-                            padding: 0;
-                        }
-                        .abgb {
-                            position: absolute;
-                            right: 16px;
-                            top: 0px;
-                        }
-                        .abgb {
-                            display: inline-block;
-                            height: 15px;
-                        }
-                        .abgc {
-                            cursor: pointer;
-                        }
-                        .abgc {
-                            display: block;
-                            height: 15px;
-                            position: absolute;
-                            right: 1px;
-                            top: 1px;
-                            text-rendering: geometricPrecision;
-                            z-index: 2147483646;
-                        }
-                        .abgc .il-wrap {
-                            background-color: #ffffff;
-                            height: 15px;
-                            white-space: nowrap;
-                        }
-                        .abgc .il-icon {
-                            height: 15px;
-                            width: 15px;
-                        }
-                        .abgc .il-icon svg {
-                            fill: #00aecd;
-                        }
-                        .abgs svg, .abgb svg {
-                            display: inline-block;
-                            height: 15px;
-                            width: 15px;
-                            vertical-align: top;
-                        }
-                        #close_button { 
-                            text-decoration: none; 
-                            margin: 0; 
-                            padding: 0; 
-                            border: none;
-                            cursor: pointer;
-                            position: absolute; 
-                            z-index: 100; 
-                            top: 0px;
-                            bottom: auto;
-                            vertical-align: top;
-                            margin-top: 1px;
-                            right: 0px;
-                            left: auto;
-                            text-align: right;
-                            margin-right: 1px;
-                            display: block; 
-                            width: 15px; 
-                            height: 15px;
-                        }
-                        #close_button #close_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                        #abgb #info_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                    `;
-                    document.head.appendChild(style);
-                }
-                
-                var container = arguments[0];
-                var imageBase64 = arguments[1];
-                var targetWidth = arguments[2];
-                var targetHeight = arguments[3];
-                var closeButtonHtml = arguments[4];
-                var closeButtonStyle = arguments[5];
-                var infoButtonHtml = arguments[6];
-                var infoButtonStyle = arguments[7];
-                var isNoneMode = arguments[8];
-                
-                if (!container) return false;
-                
-                // Yahoo 風格：不需要複雜的備份機制
-                // 只在替換個別元素時保存其原始屬性即可
-                
-                // 確保 container 是 relative
-                if (window.getComputedStyle(container).position === 'static') {
-                  container.style.position = 'relative';
-                }
-                // 先移除舊的（避免重複）
-                ['close_button', 'abgb'].forEach(function(id){
-                  var old = container.querySelector('#'+id);
-                  if(old) old.remove();
-                });
-                
-                var replacedCount = 0;
-                var newImageSrc = 'data:image/png;base64,' + imageBase64;
-                
-                // 方法1: 只替換img標籤的src，不移除元素
-                var imgs = container.querySelectorAll('img');
-                for (var i = 0; i < imgs.length; i++) {
-                    var img = imgs[i];
-                    // 排除Google廣告控制按鈕
-                    var imgRect = img.getBoundingClientRect();
-                    var isControlButton = imgRect.width < 50 || imgRect.height < 50 || 
-                                         img.className.includes('abg') || 
-                                         img.id.includes('abg') ||
-                                         img.src.includes('googleads') ||
-                                         img.src.includes('googlesyndication') ||
-                                         img.src.includes('adchoices') ||
-                                         img.src.includes('zh_tw.png') ||
-                                         img.closest('#abgcp') ||
-                                         img.closest('.abgcp') ||
-                                         img.closest('#abgc') ||
-                                         img.closest('.abgc') ||
-                                         img.closest('#abgb') ||
-                                         img.closest('.abgb') ||
-                                         img.closest('#abgs') ||
-                                         img.closest('.abgs') ||
-                                         img.closest('#cbb') ||
-                                         img.closest('.cbb') ||
-                                         img.closest('label.cbb') ||
-                                         img.closest('[data-vars-label*="feedback"]') ||
-                                         img.alt.includes('關閉') ||
-                                         img.alt.includes('close');
-                    
-                    if (!isControlButton && img.src && !img.src.startsWith('data:')) {
-                        // 保存原始src以便復原
-                        if (!img.getAttribute('data-original-src')) {
-                            img.setAttribute('data-original-src', img.src);
-                        }
-                        // 保存原始樣式以便復原
-                        if (!img.getAttribute('data-original-style')) {
-                            img.setAttribute('data-original-style', img.style.cssText || '');
-                        }
-                        // 替換圖片，保持原始尺寸和佈局
-                        img.src = newImageSrc;
-                        img.style.objectFit = 'contain';
-                        img.style.width = '100%';
-                        img.style.height = 'auto';
-                        img.style.maxWidth = 'none';
-                        img.style.maxHeight = 'none';
-                        img.style.minWidth = 'auto';
-                        img.style.minHeight = 'auto';
-                        img.style.display = 'block';
-                        img.style.margin = '0';
-                        img.style.padding = '0';
-                        img.style.border = 'none';
-                        img.style.outline = 'none';
-                        replacedCount++;
-                    
-                    // 確保img的父層是relative
-                    var imgParent = img.parentElement || container;
-                    if (window.getComputedStyle(imgParent).position === 'static') {
-                        imgParent.style.position = 'relative';
-                    }
-                    
-                    // 先移除舊的按鈕
-                    ['close_button', 'abgb'].forEach(function(id){
-                        var old = imgParent.querySelector('#'+id);
-                        if(old) old.remove();
-                    });
-                    
-                    // 只有在非 none 模式下才創建按鈕
-                    if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                        // 叉叉 - 貼著替換圖片的右上角
-                        var closeButton = document.createElement('div');
-                        closeButton.id = 'close_button';
-                        closeButton.innerHTML = closeButtonHtml;
-                        closeButton.style.cssText = closeButtonStyle;
-                        
-                        // 驚嘆號 - 貼著替換圖片的右上角，與叉叉對齊
-                        var abgb = document.createElement('div');
-                        abgb.id = 'abgb';
-                        abgb.className = 'abgb';
-                        abgb.innerHTML = infoButtonHtml;
-                        abgb.style.cssText = infoButtonStyle;
-                        
-                        // 將按鈕添加到img的父層（驚嘆號在左，叉叉在右）
-                        imgParent.appendChild(abgb);
-                        imgParent.appendChild(closeButton);
-                    }
-                }
-                }
-                // 方法2: 處理iframe
-                var iframes = container.querySelectorAll('iframe');
-                for (var i = 0; i < iframes.length; i++) {
-                    var iframe = iframes[i];
-                    var iframeRect = iframe.getBoundingClientRect();
-                    
-                    // 隱藏iframe
-                    iframe.style.visibility = 'hidden';
-                    
-                    // 確保容器是relative
-                    if (window.getComputedStyle(container).position === 'static') {
-                        container.style.position = 'relative';
-                    }
-                    
-                    // 在iframe位置創建新的圖片元素
-                    var newImg = document.createElement('img');
-                    newImg.src = newImageSrc;
-                    newImg.style.position = 'absolute';
-                    newImg.style.top = (iframeRect.top - container.getBoundingClientRect().top) + 'px';
-                    newImg.style.left = (iframeRect.left - container.getBoundingClientRect().left) + 'px';
-                    newImg.style.width = Math.round(iframeRect.width) + 'px';
-                    newImg.style.height = Math.round(iframeRect.height) + 'px';
-                    newImg.style.objectFit = 'contain';
-                    newImg.style.zIndex = '1';
-                    
-                    container.appendChild(newImg);
-                    
-                    // 先移除舊的按鈕
-                    ['close_button', 'abgb'].forEach(function(id){
-                        var old = container.querySelector('#'+id);
-                        if(old) old.remove();
-                    });
-                    
-                    // 只有在非 none 模式下才創建按鈕
-                    if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                        // 檢查廣告尺寸，針對小尺寸廣告調整按鈕位置
-                        var adWidth = iframeRect.width;
-                        var adHeight = iframeRect.height;
-                        var isSmallAd = adHeight <= 60; // 高度小於等於60px的廣告視為小廣告
-                        
-                        // 計算按鈕位置
-                        var buttonTop = iframeRect.top - container.getBoundingClientRect().top;
-                        var buttonRight = container.getBoundingClientRect().right - iframeRect.right;
-                        
-                        // 對於小廣告，調整按鈕位置避免超出範圍
-                        if (isSmallAd) {
-                            // 小廣告：按鈕放在廣告內部右上角
-                            buttonTop = Math.max(0, buttonTop);
-                            buttonRight = Math.max(0, buttonRight);
-                            
-                            // 確保按鈕不會超出廣告右邊界
-                            if (buttonRight < 15) {
-                                buttonRight = 0; // 如果空間不足，貼著右邊
-                            }
-                        }
-                        
-                        // 叉叉 - 貼著替換圖片的右上角
-                        var closeButton = document.createElement('div');
-                        closeButton.id = 'close_button';
-                        closeButton.innerHTML = closeButtonHtml;
-                        closeButton.style.cssText = 'position:absolute;top:' + buttonTop + 'px;right:' + buttonRight + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);';
-                        
-                        // 驚嘆號 - 位置調整
-                        var infoButtonRight = buttonRight + (isSmallAd ? 16 : 17); // 小廣告間距稍小
-                        
-                        // 對於小廣告，如果空間不足，將info按鈕放在close按鈕左邊
-                        if (isSmallAd && infoButtonRight + 15 > adWidth) {
-                            infoButtonRight = buttonRight - 16; // 放在close按鈕左邊
-                            if (infoButtonRight < 0) {
-                                infoButtonRight = buttonRight + 1; // 如果還是不夠，就緊貼著
-                            }
-                        }
-                        
-                        var abgb = document.createElement('div');
-                        abgb.id = 'abgb';
-                        abgb.className = 'abgb';
-                        abgb.innerHTML = infoButtonHtml;
-                        abgb.style.cssText = 'position:absolute;top:' + (buttonTop + (isSmallAd ? 0 : 1)) + 'px;right:' + infoButtonRight + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);line-height:0;';
-                        
-                        // 將按鈕添加到container內，與圖片同層
-                        container.appendChild(abgb);
-                        container.appendChild(closeButton);
-                    }
-                    replacedCount++;
-                }
-                // 方法3: 處理背景圖片
-                if (replacedCount === 0) {
-                    var style = window.getComputedStyle(container);
-                    if (style.backgroundImage && style.backgroundImage !== 'none') {
-                        // 保存原始背景圖片
-                        if (!container.getAttribute('data-original-background')) {
-                            container.setAttribute('data-original-background', style.backgroundImage);
-                        }
-                        // 保存原始背景樣式
-                        if (!container.getAttribute('data-original-bg-style')) {
-                            var bgStyle = {
-                                size: style.backgroundSize,
-                                repeat: style.backgroundRepeat,
-                                position: style.backgroundPosition
-                            };
-                            container.setAttribute('data-original-bg-style', JSON.stringify(bgStyle));
-                        }
-                        container.style.backgroundImage = 'url(' + newImageSrc + ')';
-                        container.style.backgroundSize = 'contain';
-                        container.style.backgroundRepeat = 'no-repeat';
-                        container.style.backgroundPosition = 'center';
-                        replacedCount = 1;
-                        
-                        // 確保容器是relative
-                        if (window.getComputedStyle(container).position === 'static') {
-                            container.style.position = 'relative';
-                        }
-                        
-                        // 先移除舊的按鈕
-                        ['close_button', 'abgb'].forEach(function(id){
-                            var old = container.querySelector('#'+id);
-                            if(old) old.remove();
-                        });
-                        
-                        // 只有在非 none 模式下才創建按鈕
-                        if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                            // 添加兩個按鈕 - 貼著替換圖片的右上角，水平對齊
-                            var closeButton = document.createElement('div');
-                            closeButton.id = 'close_button';
-                            closeButton.innerHTML = closeButtonHtml;
-                            closeButton.style.cssText = closeButtonStyle;
-                            
-                            var abgb = document.createElement('div');
-                            abgb.id = 'abgb';
-                            abgb.className = 'abgb';
-                            abgb.innerHTML = infoButtonHtml;
-                            abgb.style.cssText = infoButtonStyle;
-                            
-                            // 將按鈕添加到container內，與背景圖片同層
-                            container.appendChild(abgb);
-                            container.appendChild(closeButton);
-                        }
-                    }
-                }
-                return replacedCount > 0;
-            """, element, image_data, target_width, target_height, close_button_html, close_button_style, info_button_html, info_button_style, is_none_mode)
+            results = replace_slots_batched(self.driver, slots, button_style, is_none_mode, self.get_replace_options())
             
-            if success:
-                print(f"替換廣告 {original_info['width']}x{original_info['height']}")
-                return True
-            else:
-                print(f"廣告替換失敗 {original_info['width']}x{original_info['height']}")
-                return False
+            outcomes = []
+            for slot, result in zip(slots, results):
+                if result['ok']:
+                    print(f"替換廣告 {result['width']}x{result['height']}")
+                elif result.get('reason') == 'size':
+                    pass  # 尺寸不符合，直接略過
+                else:
+                    print(f"廣告替換失敗 {result['width']}x{result['height']}")
+                outcomes.append(bool(result['ok']))
+            return outcomes
                 
         except Exception as e:
             print(f"替換廣告失敗: {e}")
-            return False
+            return [False] * len(slots)
     
+    def build_replacement_extension(self):
+        """依目前的圖片策略與按鈕樣式打包擴充功能，回傳資料夾路徑"""
+        images_by_size = {}
+        for size_key, images in self.images_by_size.items():
+            selected_image = self.select_image_by_strategy(images['static'], images['gif'], size_key)
+            if selected_image:
+                images_by_size[size_key] = dict(selected_image, data=self.load_image_base64(selected_image['path']))
+        return build_extension(
+            'ad_extension_build', images_by_size, self.get_button_style(),
+            getattr(self, 'button_style', BUTTON_STYLE) == "none", self.get_replace_options(),
+            RESTORE_REPLACED_ADS_SCRIPT, ['*://*.udn.com/*'],
+            slot_selector=DEFAULT_EXTENSION_SLOT_SELECTOR)
+
+    def process_website_with_extension(self, url):
+        """擴充功能模式：頁面中的 content script 完成掃描與替換，這裡只在收到訊號時截圖
+
+        擴充功能未載入或未回應時回傳 None，呼叫端改用一般流程。
+        """
+        self.extension.new_page()
+        with self.watchdog.stage('navigate', url):
+            if self.early_commit:
+                navigate_early(self.driver, url, EARLY_COMMIT_TIMEOUT, STOP_LOADING_WHEN_READY,
+                               self.ready_signal_installed)
+            else:
+                self.driver.get(url)
+        
+        # content script 在 document_start 標記自己；沒有標記表示擴充功能未載入，不必等待訊號
+        if not self.extension.present():
+            print("⚠️ 擴充功能未載入，本次執行改用一般流程")
+            self.extension = None
+            return None
+        
+        message = self.extension.wait_signal(EXTENSION_SIGNAL_TIMEOUT)
+        if not message or message['type'] != 'ready':
+            print(f"⚠️ 擴充功能未回應 ({message['type'] if message else 'timeout'})，改用一般流程")
+            return None
+        
+        page_title = self.driver.title
+        print(f"📰 頁面標題: {page_title}")
+        
+        ready = message['payload']
+        slots = [dict(slot, index=index) for index, slot in enumerate(ready['slots'])]
+        self.page_slot_sizes = [slot['sizeKey'] for slot in slots]
+        if not slots:
+            self.extension.ack(message, 'stop')
+            print("\n❌ 本網頁沒有找到任何可替換的 Google Ads")
+            return []
+        
+        viewport = ready['viewport']
+        if VIEWPORT_BATCH_CAPTURE:
+            groups = plan_viewport_groups(slots, viewport['height'])
+        else:
+            groups = [plan_viewport_groups([slot], viewport['height'])[0] for slot in slots]
+        print(f"\n🧩 擴充功能找到 {len(slots)} 個廣告位置，分成 {len(groups)} 組截圖")
+        self.extension.ack(message, 'run', groups=[
+            {'indexes': [slot['index'] for slot in group['slots']], 'scrollY': group['scroll_y']} for group in groups
+        ])
+        
+        images_by_filename = {image['filename']: image for image in self.replace_images}
+        screenshot_paths = []
+        while True:
+            message = self.extension.wait_signal(EXTENSION_SIGNAL_TIMEOUT)
+            if not message or message['type'] != 'capture':
+                break
+            
+            capture = message['payload']
+            replaced = [(slot, images_by_filename.get(slot['filename'])) for slot in capture['slots']]
+            for slot, image in replaced:
+                print(f"   ✅ 成功替換 {image['type'] if image else ''}: {slot['filename']} ({slot['sizeKey']})")
+            print(f"   📍 滾動到廣告位置: {capture['scrollY']:.0f}px")
+            
+            with self.watchdog.stage('capture'):
+                frame_path = self.take_screenshot(page_title)
+            if frame_path:
+                if CROP_PER_AD:
+                    # 每張裁切圖都檢查截圖數量限制，同一組不會超出
+                    for index, (slot, image) in enumerate(replaced, 1):
+                        if self.total_screenshots >= SCREENSHOT_COUNT:
+                            break
+                        crop_path = crop_slot_from_frame(frame_path, slot['rect'], capture['scrollY'], capture['viewport'],
+                                                         CROP_MARGIN, suffix=f"{slot['sizeKey']}_{index}")
+                        self._update_screenshot_count(crop_path, image, slot)
+                        screenshot_paths.append(crop_path)
+                    discard_frame(frame_path)
+                else:
+                    self._update_screenshot_count(frame_path, replaced[0][1], replaced[0][0])
+                    for slot, image in replaced[1:]:
+                        self._record_replacement(frame_path, image, slot)
+                    screenshot_paths.append(frame_path)
+            
+            reached_limit = self.total_screenshots >= SCREENSHOT_COUNT
+            self.extension.ack(message, 'stop' if reached_limit else 'next')
+            if reached_limit:
+                print(f"🎯 已達到截圖數量限制 ({SCREENSHOT_COUNT})")
+                break
+        
+        if screenshot_paths:
+            print(f"\n✅ 成功替換並截圖 {len(screenshot_paths)} 張")
+        else:
+            print("\n❌ 本網頁沒有找到任何可替換的 Google Ads")
+        return screenshot_paths
+
     def process_website(self, url):
         """處理單個網站，使用 ETtoday GIF 選擇策略 + 錯誤處理"""
+        self.page_slot_sizes = None
+        if self.extension:
+            try:
+                screenshot_paths = self.process_website_with_extension(url)
+                if screenshot_paths is not None:
+                    return screenshot_paths
+            except StageTimeout as e:
+                print(f"⏱️ 跳過此網站: {e}")
+                self.page_slot_sizes = None
+                return []
+            except Exception as e:
+                print(f"⚠️ 擴充功能模式失敗，改用一般流程: {e}")
+                self.page_slot_sizes = None
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -1255,18 +1315,31 @@ class UdnAdReplacer:
                 self.driver.set_page_load_timeout(30)  # 增加超時時間
                 
                 try:
-                    self.driver.get(url)
+                    with self.watchdog.stage('navigate', url):
+                        if self.early_commit:
+                            navigate_early(self.driver, url, EARLY_COMMIT_TIMEOUT, STOP_LOADING_WHEN_READY,
+                                           self.ready_signal_installed)
+                        else:
+                            self.driver.get(url)
                     print("✅ 網頁載入成功")
                 except Exception as load_error:
                     print(f"❌ 網頁載入失敗: {load_error}")
-                    if attempt < max_retries - 1:
+                    if attempt < max_retries - 1 and not isinstance(load_error, StageTimeout):
                         print(f"等待 5 秒後重試...")
                         time.sleep(5)
                         continue
                     else:
                         raise load_error
                 
-                time.sleep(WAIT_TIME + 2)  # 增加等待時間
+                if not self.early_commit:
+                    time.sleep(WAIT_TIME + 2)  # 增加等待時間
+                
+                # 掃描前一次觸發所有懶載入廣告（每段等到廣告繪製完成即前進）
+                if LAZY_LOAD_SWEEP:
+                    try:
+                        sweep_lazy_ads(self.driver, band_timeout=LAZY_SWEEP_BAND_TIMEOUT, max_seconds=LAZY_SWEEP_MAX_SECONDS)
+                    except Exception as e:
+                        print(f"懶載入掃描失敗: {e}")
                 
                 # 獲取頁面標題
                 page_title = self.driver.title
@@ -1275,6 +1348,12 @@ class UdnAdReplacer:
                 # 使用 ETtoday 模式：按尺寸分組處理，而非遍歷所有圖片
                 total_replacements = 0
                 screenshot_paths = []  # 儲存所有截圖路徑
+                candidates = []        # 每個尺寸選出的第一個可替換位置
+                
+                # 一次掃描整頁並與所有目標尺寸比對 (保留 UDN 的 Google Ads 專門檢測)
+                with self.watchdog.stage('scan'):
+                    ads_by_size = self.scan_all_target_sizes()
+                    frames_by_size = self.discover_ad_frames()
                 
                 # 遍歷動態生成的目標廣告尺寸
                 for size_info in self.target_ad_sizes:
@@ -1285,195 +1364,145 @@ class UdnAdReplacer:
                     print(f"\n🔍 處理尺寸: {size_key}")
                     
                     # 獲取該尺寸的圖片組
-                    if size_key in self.images_by_size:
-                        static_images = self.images_by_size[size_key]['static']
-                        gif_images = self.images_by_size[size_key]['gif']
-                        
-                        print(f"   可用圖片: {len(static_images)}張靜態 + {len(gif_images)}張GIF")
-                        
-                        # 使用 ETtoday 優先級策略選擇圖片
-                        selected_image = self.select_image_by_strategy(static_images, gif_images, size_key)
+                    if size_key not in self.images_by_size:
+                        print(f"   ❌ 沒有 {size_key} 尺寸的圖片")
+                        continue
+                    
+                    static_images = self.images_by_size[size_key]['static']
+                    gif_images = self.images_by_size[size_key]['gif']
+                    
+                    print(f"   可用圖片: {len(static_images)}張靜態 + {len(gif_images)}張GIF")
+                    
+                    # 使用 ETtoday 優先級策略選擇圖片
+                    selected_image = self.select_image_by_strategy(static_images, gif_images, size_key)
+                    
+                    if not selected_image:
+                        print(f"   ❌ 沒有可用的 {size_key} 圖片")
+                        continue
+                    
+                    # 載入選中的圖片
+                    try:
+                        image_data = self.load_image_base64(selected_image['path'])
+                    except Exception as e:
+                        print(f"載入圖片失敗: {e}")
+                        continue
+                    
+                    # 跨來源 iframe 中的素材直接在 iframe 內替換
+                    if size_key in frames_by_size:
+                        frame = frames_by_size[size_key]
+                        candidates.append({
+                            'element': frame['element'],
+                            'ad_info': {'position': frame['url'][:60]},
+                            'frame': frame,
+                            'image': selected_image,
+                            'image_data': image_data,
+                            'width': target_width,
+                            'height': target_height,
+                            'is_gif': selected_image['is_gif']
+                        })
+                        continue
+                    
+                    matching_elements = ads_by_size.get(size_key, [])
+                    
+                    if not matching_elements:
+                        print(f"   ❌ 未找到符合 {size_key} 尺寸的 Google Ads")
+                        continue
+                    
+                    # 每個尺寸替換第一個找到的廣告；替換失敗時依序改用同尺寸的下一個位置
+                    candidates.append({
+                        'element': matching_elements[0]['element'],
+                        'ad_info': matching_elements[0],
+                        'fallbacks': matching_elements[1:],
+                        'image': selected_image,
+                        'image_data': image_data,
+                        'width': target_width,
+                        'height': target_height,
+                        'is_gif': selected_image['is_gif']
+                    })
+                
+                self.page_slot_sizes = [f"{c['width']}x{c['height']}" for c in candidates]
+                if not candidates:
+                    print("\n❌ 本網頁沒有找到任何可替換的 Google Ads")
+                    return []
+                
+                while candidates:
+                    # 依視窗位置分組：同一畫面內的廣告一起替換，只截一張圖
+                    measured = measure_slots(self.driver, [c['element'] for c in candidates])
+                    viewport = measured['viewport']
+                    for candidate, rect in zip(candidates, measured['rects']):
+                        candidate['rect'] = rect
+                    
+                    if VIEWPORT_BATCH_CAPTURE:
+                        groups = plan_viewport_groups(candidates, viewport['height'])
+                    else:
+                        groups = [plan_viewport_groups([c], viewport['height'])[0] for c in candidates if c.get('rect')]
+                    print(f"\n🧩 {len(candidates)} 個廣告位置分成 {len(groups)} 組截圖")
+                    
+                    retries = []           # 替換失敗、還有同尺寸備選位置的廣告
+                    for group in groups:
+                        slots = group['slots']
+                        with self.watchdog.stage('replace'):
+                            results = self.replace_group(slots)
+                        replaced_slots = [slot for slot, ok in zip(slots, results) if ok]
                         
-                        if not selected_image:
-                            print(f"   ❌ 沒有可用的 {size_key} 圖片")
-                            continue
+                        for slot, ok in zip(slots, results):
+                            if ok:
+                                continue
+                            if slot.get('fallbacks'):
+                                print(f"   🔁 {slot['width']}x{slot['height']} 替換失敗，改用下一個同尺寸位置")
+                                retries.append(dict(slot, element=slot['fallbacks'][0]['element'],
+                                                    ad_info=slot['fallbacks'][0], fallbacks=slot['fallbacks'][1:]))
+                            else:
+                                print(f"   ❌ 無法替換任何 {slot['width']}x{slot['height']} 廣告")
                         
-                        # 載入選中的圖片
-                        try:
-                            image_data = self.load_image_base64(selected_image['path'])
-                        except Exception as e:
-                            print(f"載入圖片失敗: {e}")
+                        if not replaced_slots:
                             continue
                         
-                        # 掃描網頁尋找符合尺寸的廣告 (保留 UDN 的 Google Ads 專門檢測)
-                        matching_elements = self.scan_entire_page_for_ads(target_width, target_height)
+                        for slot in replaced_slots:
+                            print(f"   ✅ 成功替換 {slot['image']['type']}: {slot['image']['filename']} at {slot['ad_info']['position']}")
+                        total_replacements += len(replaced_slots)
                         
-                        if not matching_elements:
-                            print(f"   ❌ 未找到符合 {size_key} 尺寸的 Google Ads")
-                            continue
-                    
-                    # 嘗試替換找到的廣告
-                    replaced = False
-                    processed_positions = set()  # 記錄已處理的位置
-                    for ad_info in matching_elements:
-                        # 檢查是否已經處理過這個位置
-                        position_key = f"{ad_info['position']}_{size_key}"
-                        if position_key in processed_positions:
-                            print(f"   ⏭️ 跳過已處理的位置: {ad_info['position']}")
-                            continue
-                            
                         try:
-                            if self.replace_ad_content(ad_info['element'], image_data, target_width, target_height):
-                                print(f"   ✅ 成功替換 {selected_image['type']}: {selected_image['filename']} at {ad_info['position']}")
-                                replaced = True
-                                total_replacements += 1
-                                processed_positions.add(position_key)  # 記錄已處理的位置
-                                
-                                # 滾動到廣告位置確保可見
-                                try:
-                                    # 獲取廣告元素的位置
-                                    element_rect = self.driver.execute_script("""
-                                        var element = arguments[0];
-                                        var rect = element.getBoundingClientRect();
-                                        return {
-                                            top: rect.top + window.pageYOffset,
-                                            left: rect.left + window.pageXOffset,
-                                            width: rect.width,
-                                            height: rect.height
-                                        };
-                                    """, ad_info['element'])
-                                    
-                                    # 計算滾動位置，讓廣告在螢幕中央
-                                    viewport_height = self.driver.execute_script("return window.innerHeight;")
-                                    scroll_position = element_rect['top'] - (viewport_height / 2) + (element_rect['height'] / 2)
-                                    
-                                    # 滾動到廣告位置
-                                    self.driver.execute_script(f"window.scrollTo(0, {scroll_position});")
-                                    print(f"   📍 滾動到廣告位置: {scroll_position:.0f}px")
-                                    
-                                    # 等待滾動完成
-                                    time.sleep(1)
-                                    
-                                    # 立即截圖 - ETtoday 即掃即換模式
-                                    screenshot_path = self.take_screenshot(page_title)
-                                    if screenshot_path:
-                                        # 更新統計 - 使用 ETtoday 統計模式
-                                        self._update_screenshot_count(screenshot_path, selected_image, ad_info)
-                                        screenshot_paths.append(screenshot_path)
-                                        
-                                        # 檢查是否達到截圖數量限制
+                            # 捲動一次，讓整組廣告位於螢幕中央
+                            self.driver.execute_script("window.scrollTo(0, arguments[0]);", group['scroll_y'])
+                            print(f"   📍 滾動到廣告位置: {group['scroll_y']:.0f}px")
+                            
+                            # 等待滾動完成
+                            time.sleep(1)
+                            
+                            # 整組只截一張圖
+                            with self.watchdog.stage('capture'):
+                                frame_path = self.take_screenshot(page_title)
+                            if frame_path:
+                                if CROP_PER_AD:
+                                    # 一張圖一個廣告：從整組畫面裁切，每張都檢查截圖數量限制
+                                    for index, slot in enumerate(replaced_slots, 1):
                                         if self.total_screenshots >= SCREENSHOT_COUNT:
-                                            print(f"🎯 已達到截圖數量限制 ({SCREENSHOT_COUNT})")
-                                            return screenshot_paths
-                                    
-                                    # 截圖後復原該位置的廣告 - 採用 Yahoo 簡化清理策略
-                                    try:
-                                        self.driver.execute_script("""
-                                            // Yahoo 風格的簡化還原邏輯：直接清理所有注入元素
-                                            
-                                            // 移除所有注入的按鈕
-                                            var buttons = document.querySelectorAll('#close_button, #abgb, #info_button, [id^="close_button"], [id^="abgb"]');
-                                            for (var i = 0; i < buttons.length; i++) {
-                                                buttons[i].remove();
-                                            }
-                                            
-                                            // 移除所有替換的圖片（通過 data:image 識別）
-                                            var replacedImages = document.querySelectorAll('img[src*="data:image"]');
-                                            for (var i = 0; i < replacedImages.length; i++) {
-                                                // 恢復原始 src
-                                                var originalSrc = replacedImages[i].getAttribute('data-original-src');
-                                                if (originalSrc) {
-                                                    replacedImages[i].src = originalSrc;
-                                                    replacedImages[i].removeAttribute('data-original-src');
-                                                } else {
-                                                    // 如果沒有原始 src，移除該圖片
-                                                    replacedImages[i].remove();
-                                                }
-                                            }
-                                            
-                                            // 恢復所有被修改樣式的圖片
-                                            var styledImages = document.querySelectorAll('img[data-original-style]');
-                                            for (var i = 0; i < styledImages.length; i++) {
-                                                var originalStyle = styledImages[i].getAttribute('data-original-style');
-                                                if (originalStyle !== null) {
-                                                    styledImages[i].style.cssText = originalStyle;
-                                                    styledImages[i].removeAttribute('data-original-style');
-                                                }
-                                            }
-                                            
-                                            // 恢復所有隱藏的 iframe
-                                            var hiddenIframes = document.querySelectorAll('iframe[style*="display: none"], iframe[style*="visibility: hidden"]');
-                                            for (var i = 0; i < hiddenIframes.length; i++) {
-                                                hiddenIframes[i].style.display = 'block';
-                                                hiddenIframes[i].style.visibility = 'visible';
-                                            }
-                                            
-                                            // 恢復背景圖片
-                                            var bgElements = document.querySelectorAll('[data-original-background]');
-                                            for (var i = 0; i < bgElements.length; i++) {
-                                                var originalBg = bgElements[i].getAttribute('data-original-background');
-                                                if (originalBg) {
-                                                    bgElements[i].style.backgroundImage = originalBg;
-                                                    bgElements[i].removeAttribute('data-original-background');
-                                                    
-                                                    // 恢復背景樣式
-                                                    var originalBgStyle = bgElements[i].getAttribute('data-original-bg-style');
-                                                    if (originalBgStyle) {
-                                                        try {
-                                                            var bgStyle = JSON.parse(originalBgStyle);
-                                                            bgElements[i].style.backgroundSize = bgStyle.size;
-                                                            bgElements[i].style.backgroundRepeat = bgStyle.repeat;
-                                                            bgElements[i].style.backgroundPosition = bgStyle.position;
-                                                        } catch(e) {}
-                                                        bgElements[i].removeAttribute('data-original-bg-style');
-                                                    }
-                                                }
-                                            }
-                                            
-                                            // 清理所有備份相關的 data 屬性
-                                            var allElements = document.querySelectorAll('[data-original-backup], [data-backup-done]');
-                                            for (var i = 0; i < allElements.length; i++) {
-                                                allElements[i].removeAttribute('data-original-backup');
-                                                allElements[i].removeAttribute('data-backup-done');
-                                            }
-                                            
-                                            console.log('✅ Yahoo 風格清理完成：已移除所有注入元素');
-                                        """)
-                                        # Yahoo 風格驗證：檢查全頁面是否還有注入元素
-                                        verification = self.driver.execute_script("""
-                                            // 檢查整個頁面是否還有注入元素
-                                            var replacedImages = document.querySelectorAll('img[src*="data:image"]');
-                                            var addedButtons = document.querySelectorAll('#close_button, #abgb, [id^="close_button"], [id^="abgb"]');
-                                            var dataAttributes = document.querySelectorAll('[data-original-src], [data-original-style], [data-original-background]');
-                                            
-                                            return {
-                                                replacedImages: replacedImages.length,
-                                                addedButtons: addedButtons.length,
-                                                dataAttributes: dataAttributes.length
-                                            };
-                                        """)
-                                        
-                                        if verification['replacedImages'] == 0 and verification['addedButtons'] == 0:
-                                            print(f"✅ {ad_info['width']}x{ad_info['height']} at {ad_info['position']}")
-                                        else:
-                                            print(f"⚠️ 清理不完整: 替換圖片:{verification['replacedImages']}, 按鈕:{verification['addedButtons']}, 屬性:{verification['dataAttributes']}")
-                                    except Exception as e:
-                                        print(f"清理失敗: {e}")
-                                    
-                                except Exception as scroll_e:
-                                    print(f"   ⚠️ 滾動或截圖失敗: {scroll_e}")
+                                            break
+                                        crop_path = crop_slot_from_frame(frame_path, slot['rect'], group['scroll_y'], viewport,
+                                                                         CROP_MARGIN, suffix=f"{slot['width']}x{slot['height']}_{index}")
+                                        self._update_screenshot_count(crop_path, slot['image'], slot['ad_info'])
+                                        screenshot_paths.append(crop_path)
+                                    # 整組畫面只是裁切來源，不留在截圖資料夾
+                                    discard_frame(frame_path)
+                                else:
+                                    self._update_screenshot_count(frame_path, replaced_slots[0]['image'], replaced_slots[0]['ad_info'])
+                                    for slot in replaced_slots[1:]:
+                                        self._record_replacement(frame_path, slot['image'], slot['ad_info'])
+                                    screenshot_paths.append(frame_path)
                                 
-                                # 只替換第一個找到的廣告，然後處理下一個尺寸
-                                break
-                                
-                        except Exception as e:
-                            print(f"   ❌ 替換廣告失敗: {e}")
-                            continue
+                                # 檢查是否達到截圖數量限制
+                                if self.total_screenshots >= SCREENSHOT_COUNT:
+                                    print(f"🎯 已達到截圖數量限制 ({SCREENSHOT_COUNT})")
+                                    self.restore_replaced_ads()
+                                    return screenshot_paths
+                        except Exception as scroll_e:
+                            print(f"   ⚠️ 滾動或截圖失敗: {scroll_e}")
+                        
+                        # 截圖後復原整組廣告 - 採用 Yahoo 簡化清理策略
+                        self.restore_replaced_ads()
                     
-                    if not replaced:
-                        print(f"   ❌ 無法替換任何 {size_key} 廣告")
-                else:
-                    print(f"   ❌ 沒有 {size_key} 尺寸的圖片")
+                    candidates = retries
             
                 if total_replacements > 0:
                     print(f"\n✅ 成功替換 {total_replacements} 個廣告")
@@ -1482,6 +1511,11 @@ class UdnAdReplacer:
                     print("\n❌ 本網頁沒有找到任何可替換的 Google Ads")
                     return []
                 
+            except StageTimeout as e:
+                # 階段逾時的頁面不重試，避免同一個壞頁面再耗掉一輪時限
+                print(f"⏱️ 跳過此網站: {e}")
+                self.page_slot_sizes = None
+                return []
             except Exception as e:
                 print(f"第 {attempt + 1} 次嘗試失敗: {e}")
                 if attempt < max_retries - 1:
@@ -1490,8 +1524,77 @@ class UdnAdReplacer:
                     continue
                 else:
                     print(f"所有重試都失敗，跳過此網站: {url}")
+                    self.page_slot_sizes = None
                     return []
     
+    def discover_ad_frames(self):
+        """CDP 引擎：量測跨來源廣告 iframe 的素材尺寸，回傳 {size_key: frame}（每個尺寸取第一個）"""
+        if not self.frame_engine:
+            return {}
+        try:
+            frames = self.frame_engine.discover()
+            owners = resolve_elements(self.driver, [
+                {'backend_node_id': f['owner_backend_node_id']} for f in frames if f['owner_backend_node_id']
+            ])
+            frames_by_size = {}
+            for frame in frames:
+                frame['element'] = owners.get(frame['owner_backend_node_id'])
+                size_key = f"{frame['width']}x{frame['height']}"
+                if frame['element'] is not None and size_key not in frames_by_size:
+                    frames_by_size[size_key] = frame
+            print(f"🧬 找到 {len(frames)} 個跨來源廣告 iframe，尺寸: {list(frames_by_size.keys())}")
+            return frames_by_size
+        except Exception as e:
+            print(f"⚠️ 讀取跨來源 iframe 失敗，改用頁面層替換: {e}")
+            self.frame_engine.close()
+            return {}
+    
+    def replace_group(self, slots):
+        """替換同一組的廣告：頁面層位置批次替換，跨來源 iframe 在 iframe 內同時替換"""
+        dom_slots = [slot for slot in slots if not slot.get('frame')]
+        frame_slots = [slot for slot in slots if slot.get('frame')]
+        outcomes = dict(zip(map(id, dom_slots), self.replace_ad_contents(dom_slots)))
+        if frame_slots:
+            try:
+                button_style = self.get_button_style()
+                is_none_mode = getattr(self, 'button_style', 'dots') == "none"
+                outcomes.update(zip(map(id, frame_slots), self.frame_engine.replace_frames(frame_slots, button_style, is_none_mode)))
+            except Exception as e:
+                print(f"⚠️ iframe 內替換失敗: {e}")
+        return [outcomes.get(id(slot), False) for slot in slots]
+    
+    def restore_replaced_ads(self):
+        """截圖後復原頁面上所有替換過的廣告 - 採用 Yahoo 簡化清理策略"""
+        with self.watchdog.stage('restore'):
+            if self.frame_engine:
+                try:
+                    self.frame_engine.restore_frames()
+                except Exception as e:
+                    print(f"還原 iframe 失敗: {e}")
+            try:
+                self.driver.execute_script(RESTORE_REPLACED_ADS_SCRIPT)
+                # Yahoo 風格驗證：檢查全頁面是否還有注入元素
+                verification = self.driver.execute_script("""
+                    // 檢查整個頁面是否還有注入元素
+                    var replacedImages = document.querySelectorAll('img[src*="data:image"]');
+                    var addedButtons = document.querySelectorAll('#close_button, #abgb, [id^="close_button"], [id^="abgb"]');
+                    var dataAttributes = document.querySelectorAll('[data-original-src], [data-original-style], [data-original-background]');
+
+                    return {
+                        replacedImages: replacedImages.length,
+                        addedButtons: addedButtons.length,
+                        dataAttributes: dataAttributes.length
+                    };
+
+                """)
+            
+                if verification['replacedImages'] == 0 and verification['addedButtons'] == 0:
+                    print("✅ 已復原所有替換的廣告")
+                else:
+                    print(f"⚠️ 清理不完整: 替換圖片:{verification['replacedImages']}, 按鈕:{verification['addedButtons']}, 屬性:{verification['dataAttributes']}")
+            except Exception as e:
+                print(f"清理失敗: {e}")
+    
     def take_screenshot(self, page_title=None):
         if not os.path.exists(SCREENSHOT_FOLDER):
             os.makedirs(SCREENSHOT_FOLDER)
@@ -1651,9 +1754,16 @@ class UdnAdReplacer:
                 return None
     
     def close(self):
-        self.driver.quit()
+        if self.frame_engine:
+            self.frame_engine.close()
+        self.results.close()
+        if self.seen_urls:
+            self.seen_urls.close()
+        if self.slot_yield:
+            self.slot_yield.close()
+        self.browser.close()
 
-def main():
+def main(resume=False):
     # 偵測並選擇螢幕
     screen_id, selected_screen = ScreenManager.select_screen()
     
@@ -1663,14 +1773,35 @@ def main():
     
     print(f"\n正在啟動 Chrome 瀏覽器到螢幕 {screen_id}...")
     bot = UdnAdReplacer(headless=False, screen_id=screen_id)
+    # 瀏覽器卡住、當掉或用量過高時重啟，bot 的統計保持不變
+    supervisor = None
+    if BROWSER_SUPERVISOR:
+        supervisor = BrowserSupervisor(bot, headless=False, max_pages=BROWSER_MAX_PAGES,
+                                       max_memory_mb=BROWSER_MAX_MEMORY_MB,
+                                       command_timeout=BROWSER_COMMAND_TIMEOUT, page_timeout=BROWSER_PAGE_TIMEOUT)
+    
+    # 檢查點帳本：續跑時還原統計並只處理尚未完成的網址
+    ledger = None
+    resumed = False
+    if CHECKPOINT_LEDGER:
+        ledger = RunLedger(os.path.join(CHECKPOINT_DIR, f"udn_screen{bot.screen_id}_ledger.jsonl"), "udn", CHECKPOINT_FSYNC_EVERY)
+        resumed = ledger.open(resume, SCREENSHOT_COUNT, bot.results.run_id)
+        bot.ledger = ledger
+        if resumed:
+            ledger.restore(bot)
     
     try:
         # 使用聯合報旅遊網站的專用網址
         udn_url = "https://travel.udn.com"  # 簡化網址
         print(f"目標網站: {udn_url}")
         
-        # 尋找旅遊連結
-        news_urls = bot.get_random_news_urls(udn_url, NEWS_COUNT)
+        # 續跑時沿用上次的網址清單；沒有剩餘網址時重新尋找，並排除已完成的網址
+        news_urls = ledger.pending_urls() if resumed else []
+        if not news_urls:
+            news_urls = bot.get_random_news_urls(udn_url, NEWS_COUNT)
+            if ledger and news_urls:
+                news_urls = [u for u in news_urls if u not in ledger.finished_urls]
+                ledger.set_urls(ledger.finished_urls + news_urls)
         
         if not news_urls:
             print("無法獲取旅遊連結")
@@ -1679,7 +1810,7 @@ def main():
         print(f"獲取到 {len(news_urls)} 個旅遊連結")
         print(f"目標截圖數量: {SCREENSHOT_COUNT}")
         
-        total_screenshots = 0
+        total_screenshots = bot.total_screenshots  # 續跑時從已完成的截圖數接續
         
         # 處理每個網站
         consecutive_failures = 0
@@ -1690,29 +1821,55 @@ def main():
             print(f"處理第 {i}/{len(news_urls)} 個網站")
             print(f"{'='*50}")
             
+            if ledger:
+                ledger.begin_url(url)
+            bot.results.begin_page(url)
             try:
                 # 處理網站並嘗試替換廣告
-                screenshot_paths = bot.process_website(url)
+                if supervisor:
+                    screenshot_paths = supervisor.process(url)
+                else:
+                    screenshot_paths = bot.process_website(url)
+                status = 'ok' if screenshot_paths else 'empty'
+                if bot.slot_yield and bot.page_slot_sizes is not None:
+                    bot.slot_yield.record(url, bot.page_slot_sizes, len(screenshot_paths or []))
+                bot.results.finish_page(url, status, len(screenshot_paths or []))
+                if ledger:
+                    ledger.finish_url(url, len(screenshot_paths or []), status)
                 
                 if screenshot_paths:
                     print(f"✅ 成功處理網站！共產生 {len(screenshot_paths)} 張截圖")
                     total_screenshots += len(screenshot_paths)
+                    if bot.seen_urls:
+                        bot.seen_urls.mark(url)
                     consecutive_failures = 0  # 重置連續失敗計數
                     
                     # 檢查是否達到目標截圖數量
                     if total_screenshots >= SCREENSHOT_COUNT:
                         print(f"✅ 已達到目標截圖數量: {SCREENSHOT_COUNT}")
+                        bot.results.finish_run()
+                        if ledger:
+                            ledger.finish_run()
                         break
                 else:
                     print("❌ 網站處理完成，但沒有找到可替換的廣告")
                     consecutive_failures += 1
                 
+            except BrowserUnrecoverable as e:
+                print(f"🛑 {e}，停止執行")
+                bot.results.finish_page(url, 'failed')
+                if ledger:
+                    ledger.finish_url(url, 0, 'failed')
+                break
             except Exception as e:
                 print(f"❌ 處理網站失敗: {e}")
+                bot.results.finish_page(url, 'failed')
+                if ledger:
+                    ledger.finish_url(url, 0, 'failed')
                 consecutive_failures += 1
                 
-                # 如果連續失敗太多次，增加等待時間
-                if consecutive_failures >= max_consecutive_failures:
+                # 如果連續失敗太多次，增加等待時間（有監控時瀏覽器已重啟，不需要等待）
+                if consecutive_failures >= max_consecutive_failures and not supervisor:
                     print(f"⚠️ 連續失敗 {consecutive_failures} 次，延長等待時間...")
                     time.sleep(30)  # 等待30秒
                     consecutive_failures = 0  # 重置計數
@@ -1728,19 +1885,8 @@ def main():
         # 顯示 ETtoday 風格的詳細統計報告
         print(f"\n📊 UDN 廣告替換統計報告 - GIF 升級版")
         print("="*60)
-        print(f"📸 總截圖數量: {bot.total_screenshots} 張")
-        print(f"🔄 總替換次數: {bot.total_replacements} 次")
-        if bot.gif_replacements > 0 or bot.static_replacements > 0:
-            gif_percentage = (bot.gif_replacements / bot.total_replacements * 100) if bot.total_replacements > 0 else 0
-            static_percentage = (bot.static_replacements / bot.total_replacements * 100) if bot.total_replacements > 0 else 0
-            print(f"   🎬 GIF 替換: {bot.gif_replacements} 次 ({gif_percentage:.1f}%)")
-            print(f"   🖼️ 靜態圖片替換: {bot.static_replacements} 次 ({static_percentage:.1f}%)")
-        
-        if bot.replacement_details:
-            print(f"\n📋 詳細替換記錄:")
-            for i, detail in enumerate(bot.replacement_details, 1):
-                type_icon = "🎬" if detail['type'] == "GIF" else "🖼️"
-                print(f"    {i}. {type_icon} {detail['filename']} ({detail['size']}) → 📸 {detail['screenshot']}")
+        # 統計由結果資料庫彙總
+        bot.results.print_report()
         
         # 顯示當前 GIF 策略
         try:
@@ -1751,9 +1897,16 @@ def main():
         except:
             pass
         
+        if supervisor:
+            supervisor.print_summary()
+        bot.watchdog.print_summary()
+        if bot.slot_yield:
+            bot.slot_yield.print_summary()
         print("="*60)
         
     finally:
+        if ledger:
+            ledger.close()
         bot.close()
 
 def test_screen_setup():
@@ -1806,4 +1959,5 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "test":
         test_screen_setup()
     else:
-        main() 
\ No newline at end of file
+        # --resume：從檢查點帳本續跑上一次中斷的執行
+        main(resume='--resume' in sys.argv[1:])
\ No newline at end of file
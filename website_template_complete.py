@@ -12,10 +12,14 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from dom_snapshot_scanner import capture_snapshot, scan_for_ads
+from batched_replace import replace_slots_batched
+from overlay_guard import DEFAULT_OVERLAY_RULES, install_overlay_guard, overlay_guard_active
+from stage_watchdog import StageTimeout, StageWatchdog
+from browser_backend import open_browser
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -48,6 +52,97 @@ except ImportError:
     HEADLESS_MODE = False
     FULLSCREEN_MODE = True
     SCREENSHOT_FOLDER = "screenshots"
+    # 廣告位置掃描預設設定
+    USE_DOM_SNAPSHOT_SCAN = True
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
+    # 階段時限預設設定
+    STAGE_WATCHDOG = True
+    STAGE_BUDGETS = None
+    STAGE_ABORT_GRACE = 5
+
+# 網站遮罩規則 - TODO: 依目標網站補上插頁/同意視窗的選擇器
+OVERLAY_RULES = {
+    "hide": DEFAULT_OVERLAY_RULES["hide"] + [],
+    "candidates": DEFAULT_OVERLAY_RULES["candidates"],
+}
+
+# Google 廣告標準樣式（替換時注入為 #google_ad_styles）
+GOOGLE_AD_STYLES_CSS = """
+div {
+    margin: 0;
+    padding: 0;
+}
+.abgb {
+    position: absolute;
+    right: 16px;
+    top: 0px;
+}
+.abgb {
+    display: inline-block;
+    height: 15px;
+}
+.abgc {
+    cursor: pointer;
+}
+.abgc {
+    display: block;
+    height: 15px;
+    position: absolute;
+    right: 1px;
+    top: 1px;
+    text-rendering: geometricPrecision;
+    z-index: 2147483646;
+}
+.abgc .il-wrap {
+    background-color: #ffffff;
+    height: 15px;
+    white-space: nowrap;
+}
+.abgc .il-icon {
+    height: 15px;
+    width: 15px;
+}
+.abgc .il-icon svg {
+    fill: #00aecd;
+}
+.abgs svg, .abgb svg {
+    display: inline-block;
+    height: 15px;
+    width: 15px;
+    vertical-align: top;
+}
+#close_button { 
+    text-decoration: none; 
+    margin: 0; 
+    padding: 0; 
+    border: none;
+    cursor: pointer;
+    position: absolute; 
+    z-index: 100; 
+    top: 0px;
+    bottom: auto;
+    vertical-align: top;
+    margin-top: 1px;
+    right: 0px;
+    left: auto;
+    text-align: right;
+    margin-right: 1px;
+    display: block; 
+    width: 15px; 
+    height: 15px;
+}
+#close_button #close_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+#abgb #info_button_svg { 
+    width: 15px; 
+    height: 15px; 
+    line-height: 0;
+}
+"""
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -336,10 +431,21 @@ class WebsiteAdReplacer:
             if not headless:
                 chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
+        
+        # 在文件開始時攔截插頁/遮罩廣告，載入後就不需要再掃描
+        self.overlay_guard_installed = install_overlay_guard(self.driver, OVERLAY_RULES)
+        
+        # 各階段時限：卡住的頁面中止後跳過，不拖住整個批次
+        previous_watchdog = getattr(self, 'watchdog', None)
+        self.watchdog = StageWatchdog(self.driver, STAGE_BUDGETS, STAGE_ABORT_GRACE, enabled=STAGE_WATCHDOG)
+        self.watchdog.carry_over(previous_watchdog)
         
         # 確保瀏覽器在正確的螢幕上
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -515,7 +621,16 @@ class WebsiteAdReplacer:
         """調試方法：顯示頁面上所有可能的廣告元素"""
         print("\n=== 調試：頁面廣告元素分析 ===")
         
+        # 常見廣告尺寸的全頁比對改由 DOMSnapshot 在 Python 端完成，不在頁面內走訪所有元素
+        snapshot = None
+        if USE_DOM_SNAPSHOT_SCAN:
+            try:
+                snapshot = capture_snapshot(self.driver)
+            except Exception as e:
+                print(f"DOMSnapshot 擷取失敗，改用頁面腳本: {e}")
+        
         ad_info = self.driver.execute_script("""
+            var includeAllSizes = arguments[0];
             var adInfo = {
                 adsbygoogle: [],
                 iframes: [],
@@ -581,29 +696,44 @@ class WebsiteAdReplacer:
                 {w: 300, h: 600}, {w: 970, h: 250}
             ];
             
-            var allElements = document.querySelectorAll('*');
-            for (var i = 0; i < allElements.length; i++) {
-                var element = allElements[i];
-                var rect = element.getBoundingClientRect();
-                var width = Math.round(rect.width);
-                var height = Math.round(rect.height);
+            if (includeAllSizes) {
+                var allElements = document.querySelectorAll('*');
+                for (var i = 0; i < allElements.length; i++) {
+                    var element = allElements[i];
+                    var rect = element.getBoundingClientRect();
+                    var width = Math.round(rect.width);
+                    var height = Math.round(rect.height);
                 
-                for (var j = 0; j < commonAdSizes.length; j++) {
-                    var adSize = commonAdSizes[j];
-                    if (Math.abs(width - adSize.w) <= 5 && Math.abs(height - adSize.h) <= 5) {
-                        adInfo.all_sizes.push({
-                            width: width,
-                            height: height,
-                            tagName: element.tagName,
-                            className: element.className || '',
-                            id: element.id || ''
-                        });
+                    for (var j = 0; j < commonAdSizes.length; j++) {
+                        var adSize = commonAdSizes[j];
+                        if (Math.abs(width - adSize.w) <= 5 && Math.abs(height - adSize.h) <= 5) {
+                            adInfo.all_sizes.push({
+                                width: width,
+                                height: height,
+                                tagName: element.tagName,
+                                className: element.className || '',
+                                id: element.id || ''
+                            });
+                        }
                     }
                 }
             }
             
             return adInfo;
-        """)
+        """, snapshot is None)
+        
+        if snapshot is not None:
+            common_ad_sizes = [(970, 90), (728, 90), (300, 250), (336, 280), (320, 50), (160, 600), (300, 600), (970, 250)]
+            for box in snapshot.boxes:
+                for width, height in common_ad_sizes:
+                    if abs(box['width'] - width) <= 5 and abs(box['height'] - height) <= 5:
+                        ad_info['all_sizes'].append({
+                            'width': box['width'],
+                            'height': box['height'],
+                            'tagName': box['tag'].upper(),
+                            'className': box['class'],
+                            'id': box['id']
+                        })
         
         print(f"AdsByGoogle 元素: {len(ad_info['adsbygoogle'])} 個")
         for ad in ad_info['adsbygoogle']:
@@ -696,7 +826,9 @@ class WebsiteAdReplacer:
             return []
     
     def remove_fullscreen_ads(self):
-        """移除佔據整個畫面的廣告"""
+        """移除佔據整個畫面的廣告（僅在文件開始攔截無法安裝時使用）"""
+        if getattr(self, 'overlay_guard_installed', False) and overlay_guard_active(self.driver):
+            return
         try:
             print("檢查並移除全螢幕廣告...")
             
@@ -781,6 +913,13 @@ class WebsiteAdReplacer:
         """掃描整個網頁尋找符合尺寸的廣告元素"""
         print(f"開始掃描整個網頁尋找 {target_width}x{target_height} 的廣告...")
         
+        # 優先使用 DOMSnapshot：一次 CDP 呼叫取得所有版面方塊，在 Python 端比對
+        if USE_DOM_SNAPSHOT_SCAN:
+            try:
+                return scan_for_ads(self.driver, target_width, target_height, tolerance=0)
+            except Exception as e:
+                print(f"DOMSnapshot 掃描失敗，改用頁面腳本掃描: {e}")
+        
         # 獲取所有可見的元素
         all_elements = self.driver.execute_script("""
             function getAllVisibleElements() {
@@ -941,330 +1080,48 @@ class WebsiteAdReplacer:
         return button_styles.get(button_style, button_styles["dots"])
 
     def replace_ad_content(self, element, image_data, target_width, target_height):
+        """替換單一廣告位置"""
+        return self.replace_ad_contents([{
+            'element': element,
+            'image_data': image_data,
+            'width': target_width,
+            'height': target_height
+        }])[0]
+    
+    def replace_ad_contents(self, slots):
+        """分階段批次替換多個廣告位置：先量測所有位置，再於同一個 animation frame 內寫入"""
+        if not slots:
+            return []
         try:
-            # 獲取原始尺寸
-            original_info = self.driver.execute_script("""
-                var element = arguments[0];
-                if (!element || !element.getBoundingClientRect) return null;
-                var rect = element.getBoundingClientRect();
-                return {width: rect.width, height: rect.height};
-            """, element)
-            
-            if not original_info:
-                return False
-            
-            # 檢查是否符合目標尺寸（精確匹配，與 ad_replacer.py 一致）
-            if (original_info['width'] != target_width or 
-                original_info['height'] != target_height):
-                return False
-            
             # 獲取按鈕樣式
             button_style = self.get_button_style()
-            close_button_html = button_style["close_button"]["html"]
-            close_button_style = button_style["close_button"]["style"]
-            info_button_html = button_style["info_button"]["html"]
-            info_button_style = button_style["info_button"]["style"]
             
-            # 只替換圖片，保留廣告按鈕
-            success = self.driver.execute_script("""
-                // 添加 Google 廣告標準樣式
-                if (!document.getElementById('google_ad_styles')) {
-                    var style = document.createElement('style');
-                    style.id = 'google_ad_styles';
-                    style.textContent = `
-                        div {
-                            margin: 0;
-                            padding: 0;
-                        }
-                        .abgb {
-                            position: absolute;
-                            right: 16px;
-                            top: 0px;
-                        }
-                        .abgb {
-                            display: inline-block;
-                            height: 15px;
-                        }
-                        .abgc {
-                            cursor: pointer;
-                        }
-                        .abgc {
-                            display: block;
-                            height: 15px;
-                            position: absolute;
-                            right: 1px;
-                            top: 1px;
-                            text-rendering: geometricPrecision;
-                            z-index: 2147483646;
-                        }
-                        .abgc .il-wrap {
-                            background-color: #ffffff;
-                            height: 15px;
-                            white-space: nowrap;
-                        }
-                        .abgc .il-icon {
-                            height: 15px;
-                            width: 15px;
-                        }
-                        .abgc .il-icon svg {
-                            fill: #00aecd;
-                        }
-                        .abgs svg, .abgb svg {
-                            display: inline-block;
-                            height: 15px;
-                            width: 15px;
-                            vertical-align: top;
-                        }
-                        #close_button { 
-                            text-decoration: none; 
-                            margin: 0; 
-                            padding: 0; 
-                            border: none;
-                            cursor: pointer;
-                            position: absolute; 
-                            z-index: 100; 
-                            top: 0px;
-                            bottom: auto;
-                            vertical-align: top;
-                            margin-top: 1px;
-                            right: 0px;
-                            left: auto;
-                            text-align: right;
-                            margin-right: 1px;
-                            display: block; 
-                            width: 15px; 
-                            height: 15px;
-                        }
-                        #close_button #close_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                        #abgb #info_button_svg { 
-                            width: 15px; 
-                            height: 15px; 
-                            line-height: 0;
-                        }
-                    `;
-                    document.head.appendChild(style);
-                }
-                
-                var container = arguments[0];
-                var imageBase64 = arguments[1];
-                var targetWidth = arguments[2];
-                var targetHeight = arguments[3];
-                var closeButtonHtml = arguments[4];
-                var closeButtonStyle = arguments[5];
-                var infoButtonHtml = arguments[6];
-                var infoButtonStyle = arguments[7];
-                
-                if (!container) return false;
-                
-                // 確保 container 是 relative
-                if (window.getComputedStyle(container).position === 'static') {
-                  container.style.position = 'relative';
-                }
-                // 先移除舊的（避免重複）
-                ['close_button', 'abgb'].forEach(function(id){
-                  var old = container.querySelector('#'+id);
-                  if(old) old.remove();
-                });
-                
-                var replacedCount = 0;
-                var newImageSrc = 'data:image/png;base64,' + imageBase64;
-                
-                // 方法1: 只替換img標籤的src，不移除元素
-                var imgs = container.querySelectorAll('img');
-                for (var i = 0; i < imgs.length; i++) {
-                    var img = imgs[i];
-                    // 排除Google廣告控制按鈕
-                    var imgRect = img.getBoundingClientRect();
-                    var isControlButton = imgRect.width < 50 || imgRect.height < 50 || 
-                                         img.className.includes('abg') || 
-                                         img.id.includes('abg') ||
-                                         img.src.includes('googleads') ||
-                                         img.src.includes('googlesyndication') ||
-                                         img.src.includes('adchoices') ||
-                                         img.src.includes('zh_tw.png') ||
-                                         img.closest('#abgcp') ||
-                                         img.closest('.abgcp') ||
-                                         img.closest('#abgc') ||
-                                         img.closest('.abgc') ||
-                                         img.closest('#abgb') ||
-                                         img.closest('.abgb') ||
-                                         img.closest('#abgs') ||
-                                         img.closest('.abgs') ||
-                                         img.closest('#cbb') ||
-                                         img.closest('.cbb') ||
-                                         img.closest('label.cbb') ||
-                                         img.closest('[data-vars-label*="feedback"]') ||
-                                         img.alt.includes('關閉') ||
-                                         img.alt.includes('close');
-                    
-                    if (!isControlButton && img.src && !img.src.startsWith('data:')) {
-                        // 保存原始src以便復原
-                        if (!img.getAttribute('data-original-src')) {
-                            img.setAttribute('data-original-src', img.src);
-                        }
-                        // 替換圖片，保持原始尺寸和佈局
-                        img.src = newImageSrc;
-                        img.style.objectFit = 'contain';
-                        img.style.width = '100%';
-                        img.style.height = 'auto';
-                        img.style.maxWidth = 'none';
-                        img.style.maxHeight = 'none';
-                        img.style.minWidth = 'auto';
-                        img.style.minHeight = 'auto';
-                        img.style.display = 'block';
-                        img.style.margin = '0';
-                        img.style.padding = '0';
-                        img.style.border = 'none';
-                        img.style.outline = 'none';
-                        replacedCount++;
-                    
-                        // 確保img的父層是relative
-                        var imgParent = img.parentElement || container;
-                        if (window.getComputedStyle(imgParent).position === 'static') {
-                            imgParent.style.position = 'relative';
-                        }
-                        
-                        // 先移除舊的按鈕
-                        ['close_button', 'abgb'].forEach(function(id){
-                            var old = imgParent.querySelector('#'+id);
-                            if(old) old.remove();
-                        });
-                        
-                        // 只有在非 none 模式下才創建按鈕
-                        if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                            // 叉叉 - 貼著替換圖片的右上角
-                            var closeButton = document.createElement('div');
-                            closeButton.id = 'close_button';
-                            closeButton.innerHTML = closeButtonHtml;
-                            closeButton.style.cssText = closeButtonStyle;
-                            
-                            // 驚嘆號 - 貼著替換圖片的右上角，與叉叉對齊
-                            var abgb = document.createElement('div');
-                            abgb.id = 'abgb';
-                            abgb.className = 'abgb';
-                            abgb.innerHTML = infoButtonHtml;
-                            abgb.style.cssText = infoButtonStyle;
-                            
-                            // 將按鈕添加到img的父層（驚嘆號在左，叉叉在右）
-                            imgParent.appendChild(abgb);
-                            imgParent.appendChild(closeButton);
-                        }
-                    }
-                }
-                
-                // 方法2: 處理iframe
-                var iframes = container.querySelectorAll('iframe');
-                for (var i = 0; i < iframes.length; i++) {
-                    var iframe = iframes[i];
-                    var iframeRect = iframe.getBoundingClientRect();
-                    
-                    // 隱藏iframe
-                    iframe.style.visibility = 'hidden';
-                    
-                    // 確保容器是relative
-                    if (window.getComputedStyle(container).position === 'static') {
-                        container.style.position = 'relative';
-                    }
-                    
-                    // 在iframe位置創建新的圖片元素
-                    var newImg = document.createElement('img');
-                    newImg.src = newImageSrc;
-                    newImg.style.position = 'absolute';
-                    newImg.style.top = (iframeRect.top - container.getBoundingClientRect().top) + 'px';
-                    newImg.style.left = (iframeRect.left - container.getBoundingClientRect().left) + 'px';
-                    newImg.style.width = Math.round(iframeRect.width) + 'px';
-                    newImg.style.height = Math.round(iframeRect.height) + 'px';
-                    newImg.style.objectFit = 'contain';
-                    newImg.style.zIndex = '1';
-                    
-                    container.appendChild(newImg);
-                    
-                    // 先移除舊的按鈕
-                    ['close_button', 'abgb'].forEach(function(id){
-                        var old = container.querySelector('#'+id);
-                        if(old) old.remove();
-                    });
-                    
-                    // 只有在非 none 模式下才創建按鈕
-                    if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                        // 叉叉 - 貼著替換圖片的右上角
-                        var closeButton = document.createElement('div');
-                        closeButton.id = 'close_button';
-                        closeButton.innerHTML = closeButtonHtml;
-                        closeButton.style.cssText = 'position:absolute;top:' + (iframeRect.top - container.getBoundingClientRect().top) + 'px;right:' + (container.getBoundingClientRect().right - iframeRect.right) + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);';
-                        
-                        // 驚嘆號 - 貼著替換圖片的右上角，與叉叉水平對齊
-                        var abgb = document.createElement('div');
-                        abgb.id = 'abgb';
-                        abgb.className = 'abgb';
-                        abgb.innerHTML = infoButtonHtml;
-                        abgb.style.cssText = 'position:absolute;top:' + (iframeRect.top - container.getBoundingClientRect().top + 1) + 'px;right:' + (container.getBoundingClientRect().right - iframeRect.right + 17) + 'px;width:15px;height:15px;z-index:100;display:block;background-color:rgba(255,255,255,1);line-height:0;';
-                        
-                        // 將按鈕添加到container內，與圖片同層
-                        container.appendChild(abgb);
-                        container.appendChild(closeButton);
-                    }
-                    replacedCount++;
-                }
-                
-                // 方法3: 處理背景圖片
-                if (replacedCount === 0) {
-                    var style = window.getComputedStyle(container);
-                    if (style.backgroundImage && style.backgroundImage !== 'none') {
-                        container.style.backgroundImage = 'url(' + newImageSrc + ')';
-                        container.style.backgroundSize = 'contain';
-                        container.style.backgroundRepeat = 'no-repeat';
-                        container.style.backgroundPosition = 'center';
-                        replacedCount = 1;
-                        
-                        // 確保容器是relative
-                        if (window.getComputedStyle(container).position === 'static') {
-                            container.style.position = 'relative';
-                        }
-                        
-                        // 先移除舊的按鈕
-                        ['close_button', 'abgb'].forEach(function(id){
-                            var old = container.querySelector('#'+id);
-                            if(old) old.remove();
-                        });
-                        
-                        // 只有在非 none 模式下才創建按鈕
-                        if (!isNoneMode && closeButtonHtml && infoButtonHtml) {
-                            // 添加兩個按鈕 - 貼著替換圖片的右上角，水平對齊
-                            var closeButton = document.createElement('div');
-                            closeButton.id = 'close_button';
-                            closeButton.innerHTML = closeButtonHtml;
-                            closeButton.style.cssText = closeButtonStyle;
-                            
-                            var abgb = document.createElement('div');
-                            abgb.id = 'abgb';
-                            abgb.className = 'abgb';
-                            abgb.innerHTML = infoButtonHtml;
-                            abgb.style.cssText = infoButtonStyle;
-                            
-                            // 將按鈕添加到container內，與背景圖片同層
-                            container.appendChild(abgb);
-                            container.appendChild(closeButton);
-                        }
-                    }
-                }
-                return replacedCount > 0;
-            """, element, image_data, target_width, target_height, close_button_html, close_button_style, info_button_html, info_button_style, is_none_mode)
+            # 檢查是否為 "none" 模式
+            current_button_style = getattr(self, 'button_style', 'dots')
+            is_none_mode = current_button_style == "none"
             
-            if success:
-                print(f"替換廣告 {original_info['width']}x{original_info['height']}")
-                return True
-            else:
-                print(f"廣告替換失敗 {original_info['width']}x{original_info['height']}")
-                return False
+            options = {
+                'sizeTolerance': 0,                # 精確匹配，與 ad_replacer.py 一致
+                'saveOriginalStyle': False,
+                'saveOriginalBackground': False,
+                'adStylesCss': GOOGLE_AD_STYLES_CSS
+            }
+            results = replace_slots_batched(self.driver, slots, button_style, is_none_mode, options)
+            
+            outcomes = []
+            for slot, result in zip(slots, results):
+                if result['ok']:
+                    print(f"替換廣告 {result['width']}x{result['height']}")
+                elif result.get('reason') == 'size':
+                    pass  # 尺寸不符合，直接略過
+                else:
+                    print(f"廣告替換失敗 {result['width']}x{result['height']}")
+                outcomes.append(bool(result['ok']))
+            return outcomes
                 
         except Exception as e:
             print(f"替換廣告失敗: {e}")
-            return False
+            return [False] * len(slots)
     
     def process_website(self, url):
         """處理單個網站，遍歷所有替換圖片"""
@@ -1273,7 +1130,8 @@ class WebsiteAdReplacer:
             
             # 載入網頁
             self.driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
-            self.driver.get(url)
+            with self.watchdog.stage('navigate', url):
+                self.driver.get(url)
             
             # 等待頁面基本載入
             time.sleep(WAIT_TIME)
@@ -1300,8 +1158,9 @@ class WebsiteAdReplacer:
             self.driver.execute_script("window.scrollTo(0, 0);")
             time.sleep(2)
             
-            # 可選：顯示頁面廣告元素調試資訊
-            # self.debug_page_ads()
+            # 可選：顯示頁面廣告元素調試資訊（逐一走訪所有元素，需在時限內完成）
+            # with self.watchdog.stage('scan'):
+            #     self.debug_page_ads()
             
             # 遍歷所有替換圖片
             total_replacements = 0
@@ -1318,7 +1177,8 @@ class WebsiteAdReplacer:
                     continue
                 
                 # 掃描網頁尋找符合尺寸的廣告
-                matching_elements = self.scan_entire_page_for_ads(image_info['width'], image_info['height'])
+                with self.watchdog.stage('scan'):
+                    matching_elements = self.scan_entire_page_for_ads(image_info['width'], image_info['height'])
                 
                 if not matching_elements:
                     print(f"未找到符合 {image_info['width']}x{image_info['height']} 尺寸的廣告位置")
@@ -1335,7 +1195,9 @@ class WebsiteAdReplacer:
                         continue
                         
                     try:
-                        if self.replace_ad_content(ad_info['element'], image_data, image_info['width'], image_info['height']):
+                        with self.watchdog.stage('replace'):
+                            replaced_here = self.replace_ad_content(ad_info['element'], image_data, image_info['width'], image_info['height'])
+                        if replaced_here:
                             print(f"成功替換廣告: {ad_info['width']}x{ad_info['height']} at {ad_info['position']}")
                             replaced = True
                             total_replacements += 1
@@ -1372,7 +1234,8 @@ class WebsiteAdReplacer:
                             # 每次替換後立即截圖
                             print("準備截圖...")
                             time.sleep(2)  # 等待頁面穩定
-                            screenshot_path = self.take_screenshot()
+                            with self.watchdog.stage('capture'):
+                                screenshot_path = self.take_screenshot()
                             if screenshot_path:
                                 screenshot_paths.append(screenshot_path)
                                 print(f"✅ 截圖保存: {screenshot_path}")
@@ -1404,6 +1267,8 @@ class WebsiteAdReplacer:
                             
                             # 繼續尋找下一個廣告位置，不要break
                             continue
+                    except StageTimeout:
+                        raise
                     except Exception as e:
                         print(f"替換廣告失敗: {e}")
                         continue
@@ -1424,6 +1289,10 @@ class WebsiteAdReplacer:
                 print("本網頁沒有找到任何可替換的廣告")
                 return []
                 
+        except StageTimeout as e:
+            # 階段逾時的頁面直接跳過，避免同一個壞頁面再耗掉一輪時限
+            print(f"⏱️ 跳過此網站: {e}")
+            return []
         except Exception as e:
             print(f"處理網站失敗: {e}")
             return []
@@ -1615,7 +1484,7 @@ class WebsiteAdReplacer:
                 return None
     
     def close(self):
-        self.driver.quit()
+        self.browser.close()
 
 def main():
     # 偵測並選擇螢幕
@@ -1700,6 +1569,7 @@ def main():
         print(f"\n{'='*50}")
         print(f"所有網站處理完成！總共產生 {total_screenshots} 張截圖")
         print(f"{'='*50}")
+        bot.watchdog.print_summary()
         
     finally:
         bot.close()
@@ -26,10 +26,18 @@ import random
 import re
 import platform
 import subprocess
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from datetime import datetime
+from size_matcher import match_sizes, matches_by_size
+from scan_cache import PageScanCache
+from slot_handles import TAG_SLOT_JS, RESOLVE_SLOT_JS, scroll_slot_into_view
+from slot_index import DEFAULT_SLOT_SELECTORS, SlotIndex
+from gpt_slots import find_declared_ad_slots
+from early_commit import install_slots_ready_signal, navigate_early
+from resource_blocking import ResourceBlocker, enable_network_log
+from browser_backend import open_browser
+from results_store import ResultsStore
 
 # 載入 GIF 功能專用設定檔
 try:
@@ -74,6 +82,17 @@ except ImportError:
     BUTTON_STYLE = "dots"  # 預設按鈕樣式
     # GIF 使用策略預設設定
     GIF_PRIORITY = True
+    # 頁面載入策略預設設定
+    PAGE_LOAD_STRATEGY = "normal"
+    EARLY_COMMIT_TIMEOUT = 15
+    STOP_LOADING_WHEN_READY = True
+    # 資源封鎖預設設定
+    RESOURCE_BLOCKING = True
+    RESOURCE_BLOCKING_DRY_RUN = False
+    # 瀏覽器後端預設設定
+    BROWSER_BACKEND = "local"
+    # 結果資料庫預設設定
+    RESULTS_DB = "results.db"
 
 class ScreenManager:
     """螢幕管理器，用於偵測和管理多螢幕"""
@@ -275,6 +294,26 @@ class ScreenManager:
     
 
 
+# 即時索引追蹤的 Yahoo 廣告容器：全面掃描選擇器中屬於廣告本身的部分
+# （w-full、shrink-0、class*="ad" 等版面通用選擇器會讓索引追蹤大量非廣告元素，不列入）
+YAHOO_SLOT_SELECTORS = DEFAULT_SLOT_SELECTORS + [
+    'div[class*="GoogleActiveView"]',
+    'div[data-google-av-cxn]',
+    'div[data-google-av-metadata]',
+    'div[data-google-av-adk]',
+    'div[data-google-av-aid]',
+    'a[href*="criteo.com"]',
+    'div[id*="sda-"]',
+    'div[id*="tw_ynews_ros_dt_top_center"]',
+    'div[id*="google_ads"]',
+    'div[class*="google-ads"]',
+    'div[data-creative-load-listener]',
+    'div[data-bsc]',
+    'div[data-imgsrc]',
+    'div[onclick*="clickTag"]',
+]
+
+
 class YahooAdReplacer:
     def __init__(self, headless=False, screen_id=1):
         print("正在初始化 Yahoo 廣告替換器 - GIF 升級版...")
@@ -285,9 +324,10 @@ class YahooAdReplacer:
         self.total_replacements = 0     # 總替換次數
         self.gif_replacements = 0       # GIF 替換次數
         self.static_replacements = 0    # 靜態圖片替換次數
-        self.replacement_details = []   # 詳細替換記錄
+        self.results = ResultsStore(RESULTS_DB, 'yahoo', SCREENSHOT_COUNT)  # 詳細替換記錄（SQLite）
         
         self.setup_driver(headless)
+        self.scan_cache = PageScanCache(self.driver, lambda: self._add_declared_slots(self.find_all_yahoo_ads(), False))
         self.load_replace_images()
         print("Yahoo 廣告替換器 - GIF 升級版")
         
@@ -337,15 +377,40 @@ class YahooAdReplacer:
         if not headless:
             chrome_options.add_argument('--start-fullscreen')
         
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # 'eager'/'none'：driver.get() 不等 load 事件，改以廣告位置就緒訊號開始掃描
+        chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+        
+        if RESOURCE_BLOCKING:
+            enable_network_log(chrome_options)
+        
+        # 依 BROWSER_BACKEND 取得本機、常駐或遠端 (Grid) 瀏覽器，無法使用時啟動本機瀏覽器
+        self.browser = open_browser(chrome_options, self.screen_id, BROWSER_BACKEND)
+        self.driver = self.browser.driver
         
         # 設置超時時間 - 解決網路連線問題
         self.driver.set_page_load_timeout(30)  # 頁面載入超時30秒
         self.driver.implicitly_wait(10)        # 隱式等待10秒
         print("瀏覽器超時設定完成")
         
+        # 封鎖字型以外不影響廣告截圖的資源（信標、社群外掛、第三方影片）
+        self.resource_blocker = None
+        if RESOURCE_BLOCKING:
+            self.resource_blocker = ResourceBlocker(self.driver, 'yahoo', RESOURCE_BLOCKING_DRY_RUN)
+            self.resource_blocker.apply()
+        
+        self.early_commit = PAGE_LOAD_STRATEGY != "normal"
+        if self.early_commit:
+            self.ready_signal_installed = install_slots_ready_signal(self.driver)
+        
+        # 文件開始時即追蹤延遲插入/刷新的廣告位置
+        self.slot_index = SlotIndex(self.driver, YAHOO_SLOT_SELECTORS)
+        self.slot_index.install()
+        self._index_ads = None
+        self._index_ads_doc = None
+        
         # 確保瀏覽器在正確的螢幕上並全螢幕
-        if not headless:
+        # 常駐或遠端瀏覽器的視窗不由 replacer 調整
+        if not headless and not self.browser.attached:
             self.move_to_screen()
     
     def move_to_screen(self):
@@ -518,13 +583,12 @@ class YahooAdReplacer:
             self.static_replacements += 1
         
         # 記錄詳細替換資訊
-        if current_image_info:
-            self.replacement_details.append({
-                'filename': current_image_info['filename'],
-                'size': f"{current_image_info['width']}x{current_image_info['height']}",
-                'type': current_image_info['type'],
-                'screenshot': filepath
-            })
+        self.results.record_replacement(
+            f"{current_image_info['width']}x{current_image_info['height']}" if current_image_info else None,
+            (original_ad_info or {}).get('position'),
+            current_image_info['filename'] if current_image_info else None,
+            current_image_info and current_image_info.get('is_gif'),
+            filepath)
         
         print(f"📊 總截圖數: {self.total_screenshots}")
         if self.gif_replacements > 0:
@@ -701,8 +765,8 @@ class YahooAdReplacer:
         """全面掃描Yahoo網站的所有廣告 - 使用完整17個選擇器"""
         print("🔍 全面掃描Yahoo網站所有廣告 (使用完整選擇器)...")
         
-        # 一次性獲取所有廣告元素和尺寸
-        all_ads_data = self.driver.execute_script("""
+        # 一次性獲取所有廣告元素和尺寸（回傳 handle 而非 WebElement）
+        all_ads_data = self.driver.execute_script(TAG_SLOT_JS + """
             // 在瀏覽器中完成所有廣告掃描工作
             var allAds = [];
             
@@ -795,9 +859,11 @@ class YahooAdReplacer:
                             
                             var width = Math.round(rect.width);
                             var height = Math.round(rect.height);
+                            var computedStyle = window.getComputedStyle(element);
                             
                             allAds.push({
-                                element: element,
+                                handle: tagSlot(element),
+                                visible: computedStyle.display !== 'none' && computedStyle.visibility !== 'hidden',
                                 width: width,
                                 height: height,
                                 top: rect.top,
@@ -834,10 +900,13 @@ class YahooAdReplacer:
                 ads_by_size[size_key] = []
             
             ads_by_size[size_key].append({
-                'element': ad_data['element'],
+                'handle': ad_data['handle'],
+                'visible': ad_data['visible'],
                 'width': ad_data['width'],
                 'height': ad_data['height'],
                 'position': f"top:{ad_data['top']:.0f}, left:{ad_data['left']:.0f}",
+                'top': ad_data['top'],
+                'left': ad_data['left'],
                 'selector': ad_data['selector'],
                 'tagName': ad_data['tagName'],
                 'id': ad_data['id'],
@@ -859,39 +928,109 @@ class YahooAdReplacer:
         
         return ads_by_size
 
+    def get_page_ads(self):
+        """目前頁面依尺寸分組的廣告
+
+        以即時索引的版本差異更新（沒有變動時沿用同一份結果）；索引無法使用時
+        才改用全面掃描，且每個頁面只完整掃描一次，廣告區域變動時才重新掃描。
+        """
+        try:
+            changed = self.slot_index.sync()
+        except Exception as e:
+            print(f"⚠️ 廣告位置索引無法使用，改用全面掃描: {e}")
+            return self.scan_cache.get()
+        if changed or self._index_ads is None or self._index_ads_doc != self.slot_index.doc_id:
+            self._index_ads = self._add_declared_slots(self._ads_from_slot_index(), True)
+            self._index_ads_doc = self.slot_index.doc_id
+            total = sum(len(ads) for ads in self._index_ads.values())
+            print(f"📇 廣告位置索引 (版本 {self.slot_index.version}): {total} 個廣告, "
+                  f"{len(self._index_ads)} 種尺寸")
+        return self._index_ads
+
+    def _add_declared_slots(self, ads_by_size, page_coordinates):
+        """補上 googletag / AdSense 宣告、但選擇器沒有涵蓋的廣告位置（同一元素或同一位置不重複）
+
+        page_coordinates：ads_by_size 的 top/left 是文件座標（即時索引）或視窗座標（全面掃描）。
+        """
+        try:
+            has_tags, declared_slots = find_declared_ad_slots(self.driver)
+        except Exception as e:
+            print(f"⚠️ 讀取 googletag/AdSense 廣告位置失敗: {e}")
+            return ads_by_size
+        if not has_tags:
+            return ads_by_size
+        handles = {ad['handle'] for ads in ads_by_size.values() for ad in ads}
+        positions = {(round(ad['top']), round(ad['left'])) for ads in ads_by_size.values() for ad in ads}
+        added = 0
+        for slot in declared_slots:
+            if not slot['visible'] or slot['width'] <= 50 or slot['height'] <= 50 or slot['handle'] in handles:
+                continue
+            top = slot['pageTop'] if page_coordinates else slot['top']
+            left = slot['pageLeft'] if page_coordinates else slot['left']
+            position_key = (round(top), round(left))
+            if position_key in positions:
+                continue
+            positions.add(position_key)
+            ads_by_size.setdefault(f"{slot['width']}x{slot['height']}", []).append({
+                'handle': slot['handle'],
+                'visible': True,
+                'width': slot['width'],
+                'height': slot['height'],
+                'position': f"top:{top:.0f}, left:{left:.0f}",
+                'top': top,
+                'left': left,
+                'selector': f"declared:{slot['source']}",
+                'tagName': '',
+                'id': '',
+                'className': ''
+            })
+            added += 1
+        if added:
+            print(f"⚡ 由廣告標籤補上 {added} 個廣告位置")
+        return ads_by_size
+
+    def _ads_from_slot_index(self):
+        """索引中的位置轉為全面掃描的格式；同一位置的巢狀容器只保留最外層"""
+        ads_by_size = {}
+        processed = set()
+        for slot in self.slot_index.slots.values():
+            if slot['width'] <= 50 or slot['height'] <= 50:
+                continue
+            position_key = (round(slot['top']), round(slot['left']))
+            if position_key in processed:
+                continue
+            processed.add(position_key)
+            ads_by_size.setdefault(slot['sizeKey'], []).append({
+                'handle': slot['handle'],
+                'visible': True,
+                'width': slot['width'],
+                'height': slot['height'],
+                'position': f"top:{slot['top']:.0f}, left:{slot['left']:.0f}",
+                'top': slot['top'],
+                'left': slot['left'],
+                'selector': 'slot-index',
+                'tagName': slot['tagName'],
+                'id': slot['id'],
+                'className': slot['className']
+            })
+        return ads_by_size
+
     def scan_entire_page_for_ads(self, target_width, target_height):
         """掃描Yahoo所有廣告 - 全面掃描版本"""
         print(f"🎯 尋找 {target_width}x{target_height} 的廣告...")
         
-        # 如果還沒有掃描過所有廣告，先進行全面掃描
-        if not hasattr(self, '_all_yahoo_ads'):
-            self._all_yahoo_ads = self.find_all_yahoo_ads()
-        
         size_key = f"{target_width}x{target_height}"
+        tolerance = 10  # 容差改為10像素，確保按鈕位置準確
         
-        # 從所有廣告中找到符合尺寸的
-        if size_key in self._all_yahoo_ads:
-            matching_elements = self._all_yahoo_ads[size_key]
+        # 從所有廣告中找到符合尺寸的（完全相符優先，沒有時才用相近尺寸）
+        matching_elements, exact = self._match_yahoo_ads(target_width, target_height, tolerance)
+        if exact:
             print(f"✅ 從所有廣告中找到 {len(matching_elements)} 個 {size_key} 廣告")
+        elif matching_elements:
+            for ad in matching_elements:
+                print(f"✅ 找到相近尺寸 {ad['width']}x{ad['height']} (目標: {size_key}, 容差±{tolerance}px)")
         else:
-            # 如果沒有完全匹配的尺寸，尋找相近的尺寸 (容差10像素)
-            matching_elements = []
-            tolerance = 10  # 容差改為10像素，確保按鈕位置準確
-            
-            for existing_size, ads in self._all_yahoo_ads.items():
-                try:
-                    existing_width, existing_height = map(int, existing_size.split('x'))
-                    width_match = abs(existing_width - target_width) <= tolerance
-                    height_match = abs(existing_height - target_height) <= tolerance
-                    
-                    if width_match and height_match:
-                        matching_elements.extend(ads)
-                        print(f"✅ 找到相近尺寸 {existing_size} (目標: {size_key}, 容差±{tolerance}px): {len(ads)}個")
-                except:
-                    continue
-            
-            if not matching_elements:
-                print(f"❌ 未找到 {size_key} 或相近尺寸的廣告 (容差±{tolerance}px)")
+            print(f"❌ 未找到 {size_key} 或相近尺寸的廣告 (容差±{tolerance}px)")
         
         return matching_elements
     
@@ -900,31 +1039,39 @@ class YahooAdReplacer:
         print(f"🔍 備用掃描: {target_width}x{target_height}")
         print("⚠️ 全面掃描未啟用，使用備用掃描方法")
         
-        # 如果全面掃描沒有執行，先執行一次
-        if not hasattr(self, '_all_yahoo_ads'):
-            print("🔄 執行全面掃描...")
-            self._all_yahoo_ads = self.find_all_yahoo_ads()
-        
-        # 從全面掃描結果中查找
-        size_key = f"{target_width}x{target_height}"
-        tolerance = 10
-        matching_elements = []
-        
-        for existing_size, ads in self._all_yahoo_ads.items():
-            try:
-                existing_width, existing_height = map(int, existing_size.split('x'))
-                width_match = abs(existing_width - target_width) <= tolerance
-                height_match = abs(existing_height - target_height) <= tolerance
-                
-                if width_match and height_match:
-                    matching_elements.extend(ads)
-                    print(f"✅ 找到相近尺寸 {existing_size} (目標: {size_key}): {len(ads)}個")
-            except:
-                continue
+        # 從全面掃描結果中查找（相近尺寸一併納入）
+        matching_elements = [row['candidate'] for row in self._get_yahoo_size_matches(10).get(f"{target_width}x{target_height}", [])]
         
         print(f"🎯 備用掃描找到 {len(matching_elements)} 個廣告")
         return matching_elements
     
+    def _get_yahoo_size_matches(self, tolerance):
+        """全面掃描結果與所有目標尺寸一次比對，依尺寸分組的比對表（同一次掃描只計算一次）"""
+        page_ads = self.get_page_ads()
+        cache_key = (page_ads, tolerance)
+        cached_key = getattr(self, '_yahoo_size_matches_key', None)
+        if cached_key is None or cached_key[0] is not page_ads or cached_key[1] != tolerance:
+            candidates = [ad for ads in page_ads.values() for ad in ads]
+            self._yahoo_size_matches = matches_by_size(match_sizes(candidates, self.target_ad_sizes, tolerance))
+            self._yahoo_size_matches_key = cache_key
+        return self._yahoo_size_matches
+    
+    def _match_yahoo_ads(self, target_width, target_height, tolerance):
+        """回傳 (符合的廣告列表, 是否為完全相符)"""
+        size_key = f"{target_width}x{target_height}"
+        size_matches = self._get_yahoo_size_matches(tolerance)
+        if size_key in size_matches:
+            rows = size_matches[size_key]
+        else:
+            # 不在替換圖片尺寸清單中的目標，單獨比對一次
+            candidates = [ad for ads in self.get_page_ads().values() for ad in ads]
+            rows = match_sizes(candidates, [(target_width, target_height)], tolerance)
+        
+        exact_rows = [row for row in rows if row['exact']]
+        if exact_rows:
+            return [row['candidate'] for row in exact_rows], True
+        return [row['candidate'] for row in rows], False
+    
     def is_valid_ad_element(self, element, target_width, target_height):
         """基於4個廣告樣式特徵驗證元素是否為有效廣告"""
         try:
@@ -1093,15 +1240,16 @@ class YahooAdReplacer:
         
         return button_styles.get(button_style, button_styles["dots"])
 
-    def replace_ad_content(self, element, image_data, target_width, target_height):
+    def replace_ad_content(self, slot, image_data, target_width, target_height):
+        """替換廣告內容，slot 可為掃描回傳的 handle 或 WebElement"""
         try:
             # 獲取原始尺寸
-            original_info = self.driver.execute_script("""
-                var element = arguments[0];
+            original_info = self.driver.execute_script(RESOLVE_SLOT_JS + """
+                var element = resolveSlot(arguments[0]);
                 if (!element || !element.getBoundingClientRect) return null;
                 var rect = element.getBoundingClientRect();
                 return {width: rect.width, height: rect.height};
-            """, element)
+            """, slot)
             
             if not original_info:
                 return False
@@ -1134,10 +1282,10 @@ class YahooAdReplacer:
                 info_button_style = ""
             
             # 安全的廣告替換，完全避免注入可能影響佈局的 CSS
-            success = self.driver.execute_script("""
+            success = self.driver.execute_script(RESOLVE_SLOT_JS + """
                 // 不注入任何全域 CSS，使用內聯樣式確保不影響網頁佈局
                 
-                var container = arguments[0];
+                var container = resolveSlot(arguments[0]);
                 var imageBase64 = arguments[1];
                 var targetWidth = arguments[2];
                 var targetHeight = arguments[3];
@@ -1390,7 +1538,7 @@ class YahooAdReplacer:
                     }
                 }
                 return replacedCount > 0;
-            """, element, image_data, target_width, target_height, close_button_html, close_button_style, info_button_html, info_button_style, is_none_mode)
+            """, slot, image_data, target_width, target_height, close_button_html, close_button_style, info_button_html, info_button_style, is_none_mode)
             
             if success:
                 print(f"替換廣告 {original_info['width']}x{original_info['height']}")
@@ -1416,7 +1564,13 @@ class YahooAdReplacer:
                 self.driver.set_page_load_timeout(30)  # 增加超時時間
                 
                 try:
-                    self.driver.get(url)
+                    if self.resource_blocker:
+                        self.resource_blocker.discard_events()
+                    if self.early_commit:
+                        navigate_early(self.driver, url, EARLY_COMMIT_TIMEOUT, STOP_LOADING_WHEN_READY,
+                                       self.ready_signal_installed)
+                    else:
+                        self.driver.get(url)
                     print("✅ 網頁載入成功")
                 except Exception as load_error:
                     print(f"❌ 網頁載入失敗: {load_error}")
@@ -1427,21 +1581,28 @@ class YahooAdReplacer:
                     else:
                         raise load_error
                 
-                # 等待5秒讓廣告完全載入
-                print("⏳ 等待 5 秒讓廣告完全載入...")
-                time.sleep(5)
+                # 等待廣告位置穩定（最多5秒）：讀取即時索引的變動，不重複掃描
+                print("⏳ 等待廣告完全載入 (最多 5 秒)...")
+                try:
+                    if self.slot_index.wait_until_settled(timeout=5):
+                        print(f"✅ 廣告位置已穩定: {len(self.slot_index.slots)} 個 (索引版本 {self.slot_index.version})")
+                except Exception as e:
+                    print(f"⚠️ 廣告位置索引無法使用: {e}")
+                    time.sleep(5)
+                
+                if self.resource_blocker:
+                    self.resource_blocker.page_report(url)
                 
                 # 獲取頁面標題
                 page_title = self.driver.title
                 print(f"📰 頁面標題: {page_title}")
                 
-                # 使用新的全面掃描模式：一次掃描所有廣告，然後按尺寸處理
+                # 一次取得所有廣告（即時索引，無法使用時全面掃描），然後按尺寸處理
                 total_replacements = 0
                 screenshot_paths = []  # 儲存所有截圖路徑
                 
-                # 先進行一次全面掃描，找到所有廣告
-                print(f"\n🔍 全面掃描網站廣告...")
-                all_ads = self.find_all_yahoo_ads()
+                print(f"\n🔍 讀取網站廣告位置...")
+                all_ads = self.get_page_ads()
                 
                 if not all_ads:
                     print("❌ 未找到任何廣告")
@@ -1506,13 +1667,10 @@ class YahooAdReplacer:
                             else:
                                 self.static_replacements += 1
                             
-                            # 記錄替換詳情
-                            self.replacement_details.append({
-                                'size': size_key,
-                                'type': selected_image['type'],
-                                'filename': selected_image['filename'],
-                                'count': matching_ads
-                            })
+                            # 記錄替換詳情：同一張截圖中替換的每個廣告各記一筆
+                            for _ in range(matching_ads):
+                                self.results.record_replacement(size_key, None, selected_image['filename'],
+                                                                selected_image.get('is_gif'), screenshot_path)
                             
                             # 檢查是否達到截圖數量限制
                             if self.total_screenshots >= SCREENSHOT_COUNT:
@@ -1712,148 +1870,52 @@ class YahooAdReplacer:
                 return None
     
     def find_and_replace_ads_immediately(self, target_width, target_height, image_data, selected_image, processed_positions, tolerance=10):
-        """重新掃描頁面並立即替換符合尺寸的廣告，避免stale element問題"""
+        """從本頁掃描結果中取出符合尺寸的廣告 handle 並立即替換"""
         replaced_count = 0
+        self.last_replaced_handles = []
         
-        # 重新掃描所有廣告選擇器
-        all_selectors = [
-            # Yahoo 特定選擇器
-            'div[class*="ad"]',
-            'div[id*="ad"]', 
-            'div[class*="sticky"]',
-            'div[data-google-query-id]',
-            'div[id*="google_ads"]',
-            'div[id*="google_ads_iframe_"]',
-            'div[id*="container__"]',
-            'div[id*="sda-"][id*="-iframe"]',
-            'div[id="sda-top-center-iframe"]',
-            'div[id="sda-top-right-iframe"]',
-            'div[id="sda-mid-right-iframe"]',
-            'div[id="sda-mid-right-2-iframe"]',
-            'div[id*="tw_ynews_ros_dt_top_center"]',
-            'iframe[src*="googlesyndication.com"]',
-            'iframe[src*="doubleclick"]',
-            'iframe[src*="safeframe.googlesyndication.com"]',
-            # 通用廣告選擇器
-            'div[class*="w-full"]',
-            'div[class*="shrink-0"]',
-            'div[class*="min-h-[250px]"]',
-            'div[class*="min-w-[300px]"]',
-            'div[class*="mb-module-gap"]',
-            'div[class*="z-index-1"]',
-            'aside[class*="mt-module-gap"]'
-        ]
-        
-        for selector in all_selectors:
-            try:
-                elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                
-                for element in elements:
-                    try:
-                        # 檢查元素是否可見且有尺寸
-                        if not element.is_displayed():
-                            continue
-                            
-                        size = element.size
-                        location = element.location
-                        width = size['width']
-                        height = size['height']
-                        
-                        # 跳過太小的元素
-                        if width < 50 or height < 50:
-                            continue
-                        
-                        # 檢查尺寸是否匹配
-                        if (abs(width - target_width) <= tolerance and 
-                            abs(height - target_height) <= tolerance):
-                            
-                            # 檢查是否已經處理過這個位置
-                            position_key = f"{location['x']}_{location['y']}_{width}x{height}"
-                            if position_key in processed_positions:
-                                continue
-                            
-                            # 立即嘗試替換
-                            if self.replace_ad_content(element, image_data, target_width, target_height):
-                                print(f"   ✅ 成功替換 {selected_image['type']}: {selected_image['filename']} at top:{location['y']}, left:{location['x']}")
-                                replaced_count += 1
-                                processed_positions.add(position_key)
-                                
-                                # 限制每個尺寸最多替換的廣告數量
-                                if replaced_count >= 3:  # 每個尺寸最多替換3個廣告
-                                    return replaced_count
-                            
-                    except Exception as e:
-                        # 忽略個別元素的錯誤，繼續處理下一個
-                        continue
-                        
-            except Exception as e:
-                # 忽略選擇器錯誤，繼續下一個選擇器
+        size_key = f"{target_width}x{target_height}"
+        rows = self._get_yahoo_size_matches(tolerance).get(size_key, [])
+        
+        for row in rows:
+            ad = row['candidate']
+            handle = ad['handle']
+            
+            # 檢查是否已經處理過這個位置
+            if handle in processed_positions:
                 continue
+            
+            # 立即嘗試替換（handle 在頁面中解析，不會有 stale element 問題）
+            if self.replace_ad_content(handle, image_data, target_width, target_height):
+                print(f"   ✅ 成功替換 {selected_image['type']}: {selected_image['filename']} at {ad['position']}")
+                replaced_count += 1
+                processed_positions.add(handle)
+                self.last_replaced_handles.append(handle)
+                
+                # 限制每個尺寸最多替換的廣告數量
+                if replaced_count >= 3:  # 每個尺寸最多替換3個廣告
+                    break
         
         return replaced_count
 
     def scroll_to_ads_for_screenshot(self, target_width, target_height, tolerance=10):
         """滑動到廣告位置，讓按鈕出現在螢幕上25%的位置"""
         try:
-            # 重新找到符合尺寸的廣告元素
-            all_selectors = [
-                'div[class*="ad"]',
-                'div[id*="ad"]', 
-                'div[data-google-query-id]',
-                'div[id*="google_ads_iframe_"]',
-                'div[id*="sda-"][id*="-iframe"]',
-                'iframe[src*="googlesyndication.com"]'
-            ]
-            
-            ad_elements = []
-            
-            for selector in all_selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    
-                    for element in elements:
-                        try:
-                            if not element.is_displayed():
-                                continue
-                                
-                            size = element.size
-                            location = element.location
-                            width = size['width']
-                            height = size['height']
-                            
-                            # 檢查尺寸是否匹配
-                            if (abs(width - target_width) <= tolerance and 
-                                abs(height - target_height) <= tolerance):
-                                ad_elements.append({
-                                    'element': element,
-                                    'top': location['y'],
-                                    'left': location['x'],
-                                    'width': width,
-                                    'height': height
-                                })
-                        except:
-                            continue
-                except:
-                    continue
+            # 優先使用剛替換的廣告，否則使用本頁第一個符合尺寸的廣告
+            handles = list(getattr(self, 'last_replaced_handles', []))
+            if not handles:
+                rows = self._get_yahoo_size_matches(tolerance).get(f"{target_width}x{target_height}", [])
+                handles = [row['candidate']['handle'] for row in rows]
             
-            if not ad_elements:
+            if not handles:
                 print("   ⚠️ 未找到廣告元素，無法滑動")
                 return
             
-            # 選擇第一個廣告元素進行滑動
-            target_ad = ad_elements[0]
-            
-            # 獲取視窗高度
-            viewport_height = self.driver.execute_script("return window.innerHeight;")
-            
-            # 計算滑動位置：讓廣告頂部出現在螢幕上25%的位置
-            scroll_position = target_ad['top'] - (viewport_height * 0.25)
-            
-            # 確保滑動位置不會是負數
-            scroll_position = max(0, scroll_position)
-            
-            # 滑動到計算的位置
-            self.driver.execute_script(f"window.scrollTo(0, {scroll_position});")
+            # 滑動到計算的位置：讓廣告頂部出現在螢幕上25%的位置
+            scroll_position = scroll_slot_into_view(self.driver, handles[0], 0.25)
+            if scroll_position is None:
+                print("   ⚠️ 廣告元素已不在頁面上，無法滑動")
+                return
             print(f"   ✅ 滑動到位置: {scroll_position:.0f}px (廣告將出現在螢幕上25%位置)")
             
             # 等待滑動完成
@@ -1906,7 +1968,10 @@ class YahooAdReplacer:
             print(f"還原廣告時發生錯誤: {e}")
 
     def close(self):
-        self.driver.quit()
+        if getattr(self, 'resource_blocker', None):
+            self.resource_blocker.print_summary()
+        self.results.close()
+        self.browser.close()
 
 def main():
     # 偵測並選擇螢幕
@@ -1962,9 +2027,11 @@ def main():
             print(f"處理第 {i}/{len(news_urls)} 個網站")
             print(f"{'='*50}")
             
+            bot.results.begin_page(url)
             try:
                 # 處理網站並嘗試替換廣告
                 screenshot_paths = bot.process_website(url)
+                bot.results.finish_page(url, 'ok' if screenshot_paths else 'empty', len(screenshot_paths or []))
                 
                 if screenshot_paths:
                     print(f"✅ 成功處理網站！共產生 {len(screenshot_paths)} 張截圖")
@@ -1973,12 +2040,14 @@ def main():
                     # 檢查是否達到目標截圖數量
                     if total_screenshots >= SCREENSHOT_COUNT:
                         print(f"✅ 已達到目標截圖數量: {SCREENSHOT_COUNT}")
+                        bot.results.finish_run()
                         break
                 else:
                     print("❌ 網站處理完成，但沒有找到可替換的廣告或主題不符")
                 
             except Exception as e:
                 print(f"❌ 處理網站失敗: {e}")
+                bot.results.finish_page(url, 'failed')
                 print("繼續處理下一個網站...")
                 continue
             
@@ -2012,19 +2081,8 @@ def main():
         # 顯示 Yahoo 風格的詳細統計報告
         print(f"\n📊 Yahoo 廣告替換統計報告 - GIF 升級版")
         print("="*60)
-        print(f"📸 總截圖數量: {bot.total_screenshots} 張")
-        print(f"🔄 總替換次數: {bot.total_replacements} 次")
-        if bot.gif_replacements > 0 or bot.static_replacements > 0:
-            gif_percentage = (bot.gif_replacements / bot.total_replacements * 100) if bot.total_replacements > 0 else 0
-            static_percentage = (bot.static_replacements / bot.total_replacements * 100) if bot.total_replacements > 0 else 0
-            print(f"   🎬 GIF 替換: {bot.gif_replacements} 次 ({gif_percentage:.1f}%)")
-            print(f"   🖼️ 靜態圖片替換: {bot.static_replacements} 次 ({static_percentage:.1f}%)")
-        
-        if bot.replacement_details:
-            print(f"\n📋 詳細替換記錄:")
-            for i, detail in enumerate(bot.replacement_details, 1):
-                type_icon = "🎬" if detail['type'] == "GIF" else "🖼️"
-                print(f"    {i}. {type_icon} {detail['filename']} ({detail['size']}) → 📸 {detail['screenshot']}")
+        # 統計由結果資料庫彙總
+        bot.results.print_report()
         
         # 顯示當前 GIF 策略
         try: